@@ -0,0 +1,149 @@
+import argparse
+import glob
+import os
+import shelve
+import shutil
+import tempfile
+import time
+
+from synbiohub_adapter.cache_store import SQLiteStore
+from synbiohub_adapter.sparql_results import decode_result
+from tests.LocalSPARQLServer import serialize_result
+
+from benchmarks.bench_result_formats import load_examples, VERBOSE_QUERY
+
+'''
+    This benchmark compares the disk footprint and read latency of the persistent query cache layouts.
+
+    The example SBOL files are loaded into an rdflib Graph, which answers a set of queries similar to those of
+    SynBioHubQuery: the members of each type in each collection, the entities of each type and a wide query. Each
+    result is stored under several keys, as when the same result is reached through different collections, users
+    or phrasings of a query. The results are stored in a shelve database, as the fallback cache of earlier versions
+    did, and in SQLiteStore with each codec. Run from the repository root with:
+
+        python -m benchmarks.bench_cache_storage
+'''
+
+TYPE_QUERY = '''
+PREFIX dcterms: <http://purl.org/dc/terms/>
+SELECT ?entity ?name WHERE {{
+    ?entity a <{rdf_type}> .
+    OPTIONAL {{ ?entity dcterms:title ?name }}
+}}
+'''
+
+MEMBER_QUERY = '''
+PREFIX sbol: <http://sbols.org/v2#>
+PREFIX dcterms: <http://purl.org/dc/terms/>
+SELECT ?entity ?name WHERE {{
+    <{collection}> sbol:member ?entity .
+    ?entity a <{rdf_type}> .
+    OPTIONAL {{ ?entity dcterms:title ?name }}
+}}
+'''
+
+LAYOUTS = [
+    ('shelve', None, None),
+    ('sqlite', None, None),
+    ('sqlite', 'zlib', 1),
+    ('sqlite', 'zlib', 6),
+    ('sqlite', 'zlib', 9),
+    ('sqlite', 'lzma', 6)
+]
+
+
+# Returns the results of the benchmark queries, decoded as fetch_SPARQL returns them.
+def query_results(graph):
+    rdf_types = [row[0] for row in graph.query('SELECT DISTINCT ?type WHERE { ?entity a ?type }')]
+    collections = [row[0] for row in graph.query('SELECT DISTINCT ?collection WHERE { '
+                                                 '?collection <http://sbols.org/v2#member> ?entity }')]
+
+    queries = [VERBOSE_QUERY] + [TYPE_QUERY.format(rdf_type=rdf_type) for rdf_type in rdf_types]
+    queries += [MEMBER_QUERY.format(collection=collection, rdf_type=rdf_type)
+                for collection in collections for rdf_type in rdf_types]
+
+    return [decode_result(serialize_result(graph.query(query)), 'json') for query in queries]
+
+
+# Returns the total size of the files of a database, which shelve and SQLite may split over several files.
+def footprint(path):
+    return sum(os.path.getsize(f) for f in glob.glob(path + '*'))
+
+
+def write(layout, path, entries):
+    kind, codec, level = layout
+    start = time.perf_counter()
+
+    if kind == 'shelve':
+        with shelve.open(path) as db:
+            for key, result in entries:
+                db[key] = result
+    else:
+        store = SQLiteStore(path, batch_size=len(entries), codec=codec, compress_level=level)
+        for key, result in entries:
+            store.put(key, (None, result))
+        store.close()
+
+    return time.perf_counter() - start
+
+
+# Returns the mean time of reading every entry from a newly opened database, over repeat passes.
+def read(layout, path, entries, repeat):
+    kind, codec, level = layout
+
+    if kind == 'shelve':
+        db = shelve.open(path, flag='r')
+        get = db.__getitem__
+    else:
+        db = SQLiteStore(path)
+        get = db.get
+
+    start = time.perf_counter()
+    for i in range(repeat):
+        for key, result in entries:
+            get(key)
+    elapsed = time.perf_counter() - start
+
+    db.close()
+
+    return elapsed / (repeat * len(entries))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Compare the footprint and read latency of query cache layouts.')
+    parser.add_argument('--examples', default='workingFiles/*.xml',
+                        help='Glob of example SBOL files to load, relative to the examples directory')
+    parser.add_argument('--aliases', type=int, default=3, help='Number of keys each result is stored under')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of passes reading every entry')
+    args = parser.parse_args(args)
+
+    graph = load_examples(args.examples)
+    results = query_results(graph)
+    entries = [('{}:{}'.format(alias, i), result) for i, result in enumerate(results) for alias in range(args.aliases)]
+
+    print('{} triples, {} results, {} entries'.format(len(graph), len(results), len(entries)))
+    print('{:<16}{:>14}{:>10}{:>12}{:>14}'.format('layout', 'bytes', 'ratio', 'write (ms)', 'read (us)'))
+
+    directory = tempfile.mkdtemp()
+    try:
+        shelve_size = None
+        for layout in LAYOUTS:
+            kind, codec, level = layout
+            name = kind if codec is None else '{} {} {}'.format(kind, codec, level)
+            os.mkdir(os.path.join(directory, name.replace(' ', '_')))
+            path = os.path.join(directory, name.replace(' ', '_'), 'queries')
+
+            write_time = write(layout, path, entries)
+            size = footprint(path)
+            if shelve_size is None:
+                shelve_size = size
+            read_time = read(layout, path, entries, args.repeat)
+
+            print('{:<16}{:>14}{:>10.2f}{:>12.1f}{:>14.1f}'.format(name, size, size / shelve_size,
+                                                                   write_time * 1000, read_time * 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import time
+
+from synbiohub_adapter.SynBioHubUtil import SBOLConstants, SD2Constants, SBOLQuery
+
+'''
+    This benchmark measures the time SBOLQuery spends building the SPARQL text of a query, per query family.
+
+    The query methods of a client whose fetch_SPARQL returns the query it is given are called with arguments like
+    those of SynBioHubQuery. Each family is built with the memoized builders emptied before every call, as the first
+    call with these arguments is, and again with the builders warm, as the calls repeated in a loop are. Run from the
+    repository root with:
+
+        python -m benchmarks.bench_query_builders
+'''
+
+EXPERIMENTS = ['https://hub.sd2e.org/user/sd2e/experiment/experiment_{}/1'.format(i) for i in range(20)]
+SAMPLES = ['https://hub.sd2e.org/user/sd2e/experiment/sample_{}/1'.format(i) for i in range(50)]
+
+DNA = 'http://www.biopax.org/release/biopax-level3.owl#DnaRegion'
+STRAIN_PROPERTIES = {'sbol:role': '<{}>'.format(SBOLConstants.NCIT_STRAIN)}
+
+FAMILIES = [
+    ('design_components', 'query_design_components',
+     {'types': [DNA], 'collections': [SD2Constants.SD2_DESIGN_COLLECTION], 'roles': [SBOLConstants.PRIMER]}),
+    ('design_modules', 'query_design_modules',
+     {'roles': SD2Constants.LOGIC_OPERATORS, 'collections': [SD2Constants.SD2_DESIGN_COLLECTION],
+      'custom_properties': STRAIN_PROPERTIES}),
+    ('experiment_components', 'query_experiment_components',
+     {'types': [DNA], 'collections': [SD2Constants.SD2_EXPERIMENT_COLLECTION], 'experiments': EXPERIMENTS}),
+    ('experiment_modules', 'query_experiment_modules',
+     {'roles': SD2Constants.LOGIC_OPERATORS, 'collections': [SD2Constants.SD2_EXPERIMENT_COLLECTION],
+      'experiments': EXPERIMENTS, 'custom_properties': STRAIN_PROPERTIES}),
+    ('collection_members', 'query_collection_members',
+     {'collections': [SD2Constants.SD2_EXPERIMENT_COLLECTION], 'members': SAMPLES,
+      'rdf_type': 'http://sbols.org/v2#Implementation'}),
+    ('unit', 'construct_unit_query', {'name': 'millimolar'})
+]
+
+BUILDERS = [SBOLQuery.construct_collection_entity_query, SBOLQuery.construct_unit_query]
+
+
+class BuildOnlyQuery(SBOLQuery):
+    ''' A client whose queries return the SPARQL text they would send.
+    '''
+
+    def fetch_SPARQL(self, server, query, result_format=None):
+        return query
+
+
+def clear_builders():
+    for builder in BUILDERS:
+        builder.cache.clear()
+
+
+# Returns the mean time of building a query, in seconds, over repeat calls.
+def time_builds(build, repeat, cold):
+    elapsed = 0.0
+
+    for i in range(repeat):
+        if cold:
+            clear_builders()
+
+        start = time.perf_counter()
+        build()
+        elapsed += time.perf_counter() - start
+
+    return elapsed / repeat
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Measure the time taken to build the queries of each family.')
+    parser.add_argument('--repeat', type=int, default=2000, help='Number of queries built per family and mode')
+    args = parser.parse_args(args)
+
+    sbol_query = BuildOnlyQuery('http://localhost/sparql')
+
+    print('{:<24}{:>8}{:>12}{:>12}{:>10}'.format('family', 'chars', 'cold (us)', 'warm (us)', 'speedup'))
+    for name, method, kwargs in FAMILIES:
+        def build():
+            return getattr(sbol_query, method)(**kwargs)
+
+        chars = len(build())
+        cold = time_builds(build, args.repeat, True)
+        warm = time_builds(build, args.repeat, False)
+
+        print('{:<24}{:>8}{:>12.1f}{:>12.1f}{:>10.1f}'.format(name, chars, cold * 1e6, warm * 1e6, cold / warm))
+
+    sbol_query.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+import argparse
+import contextlib
+import time
+from unittest import mock
+
+import rdflib
+from rdflib.plugins.sparql import CUSTOM_EVALS, algebra
+from rdflib.plugins.sparql.evaluate import evalBGP, evalLazyJoin
+
+from synbiohub_adapter.SynBioHubUtil import SBOLConstants, SD2Constants, SBOLQuery
+from benchmarks.bench_result_formats import load_examples
+
+'''
+    This benchmark compares the time taken to answer the queries built by construct_collection_entity_query before
+    and after they are rewritten by query_optimizer.optimize.
+
+    The example SBOL files are loaded into an rdflib Graph standing in for SynBioHub, along with the design and
+    experiment collections of SD2Constants, whose members are the ComponentDefinitions, ModuleDefinitions and
+    Experiments of the examples. Each family of queries is built by a client with and without OPTIMIZE_QUERIES,
+    and the results of both queries are checked to be the same. The experiment families are also timed for the
+    first and first two experiments, and with --max-slowdown the benchmark fails if an optimized query is slower
+    than the query written by more than the factor given.
+
+    rdflib orders the triples of each basic graph pattern itself, and evaluates most joins without the bindings of
+    the patterns before them, which hides the order the optimizer chooses. By default, patterns are evaluated in
+    the order written instead, each with the bindings of the patterns before it, as by the endpoints the optimizer
+    is meant for, and with --rdflib-order as rdflib chooses. Run from the repository root with:
+
+        python -m benchmarks.bench_query_optimizer
+'''
+
+DNA = 'http://www.biopax.org/release/biopax-level3.owl#DnaRegion'
+PROMOTER = 'http://identifiers.org/so/SO:0000167'
+TERMINATOR = 'http://identifiers.org/so/SO:0000141'
+CDS = 'http://identifiers.org/so/SO:0000316'
+
+FAMILIES = [
+    ('design_components', 'query_design_components',
+     {'types': [DNA], 'roles': [PROMOTER, TERMINATOR, CDS], 'collections': [SD2Constants.SD2_DESIGN_COLLECTION],
+      'other_comp_labels': ['name']}),
+    ('design_sub_roles', 'query_design_components',
+     {'collections': [SD2Constants.SD2_DESIGN_COLLECTION], 'sub_roles': [CDS]}),
+    ('design_modules', 'query_design_modules',
+     {'collections': [SD2Constants.SD2_DESIGN_COLLECTION], 'sub_types': [DNA], 'other_mod_labels': ['name']}),
+    ('experiment_components', 'query_experiment_components',
+     {'types': [DNA], 'roles': [CDS], 'collections': [SD2Constants.SD2_EXPERIMENT_COLLECTION]}),
+    ('experiment_modules', 'query_experiment_modules',
+     {'collections': [SD2Constants.SD2_EXPERIMENT_COLLECTION], 'other_mod_labels': ['name']}),
+    ('experiment_media', 'query_experiment_modules',
+     {'roles': [SBOLConstants.OBI_MEDIA, SBOLConstants.NCIT_MEDIA],
+      'collections': [SD2Constants.SD2_EXPERIMENT_COLLECTION], 'mod_label': 'media'}),
+    ('experiment_gates', 'query_experiment_components',
+     {'types': [DNA], 'roles': [SBOLConstants.LOGIC_OPERATOR], 'collections': [SD2Constants.SD2_EXPERIMENT_COLLECTION],
+      'comp_label': 'gate'})
+]
+
+# The numbers of experiments the experiment families are also restricted to, as by query_single_experiment_media
+# and the queries of several experiments
+EXPERIMENT_COUNTS = [1, 2]
+
+COLLECTION_MEMBERS = [
+    (SD2Constants.SD2_DESIGN_COLLECTION, [SBOLConstants.SBOL_NS + 'ComponentDefinition',
+                                          SBOLConstants.SBOL_NS + 'ModuleDefinition']),
+    (SD2Constants.SD2_EXPERIMENT_COLLECTION, ['http://sd2e.org#Experiment'])
+]
+
+
+class QueryBuilder(SBOLQuery):
+    ''' A client whose queries return the SPARQL text they would send.
+    '''
+
+    def fetch_SPARQL(self, server, query, result_format=None):
+        return query
+
+
+class OptimizedQueryBuilder(QueryBuilder):
+
+    OPTIMIZE_QUERIES = True
+
+
+# Returns a Graph of the example SBOL files matching pattern, with the collections of COLLECTION_MEMBERS.
+def load_hub(pattern):
+    graph = load_examples(pattern)
+    member = rdflib.URIRef(SBOLConstants.SBOL_NS + 'member')
+
+    for collection, rdf_types in COLLECTION_MEMBERS:
+        for rdf_type in rdf_types:
+            for entity in list(graph.subjects(rdflib.RDF.type, rdflib.URIRef(rdf_type))):
+                graph.add((rdflib.URIRef(collection), member, entity))
+
+    return graph
+
+
+# Makes rdflib evaluate the triples of basic graph patterns in the order written, and joins as nested loops
+# passing the bindings of their first pattern to the second, within the context.
+@contextlib.contextmanager
+def written_order():
+    def evaluate(ctx, part):
+        if part.name == 'BGP':
+            return evalBGP(ctx, part.triples)
+        elif part.name == 'Join':
+            return evalLazyJoin(ctx, part)
+        raise NotImplementedError()
+
+    CUSTOM_EVALS['written_order'] = evaluate
+    try:
+        with mock.patch.object(algebra, 'reorderTriples', list):
+            yield
+    finally:
+        del CUSTOM_EVALS['written_order']
+
+
+# Returns the families of queries to time, those of experiments being repeated for the first experiments of graph.
+def families(graph):
+    experiments = sorted(str(experiment) for experiment in graph.subjects(rdflib.RDF.type,
+                                                                          rdflib.URIRef('http://sd2e.org#Experiment')))
+    for name, method, kwargs in FAMILIES:
+        yield name, method, kwargs
+        if method.startswith('query_experiment_'):
+            for count in EXPERIMENT_COUNTS:
+                if count <= len(experiments):
+                    yield '{}[{}]'.format(name, count), method, dict(kwargs, experiments=experiments[:count])
+
+
+# Returns the rows of the result of query, and the best time taken to answer it, in seconds, over repeat runs.
+def time_query(graph, query, repeat):
+    best = None
+
+    for i in range(repeat):
+        start = time.perf_counter()
+        rows = set(graph.query(query))
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return rows, best
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Compare the time taken to answer queries before and after they '
+                                                 'are optimized.')
+    parser.add_argument('--examples', default='workingFiles/*.xml',
+                        help='Glob of example SBOL files to load, relative to the examples directory')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of times each query is timed')
+    parser.add_argument('--rdflib-order', action='store_true',
+                        help='Let rdflib order the triples of basic graph patterns instead of keeping their order')
+    parser.add_argument('--max-slowdown', type=float,
+                        help='Fail if an optimized query takes more than this many times as long as the query written')
+    args = parser.parse_args(args)
+
+    graph = load_hub(args.examples)
+    builders = [QueryBuilder('http://localhost/sparql'), OptimizedQueryBuilder('http://localhost/sparql')]
+
+    print('{} triples'.format(len(graph)))
+    print('{:<24}{:>8}{:>14}{:>14}{:>10}'.format('family', 'rows', 'before (ms)', 'after (ms)', 'speedup'))
+    slow = []
+    for name, method, kwargs in families(graph):
+        with contextlib.ExitStack() as stack:
+            if not args.rdflib_order:
+                stack.enter_context(written_order())
+            before_rows, before = time_query(graph, getattr(builders[0], method)(**kwargs), args.repeat)
+            after_rows, after = time_query(graph, getattr(builders[1], method)(**kwargs), args.repeat)
+        if after_rows != before_rows:
+            raise AssertionError('The optimized {} query has different results'.format(name))
+
+        print('{:<24}{:>8}{:>14.1f}{:>14.1f}{:>10.1f}'.format(name, len(after_rows), before * 1e3, after * 1e3,
+                                                              before / after))
+        if args.max_slowdown is not None and after > before * args.max_slowdown:
+            slow.append(name)
+
+    for builder in builders:
+        builder.close()
+
+    if len(slow) > 0:
+        raise AssertionError('The optimized {} queries are more than {} times slower'.format(
+            ', '.join(slow), args.max_slowdown))
+
+
+if __name__ == '__main__':
+    main()
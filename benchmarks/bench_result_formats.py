@@ -0,0 +1,94 @@
+import argparse
+import glob
+import os
+import time
+
+import rdflib
+
+from synbiohub_adapter.sparql_results import decode_result, decode_tsv_rows, decode_csv_rows
+from tests.LocalSPARQLServer import serialize_result
+
+'''
+    This benchmark compares the size and decode time of the SPARQL result formats that SBOLQuery can request.
+
+    The example SBOL files are loaded into an rdflib Graph and a wide query, similar to the verbose queries of
+    SynBioHubQuery, is answered in each format. Run from the repository root with:
+
+        python -m benchmarks.bench_result_formats
+'''
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+VERBOSE_QUERY = '''
+PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+PREFIX sbol: <http://sbols.org/v2#>
+PREFIX dcterms: <http://purl.org/dc/terms/>
+PREFIX prov: <http://www.w3.org/ns/prov#>
+SELECT ?entity ?type ?id ?version ?identity ?title ?description ?derived WHERE {
+    ?entity rdf:type ?type ;
+        sbol:displayId ?id ;
+        sbol:persistentIdentity ?identity .
+    OPTIONAL { ?entity sbol:version ?version }
+    OPTIONAL { ?entity dcterms:title ?title }
+    OPTIONAL { ?entity dcterms:description ?description }
+    OPTIONAL { ?entity prov:wasDerivedFrom ?derived }
+}
+'''
+
+
+def load_examples(pattern):
+    graph = rdflib.Graph()
+
+    for path in sorted(glob.glob(os.path.join(EXAMPLES_DIR, pattern))):
+        graph.parse(path, format='xml')
+
+    return graph
+
+
+def time_decode(decode, content, repeat):
+    best = None
+
+    for i in range(repeat):
+        start = time.perf_counter()
+        decode(content)
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Compare the size and decode time of SPARQL result formats.')
+    parser.add_argument('--examples', default='workingFiles/*.xml',
+                        help='Glob of example SBOL files to load, relative to the examples directory')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of times each decode is timed')
+    args = parser.parse_args(args)
+
+    graph = load_examples(args.examples)
+    result = graph.query(VERBOSE_QUERY)
+
+    decoders = [
+        ('json', lambda content: decode_result(content, 'json')),
+        ('tsv', lambda content: decode_result(content, 'tsv')),
+        ('tsv rows', decode_tsv_rows),
+        ('csv', lambda content: decode_result(content, 'csv')),
+        ('csv rows', decode_csv_rows)
+    ]
+
+    print('{} triples, {} result rows'.format(len(graph), len(result)))
+    print('{:<10}{:>14}{:>10}{:>16}'.format('format', 'bytes', 'ratio', 'decode (ms)'))
+
+    json_size = None
+    for name, decode in decoders:
+        content = serialize_result(result, name.split()[0])
+        if json_size is None:
+            json_size = len(content)
+
+        elapsed = time_decode(decode, content, args.repeat)
+        print('{:<10}{:>14}{:>10.2f}{:>16.2f}'.format(name, len(content), len(content) / json_size, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
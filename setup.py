@@ -9,15 +9,22 @@ install_requires = [
     'appdirs>=1.4.3',
     'pycodestyle>=2.5.0',
     'requests>=2.21.0',
-    'sbol2',
-    'tenacity>=5.0.3'
+    'sbol2'
 ]
 
+extras_require = {
+    'async': ['aiohttp>=3.5.4']
+}
+
 setup(
     name='synbiohub_adapter',
     version='1.4',
     packages=find_packages(),
     install_requires=install_requires,
+    extras_require=extras_require,
+    entry_points={
+        'console_scripts': ['synbiohub-cache=synbiohub_adapter.cache_warmup:main']
+    },
     classifiers=[
         "Programming Language :: Python :: 3 :: Only"
     ]
@@ -1,15 +1,28 @@
 import getpass
 import sys
 import csv
+import collections as collections_module
+import itertools
 
-from SPARQLWrapper import SPARQLWrapper, JSON, POST, SPARQLExceptions
+import requests
+from SPARQLWrapper import SPARQLExceptions
 from sbol2 import *
 from .cache_query import wrap_query_fn
+from .query_cache import cache_key
+from .builder_cache import memoize_builder
+from .query_optimizer import optimize
+from .sparql_ast import (serialize, Select, Group, Triple, Values, Optional, Union, Filter, Expr, Var, IRI, Literal,
+                         Seq, Repeat, iris)
+from .single_flight import SingleFlight
+from .transport import PooledTransport
+from .batch import run_many, FATAL_ERRORS
+from .resilience import RetryPolicy, CircuitBreaker
+from .cancellation import current_context, make_cancellable, QueryTimeoutError
+from .pagination import PagedResult, projected_variables, make_iterable
+from .fan_in import fan_in_method
+from .sparql_results import StreamingResult, iter_bindings, decode_result, RESULT_FORMATS
 from functools import partial
 
-# tenacity allows retrying functions/methods automatically
-import tenacity
-
 
 '''
     This is a utility module containing classes with constant variables used for querying SynBioHub information
@@ -144,52 +157,241 @@ class SBOLQuery():
         specified instance of SynBioHub.
     '''
 
+    # Size in bytes of the chunks read from the response when streaming query results.
+    STREAM_CHUNK_SIZE = 65536
+
+    # Whether the queries built by construct_collection_entity_query are rewritten by query_optimizer.optimize,
+    # to order their patterns by selectivity and factor the patterns shared by the branches of their unions.
+    # Off by default, as the estimated costs do not match every endpoint, some of which answer the rewritten
+    # queries more slowly than those written.
+    OPTIMIZE_QUERIES = False
+
+    # Whether the queries of query_experiment_components, query_experiment_modules and the methods based on them
+    # project the experiment of each row as ?exp. Set on the copies of a client used by fan_in_experiments.
+    project_experiments = False
+
+    # The attributes whose values change the queries built, which are part of the keys of memoized builders
+    BUILDER_SETTINGS = ('OPTIMIZE_QUERIES', 'project_experiments')
+
+    # The defaults of the optional settings of __init__, for the instances that do not call it, such as the replay
+    # objects of AsyncSynBioHubQuery.
+    stream_results = False
+    result_format = 'json'
+    timeout = None
+    session = None
+    endpoints = None
+    cache = None
+    existence_cache = None
+    page_size = None
+    prefetch_pages = True
+
     # server: The SynBioHub server to call sparql queries on.
-    def __init__(self, server, use_fallback_cache=False, user=None, authentication_key=None, spoofed_url=None):
+    # transport: The transport used to send HTTP requests. By default, a PooledTransport owned by this instance.
+    # pool_size: The maximum number of keep-alive connections kept open by the default transport.
+    # stream_results: Whether fetch_SPARQL returns a StreamingResult that parses bindings one at a time
+    #   instead of a dictionary holding the whole result. Only applies to the 'json' result format.
+    # result_format: The format in which query results are requested from SynBioHub by default:
+    #   'json', 'tsv' (compact and typed) or 'csv' (most compact, but term types are guessed).
+    # retry_policy: The RetryPolicy applied to login and fetch_SPARQL. By default, up to 3 attempts with
+    #   exponential backoff and a circuit breaker owned by this instance.
+    # endpoints: An EndpointSet of SPARQL endpoints (such as read replicas) to route queries to, instead of server.
+    #   Logins always go to server, which also names the graph of the logged in user.
+    # timeout: The default number of seconds after which a query_* method call raises QueryTimeoutError,
+    #   or None for no timeout. Every query_* method also accepts timeout and cancel_token keyword arguments.
+    # session: A SynBioHubSession providing the user and authentication key, shared with other clients.
+    #   A query whose token is rejected is sent once more with a refreshed token.
+    # cache: A QueryCache answering repeated queries without contacting SynBioHub, or None to send every query.
+    #   A QueryCache can be shared by several instances.
+    # single_flight: The SingleFlight through which identical queries sent at the same time by several threads
+    #   share one request. By default, one owned by this instance. Share it to coalesce the queries of several
+    #   instances. Streamed results are never shared.
+    # existence_cache: An ExistenceCache answering the checks of query_collection_members for members whose
+    #   membership is known, or None to query every member.
+    # page_size: The number of rows per page when the results of SELECT queries are fetched page by page, so that
+    #   they are never cut short by SynBioHub, or None to fetch each result with one query. Also the default page
+    #   size of the iter_* generators, which yield the result of every query_* method page by page.
+    # prefetch_pages: Whether the next page of a result is fetched in the background while a page is read.
+    def __init__(self, server, use_fallback_cache=False, user=None, authentication_key=None, spoofed_url=None,
+                 transport=None, pool_size=10, stream_results=False, result_format='json', retry_policy=None,
+                 endpoints=None, timeout=None, session=None, cache=None, single_flight=None, existence_cache=None,
+                 page_size=None, prefetch_pages=True):
+        if use_fallback_cache and stream_results:
+            raise ValueError('Streamed query results cannot be stored in the fallback cache.')
+        if cache is not None and stream_results:
+            raise ValueError('Streamed query results cannot be stored in the query cache.')
+        if result_format not in RESULT_FORMATS:
+            raise ValueError('Unsupported SPARQL result format: {}'.format(result_format))
+
         self._server = server
         self._use_fallback_cache = use_fallback_cache
         self.user = user
         self.authentication_key = authentication_key
         self.spoofed_url = spoofed_url
+        self.stream_results = stream_results
+        self.result_format = result_format
+        self.timeout = timeout
+
+        self.session = session
+        if session is not None:
+            self.user = session.email
+
+        if transport is None:
+            transport = PooledTransport(pool_size)
+        self.transport = transport
+
+        if retry_policy is None:
+            retry_policy = RetryPolicy(circuit_breaker=CircuitBreaker())
+        self.retry_policy = retry_policy
+        self.endpoints = endpoints
+        self.cache = cache
+
+        if single_flight is None:
+            single_flight = SingleFlight()
+        self.single_flight = single_flight
+        self.existence_cache = existence_cache
+        self.page_size = page_size
+        self.prefetch_pages = prefetch_pages
 
         # If using fallback cache, wrap the fetch_SPARQL function
         # with cache storage/retrieval.
         if use_fallback_cache:
-            self.fetch_SPARQL = wrap_query_fn(self.fetch_SPARQL)
-
-    # * Stop after trying 3 times
-    # * Wait 3 seconds between retries
-    # * Reraise the exception that caused the failure, rather than
-    #   raising a tenacity.RetryError
-    @tenacity.retry(stop=tenacity.stop_after_attempt(3),
-                    wait=tenacity.wait_fixed(3),
-                    reraise=True)
+            self.fetch_SPARQL = wrap_query_fn(self.fetch_SPARQL, key_fn=self.cache_key)
+
+    # The query_* methods of subclasses accept the timeout and cancel_token keyword arguments too, and have
+    # iter_* generators.
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        make_cancellable(cls)
+        make_iterable(cls)
+
+    # Failed attempts are retried according to the retry policy of this instance.
     def login(self, user, password):
         if '/sparql' not in self._server:
             self._server += '/sparql'
         p = self._server.find('/sparql')
         resource = self._server[:p]
-        login_endpoint = SPARQLWrapper(resource + '/login')
-        login_endpoint.setMethod(POST)
-        login_endpoint.addCustomHttpHeader('Content-Type', 'application/x-www-form-urlencoded')
-        login_endpoint.addCustomHttpHeader('Accept', 'text/plain')
-        login_endpoint.addCustomHttpHeader('charset', 'utf-8"')
-        login_endpoint.addParameter('email', user)
-        login_endpoint.addParameter('password', password)
+        response = self.retry_policy.call(self.transport.request, 'POST', resource + '/login',
+                                          data={'email': user, 'password': password},
+                                          headers={'Accept': 'text/plain'})
         self.user = user
-        self.authentication_key = login_endpoint.query().response.read().decode("utf-8")
-
-    # * Stop after trying 3 times
-    # * Wait 3 seconds between retries
-    # * Reraise the exception that caused the failure, rather than
-    #   raising a tenacity.RetryError
-    @tenacity.retry(stop=tenacity.stop_after_attempt(3),
-                    wait=tenacity.wait_fixed(3),
-                    reraise=True)
-    def fetch_SPARQL(self, server, query):
-        sparql = SPARQLWrapper(self._server)
+        self.authentication_key = response.content.decode("utf-8")
+
+    # Returns the key under which the result of a query sent by this instance is cached, which depends on the
+    # server, the user whose graph the query is restricted to and the result format, see query_cache.cache_key.
+    def cache_key(self, server, query, result_format=None):
+        if result_format is None:
+            result_format = self.result_format
+
+        user = self.user if self.authentication_key or self.session is not None else None
+
+        return cache_key(self._server, user, result_format, query)
+
+    # Failed attempts are retried according to the retry policy of this instance. Results are looked up in and
+    # stored to the query cache of this instance, if any. Concurrent calls with the same query share one request.
+    # With a page size, SELECT queries are fetched page by page, each page being fetched as a query of its own, and
+    # a streamed result is a PagedResult.
+    def fetch_SPARQL(self, server, query, result_format=None):
+        if result_format is None:
+            result_format = self.result_format
+
+        variables = projected_variables(query) if self.page_size is not None else None
+        if variables is not None:
+            paged_result = PagedResult(self.fetch_SPARQL, server, query, result_format, variables, self.page_size,
+                                       self.prefetch_pages)
+            if self.stream_results and result_format == 'json':
+                return paged_result
+            return paged_result.to_dict()
+
+        if self.stream_results and result_format == 'json':
+            return self.__fetch_authenticated(server, query, result_format)
+
+        key = self.cache_key(server, query, result_format)
+
+        def fetch():
+            return self.single_flight.call(key, self.__fetch_authenticated, server, query, result_format)
+
+        if self.cache is None:
+            return fetch()
+
+        return self.cache.fetch(key, current_context().query_name, fetch, query)
+
+    def __fetch_authenticated(self, server, query, result_format):
+        if self.session is None:
+            return self.__fetch_with_retries(server, query, result_format)
+
+        token = self.session.token
+        self.authentication_key = token
+        try:
+            return self.__fetch_with_retries(server, query, result_format)
+        except SPARQLExceptions.Unauthorized:
+            # The token was rejected, for instance because SynBioHub restarted, so log in again and retry once
+            self.authentication_key = self.session.refresh(token)
+            return self.__fetch_with_retries(server, query, result_format)
+
+    def __fetch_with_retries(self, server, query, result_format):
+        if self.stream_results and result_format == 'json':
+            return self.retry_policy.call(self.fetch_SPARQL_stream, server, query)
+
+        return self.retry_policy.call(self.__fetch_SPARQL, query, result_format)
+
+    def __fetch_SPARQL(self, query, result_format):
+        context = current_context()
+
+        query, headers = self.prepare_SPARQL(query, result_format)
+
+        # Within a timeout or a cancellable call, the response body is read in chunks so that reading can be aborted
+        if context.active:
+            content = context.read(self.__get(query, headers, stream=True), self.STREAM_CHUNK_SIZE)
+        else:
+            content = self.__get(query, headers).content
+
+        return self.parse_SPARQL_response(content, result_format)
+
+    # Returns a StreamingResult that parses the bindings of the query result as they are read from the response,
+    # so that memory use is bounded by the size of one binding rather than the whole result.
+    def fetch_SPARQL_stream(self, server, query):
+        query, headers = self.prepare_SPARQL(query)
+        response = self.__get(query, headers, stream=True)
+
+        # The timeout and cancellation token of the call still apply while the result is iterated over
+        context = current_context()
+        if context.active:
+            chunks = context.iter_chunks(response, self.STREAM_CHUNK_SIZE)
+        else:
+            chunks = response.iter_content(chunk_size=self.STREAM_CHUNK_SIZE)
+        first_chunk = next(chunks, b'')
+        if first_chunk.lstrip().startswith(b'<!DOCTYPE html>'):
+            response.close()
+            raise SPARQLExceptions.Unauthorized()
+
+        return StreamingResult(itertools.chain([first_chunk], chunks), response.close)
+
+    # Sends a query to the SPARQL endpoint, or to the preferred endpoint of the endpoint set of this instance,
+    # within the timeout and cancellation token of the running query method call.
+    def __get(self, query, headers, stream=False):
+        context = current_context()
+        timeout = context.remaining()
+
+        def send(url):
+            return context.send(lambda: self.transport.request('GET', url, params={'query': query}, headers=headers,
+                                                               stream=stream, timeout=timeout))
+
+        try:
+            if self.endpoints is None:
+                return send(self._server)
+
+            return self.endpoints.request(send)
+        except requests.Timeout:
+            if context.deadline is None:
+                raise
+            raise QueryTimeoutError()
+
+    # Returns the query and HTTP headers to send, adding authentication and
+    # restricting the query to the graph of the logged in user.
+    def prepare_SPARQL(self, query, result_format='json'):
+        headers = {'Accept': RESULT_FORMATS[result_format]}
         if self.authentication_key and self.user:
-            sparql.addCustomHttpHeader('X-authorization', self.authentication_key)
+            headers['X-authorization'] = self.authentication_key
             if 'WHERE' in query:
                 if self.spoofed_url:
                     resource = self.spoofed_url
@@ -201,199 +403,175 @@ class SBOLQuery():
                 FROM = "  FROM <{resource}/user/{user}> ".format(resource=resource, user=self.user)
                 p = query.find('WHERE')
                 query = query[:p] + FROM + query[p:]
-        sparql.setQuery(query)
-        sparql.setReturnFormat(JSON)
-        results = sparql.query().convert()
-        if type(results) is bytes and results.startswith(b'<!DOCTYPE html>'):
+        return query, headers
+
+    def parse_SPARQL_response(self, content, result_format='json'):
+        if content.lstrip().startswith(b'<!DOCTYPE html>'):
             # The query failed. We assume the problem was a lack of
             # authentication.
             # Without authentication, SynBioHub redirects to the home
             # page so raw HTML is returned.
             raise SPARQLExceptions.Unauthorized()
-        return results
+        return decode_result(content, result_format)
+
+    # Returns per-host connection reuse statistics for the transport of this instance.
+    def connection_stats(self):
+        return self.transport.connection_stats()
+
+    # Returns per-endpoint wait time statistics for the transport of this instance, if it limits requests.
+    def governor_stats(self):
+        return self.transport.governor_stats()
+
+    # Returns the hit, miss and eviction counters of the query cache of this instance.
+    def cache_stats(self):
+        return self.cache.stats()
+
+    # Returns the hit, miss and eviction counters of the memoized builders of query_* methods, by builder name.
+    def builder_cache_stats(self):
+        return {name: getattr(type(self), name).cache.stats()
+                for name in ['construct_collection_entity_query', 'construct_unit_query']}
+
+    # Returns the number of queries sent through fetch_SPARQL, streamed ones aside, and the number of requests
+    # saved by sharing the result of an identical query in flight.
+    def single_flight_stats(self):
+        return self.single_flight.stats()
+
+    # Closes the connections held open by the transport of this instance.
+    def close(self):
+        self.transport.close()
+
+    # Runs a list of (method name, kwargs) pairs concurrently and returns a list of BatchCallResult in the same order.
+    # Errors are collected per call. The first error of a type in fatal_errors cancels the calls not yet started.
+    # max_workers: The maximum number of concurrent calls. Defaults to the connection pool size of the transport.
+    def run_many(self, calls, max_workers=None, fatal_errors=FATAL_ERRORS):
+        if max_workers is None:
+            max_workers = getattr(self.transport, 'pool_size', 10)
+
+        return run_many(self, calls, max_workers, fatal_errors)
+
+    # Calls the query method named method_name, which takes an experiments argument, with kwargs for chunks of
+    # experiments, and returns an OrderedDict of its result for each experiment, see fan_in.fan_in_method.
+    # chunk_size: The number of experiments per query. By default, as many as fit in the URL length limit.
+    def fan_in_experiments(self, method_name, experiments, chunk_size=None, **kwargs):
+        return fan_in_method(self, method_name, experiments, kwargs, chunk_size)
 
     # Constructs a partial SPARQL query for all collection members with
     # at least one of the specified types (or all of the specified types).
     def construct_type_pattern(self, types, all_types=True, entity_label='entity', type_label='type'):
         if len(types) == 0:
-            return ""
+            return Group()
         elif all_types or len(types) == 1:
-            return "?{el} sbol:type {ty} .".format(ty=self.serialize_objects(types), el=entity_label)
+            return Group(*[Triple(Var(entity_label), 'sbol:type', iri) for iri in iris(types)])
         else:
-            return """
-            VALUES (?{tl}) {{ {ty} }}
-            ?{el} sbol:type ?{tl} .
-            """.format(ty=self.serialize_options(types), el=entity_label, tl=type_label)
+            return Group(Values(Var(type_label), iris(types)),
+                         Triple(Var(entity_label), 'sbol:type', Var(type_label)))
 
     # Constructs a partial SPARQL query for all collection members with
     # at least one of the specified roles.
     def construct_role_pattern(self, roles, entity_label='entity', role_label='role'):
         if len(roles) == 0:
-            return ""
+            return Group()
         elif len(roles) == 1:
-            return "?{el} sbol:role {ro} .".format(ro=self.serialize_objects(roles), el=entity_label)
+            return Group(Triple(Var(entity_label), 'sbol:role', iris(roles)[0]))
         else:
-            return """
-            VALUES (?{rl}) {{ {ro} }}
-            ?{el} sbol:role ?{rl} .
-            """.format(ro=self.serialize_options(roles), el=entity_label, rl=role_label)
+            return Group(Values(Var(role_label), iris(roles)),
+                         Triple(Var(entity_label), 'sbol:role', Var(role_label)))
 
+    # custom_properties: A dictionary mapping a prefixed name or <IRI> to an <IRI> or a string literal.
     def construct_custom_pattern(self, custom_properties, entity_label='entity'):
-        query_arr = ['?{el} {qn} {obj} .'.format(el=entity_label, qn=qname, obj=custom_properties[qname])
-                     if custom_properties[qname].startswith('<') and custom_properties[qname].endswith('>')
-                     else '?{el} {qn} "{obj}" .'.format(el=entity_label, qn=qname, obj=custom_properties[qname])
-                     for qname in custom_properties]
-        return '\n'.join(query_arr)
+        return Group(*[Triple(Var(entity_label), _bracketed_iri(qname, str),
+                              _bracketed_iri(custom_properties[qname], Literal))
+                       for qname in custom_properties])
 
     def construct_definition_pattern(self, definitions, entity_label='entity', sub_entity_label='sub_entity'):
         if len(definitions) == 0:
-            return ""
+            return Group()
         elif len(definitions) == 1:
-            return "?{el} sbol:definition {sd} .".format(el=entity_label, sd=self.serialize_objects(definitions))
+            return Group(Triple(Var(entity_label), 'sbol:definition', iris(definitions)[0]))
         else:
-            return """
-            VALUES (?{sel}) {{ {df} }}
-            ?{el} sbol:definition ?{sel} .
-            """.format(el=entity_label, sel=sub_entity_label, df=self.serialize_options(definitions))
+            return Group(Values(Var(sub_entity_label), iris(definitions)),
+                         Triple(Var(entity_label), 'sbol:definition', Var(sub_entity_label)))
 
     def construct_sub_pattern(self, sub_entity_pattern="", definitions=[], entity_label='entity', sub_label='sub',
                               sub_entity_label='sub_entity', rdf_type=None):
         if rdf_type is None:
-            sub_predicate = "(sbol:component) (sbol:functionalComponent) (sbol:module)"
+            sub_predicates = ['sbol:component', 'sbol:functionalComponent', 'sbol:module']
         elif rdf_type == 'http://sbols.org/v2#ComponentDefinition':
-            sub_predicate = "(sbol:component)"
+            sub_predicates = ['sbol:component']
         elif rdf_type == 'http://sbols.org/v2#ModuleDefinition':
-            sub_predicate = "(sbol:functionalComponent) (sbol:module)"
+            sub_predicates = ['sbol:functionalComponent', 'sbol:module']
 
-        if len(definitions) > 0:
-            definition_pattern = self.construct_definition_pattern(definitions, sub_label, sub_entity_label)
+        contains_pattern = Group(Values(Var('contains'), sub_predicates),
+                                 Triple(Var(entity_label), Var('contains'), Var(sub_label)))
 
-            return """
-            VALUES (?contains) {{ {sp} }}
-            ?{el} ?contains ?{sl} .
-            {dp}
-            """.format(el=entity_label, sl=sub_label, dp=definition_pattern, sp=sub_predicate)
+        if len(definitions) > 0:
+            return Group(contains_pattern,
+                         self.construct_definition_pattern(definitions, sub_label, sub_entity_label))
         elif len(sub_entity_pattern) > 0:
-            return """
-            VALUES (?contains) {{ {sp} }}
-            ?{el} ?contains ?{sl} .
-            ?{sl} sbol:definition ?{sel} .
-            {sep}
-            """.format(el=entity_label, sl=sub_label, sel=sub_entity_label, sep=sub_entity_pattern, sp=sub_predicate)
+            return Group(contains_pattern,
+                         Triple(Var(sub_label), 'sbol:definition', Var(sub_entity_label)),
+                         sub_entity_pattern)
         else:
-            return ""
+            return Group()
 
     def construct_name_pattern(self, entity_label='entity', is_optional=True):
-        if is_optional:
-            return """
-            OPTIONAL {{
-                ?{el} dcterms:title ?name .
-            }}
-            """.format(el=entity_label)
-        else:
-            return """
-            ?{el} dcterms:title ?name .
-            """.format(el=entity_label)
+        name_pattern = Triple(Var(entity_label), 'dcterms:title', Var('name'))
+
+        return Group(Optional(name_pattern) if is_optional else name_pattern)
 
     def construct_description_pattern(self, entity_label='entity', is_optional=True):
-        if is_optional:
-            return """
-            OPTIONAL {{
-                ?{el} dcterms:description ?description .
-            }}
-            """.format(el=entity_label)
-        else:
-            return """
-            ?{el} dcterms:description ?description .
-            """.format(el=entity_label)
+        description_pattern = Triple(Var(entity_label), 'dcterms:description', Var('description'))
+
+        return Group(Optional(description_pattern) if is_optional else description_pattern)
 
     def construct_sequence_pattern(self, entity_label='entity'):
-        # if is_optional:
-        #     return """
-        #     OPTIONAL {{
-        #         ?{el} sbol:sequence ?seq .
-        #         ?seq sbol:elements ?sequence .
-        #     }}
-        #     """.format(el=entity_label)
-        # else:
-        return """
-        ?{el} sbol:sequence ?seq .
-        ?seq sbol:elements ?sequence .
-        """.format(el=entity_label)
+        return Group(Triple(Var(entity_label), 'sbol:sequence', Var('seq')),
+                     Triple(Var('seq'), 'sbol:elements', Var('sequence')))
 
     def construct_feature_pattern(self, entity_label='entity', sub_label='sub',
                                   sub_entity_label='feature'):
-        return """
-        ?{el} sbol:sequenceAnnotation ?seqAnno ;
-            sbol:component ?{sl} .
-        ?seqAnno sbol:component ?{sl} ;
-            sbol:location ?location .
-        ?location sbol:start ?start ;
-            sbol:end ?end .
-        ?{sl} sbol:definition ?{sel}
-        """.format(el=entity_label, sl=sub_label, sel=sub_entity_label)
+        return Group(Triple(Var(entity_label), 'sbol:sequenceAnnotation', Var('seqAnno')),
+                     Triple(Var(entity_label), 'sbol:component', Var(sub_label)),
+                     Triple(Var('seqAnno'), 'sbol:component', Var(sub_label)),
+                     Triple(Var('seqAnno'), 'sbol:location', Var('location')),
+                     Triple(Var('location'), 'sbol:start', Var('start')),
+                     Triple(Var('location'), 'sbol:end', Var('end')),
+                     Triple(Var(sub_label), 'sbol:definition', Var(sub_entity_label)))
 
     def construct_rdf_type_pattern(self, rdf_type, entity_label='entity'):
-        return """
-        ?{el} rdf:type <{rt}> .
-        """.format(el=entity_label, rt=rdf_type)
+        return Group(Triple(Var(entity_label), 'rdf:type', IRI(rdf_type)))
 
     def construct_entity_pattern(self, types=[], roles=[], all_types=True, sub_entity_pattern="", definitions=[],
                                  entity_label='entity', other_entity_labels=[], type_label='type', role_label='role',
                                  sub_label='sub', sub_entity_label='sub_entity', rdf_type=None, custom_properties=[]):
         if len(types) > 0 or len(roles) > 0 or len(sub_entity_pattern) > 0 or len(definitions) > 0 or rdf_type is not None:
-            type_pattern = self.construct_type_pattern(types, all_types, entity_label, type_label)
-
-            role_pattern = self.construct_role_pattern(roles, entity_label, role_label)
-
-            sub_pattern = self.construct_sub_pattern(sub_entity_pattern, definitions, entity_label, sub_label,
-                                                     sub_entity_label)
+            entity_pattern = Group(self.construct_type_pattern(types, all_types, entity_label, type_label),
+                                   self.construct_role_pattern(roles, entity_label, role_label),
+                                   self.construct_sub_pattern(sub_entity_pattern, definitions, entity_label, sub_label,
+                                                              sub_entity_label))
 
             if rdf_type is not None:
-                rdf_type_pattern = self.construct_rdf_type_pattern(rdf_type, entity_label)
-            else:
-                rdf_type_pattern = ""
+                entity_pattern.add(self.construct_rdf_type_pattern(rdf_type, entity_label))
 
             if 'name' in other_entity_labels:
-                name_pattern = self.construct_name_pattern(entity_label)
-            else:
-                name_pattern = ""
+                entity_pattern.add(self.construct_name_pattern(entity_label))
 
             if 'description' in other_entity_labels:
-                description_pattern = self.construct_description_pattern(entity_label)
-            else:
-                description_pattern = ""
+                entity_pattern.add(self.construct_description_pattern(entity_label))
 
             if 'sequence' in other_entity_labels:
-                sequence_pattern = self.construct_sequence_pattern(entity_label)
-            else:
-                sequence_pattern = ""
+                entity_pattern.add(self.construct_sequence_pattern(entity_label))
 
             if 'feature' in other_entity_labels:
-                feature_pattern = self.construct_feature_pattern(entity_label,
-                                                                 sub_label)
-            else:
-                feature_pattern = ""
+                entity_pattern.add(self.construct_feature_pattern(entity_label,
+                                                                  sub_label))
 
             if len(custom_properties) > 0:
-                custom_pattern = self.construct_custom_pattern(custom_properties, entity_label)
-            else:
-                custom_pattern = ""
-
-            return """
-            {tp}
-            {rp}
-            {sp}
-            {rt}
-            {np}
-            {dp}
-            {qp}
-            {fp}
-            {cp}
-            """.format(tp=type_pattern, rp=role_pattern, sp=sub_pattern, rt=rdf_type_pattern, np=name_pattern,
-                       dp=description_pattern, qp=sequence_pattern, fp=feature_pattern, cp=custom_pattern)
+                entity_pattern.add(self.construct_custom_pattern(custom_properties, entity_label))
+
+            return entity_pattern
         else:
-            return ""
+            return Group()
 
     def construct_collection_pattern(self, collections=[], member_label='entity', members=[], member_cardinality='*',
                                      entity_label='entity', collection_label='collection'):
@@ -406,72 +584,66 @@ class SBOLQuery():
 
             member_pattern = construct_member_pattern(members, entity_label, member_cardinality)
         except:
-            member_pattern = ""
+            member_pattern = Group()
 
+        collection_pattern = Group()
         if len(collections) > 0:
-            if len(members) > 0:
-                return """
-                VALUES (?{cl}) {{ {col} }}
-                VALUES (?{ml}) {{ {mem} }}
-                ?{cl} sbol:member ?{ml} .
-                {mp}
-                """.format(col=self.serialize_options(collections), cl=collection_label,
-                           mem=self.serialize_options(members), ml=member_label, mp=member_pattern)
-            else:
-                return """
-                VALUES (?{cl}) {{ {col} }}
-                ?{cl} sbol:member ?{ml} .
-                {mp}
-                """.format(col=self.serialize_options(collections), cl=collection_label, ml=member_label,
-                           mp=member_pattern)
-        else:
-            if len(members) > 0:
-                return """
-                VALUES (?{ml}) {{ {mem} }}
-                ?{cl} sbol:member ?{ml} .
-                {mp}
-                """.format(cl=collection_label, mem=self.serialize_options(members), ml=member_label,
-                           mp=member_pattern)
-            else:
-                return """
-                ?{cl} sbol:member ?{ml} .
-                {mp}
-                """.format(cl=collection_label, ml=member_label, mp=member_pattern)
+            collection_pattern.add(Values(Var(collection_label), iris(collections)))
+        if len(members) > 0:
+            collection_pattern.add(Values(Var(member_label), iris(members)))
+        collection_pattern.add(Triple(Var(collection_label), 'sbol:member', Var(member_label)))
+        collection_pattern.add(member_pattern)
+
+        return collection_pattern
 
     def construct_experiment_pattern(self, experiments=[], entity_label='entity', sample_cardinality='*'):
         if len(sample_cardinality) > 0:
-            derivation_path = 'prov:wasDerivedFrom{sc}/sbol:built'.format(sc=sample_cardinality)
+            derivation_path = Seq(Repeat('prov:wasDerivedFrom', sample_cardinality), 'sbol:built')
         else:
             derivation_path = 'sbol:built'
 
-        if len(experiments) == 0:
-            return """
-            ?exp sd2:experimentalData ?data .
-            ?data prov:wasDerivedFrom ?sample .
-            ?sample {dp} ?{el} .
-            """.format(el=entity_label, dp=derivation_path)
-        elif len(experiments) == 1:
-            return """
-            {exp} sd2:experimentalData ?data .
-            ?data prov:wasDerivedFrom ?sample .
-            ?sample {dp} ?{el} .
-            """.format(exp=self.serialize_objects(experiments), el=entity_label, dp=derivation_path)
+        experiment_pattern = Group()
+        if len(experiments) == 1 and not self.project_experiments:
+            experiment = iris(experiments)[0]
         else:
-            return """
-            VALUES (?exp) {{ {exp} }}
-            ?exp sd2:experimentalData ?data .
-            ?data prov:wasDerivedFrom ?sample .
-            ?sample {dp} ?{el} .
-            """.format(exp=self.serialize_options(experiments), el=entity_label, dp=derivation_path)
+            experiment = Var('exp')
+            if len(experiments) > 1:
+                experiment_pattern.add(Values(experiment, iris(experiments)))
+
+        experiment_pattern.add(Triple(experiment, 'sd2:experimentalData', Var('data')))
+        experiment_pattern.add(Triple(Var('data'), 'prov:wasDerivedFrom', Var('sample')))
+        experiment_pattern.add(Triple(Var('sample'), derivation_path, Var(entity_label)))
+
+        return experiment_pattern
 
     # Constructs a SPARQL query for all members of the specified collection with
     # at least one of the specified types (or all of the specified types) and
     # at least one of the specified roles.
+    @memoize_builder()
     def construct_collection_entity_query(self, collections, member_label='entity', types=[], roles=[],
                                           all_types=True, sub_types=[], sub_roles=[], definitions=[],
                                           all_sub_types=True, entity_label=None, other_entity_labels=[],
                                           members=[], member_cardinality='+', rdf_type=None, entity_depth=1,
                                           custom_properties=[], sub_entity_label='sub_entity'):
+        select = self.construct_collection_entity_select(collections, member_label, types, roles, all_types,
+                                                         sub_types, sub_roles, definitions, all_sub_types,
+                                                         entity_label, other_entity_labels, members,
+                                                         member_cardinality, rdf_type, entity_depth,
+                                                         custom_properties, sub_entity_label)
+        if select is None:
+            return ""
+        elif self.OPTIMIZE_QUERIES:
+            return serialize(optimize(select))
+
+        return serialize(select)
+
+    # Constructs the query of construct_collection_entity_query as a Select node, to be rewritten before it is
+    # serialized. Returns None if entity_depth is neither 1 nor 2.
+    def construct_collection_entity_select(self, collections, member_label='entity', types=[], roles=[],
+                                           all_types=True, sub_types=[], sub_roles=[], definitions=[],
+                                           all_sub_types=True, entity_label=None, other_entity_labels=[],
+                                           members=[], member_cardinality='+', rdf_type=None, entity_depth=1,
+                                           custom_properties=[], sub_entity_label='sub_entity'):
         target_labels = []
         if len(collections) > 1 or len(collections) == 0:
             target_labels.append('collection')
@@ -495,17 +667,7 @@ class SBOLQuery():
                                                                  member_cardinality, entity_label)
 
         if entity_depth == 1:
-            return """
-            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-            PREFIX sbol: <http://sbols.org/v2#>
-            PREFIX sd2: <http://sd2e.org#>
-            PREFIX prov: <http://www.w3.org/ns/prov#>
-            PREFIX dcterms: <http://purl.org/dc/terms/>
-            SELECT DISTINCT ?{tl} WHERE {{
-                {cp1}
-                {ep1}
-            }}
-            """.format(tl=' ?'.join(target_labels), cp1=collection_pattern_1, ep1=entity_pattern_1)
+            return Select(target_labels, Group(collection_pattern_1, entity_pattern_1), distinct=True)
         elif entity_depth == 2:
             sub_sub_entity_pattern = self.construct_entity_pattern(types=sub_types, roles=sub_roles,
                                                                    all_types=all_sub_types,
@@ -520,68 +682,43 @@ class SBOLQuery():
             collection_pattern_2 = self.construct_collection_pattern(collections, member_label, members,
                                                                      member_cardinality)
 
-            return """
-            PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-            PREFIX sbol: <http://sbols.org/v2#>
-            PREFIX sd2: <http://sd2e.org#>
-            PREFIX prov: <http://www.w3.org/ns/prov#>
-            PREFIX dcterms: <http://purl.org/dc/terms/>
-            SELECT DISTINCT ?{tl} WHERE {{ {{
-                {cp1}
-                {ep1}
-            }} UNION {{
-                {cp2}
-                {ep2}
-            }} }}
-            """.format(tl=' ?'.join(target_labels), cp1=collection_pattern_1, cp2=collection_pattern_2,
-                       ep1=entity_pattern_1, ep2=entity_pattern_2)
+            return Select(target_labels, Group(Union(Group(collection_pattern_1, entity_pattern_1),
+                                                     Group(collection_pattern_2, entity_pattern_2))),
+                          distinct=True)
         else:
-            return ""
+            return None
 
+    @memoize_builder()
     def construct_unit_query(self, unit_id=None, name=None, symbol=None):
         if unit_id is not None or name is not None or symbol is not None:
             unit_query_fragments = []
+            english = Filter(Expr('lang(?name) = {}', Literal('en')))
 
             if unit_id is not None:
                 om_uri = '/'.join([SBOLConstants.OM_NS[:-1], unit_id])
 
-                unit_query_fragments.append("""
-                    VALUES (?uri) {{ {uri} }}
-                    ?uri rdfs:label ?name ;
-                        om:symbol ?symbol .
-                    FILTER( lang(?name) = "en" )
-                """.format(uri=self.serialize_options([om_uri])))
+                unit_query_fragments.append(Group(Values(Var('uri'), [IRI(om_uri)]),
+                                                  Triple(Var('uri'), 'rdfs:label', Var('name')),
+                                                  Triple(Var('uri'), 'om:symbol', Var('symbol')),
+                                                  english))
 
             if name is not None:
-                unit_query_fragments.append("""
-                    VALUES (?name) {{ {nam} }}
-                    ?uri rdfs:label ?name ;
-                        om:symbol ?symbol .
-                    FILTER( lang(?name) = "en" || lang(?name) = "nl" )
-                """.format(nam=self.serialize_literal_options([name])))
+                unit_query_fragments.append(Group(Values(Var('name'), [Literal(name)]),
+                                                  Triple(Var('uri'), 'rdfs:label', Var('name')),
+                                                  Triple(Var('uri'), 'om:symbol', Var('symbol')),
+                                                  Filter(Expr('lang(?name) = {} || lang(?name) = {}',
+                                                              Literal('en'), Literal('nl')))))
 
             if symbol is not None:
-                unit_query_fragments.append("""
-                    ?uri rdfs:label ?name ;
-                        om:symbol "{sym}" .
-                    FILTER( lang(?name) = "en" )
-                """.format(sym=symbol))
-
-                unit_query_fragments.append("""
-                    ?uri rdfs:label ?name ;
-                        om:alternativeSymbol "{sym}" .
-                    FILTER( lang(?name) = "en" )
-                """.format(sym=symbol))
-
-            unit_query_body = """
-            } UNION {
-            """.join(unit_query_fragments)
-
-            return """
-            SELECT ?uri ?name ?symbol WHERE {{ {{
-            {bod}
-            }} }}
-            """.format(bod=unit_query_body)
+                unit_query_fragments.append(Group(Triple(Var('uri'), 'rdfs:label', Var('name')),
+                                                  Triple(Var('uri'), 'om:symbol', Literal(symbol)),
+                                                  english))
+
+                unit_query_fragments.append(Group(Triple(Var('uri'), 'rdfs:label', Var('name')),
+                                                  Triple(Var('uri'), 'om:alternativeSymbol', Literal(symbol)),
+                                                  english))
+
+            return serialize(Select(['uri', 'name', 'symbol'], Group(Union(*unit_query_fragments))))
         else:
             return ""
 
@@ -641,23 +778,22 @@ class SBOLQuery():
 
             formatted = []
 
-            for binding in query_result['results']['bindings']:
+            for binding in iter_bindings(query_result):
                 formatted.append(self.__format_group_binding(binding, binding_keys))
         else:
             formatted = {}
 
             if group_key is not None:
-                for binding in query_result['results']['bindings']:
+                for binding in iter_bindings(query_result):
                     self.__format_group(formatted, binding, binding_keys, group_key)
             elif len(binding_keys) < 2 and sub_group_key is None:
-                for binding in query_result['results']['bindings']:
+                for binding in iter_bindings(query_result):
                     self.__format_group(formatted, binding, binding_keys, entity_key)
             else:
-                for binding in query_result['results']['bindings']:
+                for binding in iter_bindings(query_result):
                     self.__format_entity(formatted, binding, binding_keys, entity_key)
 
-                if sub_group_key is not None:
-                    for binding in query_result['results']['bindings']:
+                    if sub_group_key is not None:
                         entity_value = binding[entity_key]['value']
 
                         if sub_group_key not in formatted[entity_value]:
@@ -703,6 +839,9 @@ class SBOLQuery():
         else:
             sample_cardinality = ''
 
+        if self.project_experiments:
+            other_comp_labels = other_comp_labels + ['exp']
+
         comp_query = self.construct_collection_entity_query(collections, 'exp', types, roles, all_types, sub_types,
                                                             sub_roles, definitions, all_sub_types, comp_label,
                                                             other_comp_labels, experiments, sample_cardinality,
@@ -719,6 +858,9 @@ class SBOLQuery():
         else:
             sample_cardinality = ''
 
+        if self.project_experiments:
+            other_mod_labels = other_mod_labels + ['exp']
+
         mod_query = self.construct_collection_entity_query(collections, 'exp', roles=roles, sub_types=sub_types,
                                                            sub_roles=sub_roles, definitions=definitions,
                                                            all_sub_types=all_sub_types, entity_label=mod_label,
@@ -761,7 +903,42 @@ class SBOLQuery():
 
         return self.fetch_SPARQL(self._server, mod_query)
 
+    # With an existence cache, only the members whose membership is unknown are queried, and the result lists the
+    # members found, by the cache or the query, in the SPARQL JSON format.
     def query_collection_members(self, collections=[], members=[], rdf_type=None):
+        if self.existence_cache is None or len(members) == 0:
+            return self.__query_collection_members(collections, members, rdf_type)
+
+        found = collections_module.OrderedDict()
+        unknown = []
+        for member in members:
+            containing = self.existence_cache.get(member, rdf_type, collections)
+            if containing is None:
+                unknown.append(member)
+            else:
+                found[member] = containing
+
+        bindings = (list(iter_bindings(self.__query_collection_members(collections, unknown, rdf_type)))
+                    if unknown else [])
+
+        queried = collections_module.OrderedDict((member, []) for member in unknown)
+        for binding in bindings:
+            collection = binding['collection']['value'] if 'collection' in binding else collections[0]
+            queried.setdefault(binding['entity']['value'], []).append(collection)
+        for member, containing in queried.items():
+            self.existence_cache.put(member, rdf_type, collections, containing)
+
+        variables = ['entity'] if len(collections) == 1 else ['collection', 'entity']
+        for member, containing in found.items():
+            for collection in containing:
+                binding = {'entity': {'type': 'uri', 'value': member}}
+                if len(collections) != 1:
+                    binding['collection'] = {'type': 'uri', 'value': collection}
+                bindings.append(binding)
+
+        return {'head': {'vars': variables}, 'results': {'bindings': bindings}}
+
+    def __query_collection_members(self, collections, members, rdf_type):
         mem_query = self.construct_collection_entity_query(collections, members=members, rdf_type=rdf_type)
 
         return self.fetch_SPARQL(self._server, mem_query)
@@ -799,6 +976,17 @@ class SBOLQuery():
         return ', '.join([literal.format(obj) for obj in objects])
 
 
+make_cancellable(SBOLQuery)
+make_iterable(SBOLQuery)
+
+
+# Returns the IRI term of text written as <IRI>, or else make_term(text).
+def _bracketed_iri(text, make_term):
+    if text.startswith('<') and text.endswith('>'):
+        return IRI(text[1:-1])
+    return make_term(text)
+
+
 def loadSBOLFile(sbolFile):
     sbolDoc = Document()
     sbolDoc.read(sbolFile)
@@ -10,3 +10,6 @@ from synbiohub_adapter.SynBioHubUtil import (
 from synbiohub_adapter.query_synbiohub import (
     SynBioHubQuery
 )
+from synbiohub_adapter.async_query import (
+    AsyncSynBioHubQuery
+)
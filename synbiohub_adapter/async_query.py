@@ -0,0 +1,237 @@
+import asyncio
+import collections
+
+from synbiohub_adapter.query_synbiohub import SynBioHubQuery
+from synbiohub_adapter.transport import check_status
+from synbiohub_adapter.resilience import RetryPolicy, CircuitBreaker, RETRYABLE_ERRORS
+from synbiohub_adapter.cancellation import QueryTimeoutError, QueryCancelledError
+from synbiohub_adapter.query_cache import cache_key
+from synbiohub_adapter.single_flight import AsyncSingleFlight
+from SPARQLWrapper import SPARQLExceptions
+
+'''
+    This module provides an asyncio client exposing the query methods of SynBioHubQuery as coroutines.
+
+    The async client does not duplicate any query logic. Each query method of SynBioHubQuery is run against
+    a replay object: whenever the method asks for a SPARQL result that has not been fetched yet, the method
+    is interrupted, the query is sent without blocking the event loop, and the method is re-run with the
+    results fetched so far. The query builders and format_query_result are therefore shared with the
+    blocking client.
+
+    Requires the optional aiohttp dependency (pip install synbiohub_adapter[async]).
+'''
+
+
+class AsyncSynBioHubQuery():
+    ''' An asyncio counterpart of SynBioHubQuery.
+
+        Every query_* method of SynBioHubQuery is available on this class as a coroutine taking the same
+        arguments, including timeout and cancel_token. At most max_in_flight requests are sent to SynBioHub
+        at the same time, and identical queries made at the same time share one request.
+    '''
+
+    # server: The SynBioHub server to call sparql queries on.
+    # max_in_flight: The maximum number of concurrent requests sent by this instance.
+    # pool_size: The maximum number of keep-alive connections kept open to SynBioHub.
+    # retry_policy: The RetryPolicy applied to every request. By default, up to 3 attempts with exponential backoff
+    #   and a circuit breaker owned by this instance.
+    # timeout: The default number of seconds after which a query method raises QueryTimeoutError, or None.
+    # session: A SynBioHubSession providing the user and authentication key, shared with other clients.
+    #   Logins through the session run in a worker thread, outside of the event loop.
+    # single_flight: The AsyncSingleFlight through which identical queries share one request. By default, one owned
+    #   by this instance.
+    def __init__(self, server, user=None, authentication_key=None, spoofed_url=None, max_in_flight=10,
+                 pool_size=10, retry_policy=None, timeout=None, session=None, single_flight=None):
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError('AsyncSynBioHubQuery requires aiohttp: pip install synbiohub_adapter[async]')
+
+        self._server = server
+        self.user = user
+        self.authentication_key = authentication_key
+        self.spoofed_url = spoofed_url
+        self.max_in_flight = max_in_flight
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        self.session = session
+        if session is not None:
+            self.user = session.email
+
+        if retry_policy is None:
+            retry_policy = RetryPolicy(retryable_errors=RETRYABLE_ERRORS + (aiohttp.ClientConnectionError,),
+                                       circuit_breaker=CircuitBreaker())
+        self.retry_policy = retry_policy
+
+        if single_flight is None:
+            single_flight = AsyncSingleFlight()
+        self.single_flight = single_flight
+
+        self._aiohttp = aiohttp
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    # The session and semaphore are created lazily so that they are bound to the running event loop.
+    def __get_session(self):
+        if self._session is None:
+            connector = self._aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = self._aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def login(self, user, password):
+        if '/sparql' not in self._server:
+            self._server += '/sparql'
+        p = self._server.find('/sparql')
+        resource = self._server[:p]
+
+        content = await self.__request('POST', resource + '/login', data={'email': user, 'password': password},
+                                       headers={'Accept': 'text/plain'})
+
+        self.user = user
+        self.authentication_key = content.decode('utf-8')
+
+    async def fetch_SPARQL(self, server, query):
+        user = self.user if self.authentication_key or self.session is not None else None
+
+        return await self.single_flight.call(cache_key(self._server, user, 'json', query), self.__fetch_authenticated,
+                                             query)
+
+    # Returns the number of queries sent through fetch_SPARQL and the number of requests saved by sharing the
+    # result of an identical query in flight.
+    def single_flight_stats(self):
+        return self.single_flight.stats()
+
+    async def __fetch_authenticated(self, query):
+        if self.session is None:
+            return await self.__fetch_SPARQL(query)
+
+        loop = asyncio.get_event_loop()
+        token = await loop.run_in_executor(None, self.session.get_token)
+        self.authentication_key = token
+        try:
+            return await self.__fetch_SPARQL(query)
+        except SPARQLExceptions.Unauthorized:
+            self.authentication_key = await loop.run_in_executor(None, self.session.refresh, token)
+            return await self.__fetch_SPARQL(query)
+
+    async def __fetch_SPARQL(self, query):
+        replay = _ReplayQuery(self, [])
+
+        query, headers = replay.prepare_SPARQL(query)
+        content = await self.__request('GET', self._server, params={'query': query}, headers=headers)
+
+        return replay.parse_SPARQL_response(content)
+
+    async def __request(self, method, url, params=None, data=None, headers=None):
+        return await self.retry_policy.call_async(self.__send, method, url, params, data, headers)
+
+    async def __send(self, method, url, params, data, headers):
+        session = self.__get_session()
+
+        async with self._semaphore:
+            async with session.request(method, url, params=params, data=data, headers=headers) as response:
+                content = await response.read()
+
+                check_status(response.status, content)
+                response.raise_for_status()
+
+                return content
+
+    def format_query_result(self, query_result, binding_keys, group_key=None, sort_key=None, entity_key=None,
+                            sub_binding_keys=[], sub_group_key=None):
+        return _ReplayQuery(self, []).format_query_result(query_result, binding_keys, group_key, sort_key,
+                                                          entity_key, sub_binding_keys, sub_group_key)
+
+    # Runs a query method within its timeout. Timing out or cancelling the call cancels the pending request,
+    # which aborts it and frees its connection.
+    async def _run_query_method(self, method_name, args, kwargs, timeout=None, cancel_token=None):
+        if timeout is None:
+            timeout = self.timeout
+
+        task = asyncio.ensure_future(self.__replay_query_method(method_name, args, kwargs))
+
+        if cancel_token is not None:
+            loop = asyncio.get_event_loop()
+
+            def cancel():
+                loop.call_soon_threadsafe(task.cancel)
+
+            cancel_token.add_callback(cancel)
+
+        try:
+            return await asyncio.wait_for(task, timeout)
+        except asyncio.TimeoutError:
+            raise QueryTimeoutError(timeout)
+        except asyncio.CancelledError:
+            if cancel_token is not None and cancel_token.cancelled:
+                raise QueryCancelledError()
+            raise
+        finally:
+            if cancel_token is not None:
+                cancel_token.remove_callback(cancel)
+
+    async def __replay_query_method(self, method_name, args, kwargs):
+        results = []
+
+        while True:
+            replay = _ReplayQuery(self, results)
+
+            try:
+                return getattr(replay, method_name)(*args, **kwargs)
+            except _PendingQuery as pending:
+                results.append(await self.fetch_SPARQL(self._server, pending.query))
+
+
+class _ReplayQuery(SynBioHubQuery):
+    ''' A SynBioHubQuery that answers fetch_SPARQL from results that were already fetched, in order,
+        and raises _PendingQuery for the first query whose result is not available yet.
+    '''
+
+    def __init__(self, client, results):
+        self._server = client._server
+        self.user = client.user
+        self.authentication_key = client.authentication_key
+        self.spoofed_url = client.spoofed_url
+        self._results = collections.deque(results)
+
+    def fetch_SPARQL(self, server, query):
+        if len(self._results) > 0:
+            return self._results.popleft()
+
+        raise _PendingQuery(query)
+
+
+class _PendingQuery(Exception):
+
+    def __init__(self, query):
+        self.query = query
+
+
+def _make_query_method(method_name):
+    async def query_method(self, *args, timeout=None, cancel_token=None, **kwargs):
+        return await self._run_query_method(method_name, args, kwargs, timeout, cancel_token)
+
+    query_method.__name__ = method_name
+    query_method.__qualname__ = 'AsyncSynBioHubQuery.' + method_name
+    query_method.__doc__ = getattr(SynBioHubQuery, method_name).__doc__
+
+    return query_method
+
+
+for _method_name in dir(SynBioHubQuery):
+    if _method_name.startswith('query_'):
+        setattr(AsyncSynBioHubQuery, _method_name, _make_query_method(_method_name))
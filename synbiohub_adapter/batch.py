@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor, CancelledError, wait, FIRST_EXCEPTION
+from SPARQLWrapper.SPARQLExceptions import Unauthorized
+
+'''
+    This module runs many query methods of a query client concurrently on a thread pool.
+'''
+
+# Errors after which the remaining calls of a batch are cancelled, since they would fail the same way.
+FATAL_ERRORS = (Unauthorized,)
+
+
+class BatchCallResult():
+    ''' The outcome of one call in a batch: either the value returned by the query method or the error it raised.
+    '''
+
+    def __init__(self, method_name, kwargs, value=None, error=None):
+        self.method_name = method_name
+        self.kwargs = kwargs
+        self.value = value
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.ok:
+            return 'BatchCallResult({}, ok)'.format(self.method_name)
+        else:
+            return 'BatchCallResult({}, error={!r})'.format(self.method_name, self.error)
+
+
+# Calls each (method name, kwargs) pair on the query client using at most max_workers threads.
+# Returns a list of BatchCallResult in the same order as calls. Errors are collected rather than raised,
+# except that the first error of a type in fatal_errors cancels every call that has not started yet.
+def run_many(query_client, calls, max_workers=10, fatal_errors=FATAL_ERRORS):
+    calls = [(method_name, kwargs if kwargs is not None else {}) for method_name, kwargs in calls]
+    results = [BatchCallResult(method_name, kwargs) for method_name, kwargs in calls]
+
+    if len(calls) == 0:
+        return results
+
+    def run_call(i):
+        method_name, kwargs = calls[i]
+        try:
+            results[i].value = getattr(query_client, method_name)(**kwargs)
+        except fatal_errors:
+            raise
+        except Exception as e:
+            results[i].error = e
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_call, i) for i in range(len(calls))]
+
+        done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+
+        if len(not_done) > 0:
+            for future in not_done:
+                future.cancel()
+            wait(not_done)
+
+    for i, future in enumerate(futures):
+        if future.cancelled():
+            results[i].error = CancelledError()
+        elif future.exception() is not None:
+            results[i].error = future.exception()
+
+    return results
@@ -0,0 +1,102 @@
+import collections
+import functools
+import threading
+
+'''
+    This module memoizes the query builders of SBOLQuery, so that building the same query again is a lookup.
+
+    A builder such as construct_collection_entity_query only formats its arguments into SPARQL templates, so its
+    result is determined by its arguments, the class of the query client, whose subclasses may override the
+    builders it calls, and the settings of the client named by its BUILDER_SETTINGS attribute, such as
+    OPTIMIZE_QUERIES, which may be set on an instance. The arguments are made hashable, lists becoming tuples and
+    dictionaries sorted tuples of items, and the queries built are kept in a bounded least recently used cache
+    shared by every instance.
+'''
+
+# The number of queries kept by each memoized builder
+BUILDER_CACHE_SIZE = 512
+
+
+# Returns a hashable equivalent of the argument of a builder, or raises TypeError if there is none.
+def freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    elif isinstance(value, dict):
+        return (dict, tuple(sorted((key, freeze(item)) for key, item in value.items())))
+    elif isinstance(value, (set, frozenset)):
+        return frozenset(freeze(item) for item in value)
+
+    hash(value)
+    return value
+
+
+# Decorates a builder method of SBOLQuery so that the queries it returns are kept in a BuilderCache of maxsize
+# entries, available as the cache attribute of the method, keyed by its arguments, the class of the client and the
+# values of the attributes of the client named by BUILDER_SETTINGS. The builder is called as is when one of these
+# cannot be made hashable.
+def memoize_builder(maxsize=BUILDER_CACHE_SIZE):
+    def decorate(method):
+        cache = BuilderCache(maxsize)
+
+        @functools.wraps(method)
+        def memoized(self, *args, **kwargs):
+            try:
+                settings = tuple(getattr(self, name) for name in getattr(self, 'BUILDER_SETTINGS', ()))
+                key = (type(self), freeze(settings), freeze(args), freeze(kwargs))
+            except TypeError:
+                return method(self, *args, **kwargs)
+
+            query = cache.get(key)
+            if query is None:
+                query = method(self, *args, **kwargs)
+                cache.put(key, query)
+
+            return query
+
+        memoized.cache = cache
+        return memoized
+
+    return decorate
+
+
+class BuilderCache():
+    ''' A thread safe least recently used cache of built queries.
+    '''
+
+    def __init__(self, maxsize=BUILDER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._queries = collections.OrderedDict()
+        self._counters = collections.Counter()
+
+    def get(self, key):
+        with self._lock:
+            query = self._queries.get(key)
+            if query is None:
+                self._counters['misses'] += 1
+            else:
+                self._queries.move_to_end(key)
+                self._counters['hits'] += 1
+
+            return query
+
+    def put(self, key, query):
+        with self._lock:
+            self._queries[key] = query
+            self._queries.move_to_end(key)
+
+            while len(self._queries) > self.maxsize:
+                self._queries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._queries.clear()
+
+    # Returns the hit, miss and eviction counters of the cache, along with the number of queries kept.
+    def stats(self):
+        with self._lock:
+            stats = {name: self._counters[name] for name in ['hits', 'misses', 'evictions']}
+            stats['entries'] = len(self._queries)
+
+        return stats
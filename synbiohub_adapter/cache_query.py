@@ -1,17 +1,23 @@
-import shelve
 from SPARQLWrapper.SPARQLExceptions import QueryBadFormed, EndPointNotFound, EndPointInternalError
+from .resilience import CircuitOpenError
+from .cancellation import QueryTimeoutError
+from .cache_store import SQLiteStore, migrate_shelve
+from .query_cache import cache_key
 import appdirs
 import os
 import errno
 
 # Not sure if complete list of exceptions that can be thrown
-# When query goes bad
+# When query goes bad. CircuitOpenError is raised without contacting the hub once queries keep failing.
+# A query that timed out falls back to the cache, but a query cancelled by the caller does not.
 _catch_exceptions = (
-    QueryBadFormed, EndPointNotFound, EndPointInternalError
+    QueryBadFormed, EndPointNotFound, EndPointInternalError, CircuitOpenError, QueryTimeoutError
 )
 
 db_dir = appdirs.user_cache_dir(appname='synbiohub_adapter')
-db_file = os.path.join(db_dir, 'queries.db')
+db_file = os.path.join(db_dir, 'queries.sqlite')
+# The shelve database used by earlier versions, whose entries are copied to db_file when it is first opened
+shelve_db_file = os.path.join(db_dir, 'queries.db')
 
 try:
     os.makedirs(db_dir)
@@ -24,31 +30,46 @@ except OSError as e:
         pass
 
 
-def wrap_query_fn(fn, db_file_path=None):
+# Returns the key of the result of fetch_SPARQL(server, query, result_format) for an anonymous user.
+def query_key(server, query, result_format=None):
+    return cache_key(server, None, result_format, query)
+
+
+# Returns the key of an entry of the shelve database of earlier versions, whose keys joined the server and the query.
+def _shelve_key(old_key):
+    server, separator, query = old_key.partition(', ')
+    return query_key(server, query) if len(separator) > 0 else None
+
+
+# Wraps fn, the fetch_SPARQL method of a query client, so that its results are stored, and returned instead of
+# raising when a later query fails. key_fn maps the arguments of fn to a cache key, see query_cache.cache_key.
+# The results are kept in an SQLite database shared by every process on the host, see cache_store.
+def wrap_query_fn(fn, db_file_path=None, key_fn=query_key):
     if db_file_path is None:
         db_file_path = db_file
+        store = SQLiteStore.open(db_file_path)
+        migrate_shelve(shelve_db_file, store, _shelve_key)
+    else:
+        store = SQLiteStore.open(db_file_path)
 
     def wrapped_fn(*args):
-        # Just join the args into one string as the query key
-        q_key = ", ".join((str(x) for x in args))
+        q_key = key_fn(*args)
 
         try:
             result = fn(*args)
             # Run the query function then cache the results
-            with shelve.open(db_file_path) as db:
-                db[q_key] = result
+            store.put(q_key, (None, result))
         except _catch_exceptions as e:
 
             # Query failed, try to load the results from the cache
             import sys
             sys.stderr.write('Query failed, using fallback cache: {}\n'.format(e))
 
-            try:
-                with shelve.open(db_file_path) as db:
-                    result = db[q_key]
-            except Exception:
+            entry = store.get(q_key)
+            if entry is None:
                 # If fail to get cached value, re-raise the original exception instead.
                 raise e
+            result = entry[1]
 
         return result
 
@@ -0,0 +1,438 @@
+import atexit
+import dbm
+import hashlib
+import lzma
+import os
+import pickle
+import shelve
+import sqlite3
+import threading
+import time
+import zlib
+
+'''
+    This module stores cached query results in an SQLite database, shared by every process on a host.
+
+    The database is opened in write-ahead logging (WAL) mode, so that readers never block the writer and processes
+    do not corrupt the file when they write concurrently. Each process holds one long-lived connection per database,
+    returned by SQLiteStore.open. Writes are queued and committed in batches, in a single transaction, and are
+    visible to the process that made them before they are committed.
+
+    Values are pickled and stored once per distinct content: an entry refers to a body, keyed by the SHA-256 digest
+    of the pickled value and compressed with zlib or lzma. Identical results cached under different keys, such as
+    the same list of strains reached through different collections, therefore share their storage. Bodies no longer
+    referred to are removed by purge_expired and clear.
+
+    An entry can be tagged with the URIs its value depends on. invalidate removes the entries tagged with any of
+    the given URIs and appends the URIs to an invalidation log, which the caches of other processes read through
+    invalidations_since to drop the copies they keep in memory.
+
+    export_snapshot writes the entries that have not expired to a single database file, which import_snapshot merges
+    into the store of another host, for instance to start jobs on compute nodes without network access with a warm
+    cache. Since values are pickled, only snapshots from a trusted source must be imported.
+
+    migrate_shelve copies the entries of a cache written by an earlier version, which used shelve.
+'''
+
+
+class SQLiteStore():
+    ''' A persistent mapping from string keys to (expiry time, value) entries, shared between processes.
+
+        An expiry time of None means that the entry never expires. An entry can hold a third element, the time after
+        which its value is stale but can still be used until it expires.
+    '''
+
+    # The number of seconds invalidations are kept in the log before purge_expired removes them.
+    log_retention = 7 * 24 * 3600
+
+    _stores = {}
+    _stores_lock = threading.Lock()
+
+    # Returns the store of this process for the database at path, opening it on the first call.
+    @classmethod
+    def open(cls, path, **kwargs):
+        key = (os.path.abspath(path), os.getpid())
+
+        with cls._stores_lock:
+            store = cls._stores.get(key)
+            if store is None or store.closed:
+                store = cls(path, **kwargs)
+                cls._stores[key] = store
+
+            return store
+
+    # path: The path of the database file, created if it does not exist.
+    # batch_size: The number of queued writes that triggers a commit.
+    # flush_interval: The maximum number of seconds writes stay queued.
+    # codec: The compression of the bodies written by this store, 'zlib', 'lzma' or None. Bodies written with any
+    #   codec can be read.
+    # compress_level: The compression level, from 0 to 9 for both codecs.
+    # timeout: The number of seconds to wait for another process to finish writing.
+    def __init__(self, path, batch_size=64, flush_interval=1.0, codec='zlib', compress_level=6, timeout=30.0):
+        if codec not in _CODECS:
+            raise ValueError('Unsupported compression codec: {}'.format(codec))
+
+        directory = os.path.dirname(path)
+        if len(directory) > 0:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.codec = codec
+        self.compress_level = compress_level
+        self.closed = False
+
+        self._lock = threading.RLock()
+        self._pending = {}
+        self._timer = None
+
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            self.__create_tables()
+
+        atexit.register(self.close)
+
+    # Returns the entry stored under key, or None.
+    def get(self, key):
+        with self._lock:
+            if key in self._pending:
+                pending = self._pending[key]
+                return pending[0] if pending is not None else None
+
+            row = self._conn.execute('SELECT entries.expires, bodies.codec, bodies.value, entries.stale FROM entries '
+                                     'JOIN bodies ON bodies.hash = entries.body WHERE entries.key = ?',
+                                     (key,)).fetchone()
+
+        if row is None:
+            return None
+
+        try:
+            value = _decode(row[1], row[2])
+        except (zlib.error, lzma.LZMAError, KeyError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+
+        return (row[0], value) if row[3] is None else (row[0], value, row[3])
+
+    # Returns the tags of the entry stored under key.
+    def tags(self, key):
+        with self._lock:
+            if key in self._pending:
+                pending = self._pending[key]
+                return pending[1] if pending is not None else frozenset()
+
+            return frozenset(row[0] for row in self._conn.execute('SELECT tag FROM tags WHERE key = ?', (key,)))
+
+    # Queues the entry to be stored under key, tagged with the given strings.
+    def put(self, key, entry, tags=()):
+        with self._lock:
+            self.__queue(key, (entry, frozenset(tags)))
+
+    # Queues the removal of the entry stored under key.
+    def delete(self, key):
+        with self._lock:
+            self.__queue(key, None)
+
+    def __queue(self, key, pending):
+        self._pending[key] = pending
+
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    # Commits the queued writes in one transaction.
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            if len(self._pending) == 0 or self.closed:
+                return
+
+            bodies = {}
+            rows = []
+            tags = []
+            for key, pending in self._pending.items():
+                if pending is not None:
+                    entry = pending[0]
+                    data = pickle.dumps(entry[1], pickle.HIGHEST_PROTOCOL)
+                    digest = hashlib.sha256(data).hexdigest()
+                    bodies[digest] = data
+                    rows.append((key, entry[0], digest, entry[2] if len(entry) > 2 else None))
+                    tags.extend((tag, key) for tag in pending[1])
+            keys = [(key,) for key in self._pending]
+
+            with self._conn:
+                # Bodies already stored, by this or another process, are neither compressed nor written again
+                new_bodies = [(digest, self.codec, sqlite3.Binary(_encode(self.codec, data, self.compress_level)),
+                               len(data)) for digest, data in bodies.items() if not self.__has_body(digest)]
+                self._conn.executemany('INSERT OR IGNORE INTO bodies (hash, codec, value, size) VALUES (?, ?, ?, ?)',
+                                       new_bodies)
+                self._conn.executemany('DELETE FROM entries WHERE key = ?', keys)
+                self._conn.executemany('DELETE FROM tags WHERE key = ?', keys)
+                self._conn.executemany('INSERT INTO entries (key, expires, body, stale) VALUES (?, ?, ?, ?)', rows)
+                self._conn.executemany('INSERT OR IGNORE INTO tags (tag, key) VALUES (?, ?)', tags)
+
+            self._pending.clear()
+
+    def __has_body(self, digest):
+        return self._conn.execute('SELECT 1 FROM bodies WHERE hash = ?', (digest,)).fetchone() is not None
+
+    def __create_tables(self):
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(entries)')]
+        if 'value' in columns:
+            # Entries written by an earlier version hold their value, compressed with zlib
+            self._conn.execute('ALTER TABLE entries RENAME TO old_entries')
+
+        self._conn.execute('CREATE TABLE IF NOT EXISTS entries '
+                           '(key TEXT PRIMARY KEY, expires REAL, body TEXT NOT NULL, stale REAL)')
+        if 'body' in columns and 'stale' not in columns:
+            self._conn.execute('ALTER TABLE entries ADD COLUMN stale REAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS bodies '
+                           '(hash TEXT PRIMARY KEY, codec TEXT, value BLOB NOT NULL, size INTEGER NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS entries_body ON entries (body)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS tags '
+                           '(tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key)) WITHOUT ROWID')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS tags_key ON tags (key)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS invalidations '
+                           '(id INTEGER PRIMARY KEY AUTOINCREMENT, time REAL NOT NULL, tags TEXT NOT NULL)')
+
+        if 'value' in columns:
+            for key, expires, value in self._conn.execute('SELECT key, expires, value FROM old_entries').fetchall():
+                data = zlib.decompress(value)
+                digest = hashlib.sha256(data).hexdigest()
+                self._conn.execute('INSERT OR IGNORE INTO bodies (hash, codec, value, size) VALUES (?, ?, ?, ?)',
+                                   (digest, 'zlib', value, len(data)))
+                self._conn.execute('INSERT OR REPLACE INTO entries (key, expires, body) VALUES (?, ?, ?)',
+                                   (key, expires, digest))
+            self._conn.execute('DROP TABLE old_entries')
+
+    # Removes the bodies and tags that no entry refers to.
+    def __collect_bodies(self):
+        self._conn.execute('DELETE FROM tags WHERE key NOT IN (SELECT key FROM entries)')
+        return self._conn.execute('DELETE FROM bodies WHERE hash NOT IN (SELECT body FROM entries)').rowcount
+
+    # Removes the entries tagged with any of tags, in this and every other process, and logs the tags as
+    # invalidated. Returns the number of entries removed and the id of the invalidation logged.
+    def invalidate(self, tags, now=None):
+        if now is None:
+            now = time.time()
+        tags = frozenset(tags)
+
+        with self._lock:
+            for key, pending in list(self._pending.items()):
+                if pending is not None and not pending[1].isdisjoint(tags):
+                    del self._pending[key]
+            self.flush()
+
+            count = 0
+            ordered = sorted(tags)
+            with self._conn:
+                # SQLite limits the number of parameters of a statement
+                for i in range(0, len(ordered), 500):
+                    chunk = ordered[i:i + 500]
+                    marks = ', '.join('?' * len(chunk))
+                    count += self._conn.execute('DELETE FROM entries WHERE key IN (SELECT key FROM tags WHERE tag IN '
+                                                '({}))'.format(marks), chunk).rowcount
+                    self._conn.execute('DELETE FROM tags WHERE tag IN ({})'.format(marks), chunk)
+                logged = self._conn.execute('INSERT INTO invalidations (time, tags) VALUES (?, ?)',
+                                            (now, '\n'.join(ordered))).lastrowid
+
+            return count, logged
+
+    # Returns the id of the last invalidation logged, or 0.
+    def last_invalidation(self):
+        with self._lock:
+            return self._conn.execute('SELECT COALESCE(MAX(id), 0) FROM invalidations').fetchone()[0]
+
+    # Returns the (id, tags) of the invalidations logged by any process after the invalidation with id last.
+    def invalidations_since(self, last):
+        with self._lock:
+            rows = self._conn.execute('SELECT id, tags FROM invalidations WHERE id > ? ORDER BY id',
+                                      (last,)).fetchall()
+
+        return [(row[0], frozenset(row[1].split('\n'))) for row in rows]
+
+    # Removes the entries that expired before now, the bodies they alone referred to, and the invalidations logged
+    # more than log_retention seconds before now.
+    def purge_expired(self, now=None):
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            self.flush()
+            with self._conn:
+                count = self._conn.execute('DELETE FROM entries WHERE expires < ?', (now,)).rowcount
+                self.__collect_bodies()
+                self._conn.execute('DELETE FROM invalidations WHERE time < ?', (now - self.log_retention,))
+
+            return count
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            with self._conn:
+                self._conn.execute('DELETE FROM entries')
+                self._conn.execute('DELETE FROM tags')
+                self.__collect_bodies()
+
+    # Returns the number of entries, of distinct bodies, and the total size of the bodies before and after
+    # compression, in bytes.
+    def stats(self):
+        with self._lock:
+            self.flush()
+            entries = self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+            bodies, size, stored = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0), '
+                                                      'COALESCE(SUM(LENGTH(value)), 0) FROM bodies').fetchone()
+
+        return {'entries': entries, 'bodies': bodies, 'size': size, 'stored_size': stored}
+
+    def __len__(self):
+        with self._lock:
+            self.flush()
+            return self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    # Writes the entries of this store that have not expired at now, with their bodies and tags, to a new database
+    # file at path, replacing any file there. Returns the number of entries written.
+    def export_snapshot(self, path, now=None):
+        if now is None:
+            now = time.time()
+        partial_path = path + '.partial'
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+        with self._lock:
+            self.flush()
+            snapshot = sqlite3.connect(partial_path)
+            try:
+                self._conn.backup(snapshot)
+            except BaseException:
+                snapshot.close()
+                os.remove(partial_path)
+                raise
+
+        try:
+            with snapshot:
+                snapshot.execute('DELETE FROM entries WHERE expires < ?', (now,))
+                snapshot.execute('DELETE FROM tags WHERE key NOT IN (SELECT key FROM entries)')
+                snapshot.execute('DELETE FROM bodies WHERE hash NOT IN (SELECT body FROM entries)')
+                snapshot.execute('DELETE FROM invalidations')
+                snapshot.execute('DELETE FROM meta')
+            # The snapshot is a single file, without a write-ahead log
+            snapshot.execute('PRAGMA journal_mode=DELETE')
+            snapshot.execute('VACUUM')
+            count = snapshot.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        finally:
+            snapshot.close()
+
+        os.replace(partial_path, path)
+
+        return count
+
+    # Copies the entries of the snapshot at path into this store, replacing those with the same keys. Entries keep
+    # their expiry time, unless ttl is given: they then expire ttl seconds after now and are never stale. Returns
+    # the number of entries copied.
+    def import_snapshot(self, path, ttl=None, now=None):
+        if now is None:
+            now = time.time()
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+
+        with self._lock:
+            self.flush()
+            self._conn.execute('ATTACH DATABASE ? AS snapshot', (path,))
+            try:
+                with self._conn:
+                    self._conn.execute('INSERT OR IGNORE INTO bodies (hash, codec, value, size) '
+                                       'SELECT hash, codec, value, size FROM snapshot.bodies')
+                    self._conn.execute('DELETE FROM tags WHERE key IN (SELECT key FROM snapshot.entries)')
+                    if ttl is None:
+                        count = self._conn.execute('INSERT OR REPLACE INTO entries (key, expires, body, stale) '
+                                                   'SELECT key, expires, body, stale FROM snapshot.entries').rowcount
+                    else:
+                        count = self._conn.execute('INSERT OR REPLACE INTO entries (key, expires, body, stale) '
+                                                   'SELECT key, ?, body, NULL FROM snapshot.entries',
+                                                   (now + ttl,)).rowcount
+                    self._conn.execute('INSERT OR IGNORE INTO tags (tag, key) SELECT tag, key FROM snapshot.tags')
+                    self.__collect_bodies()
+            finally:
+                self._conn.execute('DETACH DATABASE snapshot')
+
+            return count
+
+    # Returns the value of a setting kept in the database, or None.
+    def get_meta(self, name):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE name = ?', (name,)).fetchone()
+
+        return row[0] if row is not None else None
+
+    def set_meta(self, name, value):
+        with self._lock:
+            with self._conn:
+                self._conn.execute('INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)', (name, value))
+
+    # Commits the queued writes and closes the connection.
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+
+            self.flush()
+            self._conn.close()
+            self.closed = True
+
+        atexit.unregister(self.close)
+
+
+_CODECS = {
+    None: (lambda data, level: data, lambda data: data),
+    'zlib': (lambda data, level: zlib.compress(data, level), zlib.decompress),
+    'lzma': (lambda data, level: lzma.compress(data, preset=level), lzma.decompress)
+}
+
+
+def _encode(codec, data, level):
+    return _CODECS[codec][0](data, level)
+
+
+def _decode(codec, value):
+    return pickle.loads(_CODECS[codec][1](value))
+
+
+# Copies every entry of the shelve database at shelve_path into store, as entries that never expire, unless it was
+# already copied. Returns the number of entries copied. key_fn maps the keys of the shelve database to those of
+# store, or returns None to skip an entry.
+def migrate_shelve(shelve_path, store, key_fn=None):
+    source = os.path.abspath(shelve_path)
+    if store.get_meta('migrated:' + source) is not None or dbm.whichdb(shelve_path) in (None, ''):
+        return 0
+
+    count = 0
+
+    with shelve.open(shelve_path, flag='r') as db:
+        for old_key in db.keys():
+            new_key = key_fn(old_key) if key_fn is not None else old_key
+            if new_key is None:
+                continue
+
+            try:
+                value = db[old_key]
+            except Exception:
+                # Entries that can no longer be unpickled are not worth keeping
+                continue
+
+            store.put(new_key, (None, value))
+            count += 1
+
+    store.flush()
+    store.set_meta('migrated:' + source, str(count))
+
+    return count
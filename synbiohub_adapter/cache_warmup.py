@@ -0,0 +1,199 @@
+import argparse
+import collections
+import fnmatch
+import itertools
+import json
+import sys
+
+from synbiohub_adapter.SynBioHubUtil import SD2Constants
+from synbiohub_adapter.query_synbiohub import SynBioHubQuery
+from synbiohub_adapter.query_cache import QueryCache, CACHE_PATH
+from synbiohub_adapter.cache_store import SQLiteStore
+from synbiohub_adapter.session import SynBioHubSession
+
+'''
+    This module fills the persistent query cache ahead of time and moves it between hosts as a snapshot file.
+
+    The warm command runs the query methods of SynBioHubQuery listed in a JSON manifest, in parallel, storing their
+    results in the cache. A manifest lists calls, each naming a query method or a pattern matching several, with
+    optional keyword arguments:
+
+        {"calls": [
+            {"method": "query_design_strains", "kwargs": {"verbose": true}},
+            {"method": "query_design_set_*", "for_each": {"collection": "query_design_sets"}}
+        ]}
+
+    for_each maps a keyword argument to the query method, or {"method": ..., "kwargs": ...}, whose result lists its
+    values: the call is made once for each of them, here for every design set. The default manifest is the one
+    above without its first call.
+
+    The export command writes the cache to a single snapshot file, and the import command merges a snapshot into
+    the cache of another host, such as a compute node without network access:
+
+        python -m synbiohub_adapter.cache_warmup warm -o design.snapshot
+        python -m synbiohub_adapter.cache_warmup import design.snapshot --ttl 86400
+
+    Cached results are keyed by user, so the cache must be warmed as the user the jobs query as. Snapshots hold
+    pickled results and must only be imported from a trusted source.
+'''
+
+DEFAULT_MANIFEST = {
+    'calls': [
+        {'method': 'query_design_set_*', 'for_each': {'collection': 'query_design_sets'}}
+    ]
+}
+
+
+# Returns the names of the query methods of SynBioHubQuery matching pattern.
+def query_methods(pattern):
+    names = sorted(name for name in dir(SynBioHubQuery)
+                   if name.startswith('query_') and fnmatch.fnmatchcase(name, pattern))
+    if len(names) == 0:
+        raise ManifestError('No query method matches {}'.format(pattern))
+
+    return names
+
+
+# Returns the values listed by the result of a query method: the items of a list, the keys of a dictionary, or the
+# values of the first variable of a SPARQL result.
+def result_values(result):
+    if isinstance(result, dict) and 'head' in result and 'results' in result:
+        variable = result['head']['vars'][0]
+        return [binding[variable]['value'] for binding in result['results']['bindings'] if variable in binding]
+    elif isinstance(result, dict):
+        return list(result.keys())
+    elif isinstance(result, (list, tuple, set)):
+        return list(result)
+
+    raise ManifestError('The result of type {} does not list values'.format(type(result).__name__))
+
+
+def _source(spec):
+    if isinstance(spec, str):
+        spec = {'method': spec}
+
+    return spec['method'], dict(spec.get('kwargs', {}))
+
+
+def _source_key(method, kwargs):
+    return method, json.dumps(kwargs, sort_keys=True)
+
+
+# Runs the calls of a manifest on sbh_query using at most workers threads. The sources of the for_each arguments
+# are run along with the calls without for_each, and the calls depending on them once they are known. Returns the
+# BatchCallResult of every call made, including the sources.
+def warm(sbh_query, manifest, workers=10):
+    entries = manifest.get('calls', [])
+
+    calls = []
+    sources = collections.OrderedDict()
+    for entry in entries:
+        if 'for_each' in entry:
+            for spec in entry['for_each'].values():
+                method, kwargs = _source(spec)
+                sources[_source_key(method, kwargs)] = (method, kwargs)
+        else:
+            calls.extend((method, dict(entry.get('kwargs', {}))) for method in query_methods(entry['method']))
+
+    results = sbh_query.run_many(calls + list(sources.values()), max_workers=workers)
+
+    values = {}
+    for key, result in zip(sources.keys(), results[len(calls):]):
+        if result.ok:
+            values[key] = result_values(result.value)
+
+    dependent_calls = []
+    for entry in entries:
+        if 'for_each' not in entry:
+            continue
+
+        names = list(entry['for_each'].keys())
+        keys = [_source_key(*_source(spec)) for spec in entry['for_each'].values()]
+        # The calls depending on a source that failed are not made, the failure being reported with the source
+        if not all(key in values for key in keys):
+            continue
+
+        for method in query_methods(entry['method']):
+            for combination in itertools.product(*[values[key] for key in keys]):
+                kwargs = dict(entry.get('kwargs', {}))
+                kwargs.update(zip(names, combination))
+                dependent_calls.append((method, kwargs))
+
+    return results + sbh_query.run_many(dependent_calls, max_workers=workers)
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+
+    parser = argparse.ArgumentParser(description='Warm up, export and import the SynBioHub query cache.')
+    parser.add_argument('-c', '--cache', default=CACHE_PATH, help='Path of the query cache database')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    warm_parser = commands.add_parser('warm', help='Run the query methods of a manifest to fill the cache')
+    warm_parser.add_argument('-s', '--sparql', default=SD2Constants.SD2_SERVER + '/sparql',
+                             help='SPARQL endpoint of the SynBioHub instance')
+    warm_parser.add_argument('-e', '--email', help='User to query as, by default the public graph is queried')
+    warm_parser.add_argument('-p', '--password', help='Password of the user, prompted for if needed')
+    warm_parser.add_argument('-m', '--manifest', help='JSON manifest of the calls to make')
+    warm_parser.add_argument('-w', '--workers', type=int, default=10, help='Number of calls made at the same time')
+    warm_parser.add_argument('-o', '--snapshot', help='Snapshot file to export the cache to once warmed')
+
+    export_parser = commands.add_parser('export', help='Write the cache to a snapshot file')
+    export_parser.add_argument('snapshot')
+
+    import_parser = commands.add_parser('import', help='Merge a snapshot file into the cache')
+    import_parser.add_argument('snapshot')
+    import_parser.add_argument('--ttl', type=float,
+                               help='Number of seconds the imported results are kept, instead of their own TTLs')
+
+    args = parser.parse_args(args)
+
+    status = 0
+
+    if args.command == 'warm':
+        manifest = DEFAULT_MANIFEST
+        if args.manifest is not None:
+            with open(args.manifest) as manifest_file:
+                manifest = json.load(manifest_file)
+
+        session = None
+        if args.email is not None:
+            session = SynBioHubSession(args.sparql, args.email, args.password)
+
+        cache = QueryCache(path=args.cache)
+        sbh_query = SynBioHubQuery(args.sparql, session=session, cache=cache)
+        try:
+            results = warm(sbh_query, manifest, args.workers)
+        finally:
+            cache.close()
+
+        failed = [result for result in results if not result.ok]
+        for result in failed:
+            print('{}({}) failed: {}'.format(result.method_name, result.kwargs, result.error), file=sys.stderr)
+        print('{} calls, {} failed, {} cache misses'.format(len(results), len(failed), cache.stats()['misses']))
+        if len(failed) > 0:
+            status = 1
+
+    if args.command == 'export' or args.command == 'warm' and args.snapshot is not None:
+        count = SQLiteStore.open(args.cache).export_snapshot(args.snapshot)
+        print('{} results exported to {}'.format(count, args.snapshot))
+    elif args.command == 'import':
+        count = SQLiteStore.open(args.cache).import_snapshot(args.snapshot, args.ttl)
+        print('{} results imported from {}'.format(count, args.snapshot))
+
+    return status
+
+
+class ManifestError(Exception):
+
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+'''
+    This module bounds how long a query method of SBOLQuery may run and lets other threads cancel it.
+
+    Every query_* method accepts two keyword arguments: timeout, the number of seconds after which the call raises
+    QueryTimeoutError, and cancel_token, a CancellationToken whose cancel method makes the call raise
+    QueryCancelledError. Both apply to the whole call, including every SPARQL query it sends and any retries.
+
+    The limits of the running call are kept in a CallContext local to the calling thread. fetch_SPARQL consults it
+    before sending a request, while waiting for the response and between the chunks of the response body. A request
+    that is aborted is closed, so that its connection is not reused.
+
+    The CallContext also holds the name of the outermost query method called, which the query result cache uses to
+    choose how long results are kept.
+'''
+
+
+class CancellationToken():
+    ''' A flag that can be set from any thread to cancel the query method calls it was given to.
+    '''
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks)
+
+        for callback in callbacks:
+            callback()
+
+    # Waits until the token is cancelled or timeout seconds have passed. Returns whether the token was cancelled.
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+    # Calls callback once the token is cancelled, or immediately if it already is.
+    def add_callback(self, callback):
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+
+        callback()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+class CallContext():
+    ''' The deadline, the cancellation token and the name of the query method call running in a thread.
+    '''
+
+    def __init__(self, deadline=None, cancel_token=None, query_name=None):
+        self.deadline = deadline
+        self.cancel_token = cancel_token
+        self.query_name = query_name
+
+    @property
+    def active(self):
+        return self.deadline is not None or self.cancel_token is not None
+
+    # Returns the number of seconds left before the deadline, or None if there is no deadline.
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0)
+
+    # Raises QueryCancelledError or QueryTimeoutError if the call must stop.
+    def check(self):
+        if self.cancel_token is not None and self.cancel_token.cancelled:
+            raise QueryCancelledError()
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise QueryTimeoutError()
+
+    # Sleeps for delay seconds, waking up early if the call is cancelled, and raises if the call must stop.
+    def sleep(self, delay, sleep=time.sleep):
+        if self.cancel_token is not None:
+            self.cancel_token.wait(delay)
+        else:
+            sleep(delay)
+        self.check()
+
+    # Calls send, which sends an HTTP request and returns its response, raising as soon as the call is cancelled
+    # or times out. Since a blocking request cannot be interrupted, the request is then left to finish in the
+    # background and its response is closed. send runs within this context, whose limits it can apply to the
+    # waits before the request is sent.
+    def send(self, send):
+        self.check()
+
+        if self.cancel_token is None:
+            return send()
+
+        state = {}
+        finished = threading.Event()
+        lock = threading.Lock()
+
+        def run():
+            try:
+                with within_context(self):
+                    response = send()
+            except BaseException as e:
+                response = None
+                state['error'] = e
+
+            with lock:
+                if state.get('abandoned') and response is not None:
+                    response.close()
+                else:
+                    state['response'] = response
+                finished.set()
+
+        self.cancel_token.add_callback(finished.set)
+        try:
+            threading.Thread(target=run, daemon=True).start()
+            finished.wait(self.remaining())
+
+            with lock:
+                if 'response' not in state and 'error' not in state:
+                    state['abandoned'] = True
+                    self.check()
+                    raise QueryTimeoutError()
+        finally:
+            self.cancel_token.remove_callback(finished.set)
+
+        if 'error' in state:
+            raise state['error']
+
+        return state['response']
+
+    # Yields the chunks of a response body, closing the response and raising if the call must stop between chunks.
+    def iter_chunks(self, response, chunk_size):
+        try:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                self.check()
+                yield chunk
+        except BaseException:
+            response.close()
+            raise
+
+    # Reads a streamed response body, closing the response and raising if the call must stop between chunks.
+    def read(self, response, chunk_size):
+        try:
+            return b''.join(self.iter_chunks(response, chunk_size))
+        finally:
+            response.close()
+
+
+_NO_CONTEXT = CallContext()
+
+_local = threading.local()
+
+
+# Returns the CallContext of the query method call running in this thread.
+def current_context():
+    return getattr(_local, 'context', _NO_CONTEXT)
+
+
+# Runs the enclosed code with the given timeout and cancellation token. Nested calls keep the earliest deadline,
+# the token of the enclosing call unless they are given their own, and the query name of the enclosing call.
+@contextmanager
+def call_context(timeout=None, cancel_token=None, query_name=None):
+    outer = current_context()
+
+    deadline = outer.deadline
+    if timeout is not None:
+        deadline = time.monotonic() + timeout if deadline is None else min(deadline, time.monotonic() + timeout)
+
+    if cancel_token is None:
+        cancel_token = outer.cancel_token
+
+    if outer.query_name is not None:
+        query_name = outer.query_name
+
+    _local.context = CallContext(deadline, cancel_token, query_name)
+    try:
+        yield _local.context
+    finally:
+        _local.context = outer
+
+
+# Runs the enclosed code within an existing CallContext, such as that of a query method call whose result is read
+# after the call returned, or from another thread.
+@contextmanager
+def within_context(context):
+    outer = current_context()
+
+    _local.context = context
+    try:
+        yield context
+    finally:
+        _local.context = outer
+
+
+# Wraps a query method so that it accepts the timeout and cancel_token keyword arguments.
+# The timeout defaults to the timeout attribute of the query client.
+def cancellable(method):
+    if getattr(method, '_cancellable', False):
+        return method
+
+    @functools.wraps(method)
+    def query_method(self, *args, timeout=None, cancel_token=None, **kwargs):
+        if timeout is None:
+            timeout = getattr(self, 'timeout', None)
+
+        with call_context(timeout, cancel_token, method.__name__):
+            return method(self, *args, **kwargs)
+
+    query_method._cancellable = True
+
+    return query_method
+
+
+# Makes every query_* method defined by a class cancellable.
+def make_cancellable(cls):
+    for name, value in list(vars(cls).items()):
+        if name.startswith('query_') and callable(value):
+            setattr(cls, name, cancellable(value))
+
+
+class QueryTimeoutError(Exception):
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+
+    def __str__(self):
+        if self.timeout is None:
+            return "The query did not complete before its deadline."
+        return "The query did not complete within {} seconds.".format(self.timeout)
+
+
+class QueryCancelledError(Exception):
+
+    def __init__(self):
+        pass
+
+    def __str__(self):
+        return "The query was cancelled."
@@ -0,0 +1,204 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .resilience import is_retryable
+
+'''
+    This module routes read queries across several SPARQL endpoints serving the same SynBioHub data,
+    such as a primary hub and its read replicas.
+
+    An EndpointSet tracks the health and the rolling latency of each endpoint. Each read goes to the fastest
+    healthy endpoint and fails over to the next one if the endpoint is unavailable. Reads can also be hedged:
+    if the first endpoint has not answered after hedge_delay seconds, the same request is sent to a second
+    endpoint and whichever answers first is used.
+
+    Only reads are routed. Logins and submissions always go to the primary endpoint.
+'''
+
+
+class Endpoint():
+    ''' The health and latency statistics of one SPARQL endpoint.
+    '''
+
+    def __init__(self, url):
+        self.url = url
+        self.latency = None
+        self.requests = 0
+        self.failures = 0
+        self.hedged_wins = 0
+        self.unhealthy_until = None
+
+    def is_healthy(self, now):
+        return self.unhealthy_until is None or now >= self.unhealthy_until
+
+    def stats(self, now):
+        return {
+            'healthy': self.is_healthy(now),
+            'latency': self.latency,
+            'requests': self.requests,
+            'failures': self.failures,
+            'hedged_wins': self.hedged_wins
+        }
+
+
+class EndpointSet():
+    ''' A set of SPARQL endpoints serving the same data, the first of which is the primary.
+
+        Endpoints are ranked by an exponentially weighted moving average of their latency. Endpoints that have not
+        answered yet are tried first, so that every endpoint gets a latency estimate. An endpoint that fails with
+        a transient error (see resilience.is_retryable) is considered unhealthy for unhealthy_timeout seconds,
+        during which it is only used if every endpoint is unhealthy.
+    '''
+
+    # urls: The SPARQL endpoint URLs, starting with the primary.
+    # hedge_delay: The number of seconds after which a read is also sent to a second endpoint, or None not to hedge.
+    # latency_weight: The weight of the latest latency in the moving average, between 0 and 1.
+    # unhealthy_timeout: The number of seconds an endpoint is avoided after a transient failure.
+    # max_workers: The maximum number of concurrent hedged requests.
+    def __init__(self, urls, hedge_delay=None, latency_weight=0.3, unhealthy_timeout=30.0, max_workers=10,
+                 clock=time.monotonic):
+        if len(urls) == 0:
+            raise ValueError('An EndpointSet needs at least one endpoint.')
+
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.hedge_delay = hedge_delay
+        self.latency_weight = latency_weight
+        self.unhealthy_timeout = unhealthy_timeout
+        self.max_workers = max_workers
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def primary(self):
+        return self.endpoints[0].url
+
+    # Returns the endpoints not in exclude, from the most to the least preferred.
+    def ranked(self, exclude=()):
+        with self._lock:
+            now = self._clock()
+            endpoints = [endpoint for endpoint in self.endpoints if endpoint.url not in exclude]
+
+            # Healthy endpoints first, then untested ones, then by latency. The sort is stable, so ties favour
+            # the order in which the endpoints were given.
+            return sorted(endpoints, key=lambda endpoint: (not endpoint.is_healthy(now), endpoint.latency is not None,
+                                                           endpoint.latency or 0))
+
+    def record_success(self, endpoint, latency):
+        with self._lock:
+            endpoint.requests += 1
+            endpoint.unhealthy_until = None
+
+            if endpoint.latency is None:
+                endpoint.latency = latency
+            else:
+                endpoint.latency += self.latency_weight * (latency - endpoint.latency)
+
+    def record_failure(self, endpoint):
+        with self._lock:
+            endpoint.requests += 1
+            endpoint.failures += 1
+            endpoint.unhealthy_until = self._clock() + self.unhealthy_timeout
+
+    # Returns a dictionary mapping each endpoint URL to its health and latency statistics.
+    def stats(self):
+        with self._lock:
+            now = self._clock()
+            return {endpoint.url: endpoint.stats(now) for endpoint in self.endpoints}
+
+    # Calls send with the URL of the preferred endpoint and returns its result, failing over to the other
+    # endpoints while send raises transient errors. Other errors are raised at once.
+    def request(self, send):
+        tried = []
+
+        while True:
+            candidates = self.ranked(exclude=tried)
+
+            if self.hedge_delay is not None and len(candidates) > 1:
+                candidates = candidates[:2]
+                call = self.__hedged
+            else:
+                candidates = candidates[:1]
+                call = self.__send
+
+            tried.extend(endpoint.url for endpoint in candidates)
+
+            try:
+                return call(send, *candidates)
+            except Exception as e:
+                if not is_retryable(e) or len(tried) == len(self.endpoints):
+                    raise
+
+    def __send(self, send, endpoint):
+        start = self._clock()
+
+        try:
+            result = send(endpoint.url)
+        except Exception as e:
+            if is_retryable(e):
+                self.record_failure(endpoint)
+            else:
+                self.record_success(endpoint, self._clock() - start)
+            raise
+
+        self.record_success(endpoint, self._clock() - start)
+        return result
+
+    # Sends to the first endpoint, and also to the second one if the first has not answered after hedge_delay
+    # or has failed with a transient error. Returns the first successful result.
+    # The result of the slower request is closed once it arrives.
+    def __hedged(self, send, first, second):
+        executor = self.__get_executor()
+
+        first_future = executor.submit(self.__send, send, first)
+        wait([first_future], timeout=self.hedge_delay)
+
+        pending = {first_future}
+        first_failed = first_future.done() and first_future.exception() is not None
+        if not first_future.done() or (first_failed and is_retryable(first_future.exception())):
+            second_future = executor.submit(self.__send, send, second)
+            pending.add(second_future)
+        else:
+            second_future = None
+
+        error = None
+
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                error = future.exception()
+
+                if error is None or not is_retryable(error):
+                    for slower in pending:
+                        slower.add_done_callback(_close_result)
+
+                if error is None:
+                    if future is second_future:
+                        with self._lock:
+                            second.hedged_wins += 1
+                    return future.result()
+                elif not is_retryable(error):
+                    raise error
+
+        raise error
+
+    def __get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+def _close_result(future):
+    if not future.cancelled() and future.exception() is None:
+        close = getattr(future.result(), 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,117 @@
+import collections
+import threading
+import time
+
+from .query_cache import _tag
+
+'''
+    This module remembers which entities exist on SynBioHub, so that repeated existence checks are answered locally.
+
+    An ExistenceCache maps an entity URI, an rdf:type and the collections searched to the collections found to
+    contain the entity. An entity contained by none of them is remembered as missing. Since an entity found rarely
+    disappears while a missing one may be uploaded at any time, found and missing entities are kept for separate
+    TTLs. Entries are kept in memory, by the process that made the checks.
+'''
+
+
+class ExistenceCache():
+    ''' A bounded cache of the results of collection membership checks, positive and negative.
+
+        An ExistenceCache can be shared by several query clients and threads.
+    '''
+
+    # hit_ttl: The number of seconds an entity found in a collection is remembered.
+    # miss_ttl: The number of seconds an entity found in none of the collections searched is remembered.
+    # max_entries: The maximum number of entities remembered. The least recently used are forgotten first.
+    # clock: The function returning the current time, in seconds since the epoch.
+    def __init__(self, hit_ttl=3600, miss_ttl=60, max_entries=100000, clock=time.time):
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+        self.max_entries = max_entries
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        # Entries are (expiry time, collections containing the entity), and _keys maps the entity and collection
+        # URIs of each entry to its key, to invalidate them
+        self._entries = collections.OrderedDict()
+        self._keys = collections.defaultdict(set)
+        self._counters = collections.Counter()
+
+    # Returns the list of the collections containing the entity with the given URI and rdf:type, among collections,
+    # or among every collection if collections is empty. The list is empty if the entity is known to be missing,
+    # and None if it is unknown.
+    def get(self, uri, rdf_type=None, collections=()):
+        key = self.__key(uri, rdf_type, collections)
+        now = self._clock()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    self.__forget(key)
+                self._counters['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._counters['hits' if len(entry[1]) > 0 else 'negative_hits'] += 1
+
+            return list(entry[1])
+
+    # Remembers the collections found to contain the entity with the given URI and rdf:type, among collections.
+    def put(self, uri, rdf_type, collections, containing):
+        key = self.__key(uri, rdf_type, collections)
+        ttl = self.hit_ttl if len(containing) > 0 else self.miss_ttl
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.__forget(key)
+
+            self._entries[key] = (self._clock() + ttl, tuple(containing))
+            for tag in self.__tags(key):
+                self._keys[tag].add(key)
+
+            while len(self._entries) > self.max_entries:
+                self.__forget(next(iter(self._entries)))
+                self._counters['evictions'] += 1
+
+    # Forgets the entities with any of uris, and every entity searched for in a collection with any of uris.
+    def invalidate(self, uris):
+        with self._lock:
+            keys = set()
+            for uri in uris:
+                keys.update(self._keys.get(_tag(uri), ()))
+
+            for key in keys:
+                self.__forget(key)
+
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+
+    # Returns the number of checks answered by a found entity, by a missing entity and not answered, and of the
+    # entities forgotten to make room for others, along with the number of entities remembered.
+    def stats(self):
+        with self._lock:
+            stats = {name: self._counters[name] for name in ['hits', 'negative_hits', 'misses', 'evictions']}
+            stats['entries'] = len(self._entries)
+
+        return stats
+
+    def __key(self, uri, rdf_type, collections):
+        return _tag(uri), rdf_type, frozenset(_tag(collection) for collection in collections)
+
+    def __tags(self, key):
+        return [key[0]] + list(key[2])
+
+    def __forget(self, key):
+        del self._entries[key]
+        for tag in self.__tags(key):
+            keys = self._keys[tag]
+            keys.discard(key)
+            if len(keys) == 0:
+                del self._keys[tag]
@@ -0,0 +1,130 @@
+import collections
+import copy
+import functools
+from urllib.parse import urlencode
+
+from .sparql_results import iter_bindings
+
+'''
+    This module answers a query about each of many experiments with a few queries about chunks of them, instead of
+    one query per experiment.
+
+    The query of a chunk binds the experiment variable to every experiment of the chunk with VALUES and projects it,
+    so that each row of its result tells which experiment it belongs to. The rows are then split back into a
+    result per experiment, from which the variable is removed, as if each experiment had been queried on its own.
+
+    Queries are sent in the URL of a GET request, whose length web servers limit. Unless a chunk size is given,
+    chunks are as large as they can be for the URL of their query to stay under MAX_URL_LENGTH, up to
+    MAX_CHUNK_SIZE experiments, which bounds the size of each result.
+'''
+
+# The maximum length of the URL of a query, below the 8 KiB request line limit of common web servers
+MAX_URL_LENGTH = 8000
+
+# The maximum number of experiments per query
+MAX_CHUNK_SIZE = 200
+
+_EMPTY_RESULT = {'head': {'vars': []}, 'results': {'bindings': []}}
+
+
+# Returns the length of the URL of a GET request sending query to url.
+def url_length(url, query):
+    return len(url) + len('?') + len(urlencode({'query': query}))
+
+
+# Splits experiments into chunks whose query, returned by build(chunk), has a URL of at most max_url_length
+# characters. The chunk size is estimated from the growth of the URL with the first two experiments, and a chunk
+# whose URL is still too long, for instance because its experiments have longer URIs, is split in two.
+def iter_chunks(experiments, build, url, chunk_size=None, max_url_length=MAX_URL_LENGTH,
+                max_chunk_size=MAX_CHUNK_SIZE):
+    experiments = list(experiments)
+
+    if chunk_size is None:
+        chunk_size = min(max_chunk_size, len(experiments))
+        if len(experiments) > 1:
+            one = url_length(url, build(experiments[:1]))
+            two = url_length(url, build(experiments[:2]))
+            if two > one:
+                chunk_size = max(1, min(chunk_size, 1 + (max_url_length - one) // (two - one)))
+
+        pending = [experiments[i:i + chunk_size] for i in range(0, len(experiments), chunk_size)]
+        while len(pending) > 0:
+            chunk = pending.pop(0)
+            if len(chunk) > 1 and url_length(url, build(chunk)) > max_url_length:
+                pending[:0] = [chunk[:len(chunk) // 2], chunk[len(chunk) // 2:]]
+            else:
+                yield chunk
+    else:
+        for i in range(0, len(experiments), chunk_size):
+            yield experiments[i:i + chunk_size]
+
+
+# Returns an OrderedDict of the SPARQL JSON result of each experiment, given the results of fetch(chunk) for each
+# chunk, whose rows bind variable to the experiment they belong to.
+def fan_in(chunks, fetch, variable='exp'):
+    results = collections.OrderedDict()
+    variables = None
+
+    for chunk in chunks:
+        for experiment in chunk:
+            results[experiment] = []
+
+        query_result = fetch(chunk)
+        for binding in iter_bindings(query_result):
+            experiment = binding[variable]['value']
+            results.setdefault(experiment, []).append({name: term for name, term in binding.items()
+                                                       if name != variable})
+
+        # The head of a streamed result is read along with its bindings
+        if variables is None:
+            try:
+                head = query_result['head']
+            except (KeyError, TypeError):
+                head = {}
+            variables = [name for name in head.get('vars', []) if name != variable]
+
+    return collections.OrderedDict((experiment, {'head': {'vars': list(variables or [])},
+                                                 'results': {'bindings': bindings}})
+                                   for experiment, bindings in results.items())
+
+
+# Calls the query method named method_name of client, which takes an experiments argument, for chunks of
+# experiments, and returns an OrderedDict of its result for each experiment, as if it had been called with
+# experiments=[experiment]. The result of a chunk is fetched unformatted, with pretty=False if the method takes
+# pretty, from a copy of client whose queries project the experiment variable, see SBOLQuery.project_experiments.
+# Each result is then formatted by the method itself, called on a copy of client answering its query with the
+# result of the experiment.
+def fan_in_method(client, method_name, experiments, kwargs, chunk_size=None):
+    fanning_client = copy.copy(client)
+    fanning_client.project_experiments = True
+    chunk_kwargs = dict(kwargs, pretty=False) if 'pretty' in kwargs else dict(kwargs)
+
+    def build(chunk):
+        queries = []
+
+        def record_SPARQL(server, query, result_format=None):
+            queries.append(query)
+            return _EMPTY_RESULT
+
+        recording_client = copy.copy(fanning_client)
+        recording_client.fetch_SPARQL = record_SPARQL
+        getattr(recording_client, method_name)(experiments=chunk, **chunk_kwargs)
+
+        return client.prepare_SPARQL(queries[0])[0]
+
+    def fetch(chunk):
+        return getattr(fanning_client, method_name)(experiments=chunk, **chunk_kwargs)
+
+    results = fan_in(iter_chunks(experiments, build, client._server, chunk_size), fetch)
+
+    formatted = collections.OrderedDict()
+    for experiment, query_result in results.items():
+        replay_client = copy.copy(client)
+        replay_client.fetch_SPARQL = functools.partial(_replay_SPARQL, query_result)
+        formatted[experiment] = getattr(replay_client, method_name)(experiments=[experiment], **kwargs)
+
+    return formatted
+
+
+def _replay_SPARQL(query_result, server, query, result_format=None):
+    return query_result
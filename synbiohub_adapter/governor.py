@@ -0,0 +1,414 @@
+import collections
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from .cancellation import current_context, QueryTimeoutError, QueryCancelledError
+from .transport import Transport
+
+'''
+    This module limits the load that clients put on a SynBioHub instance.
+
+    A Governor combines a token bucket, which limits the rate at which requests are started, with a limit on the
+    number of requests in flight at the same time. Callers that exceed either limit wait for their turn, and the
+    time they wait for each limit is recorded so that the limits can be sized. A caller waits no longer than the
+    time left to the query method call it is part of, and stops waiting once the call is cancelled, so that no
+    request is sent for a call that already failed.
+
+    By default, a Governor only coordinates the threads of one process. Given a lock_path, it coordinates every
+    process on the host that uses the same lock_path, through files locked with fcntl.flock. Locks held by a
+    process are released by the operating system if the process dies.
+
+    A GovernedTransport applies a Governor per endpoint to every request sent through another transport.
+'''
+
+
+class Governor():
+    ''' Limits the rate and the concurrency of requests sent to one endpoint.
+
+        Every request must hold a permit, obtained from acquire and returned through its release method.
+    '''
+
+    # rate: The maximum number of requests started per second, or None for no limit.
+    # burst: The number of requests that can be started at once after a period of inactivity.
+    # max_in_flight: The maximum number of requests in flight at the same time, or None for no limit.
+    # lock_path: The path prefix of the files through which processes sharing the limits coordinate,
+    #   or None to coordinate only the threads of this process.
+    # poll_interval: The number of seconds between attempts to take a slot held by another process.
+    # history: The number of recent wait times kept to compute percentiles.
+    def __init__(self, rate=None, burst=1, max_in_flight=None, lock_path=None, poll_interval=0.01, history=1000):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.lock_path = lock_path
+
+        if lock_path is None:
+            self._bucket = _TokenBucket(rate, burst) if rate is not None else None
+            self._slots = _Slots(max_in_flight, poll_interval) if max_in_flight is not None else None
+        else:
+            directory = os.path.dirname(lock_path)
+            if len(directory) > 0:
+                os.makedirs(directory, exist_ok=True)
+
+            self._bucket = _FileTokenBucket(lock_path + '.bucket', rate, burst) if rate is not None else None
+            self._slots = _FileSlots(lock_path, max_in_flight, poll_interval) if max_in_flight is not None else None
+
+        self._lock = threading.Lock()
+        self._waits = _WaitTimes(history)
+        self._slot_waits = _WaitTimes(history)
+        self._rate_waits = _WaitTimes(history)
+        self._requests = 0
+        self._in_flight = 0
+
+    # Waits until a request may be sent and returns its permit. Raises QueryTimeoutError if the request could not
+    # be sent within timeout seconds, and QueryCancelledError once cancel_token is cancelled.
+    def acquire(self, timeout=None, cancel_token=None):
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+
+        slot = self._slots.acquire(deadline, cancel_token) if self._slots is not None else None
+        slotted = time.monotonic()
+        try:
+            # A slot freed as the cancelled call gave up may be taken before the cancellation is noticed
+            if cancel_token is not None and cancel_token.cancelled:
+                raise QueryCancelledError()
+            if self._bucket is not None:
+                self._bucket.acquire(deadline, cancel_token)
+        except BaseException:
+            if slot is not None:
+                self._slots.release(slot)
+            raise
+
+        end = time.monotonic()
+
+        with self._lock:
+            self._requests += 1
+            self._in_flight += 1
+            self._waits.record(end - start)
+            self._slot_waits.record(slotted - start)
+            self._rate_waits.record(end - slotted)
+
+        return _Permit(self, slot, end - start)
+
+    def _release(self, slot):
+        if slot is not None:
+            self._slots.release(slot)
+
+        with self._lock:
+            self._in_flight -= 1
+
+    # Calls fn with the given arguments while holding a permit, obtained within the limits of the query method call
+    # running in this thread.
+    def call(self, fn, *args, **kwargs):
+        context = current_context()
+        permit = self.acquire(context.remaining(), context.cancel_token)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            permit.release()
+
+    # Returns the number of requests governed by this instance, how many of them had to wait,
+    # their total, mean, maximum and 95th percentile wait times in seconds, and the number of requests in flight.
+    # The same figures are given for the waits for a slot under max_in_flight, as slot_wait, and for the waits for
+    # a token of the rate limit, as rate_wait, so that each limit can be sized on its own.
+    def stats(self):
+        with self._lock:
+            stats = self._waits.stats(self._requests)
+            stats['requests'] = self._requests
+            stats['in_flight'] = self._in_flight
+            stats['slot_wait'] = self._slot_waits.stats(self._requests)
+            stats['rate_wait'] = self._rate_waits.stats(self._requests)
+
+            return stats
+
+
+class _WaitTimes():
+    ''' The times requests waited for a permit, or for one of the limits of a permit.
+    '''
+
+    def __init__(self, history):
+        self._waits = collections.deque(maxlen=history)
+        self._waited = 0
+        self._total = 0.0
+        self._max = 0.0
+
+    def record(self, wait):
+        self._waits.append(wait)
+        self._total += wait
+        self._max = max(self._max, wait)
+        if wait > 0.001:
+            self._waited += 1
+
+    # Returns how many of requests had to wait and their total, mean, maximum and 95th percentile wait times.
+    def stats(self, requests):
+        waits = sorted(self._waits)
+
+        return {
+            'waited': self._waited,
+            'total_wait': self._total,
+            'mean_wait': self._total / requests if requests > 0 else 0.0,
+            'max_wait': self._max,
+            'p95_wait': waits[int(0.95 * (len(waits) - 1))] if len(waits) > 0 else 0.0
+        }
+
+
+class _Permit():
+
+    def __init__(self, governor, slot, wait):
+        self._governor = governor
+        self._slot = slot
+        self.wait = wait
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._governor._release(self._slot)
+
+
+class _TokenBucket():
+    ''' Each request takes a token, and tokens are added at the given rate up to burst tokens.
+        A request finding no token reserves the next one and sleeps until it is added. A request that cannot wait
+        that long takes no token, and a request cancelled while it sleeps gives its token back.
+    '''
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline=None, cancel_token=None):
+        with self._lock:
+            now = time.monotonic()
+            tokens, delay = _take_token(self._tokens, now - self._last, self.rate, self.burst)
+            _check_wait(now, delay, deadline, cancel_token)
+            self._tokens = tokens
+            self._last = now
+
+        if _sleep(delay, cancel_token):
+            with self._lock:
+                self._tokens += 1
+            raise QueryCancelledError()
+
+
+class _FileTokenBucket():
+    ''' A token bucket whose state is kept in a file, updated under an exclusive lock on that file.
+    '''
+
+    def __init__(self, path, rate, burst):
+        import fcntl
+        self._fcntl = fcntl
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+
+    def acquire(self, deadline=None, cancel_token=None):
+        def take(tokens, elapsed):
+            tokens, delay = _take_token(tokens, elapsed, self.rate, self.burst)
+            _check_wait(time.monotonic(), delay, deadline, cancel_token)
+            return tokens, delay
+
+        delay = self.__update(take)
+
+        if _sleep(delay, cancel_token):
+            self.__update(lambda tokens, elapsed: (min(self.burst, tokens + elapsed * self.rate + 1), None))
+            raise QueryCancelledError()
+
+    # Replaces the tokens of the bucket by the first value returned by update, given the tokens and the time elapsed
+    # since the last update, under the lock of the file, and returns the second value.
+    def __update(self, update):
+        with open(self.path, 'a+') as f:
+            self._fcntl.flock(f, self._fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                state = f.read().split()
+                now = time.time()
+
+                if len(state) == 2:
+                    tokens, last = float(state[0]), float(state[1])
+                else:
+                    tokens, last = self.burst, now
+
+                tokens, result = update(tokens, max(now - last, 0))
+
+                f.seek(0)
+                f.truncate()
+                f.write('{} {}'.format(tokens, now))
+                f.flush()
+            finally:
+                self._fcntl.flock(f, self._fcntl.LOCK_UN)
+
+        return result
+
+
+# Refills a bucket of tokens over the elapsed time and takes one token from it.
+# Returns the remaining tokens, which are negative if tokens were reserved ahead, and the delay before the token
+# taken is available.
+def _take_token(tokens, elapsed, rate, burst):
+    tokens = min(burst, tokens + elapsed * rate) - 1
+
+    if tokens >= 0:
+        return tokens, 0
+    else:
+        return tokens, -tokens / rate
+
+
+# Raises QueryCancelledError if cancel_token is cancelled, and QueryTimeoutError if waiting delay seconds from now
+# would reach the deadline.
+def _check_wait(now, delay, deadline, cancel_token):
+    if cancel_token is not None and cancel_token.cancelled:
+        raise QueryCancelledError()
+    if deadline is not None and now + delay >= deadline:
+        raise QueryTimeoutError()
+
+
+# Sleeps for delay seconds, waking up early if cancel_token is cancelled. Returns whether it was cancelled.
+def _sleep(delay, cancel_token):
+    if cancel_token is not None:
+        return cancel_token.wait(delay) if delay > 0 else cancel_token.cancelled
+    if delay > 0:
+        time.sleep(delay)
+    return False
+
+
+class _Slots():
+    ''' A pool of slots shared between the threads of a process. Waiting callers check for cancellation every
+        poll_interval seconds.
+    '''
+
+    def __init__(self, size, poll_interval):
+        self._semaphore = threading.BoundedSemaphore(size)
+        self.poll_interval = poll_interval
+
+    def acquire(self, deadline=None, cancel_token=None):
+        while True:
+            wait = None if cancel_token is None else self.poll_interval
+            if deadline is not None:
+                remaining = max(deadline - time.monotonic(), 0)
+                wait = remaining if wait is None else min(wait, remaining)
+
+            if self._semaphore.acquire(timeout=wait):
+                return True
+            _check_wait(time.monotonic(), 0, deadline, cancel_token)
+
+    def release(self, slot):
+        self._semaphore.release()
+
+
+class _FileSlots():
+    ''' A pool of slots shared between processes, each slot being a file that is locked while it is held.
+    '''
+
+    def __init__(self, lock_path, size, poll_interval):
+        import fcntl
+        self._fcntl = fcntl
+        self.paths = ['{}.slot{}'.format(lock_path, i) for i in range(size)]
+        self.poll_interval = poll_interval
+
+    def acquire(self, deadline=None, cancel_token=None):
+        while True:
+            for path in self.paths:
+                f = open(path, 'a')
+                try:
+                    self._fcntl.flock(f, self._fcntl.LOCK_EX | self._fcntl.LOCK_NB)
+                    return f
+                except OSError:
+                    f.close()
+
+            now = time.monotonic()
+            _check_wait(now, 0, deadline, cancel_token)
+            delay = self.poll_interval if deadline is None else min(self.poll_interval, deadline - now)
+            if _sleep(delay, cancel_token):
+                raise QueryCancelledError()
+
+    def release(self, slot):
+        self._fcntl.flock(slot, self._fcntl.LOCK_UN)
+        slot.close()
+
+
+class GovernedTransport(Transport):
+    ''' A transport that sends every request through another transport while holding a permit from the Governor
+        of the endpoint the request is sent to.
+
+        A streamed response holds its permit until it is closed.
+    '''
+
+    # transport: The transport that sends the requests.
+    # governors: A dictionary mapping endpoint URLs to their Governor. Only the scheme, host and port of the URLs
+    #   are significant.
+    # default: The Governor of the endpoints that are not in governors, or None not to govern them.
+    def __init__(self, transport, governors=None, default=None):
+        self.transport = transport
+        self.governors = {endpoint_key(url): governor for url, governor in (governors or {}).items()}
+        self.default = default
+
+    @property
+    def pool_size(self):
+        return getattr(self.transport, 'pool_size', 10)
+
+    # Returns the Governor of the endpoint of the given URL, or None.
+    def governor(self, url):
+        return self.governors.get(endpoint_key(url), self.default)
+
+    def request(self, method, url, params=None, data=None, headers=None, stream=False, timeout=None):
+        governor = self.governor(url)
+        if governor is None:
+            return self.transport.request(method, url, params=params, data=data, headers=headers, stream=stream,
+                                          timeout=timeout)
+
+        context = current_context()
+        permit = governor.acquire(context.remaining(), context.cancel_token)
+        try:
+            response = self.transport.request(method, url, params=params, data=data, headers=headers, stream=stream,
+                                              timeout=timeout)
+        except BaseException:
+            permit.release()
+            raise
+
+        if stream:
+            close = response.close
+
+            def close_and_release():
+                try:
+                    close()
+                finally:
+                    permit.release()
+
+            response.close = close_and_release
+        else:
+            permit.release()
+
+        return response
+
+    def call(self, url, fn, *args, **kwargs):
+        governor = self.governor(url)
+        if governor is None:
+            return fn(*args, **kwargs)
+
+        return governor.call(fn, *args, **kwargs)
+
+    def governor_stats(self):
+        stats = {key: governor.stats() for key, governor in self.governors.items()}
+        if self.default is not None:
+            stats['default'] = self.default.stats()
+
+        return stats
+
+    def connection_stats(self):
+        return self.transport.connection_stats()
+
+    def close(self):
+        self.transport.close()
+
+
+# Returns the scheme, host and port of a URL, which identify the endpoint it is sent to.
+def endpoint_key(url):
+    parsed = urlparse(url)
+    port = parsed.port
+    if port is None:
+        port = 443 if parsed.scheme == 'https' else 80
+
+    return '{}://{}:{}'.format(parsed.scheme, parsed.hostname, port)
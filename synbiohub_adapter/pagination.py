@@ -0,0 +1,321 @@
+import copy
+import functools
+import hashlib
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from .cancellation import current_context, within_context
+from .sparql_ast import serialize, Filter, Expr, IRI, Literal, INDENT
+from .sparql_results import iter_bindings
+
+'''
+    This module fetches the results of SELECT queries page by page, so that a result is never cut short by the
+    maximum number of rows a SPARQL endpoint returns for one query, which is 10000 by default for Virtuoso.
+
+    Each page is a copy of the query nested in a query adding an ORDER BY over every variable it projects, so
+    that successive pages come in a stable order, along with a LIMIT and an OFFSET. A page asks for one row more
+    than the page size: the extra row is not returned, but shows that there is a next page, so that iteration
+    stops exactly at the end of the result, without asking for an empty page. While the rows of a page are read,
+    the next page can be fetched in the background.
+
+    Since the endpoint has to order and skip every row before the OFFSET of a page, pages get slower the further
+    they are in the result. Given a ScanCursor, pages are fetched with keyset pagination instead. The query is not
+    nested: a FILTER added to its WHERE clause keeps the rows whose key variable is bound to the RDF term of the
+    last row read or to a term after it, which the endpoint can apply while matching the patterns, and the rows
+    are ordered by the key variable, the other variables only breaking ties. The rows sharing the key of the last
+    row read that were already read are skipped with an OFFSET, so that an OFFSET only grows with the number of
+    rows sharing a key, and duplicate rows are neither lost nor read twice. The key should therefore be a
+    variable with few rows per value, typically the entity scanned, and bound to IRIs or to literals of a single
+    datatype, whose order the FILTER follows. The cursor records how far the result has been read and can be saved
+    as JSON, so that an interrupted scan can resume where it stopped.
+
+    Queries that already have a LIMIT or OFFSET, and queries that are not SELECT queries or project every variable
+    with SELECT *, are not paginated. Queries that already have an ORDER BY, or whose key is the alias of an
+    expression, cannot be paginated with a ScanCursor.
+
+    make_iterable adds an iter_* generator for every query_* method of a query client, which yields the result
+    of the method as its pages are fetched.
+'''
+
+# The default number of rows per page, which is kept below the maximum number of rows of SynBioHub results
+DEFAULT_PAGE_SIZE = 5000
+
+_SELECT = re.compile(r'\bSELECT\s+(?:DISTINCT\s+|REDUCED\s+)?(.*?)(?:\bFROM\b|\bWHERE\b|\{)',
+                     re.IGNORECASE | re.DOTALL)
+
+_PROJECTION = re.compile(r'\(.*?\bAS\s+[?$](\w+)\s*\)|[?$](\w+)', re.IGNORECASE | re.DOTALL)
+
+_SOLUTION_MODIFIERS = re.compile(r'\b(?:LIMIT|OFFSET)\b', re.IGNORECASE)
+
+_ORDER_BY = re.compile(r'\bORDER\s+BY\b', re.IGNORECASE)
+
+
+# Returns the names of the variables projected by query, or None if it cannot be paginated.
+def projected_variables(query):
+    match = _SELECT.search(query)
+    if match is None or _SOLUTION_MODIFIERS.search(query[query.rfind('}') + 1:]):
+        return None
+
+    variables = [alias or name for alias, name in _PROJECTION.findall(match.group(1))]
+    if len(variables) == 0:
+        return None
+
+    return variables
+
+
+# Returns the query fetching the rows of query from offset to offset + limit, ordered by its variables.
+def page_query(query, variables, limit, offset):
+    start = _SELECT.search(query).start()
+
+    return '\n'.join([query[:start] + 'SELECT * WHERE {', '{', query[start:], '}', '}',
+                      'ORDER BY ' + ' '.join('?' + variable for variable in variables),
+                      'LIMIT {}'.format(limit), 'OFFSET {}'.format(offset)])
+
+
+# Returns the query fetching the first limit rows of query ordered by its variables, the first of which is the key,
+# from the rows whose key is bound to the term after, a SPARQL JSON binding, or to a term after it, skipping the
+# first ties of them. If after is None, the rows are fetched from the first row.
+def keyset_page_query(query, variables, limit, after=None, ties=0):
+    key = variables[0]
+    end = query.rfind('}')
+    if _ORDER_BY.search(query[end + 1:]):
+        raise ValueError('A query with an ORDER BY cannot be paginated with a ScanCursor.')
+    elif re.search(r'\bAS\s+[?$]{}\b'.format(key), _SELECT.search(query).group(1), re.IGNORECASE):
+        raise ValueError('The key variable {} is the alias of an expression.'.format(key))
+
+    lines = [query[:end].rstrip()]
+    if after is not None:
+        lines.append(INDENT + serialize(_after_filter(key, after)))
+    lines.extend([query[end:], 'ORDER BY ' + ' '.join('?' + variable for variable in variables),
+                  'LIMIT {}'.format(limit)])
+    if ties > 0:
+        lines.append('OFFSET {}'.format(ties))
+
+    return '\n'.join(lines)
+
+
+# Returns the FILTER keeping the rows whose key is bound to the term after or to a term after it in the order of
+# ORDER BY, in which IRIs come before literals. IRIs are compared by their strings, as relational operators are
+# only defined on literals, and so are literals with a language tag.
+def _after_filter(key, after):
+    if after['type'] == 'uri':
+        return Filter(Expr('isLiteral(?{0}) || isIRI(?{0}) && str(?{0}) >= {{}}'.format(key), Literal(after['value'])))
+    elif after['type'] not in ('literal', 'typed-literal'):
+        raise ValueError('The key variable {} is bound to a blank node, which cannot be paginated.'.format(key))
+    elif 'xml:lang' in after:
+        return Filter(Expr('isLiteral(?{0}) && str(?{0}) >= {{}}'.format(key), Literal(after['value'])))
+
+    datatype = IRI(after['datatype']) if 'datatype' in after else None
+    return Filter(Expr('isLiteral(?{0}) && ?{0} >= {{}}'.format(key), Literal(after['value'], datatype)))
+
+
+class ScanCursor():
+    ''' The position reached in the result of a query read page by page, from which reading can resume, possibly
+        in another process. A cursor follows the result of a single query.
+
+        With keyset pagination, the cursor holds the key of the last row read, as a SPARQL JSON binding, and the
+        number of rows read with that key, and otherwise the number of rows read. A cursor is updated as the rows
+        of the result are read. to_json and from_json save and restore it.
+    '''
+
+    # keyset: Whether pages are fetched with keyset pagination rather than at an offset.
+    # key: The variable by which rows are ordered first with keyset pagination, typically the entity scanned.
+    #   By default, rows are ordered by the variables in the order they are projected.
+    def __init__(self, keyset=True, key=None, offset=0, after=None, ties=0, query_digest=None, done=False):
+        self.keyset = keyset
+        self.key = key
+        self.offset = offset
+        self.after = after
+        self.ties = ties
+        self.query_digest = query_digest
+        self.done = done
+
+    def to_json(self):
+        return json.dumps(vars(self), sort_keys=True)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls(**json.loads(text))
+
+    # Returns the variables of a query by which its rows are ordered.
+    def order(self, variables):
+        if self.key is None:
+            return list(variables)
+        elif self.key not in variables:
+            raise ValueError('The key variable {} is not projected by the query.'.format(self.key))
+
+        return [self.key] + [variable for variable in variables if variable != self.key]
+
+    # Checks that the cursor follows the result of query, which it follows from now on if it did not follow any.
+    def follow(self, query):
+        digest = hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+        if self.query_digest is None:
+            self.query_digest = digest
+        elif self.query_digest != digest:
+            raise ValueError('The cursor follows the result of another query.')
+
+    def __repr__(self):
+        if self.keyset:
+            return 'ScanCursor(after={!r}, ties={}, done={})'.format(self.after, self.ties, self.done)
+        return 'ScanCursor(offset={}, done={})'.format(self.offset, self.done)
+
+
+class PagedResult():
+    ''' A SPARQL JSON result whose bindings are fetched one page at a time as they are iterated over.
+
+        Iterating over the result (or over result['results']['bindings']) yields each binding once.
+        The result can only be iterated over once. The timeout and cancellation token of the query method call
+        that created the result still apply to the pages fetched after the call returned.
+    '''
+
+    # fetch: The fetch_SPARQL method of a query client, through which each page is fetched.
+    # variables: The variables projected by query, see projected_variables.
+    # prefetch: Whether the next page is fetched in the background while the rows of a page are read.
+    # cursor: A ScanCursor from which to read the result and which is updated as it is read. By default, pages are
+    #   fetched at an offset from the first row.
+    def __init__(self, fetch, server, query, result_format, variables, page_size=DEFAULT_PAGE_SIZE, prefetch=True,
+                 cursor=None):
+        if cursor is None:
+            cursor = ScanCursor(keyset=False)
+        cursor.follow(query)
+
+        self._fetch = fetch
+        self.server = server
+        self.query = query
+        self.result_format = result_format
+        self.variables = variables
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.cursor = cursor
+        self.pages_fetched = 0
+        self._order = cursor.order(variables)
+        self._context = current_context()
+        self._iterated = False
+
+    def __iter__(self):
+        if self._iterated:
+            raise RuntimeError('The bindings of a PagedResult can only be iterated over once.')
+        self._iterated = True
+
+        if self.cursor.done:
+            return
+
+        executor = ThreadPoolExecutor(max_workers=1) if self.prefetch else None
+        try:
+            rows = self.__fetch_page(self.cursor.offset, self.cursor.after, self.cursor.ties)
+            while True:
+                next_rows = None
+                if len(rows) > self.page_size and executor is not None:
+                    next_rows = executor.submit(self.__fetch_page, self.cursor.offset + self.page_size,
+                                                *self.__position(rows[:self.page_size]))
+
+                for row in rows[:self.page_size]:
+                    self.cursor.offset += 1
+                    if self.cursor.keyset:
+                        self.cursor.after, self.cursor.ties = self.__position([row])
+                    yield row
+
+                if len(rows) <= self.page_size:
+                    self.cursor.done = True
+                    return
+                elif next_rows is None:
+                    rows = self.__fetch_page(self.cursor.offset, self.cursor.after, self.cursor.ties)
+                else:
+                    rows = next_rows.result()
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+    def __getitem__(self, key):
+        if key == 'head':
+            return {'vars': list(self.variables)}
+        elif key == 'results':
+            return {'bindings': iter(self)}
+        raise KeyError(key)
+
+    # Returns the key of the last of rows, read after the position of the cursor, and the number of rows read with
+    # that key, from which the next page is fetched with keyset pagination.
+    def __position(self, rows):
+        after, ties = self.cursor.after, self.cursor.ties
+
+        for row in rows:
+            key = row.get(self._order[0])
+            if key == after:
+                ties += 1
+            else:
+                after, ties = key, 1
+
+        return after, ties
+
+    # Fetches the rows of the result from offset, or with keyset pagination from the rows whose key is after or
+    # after it, skipping ties of them, with one more row than the page size if there is a next page.
+    def __fetch_page(self, offset, after=None, ties=0):
+        if self.cursor.keyset:
+            query = keyset_page_query(self.query, self._order, self.page_size + 1, after, ties)
+        else:
+            query = page_query(self.query, self._order, self.page_size + 1, offset)
+
+        with within_context(self._context):
+            rows = list(iter_bindings(self._fetch(self.server, query, self.result_format)))
+        self.pages_fetched += 1
+
+        return rows
+
+    # Reads the remaining bindings into a SPARQL JSON result dictionary.
+    def to_dict(self):
+        return {'head': {'vars': list(self.variables)}, 'results': {'bindings': list(self)}}
+
+
+# Returns the result of fetch(server, query, result_format) as a PagedResult, unless the query cannot be paginated.
+def fetch_pages(fetch, page_size, prefetch, cursor, server, query, result_format=None):
+    variables = projected_variables(query)
+    if variables is None:
+        return fetch(server, query, result_format)
+
+    return PagedResult(fetch, server, query, result_format, variables, page_size, prefetch, cursor)
+
+
+# Calls a query method of client on a copy of it whose queries return a PagedResult, and yields the bindings of
+# the result of the method, or else the entries of the list or the items of the dictionary it returns.
+def iter_query_method(client, method_name, args, kwargs, page_size=None, prefetch=None, cursor=None):
+    if page_size is None:
+        page_size = client.page_size if client.page_size is not None else DEFAULT_PAGE_SIZE
+    if prefetch is None:
+        prefetch = client.prefetch_pages
+
+    paging_client = copy.copy(client)
+    paging_client.fetch_SPARQL = functools.partial(fetch_pages, client.fetch_SPARQL, page_size, prefetch, cursor)
+
+    query_result = getattr(paging_client, method_name)(*args, **kwargs)
+    if query_result is None:
+        return
+    elif isinstance(query_result, PagedResult) or isinstance(query_result, dict) and 'results' in query_result:
+        yield from iter_bindings(query_result)
+    elif isinstance(query_result, dict):
+        yield from query_result.items()
+    elif isinstance(query_result, list):
+        yield from query_result
+    else:
+        yield query_result
+
+
+# Returns an iter_* generator method calling the query method named method_name, see iter_query_method.
+def iterable(method_name):
+    def iter_method(self, *args, page_size=None, prefetch=None, cursor=None, **kwargs):
+        return iter_query_method(self, method_name, args, kwargs, page_size, prefetch, cursor)
+
+    iter_method.__name__ = 'iter_' + method_name[len('query_'):]
+    iter_method.__doc__ = ('Yields the result of {} page by page, taking the same arguments along with page_size, '
+                           'prefetch and cursor.'.format(method_name))
+
+    return iter_method
+
+
+# Adds an iter_* generator method for every query_* method defined by a class, unless the class defines it.
+def make_iterable(cls):
+    for name, value in list(vars(cls).items()):
+        iter_name = 'iter_' + name[len('query_'):]
+        if name.startswith('query_') and callable(value) and iter_name not in vars(cls):
+            setattr(cls, iter_name, iterable(name))
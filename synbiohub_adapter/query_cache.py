@@ -0,0 +1,455 @@
+import collections
+import concurrent.futures
+import fnmatch
+import functools
+import hashlib
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import appdirs
+
+from .cache_store import SQLiteStore
+
+'''
+    This module keeps the results of SPARQL queries so that repeated queries are answered without contacting
+    SynBioHub.
+
+    A QueryCache is a read-through cache: on a miss, the query is sent and its result is stored. Results are kept in
+    a bounded in-memory LRU tier and, optionally, in a persistent tier on disk shared with other processes. Every entry
+    expires after the TTL of its query family, the name of the outermost query_* method that sent the query, so
+    that results that rarely change, such as those of design queries, are kept longer than experiment results.
+
+    A family can also be given a soft and a hard TTL. A result older than its soft TTL is stale: it is still returned
+    at once, while a background worker sends its query again and stores the new result. Only results older than
+    their hard TTL make callers wait for the query. At most one refresh per entry runs at a time, on a bounded pool
+    of threads.
+
+    Entries are keyed by a fixed-size digest of the server, the user, the result format and the canonical form of
+    the query, in which whitespace, comments and the order of PREFIX declarations do not matter.
+
+    Each entry is tagged with the URIs it depends on: the IRIs in the body of its query, among which the collections
+    and entities of its VALUES clauses, and the URIs in its result. After a write to SynBioHub, invalidate removes
+    the entries tagged with the URIs written, in memory and on disk. Caches sharing a disk tier read the invalidations
+    made by other processes at most every poll_interval seconds.
+
+    Cached results are shared between callers and must not be modified. The lock of a cache only guards its memory
+    tier and statistics: the disk tier is read and written outside of it, so that threads sharing a cache do not
+    wait for each other's disk reads and decompressions.
+'''
+
+# The default path of the disk tier, shared by the processes of a user
+CACHE_PATH = os.path.join(appdirs.user_cache_dir(appname='synbiohub_adapter'), 'query_cache.sqlite')
+
+# The TTLs in seconds of the query families, as patterns matched against query method names. The first matching
+# pattern applies, and a TTL of 0 disables caching. A TTL can be a (soft TTL, hard TTL) pair, so that the results
+# of slow queries, such as {'query_experiment_set_inducers': (300, 24 * 3600)}, are refreshed in the background.
+DEFAULT_TTLS = collections.OrderedDict([
+    ('query_design*', 24 * 3600),
+    ('query_gate_*', 24 * 3600),
+    ('query_units', 24 * 3600),
+    ('*', 300)
+])
+
+
+class QueryCache():
+    ''' A read-through cache of SPARQL query results with an in-memory LRU tier and an optional disk tier.
+
+        A QueryCache can be shared by several query clients and threads.
+    '''
+
+    # max_entries: The maximum number of results kept in memory. The least recently used results are evicted first.
+    # path: The path of the SQLite database holding the disk tier, or None to keep results in memory only.
+    #   The database can be shared by the caches of several processes.
+    # ttls: A dictionary mapping query method name patterns to the number of seconds their results are kept,
+    #   checked in order, or to a (soft TTL, hard TTL) pair. Queries sent outside of a query method belong to the
+    #   family None, matched by '*'.
+    # codec, compress_level: The compression of the results written to disk, see cache_store.SQLiteStore. The
+    #   database is opened once per process, with the settings of the first cache opening it.
+    # poll_interval: The minimum number of seconds between two reads of the invalidations made by other processes.
+    # refresh_workers: The number of threads refreshing stale results.
+    # max_refreshes: The maximum number of refreshes running or waiting for a thread. Stale results found while
+    #   this many are pending are returned without being refreshed.
+    # clock: The function returning the current time, in seconds since the epoch.
+    def __init__(self, max_entries=1024, path=None, ttls=DEFAULT_TTLS, codec='zlib', compress_level=6,
+                 poll_interval=1.0, refresh_workers=2, max_refreshes=32, clock=time.time):
+        self.max_entries = max_entries
+        self.path = path
+        self.ttls = collections.OrderedDict(ttls)
+        self.poll_interval = poll_interval
+        self.refresh_workers = refresh_workers
+        self.max_refreshes = max_refreshes
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        # Entries are (expiry time, result, tags, stale time), where the stale time is None for results that are
+        # not refreshed, and _tagged maps each tag to the keys of the entries in memory bearing it
+        self._memory = collections.OrderedDict()
+        self._tagged = collections.defaultdict(set)
+        self._ttl_cache = {}
+        # Incremented by every invalidation, so that results fetched while it happened are not stored
+        self._generation = 0
+        # The futures of the pending refreshes by key, run by an executor created on the first refresh
+        self._refreshes = {}
+        self._executor = None
+        self._disk = None
+        if path is not None:
+            self._disk = SQLiteStore.open(path, codec=codec, compress_level=compress_level)
+            self._polled = self._clock()
+            self._last_invalidation = self._disk.last_invalidation()
+            self._logged = set()
+
+        self._counters = collections.Counter()
+
+    # Returns the number of seconds the results of a query family are fresh, which is their soft TTL.
+    def ttl(self, family):
+        return self.__ttls(family)[0]
+
+    # Returns the number of seconds the results of a query family are kept, which is their hard TTL.
+    def max_age(self, family):
+        return self.__ttls(family)[1]
+
+    def __ttls(self, family):
+        if family not in self._ttl_cache:
+            name = family if family is not None else ''
+            ttl = next((ttl for pattern, ttl in self.ttls.items() if fnmatch.fnmatchcase(name, pattern)), 0)
+            self._ttl_cache[family] = tuple(ttl) if isinstance(ttl, (tuple, list)) else (ttl, ttl)
+
+        return self._ttl_cache[family]
+
+    # Returns the result stored under key, or calls fetch and stores its result for the TTL of family, tagged with
+    # the URIs of query and of the result. A stale result is returned, and fetch called again in the background.
+    def fetch(self, key, family, fetch, query=None):
+        found, result, stale = self.__lookup(key)
+        if found:
+            if stale:
+                self.__refresh(key, family, fetch, query)
+            return result
+
+        return self.__fetch(key, family, fetch, query, self._generation)
+
+    def __fetch(self, key, family, fetch, query, generation):
+        result = fetch()
+
+        ttl, max_age = self.__ttls(family)
+        if ttl > 0:
+            tags = result_tags(result)
+            if query is not None:
+                tags |= query_tags(query)
+            self.put(key, result, ttl, tags, generation, max_age)
+
+        return result
+
+    # Schedules a refresh of the entry under key, unless one is pending or too many are.
+    def __refresh(self, key, family, fetch, query):
+        with self._lock:
+            if key in self._refreshes or len(self._refreshes) >= self.max_refreshes:
+                self._counters['refreshes_skipped'] += 1
+                return
+
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.refresh_workers,
+                                                                       thread_name_prefix='QueryCache-refresh')
+            self._refreshes[key] = self._executor.submit(self.__run_refresh, key, family, fetch, query,
+                                                         self._generation)
+
+    def __run_refresh(self, key, family, fetch, query, generation):
+        try:
+            self.__fetch(key, family, fetch, query, generation)
+            outcome = 'refreshes'
+        except Exception:
+            # The stale result is kept until its hard TTL
+            outcome = 'refresh_errors'
+
+        with self._lock:
+            del self._refreshes[key]
+            self._counters[outcome] += 1
+
+    # Waits for the pending refreshes to finish, at most timeout seconds if given. Returns whether they all did.
+    def wait_refreshes(self, timeout=None):
+        with self._lock:
+            futures = list(self._refreshes.values())
+
+        return len(concurrent.futures.wait(futures, timeout=timeout).not_done) == 0
+
+    # Returns whether a result is stored under key, and that result.
+    def get(self, key):
+        return self.__lookup(key)[:2]
+
+    # Returns whether a result is stored under key, that result, and whether it is stale.
+    def __lookup(self, key):
+        now = self._clock()
+        self.__poll(now)
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return True, entry[1], self.__stale(entry[3], now)
+
+                self.__forget(key)
+                self._counters['expirations'] += 1
+
+            if self._disk is None:
+                self._counters['misses'] += 1
+                return False, None, False
+            generation = self._generation
+
+        entry = self._disk.get(key)
+        if entry is not None and entry[0] > now:
+            stale = entry[2] if len(entry) > 2 else None
+            tags = self._disk.tags(key)
+
+            with self._lock:
+                # A result read while an invalidation happened is returned, as if read just before it, but not kept
+                if generation == self._generation:
+                    self.__remember(key, (entry[0], entry[1], tags, stale))
+                self._counters['disk_hits'] += 1
+                return True, entry[1], self.__stale(stale, now)
+
+        if entry is not None:
+            self._disk.delete(key)
+        with self._lock:
+            if entry is not None:
+                self._counters['expirations'] += 1
+            self._counters['misses'] += 1
+            return False, None, False
+
+    def __stale(self, stale, now):
+        if stale is None or stale > now:
+            return False
+
+        self._counters['stale_hits'] += 1
+        return True
+
+    # Stores result under key for ttl seconds, or until max_age seconds if greater, after which it is stale, tagged
+    # with the URIs it depends on. The result is not stored if generation is given and an invalidation happened
+    # since, as it may have been fetched before the write.
+    def put(self, key, result, ttl, tags=(), generation=None, max_age=None):
+        if ttl <= 0:
+            return
+
+        now = self._clock()
+        if max_age is not None and max_age > ttl:
+            expires, stale = now + max_age, now + ttl
+        else:
+            expires, stale = now + ttl, None
+        tags = frozenset(_tag(uri) for uri in tags)
+
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+
+            self.__remember(key, (expires, result, tags, stale))
+            self._counters['stores'] += 1
+            generation = self._generation
+
+        if self._disk is not None:
+            self._disk.put(key, (expires, result) if stale is None else (expires, result, stale), tags)
+
+            # An invalidation made while the result was written may have missed it
+            with self._lock:
+                invalidated = generation != self._generation
+            if invalidated:
+                self._disk.delete(key)
+
+    def __remember(self, key, entry):
+        if key in self._memory:
+            self.__forget(key)
+
+        self._memory[key] = entry
+        for tag in entry[2]:
+            self._tagged[tag].add(key)
+
+        while len(self._memory) > self.max_entries:
+            self.__forget(next(iter(self._memory)))
+            self._counters['evictions'] += 1
+
+    def __forget(self, key):
+        entry = self._memory.pop(key)
+        for tag in entry[2]:
+            keys = self._tagged[tag]
+            keys.discard(key)
+            if len(keys) == 0:
+                del self._tagged[tag]
+
+    # Removes the entries in memory tagged with any of tags, and returns their number.
+    def __drop(self, tags):
+        keys = set()
+        for tag in tags:
+            keys.update(self._tagged.get(tag, ()))
+
+        for key in keys:
+            self.__forget(key)
+        self._counters['invalidations'] += len(keys)
+
+        return len(keys)
+
+    # Drops the entries in memory invalidated by other processes since the last poll.
+    def __poll(self, now):
+        if self._disk is None:
+            return
+
+        with self._lock:
+            if now - self._polled < self.poll_interval:
+                return
+            self._polled = now
+            last_invalidation = self._last_invalidation
+
+        invalidations = self._disk.invalidations_since(last_invalidation)
+
+        with self._lock:
+            for logged, tags in invalidations:
+                # Invalidations already read by a concurrent poll
+                if logged <= self._last_invalidation:
+                    continue
+
+                self._last_invalidation = logged
+                if logged in self._logged:
+                    self._logged.discard(logged)
+                else:
+                    self._generation += 1
+                    self.__drop(tags)
+
+    # Removes the results depending on any of uris, in memory and on disk, and in the memory of the other caches
+    # sharing the disk tier once they poll. Returns the number of results removed from memory.
+    def invalidate(self, uris):
+        tags = frozenset(_tag(uri) for uri in uris)
+        if len(tags) == 0:
+            return 0
+
+        with self._lock:
+            self._generation += 1
+            count = self.__drop(tags)
+            if self._disk is not None:
+                self._logged.add(self._disk.invalidate(tags)[1])
+
+            return count
+
+    # Removes every result, in memory and on disk.
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._memory.clear()
+            self._tagged.clear()
+            if self._disk is not None:
+                self._disk.clear()
+
+    # Returns the number of memory and disk hits, misses, results stored, results evicted from memory, expired
+    # results found and results invalidated in memory, of the hits on stale results and of the refreshes that
+    # succeeded, failed or were skipped, along with the hit ratio and the number of results in memory.
+    def stats(self):
+        with self._lock:
+            stats = {name: self._counters[name] for name in
+                     ['memory_hits', 'disk_hits', 'misses', 'stores', 'evictions', 'expirations', 'invalidations',
+                      'stale_hits', 'refreshes', 'refresh_errors', 'refreshes_skipped']}
+            stats['entries'] = len(self._memory)
+
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups > 0 else 0.0
+
+        return stats
+
+    # Waits for the pending refreshes and commits the results waiting to be written to disk. The database stays open
+    # for the other caches using it.
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+        with self._lock:
+            if self._disk is not None:
+                self._disk.flush()
+
+
+# Returns the key under which the result of a query is cached: the SHA-256 digest, in hexadecimal, of the server,
+# the user on whose behalf the query is sent and whose graph it is restricted to, the result format and the
+# canonical form of the query.
+@functools.lru_cache(maxsize=4096)
+def cache_key(server, user, result_format, query):
+    parts = [_canonical_server(server), user or '', result_format or 'json', canonical_query(query)]
+    return hashlib.sha256('\x00'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _canonical_server(server):
+    parts = urlsplit(server.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/'), parts.query, ''))
+
+
+_TOKEN = re.compile(r"""
+    (?P<string>"{3}(?:[^"\\]|\\.|"(?!""))*"{3}|'{3}(?:[^'\\]|\\.|'(?!''))*'{3}
+        |"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+    |(?P<iri><[^<>"{}|^`\\\s]*>)
+    |(?P<comment>\#[^\n]*)
+    |(?P<space>\s+)
+    |(?P<punctuation>[{}(),;]|\.(?!\d))
+    |(?P<variable>[?$]\w+)
+    |(?P<word>[^\s"'<#{}(),;]*[^\s"'<#{}(),;.]|.)
+""", re.VERBOSE | re.DOTALL)
+
+
+# Returns the tokens of a query, dropping whitespace and comments. String literals and IRIs are single tokens, and
+# a dot is a token of its own unless it is within a name or a number.
+def _tokenize(query):
+    return [match.group() for match in _TOKEN.finditer(query) if match.lastgroup not in ('space', 'comment')]
+
+
+# Returns the BASE declaration of a query as a list of tokens, its PREFIX declarations as a dictionary, and the
+# index of the first token of its body.
+def _prologue(tokens):
+    base = []
+    prefixes = {}
+    i = 0
+    while i < len(tokens):
+        keyword = tokens[i].upper()
+        if keyword == 'PREFIX' and i + 2 < len(tokens):
+            prefixes[tokens[i + 1]] = tokens[i + 2]
+            i += 3
+        elif keyword == 'BASE' and i + 1 < len(tokens):
+            base = ['BASE', tokens[i + 1]]
+            i += 2
+        else:
+            break
+
+    return base, prefixes, i
+
+
+# Returns a form of a query shared by queries that only differ by whitespace, comments or the order and repetition
+# of their PREFIX declarations. Whitespace within string literals is kept.
+def canonical_query(query):
+    tokens = _tokenize(query)
+    base, prefixes, i = _prologue(tokens)
+
+    prologue = base + [token for name in sorted(prefixes) for token in ('PREFIX', name, prefixes[name])]
+
+    return ' '.join(prologue + tokens[i:])
+
+
+# Returns the URIs a query depends on: the IRIs in its body, which include the collections and entities listed in
+# its VALUES clauses. The IRIs of its PREFIX declarations are left out.
+def query_tags(query):
+    tokens = _tokenize(query)
+    i = _prologue(tokens)[2]
+
+    return set(token[1:-1] for token in tokens[i:] if len(token) > 2 and token[0] == '<' and token[-1] == '>')
+
+
+# Returns the URIs bound in a result in the SPARQL JSON format. Results in other formats have no tags.
+def result_tags(result):
+    try:
+        bindings = result['results']['bindings']
+    except (TypeError, KeyError, IndexError):
+        return set()
+
+    return set(value['value'] for binding in bindings for value in binding.values() if value.get('type') == 'uri')
+
+
+# Returns the form of a URI under which entries are tagged. The scheme is dropped, as SynBioHub serves the same
+# objects over http and https.
+def _tag(uri):
+    return uri.split('://', 1)[-1]
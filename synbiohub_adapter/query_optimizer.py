@@ -0,0 +1,229 @@
+import re
+
+from .sparql_ast import Select, Group, Triple, Values, Optional, Union, Filter, Var, Expr, Seq, Alt, Repeat, Inverse
+
+'''
+    This module rewrites the Select nodes of sparql_ast so that SPARQL endpoints evaluating their patterns in the
+    order written, as Virtuoso largely does, start from the most selective ones.
+
+    Within a group, the patterns between two OPTIONALs are joined, so they can be evaluated in any order. Their
+    triples are ordered greedily, each next triple being the cheapest given the variables bound by the patterns
+    before it, the variables of VALUES blocks counting as bound from the start. Each VALUES block is moved just
+    before the first triple using its variables, so that a triple made selective by a VALUES block comes first
+    along with it, while blocks used later do not multiply the evaluation of the triples before them. FILTERs,
+    which apply to the whole group, are moved last. Patterns are never moved across an OPTIONAL, which is only
+    joined to the patterns before it.
+
+    A path repeating a property any number of times, such as the prov:wasDerivedFrom*/sbol:built path from the
+    samples of an experiment to what they were built from, is evaluated from every node of the graph when its ends
+    are unbound. REPEAT_COST makes such a triple cost more than any other triple, so that it is placed after a
+    triple binding one of its ends.
+
+    The leading triples and VALUES blocks shared by every branch of a UNION, such as the collection pattern of the
+    entity_depth=2 queries of SBOLQuery, are moved out of it, as joining them to the union is the same as joining
+    them to each branch. They are left in the branches when a FILTER, OPTIONAL or repeated path of a branch uses one
+    of their variables that the rest of the branch does not bind, as engines evaluating each branch on its own, like
+    rdflib, would evaluate it without that variable bound.
+'''
+
+# The estimated cost of a triple pattern, by whether its subject, predicate and object are bound
+TRIPLE_COSTS = {
+    (True, True, True): 1,
+    (True, False, True): 2,
+    (False, True, True): 3,
+    (True, True, False): 4,
+    (False, False, True): 5,
+    (True, False, False): 6,
+    (False, True, False): 7,
+    (False, False, False): 8
+}
+
+# The cost added to a triple whose predicate path repeats a property any number of times
+REPEAT_COST = 2
+
+# The cost added to a triple sharing no variable with the patterns before it, which would be a cross product
+CROSS_PRODUCT_COST = 4
+
+# Predicates whose objects are classes, matched by too many subjects to be counted as bound
+CLASS_PREDICATES = ['a', 'rdf:type']
+
+_TEMPLATE_VARIABLE = re.compile(r'[?$](\w+)')
+
+
+# Returns a copy of select whose patterns are reordered and whose unions are factored.
+def optimize(select):
+    return Select(select.variables, rewrite_group(select.where), select.distinct, select.group_by,
+                  select.order_by, select.limit, select.offset, select.prefixes)
+
+
+# Returns a copy of group whose patterns are reordered and whose unions are factored, given the variables bound
+# by the patterns the group is joined to.
+def rewrite_group(group, bound=()):
+    bound = set(bound)
+    patterns = []
+    segment = []
+
+    for pattern in group:
+        if isinstance(pattern, Optional):
+            patterns.extend(_rewrite_segment(segment, bound))
+            patterns.append(Optional(rewrite_group(pattern.group, bound)))
+            segment = []
+        elif isinstance(pattern, Union):
+            common, union = factor_union(pattern)
+            segment.extend(common)
+            segment.append(union)
+        else:
+            segment.append(pattern)
+    patterns.extend(_rewrite_segment(segment, bound))
+
+    return Group(*patterns)
+
+
+# Returns the leading triples and VALUES blocks shared by every branch of union, which can be joined to it
+# instead, and the union of the rest of each branch.
+def factor_union(union):
+    if len(union.groups) < 2:
+        return [], union
+
+    branches = [list(group) for group in union.groups]
+    common = []
+    for patterns in zip(*branches):
+        if not isinstance(patterns[0], (Triple, Values)) or any(pattern != patterns[0] for pattern in patterns):
+            break
+        common.append(patterns[0])
+
+    branches = [branch[len(common):] for branch in branches]
+    if len(common) == 0 or not all(_can_factor(common, branch) for branch in branches):
+        return [], union
+
+    return common, Union(*[Group(*branch) for branch in branches])
+
+
+# Returns the names of the variables of a term or pattern.
+def variables(node):
+    if isinstance(node, Var):
+        return {node.name}
+    elif isinstance(node, Expr):
+        names = set(_TEMPLATE_VARIABLE.findall(node.template))
+        for arg in node.args:
+            names.update(variables(arg))
+        return names
+    elif isinstance(node, Triple):
+        return variables(node.subject) | variables(node.predicate) | variables(node.object)
+    elif isinstance(node, Values):
+        return {var.name for var in node.variables}
+    elif isinstance(node, Filter):
+        return variables(node.expression)
+    elif isinstance(node, Optional):
+        return variables(node.group)
+    elif isinstance(node, Union):
+        return set().union(*[variables(group) for group in node.groups])
+    elif isinstance(node, Group):
+        return set().union(*[variables(pattern) for pattern in node])
+
+    return set()
+
+
+# Returns the estimated cost of evaluating triple once the variables in bound are bound.
+def triple_cost(triple, bound):
+    subject_bound = _is_bound(triple.subject, bound)
+    predicate_bound = _is_bound(triple.predicate, bound)
+    object_bound = _is_bound(triple.object, bound) and triple.predicate not in CLASS_PREDICATES
+
+    cost = TRIPLE_COSTS[(subject_bound, predicate_bound, object_bound)]
+    if _repeats(triple.predicate):
+        cost += REPEAT_COST
+    if len(bound) > 0 and len(variables(triple)) > 0 and variables(triple).isdisjoint(bound):
+        cost += CROSS_PRODUCT_COST
+
+    return cost
+
+
+# Orders the patterns of a segment, joined to the patterns binding the variables in bound, which is updated with
+# the variables they bind.
+def _rewrite_segment(segment, bound):
+    values = [pattern for pattern in segment if isinstance(pattern, Values)]
+    triples = [pattern for pattern in segment if isinstance(pattern, Triple)]
+    unions = [pattern for pattern in segment if isinstance(pattern, Union)]
+    filters = [pattern for pattern in segment if isinstance(pattern, Filter)]
+
+    ordered = []
+    for pattern in values:
+        bound.update(variables(pattern))
+
+    while len(triples) > 0:
+        costs = [triple_cost(triple, bound) for triple in triples]
+        triple = triples.pop(costs.index(min(costs)))
+        ordered.extend(pattern for pattern in values if not variables(pattern).isdisjoint(variables(triple)))
+        values = [pattern for pattern in values if variables(pattern).isdisjoint(variables(triple))]
+        ordered.append(triple)
+        bound.update(variables(triple))
+
+    ordered.extend(values)
+    for union in unions:
+        ordered.append(Union(*[rewrite_group(group, bound) for group in union.groups]))
+    for union in unions:
+        bound.update(_certain_variables(union))
+
+    return ordered + filters
+
+
+def _is_bound(term, bound):
+    if isinstance(term, Var):
+        return term.name in bound
+
+    return True
+
+
+def _repeats(path):
+    if isinstance(path, Repeat):
+        return path.modifier in ('*', '+') or _repeats(path.path)
+    elif isinstance(path, (Seq, Alt)):
+        return any(_repeats(sub_path) for sub_path in path.paths)
+    elif isinstance(path, Inverse):
+        return _repeats(path.path)
+
+    return False
+
+
+# Returns the names of the variables bound in every solution of a pattern.
+def _certain_variables(pattern):
+    if isinstance(pattern, Triple):
+        return variables(pattern)
+    elif isinstance(pattern, Values):
+        return {var.name for i, var in enumerate(pattern.variables)
+                if all(row[i] is not None for row in pattern.rows)}
+    elif isinstance(pattern, Union):
+        return set.intersection(*[_certain_variables(group) for group in pattern.groups])
+    elif isinstance(pattern, Group):
+        return set().union(*[_certain_variables(member) for member in pattern
+                             if not isinstance(member, (Optional, Filter))])
+
+    return set()
+
+
+# Returns whether the common patterns can be moved out of a branch of a union, that is whether the FILTERs,
+# OPTIONALs and repeated paths of the branch use only the variables of the common patterns that the rest of the
+# branch binds.
+def _can_factor(common, branch):
+    common_variables = set().union(*[variables(pattern) for pattern in common])
+    branch_variables = _certain_variables(Group(*branch))
+
+    paths = [pattern for pattern in branch if isinstance(pattern, Triple) and _repeats(pattern.predicate)]
+    path_free_variables = _certain_variables(Group(*[pattern for pattern in branch if pattern not in paths]))
+    for path in paths:
+        if not variables(path) & common_variables <= path_free_variables:
+            return False
+
+    preceding = set()
+    for pattern in branch:
+        if isinstance(pattern, Filter):
+            if not variables(pattern) & common_variables <= branch_variables:
+                return False
+        elif isinstance(pattern, Optional):
+            if not variables(pattern) & common_variables <= preceding:
+                return False
+        else:
+            preceding.update(_certain_variables(pattern))
+
+    return True
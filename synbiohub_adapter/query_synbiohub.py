@@ -3,6 +3,9 @@ import sys
 import json
 
 from synbiohub_adapter.SynBioHubUtil import *
+from synbiohub_adapter.sparql_results import iter_bindings
+from synbiohub_adapter.sparql_ast import (serialize, Select, Group, Triple, Values, Optional, Union, Filter, Expr, As,
+                                          Var, IRI, Literal, Repeat, iris)
 from sbol2 import *
 
 '''
@@ -12,6 +15,9 @@ from sbol2 import *
                 Tramy Nguyen
 '''
 
+# The levels of an inducer, as a JSON list of its concentrations
+INDUCER_LEVELS = As(Expr("concat('[',group_concat(distinct ?level;separator=','),']')"), Var('levels'))
+
 
 class SynBioHubQuery(SBOLQuery):
     ''' This class is used is used to push and pull information from SynBioHub.
@@ -19,8 +25,13 @@ class SynBioHubQuery(SBOLQuery):
     '''
 
     # server: The SynBioHub server to call sparql queries on.
-    def __init__(self, server, use_fallback_cache=False, user=None, authentication_key=None, spoofed_url=None):
-        super().__init__(server, use_fallback_cache, user, authentication_key, spoofed_url)
+    def __init__(self, server, use_fallback_cache=False, user=None, authentication_key=None, spoofed_url=None,
+                 transport=None, pool_size=10, stream_results=False, result_format='json', retry_policy=None,
+                 endpoints=None, timeout=None, session=None, cache=None, single_flight=None,
+                 existence_cache=None, page_size=None, prefetch_pages=True):
+        super().__init__(server, use_fallback_cache, user, authentication_key, spoofed_url, transport, pool_size,
+                         stream_results, result_format, retry_policy, endpoints, timeout, session, cache,
+                         single_flight, existence_cache, page_size, prefetch_pages)
 
     # Control query methods \\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\
 
@@ -108,6 +119,13 @@ class SynBioHubQuery(SBOLQuery):
     def query_single_experiment_controls(self, experiment, verbose=False, trace_derivation=True, by_sample=True, pretty=True):
         return self.query_experiment_controls(verbose, trace_derivation, by_sample, pretty, experiments=[experiment])
 
+    # Retrieves the result of query_single_experiment_controls for each of the specified experiments,
+    # by experiment URI, with a few queries over chunks of the experiments, see fan_in_experiments.
+    def query_multi_experiment_controls(self, experiments, verbose=False, trace_derivation=True, by_sample=True,
+                                        pretty=True, chunk_size=None):
+        return self.fan_in_experiments('query_experiment_controls', experiments, chunk_size, verbose=verbose,
+                                       trace_derivation=trace_derivation, by_sample=by_sample, pretty=pretty)
+
     # Retrieves the URIs for all controls used by experiments in the collection of every SD2 experiment.
     def query_experiment_fbead_controls(self, verbose=False, trace_derivation=True, by_sample=False, pretty=True, collections=[SD2Constants.SD2_EXPERIMENT_COLLECTION], experiments=[]):
         return self.query_experiment_controls(verbose, trace_derivation, by_sample, pretty, collections, [SBOLConstants.BEAD], [SBOLConstants.FLUORESCENCE], experiments=experiments)
@@ -217,29 +235,31 @@ class SynBioHubQuery(SBOLQuery):
     def query_single_experiment_dna(self, experiment, verbose=False, with_sequence=False, trace_derivation=True, by_sample=True, pretty=True):
         return self.query_experiment_dna(verbose, with_sequence, trace_derivation, by_sample, pretty, experiments=[experiment])
 
+    # Retrieves the result of query_single_experiment_dna for each of the specified experiments,
+    # by experiment URI, with a few queries over chunks of the experiments, see fan_in_experiments.
+    def query_multi_experiment_dna(self, experiments, verbose=False, with_sequence=False, trace_derivation=True,
+                                   by_sample=True, pretty=True, chunk_size=None):
+        return self.fan_in_experiments('query_experiment_dna', experiments, chunk_size, verbose=verbose,
+                                       with_sequence=with_sequence, trace_derivation=trace_derivation,
+                                       by_sample=by_sample, pretty=pretty)
+
     # Gate query methods \\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\
 
     # Retrieves input levels for gates based on experimental conditions and sorts levels by input ID if a single gate is queried.
     def query_gate_input_levels(self, gates, pretty=False):
-        gate_query = """
-        PREFIX dcterms: <http://purl.org/dc/terms/>
-        PREFIX sbol: <http://sbols.org/v2#>
-        PREFIX sd2: <http://sd2e.org#>
-
-        SELECT DISTINCT ?gate ?gate_type ?input ?level WHERE {{
-            <https://hub.sd2e.org/user/sd2e/experiment/experiment_collection/1> sbol:member ?exp .
-            ?exp sd2:experimentalDesign ?design .
-            ?design sd2:experimentalCondition ?cond .
-            VALUES (?gate) {{ {ga} }}
-            ?cond sd2:definition ?gate ;
-                sd2:experimentalLevel ?elevel .
-            ?gate sbol:role ?gate_type .
-            ?elevel sd2:level ?level;
-                sd2:experimentalVariable ?evar .
-            ?evar dcterms:title ?input .
-            FILTER ( strstarts(str(?gate_type), "http://www.openmath.org/cd/logic1") )
-        }}
-        """.format(ga=self.serialize_options(gates))
+        gate_query = serialize(Select(['gate', 'gate_type', 'input', 'level'], Group(
+            Triple(IRI(SD2Constants.SD2_EXPERIMENT_COLLECTION), 'sbol:member', Var('exp')),
+            Triple(Var('exp'), 'sd2:experimentalDesign', Var('design')),
+            Triple(Var('design'), 'sd2:experimentalCondition', Var('cond')),
+            Values(Var('gate'), iris(gates)),
+            Triple(Var('cond'), 'sd2:definition', Var('gate')),
+            Triple(Var('cond'), 'sd2:experimentalLevel', Var('elevel')),
+            Triple(Var('gate'), 'sbol:role', Var('gate_type')),
+            Triple(Var('elevel'), 'sd2:level', Var('level')),
+            Triple(Var('elevel'), 'sd2:experimentalVariable', Var('evar')),
+            Triple(Var('evar'), 'dcterms:title', Var('input')),
+            Filter(Expr('strstarts(str(?gate_type), {})', Literal('http://www.openmath.org/cd/logic1')))),
+            distinct=True))
         query_result = self.fetch_SPARQL(self._server, gate_query)
         if pretty:
             if len(gates) == 1:
@@ -247,19 +267,18 @@ class SynBioHubQuery(SBOLQuery):
             else:
                 query_result = self.format_query_result(query_result, ['gate', 'gate_type', 'input', 'level'])
         elif len(gates) == 1:
+            if not isinstance(query_result, dict):
+                query_result = query_result.to_dict()
             self.sort_query_result(query_result, 'input')
 
         return query_result
 
     def query_gate_logic(self, gates, pretty=False):
-        gate_query = """
-            PREFIX sbol: <http://sbols.org/v2#>
-            SELECT DISTINCT ?gate ?gate_type WHERE  {{
-                VALUES (?gate) {{ {ga} }}
-                ?gate sbol:role ?gate_type
-                FILTER(STRSTARTS(STR(?gate_type), "http://www.openmath.org/cd/logic1#"))
-            }}
-        """.format(ga=self.serialize_options(gates))
+        gate_query = serialize(Select(['gate', 'gate_type'], Group(
+            Values(Var('gate'), iris(gates)),
+            Triple(Var('gate'), 'sbol:role', Var('gate_type')),
+            Filter(Expr('STRSTARTS(STR(?gate_type), {})', Literal('http://www.openmath.org/cd/logic1#')))),
+            distinct=True))
 
         query_result = self.fetch_SPARQL(self._server, gate_query)
         if pretty:
@@ -324,19 +343,23 @@ class SynBioHubQuery(SBOLQuery):
     def query_single_experiment_gates(self, experiment, verbose=False, with_role=True, trace_derivation=True, by_sample=True, pretty=True):
         return self.query_experiment_gates(verbose, with_role, trace_derivation, by_sample, pretty, experiments=[experiment])
 
+    # Retrieves the result of query_single_experiment_gates for each of the specified experiments,
+    # by experiment URI, with a few queries over chunks of the experiments, see fan_in_experiments.
+    def query_multi_experiment_gates(self, experiments, verbose=False, with_role=True, trace_derivation=True,
+                                     by_sample=True, pretty=True, chunk_size=None):
+        return self.fan_in_experiments('query_experiment_gates', experiments, chunk_size, verbose=verbose,
+                                       with_role=with_role, trace_derivation=trace_derivation, by_sample=by_sample,
+                                       pretty=pretty)
+
     # Inducer query methods \\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\
 
     # Retrieves the URIs for all inducers from the specified collection of design elements.
     # This collection is typically associated with a challenge problem.
     def query_design_set_inducers(self, collection):
-        inducer_query = """
-        PREFIX sbol: <http://sbols.org/v2#>
-        SELECT DISTINCT ?inducer WHERE {{
-            <{col}> sbol:member ?inducer .
-            ?inducer sbol:type <{ty}> ;
-                sbol:role <{ro}>
-        }}
-        """.format(col=collection, ty=BIOPAX_SMALL_MOLECULE, ro=SBOLConstants.EFFECTOR)
+        inducer_query = serialize(Select(['inducer'], Group(
+            Triple(IRI(collection), 'sbol:member', Var('inducer')),
+            Triple(Var('inducer'), 'sbol:type', IRI(BIOPAX_SMALL_MOLECULE)),
+            Triple(Var('inducer'), 'sbol:role', IRI(SBOLConstants.EFFECTOR))), distinct=True))
 
         return self.fetch_SPARQL(self._server, inducer_query)
 
@@ -346,103 +369,71 @@ class SynBioHubQuery(SBOLQuery):
 
     # Retrieves the URIs for all inducers in the specified experiment and their associated levels.
     def query_single_experiment_inducers(self, experiment):
-        inducer_query = """
-        PREFIX sbol: <http://sbols.org/v2#>
-        PREFIX sd2: <http://sd2e.org#>
-        PREFIX om: <http://www.ontology-of-units-of-measure.org/resource/om-2#>
-        PREFIX prov: <http://www.w3.org/ns/prov#>
-        SELECT ?inducer (concat('[',group_concat(distinct ?level;separator=','),']') as ?levels)
-        WHERE {{
-            <{exp}> sd2:experimentalData ?data .
-            ?data prov:wasDerivedFrom ?sample .
-            ?sample sbol:built ?condition .
-            ?condition sbol:functionalComponent ?fc .
-            ?fc sbol:definition ?inducer .
-            ?inducer sbol:type <{ty}> ;
-                sbol:role <{ro}> .
-            OPTIONAL {{
-                ?fc om:measure ?concentration .
-                ?concentration om:hasNumericalValue ?level
-            }}
-        }}
-        GROUP BY ?inducer
-        """.format(exp=experiment, ty=BIOPAX_SMALL_MOLECULE, ro=SBOLConstants.EFFECTOR)
+        inducer_query = serialize(Select(['inducer', INDUCER_LEVELS], Group(
+            Triple(IRI(experiment), 'sd2:experimentalData', Var('data')),
+            Triple(Var('data'), 'prov:wasDerivedFrom', Var('sample')),
+            Triple(Var('sample'), 'sbol:built', Var('condition')),
+            self.__inducer_pattern(Var('condition'))), group_by=['inducer']))
 
         return self.fetch_SPARQL(self._server, inducer_query)
 
     # Retrieves the URIs for all inducers used in the specified collection of experiments and their associated levels.
     # This collection is typically associated with a challenge problem.
     def query_experiment_set_inducers(self, collection):
-        inducer_query = """
-        PREFIX sbol: <http://sbols.org/v2#>
-        PREFIX sd2: <http://sd2e.org#>
-        PREFIX om: <http://www.ontology-of-units-of-measure.org/resource/om-2#>
-        PREFIX prov: <http://www.w3.org/ns/prov#>
-        SELECT ?inducer (concat('[',group_concat(distinct ?level;separator=','),']') as ?levels)
-        WHERE {{
-            <{col}> sbol:member ?exp .
-            ?exp sd2:experimentalData ?data .
-            ?data prov:wasDerivedFrom ?sample .
-            ?sample sbol:built ?condition .
-            ?condition sbol:functionalComponent ?fc .
-            ?fc sbol:definition ?inducer .
-            ?inducer sbol:type <{ty}> ;
-                sbol:role <{ro}> .
-            OPTIONAL {{
-                ?fc om:measure ?concentration .
-                ?concentration om:hasNumericalValue ?level
-            }}
-        }}
-        GROUP BY ?inducer
-        """.format(col=collection, ty=BIOPAX_SMALL_MOLECULE, ro=SBOLConstants.EFFECTOR)
+        inducer_query = serialize(Select(['inducer', INDUCER_LEVELS], Group(
+            Triple(IRI(collection), 'sbol:member', Var('exp')),
+            Triple(Var('exp'), 'sd2:experimentalData', Var('data')),
+            Triple(Var('data'), 'prov:wasDerivedFrom', Var('sample')),
+            Triple(Var('sample'), 'sbol:built', Var('condition')),
+            self.__inducer_pattern(Var('condition'))), group_by=['inducer']))
+
+        return self.fetch_SPARQL(self._server, inducer_query)
+
+    # Retrieves the URIs for all inducers used by experiments in the collection of every SD2 experiment, or by the
+    # specified experiments, and their associated levels.
+    def query_experiment_inducers(self, experiments=[]):
+        if len(experiments) == 0:
+            return self.query_experiment_set_inducers(SD2Constants.SD2_EXPERIMENT_COLLECTION)
+
+        labels = ['exp', 'inducer'] if self.project_experiments else ['inducer']
+        inducer_query = serialize(Select(labels + [INDUCER_LEVELS], Group(
+            Values(Var('exp'), iris(experiments)),
+            Triple(Var('exp'), 'sd2:experimentalData', Var('data')),
+            Triple(Var('data'), 'prov:wasDerivedFrom', Var('sample')),
+            Triple(Var('sample'), 'sbol:built', Var('condition')),
+            self.__inducer_pattern(Var('condition'))), group_by=labels))
 
         return self.fetch_SPARQL(self._server, inducer_query)
 
-    # Retrieves the URIs for all inducers used by experiments in the collection of every SD2 experiment.
-    def query_experiment_inducers(self):
-        return self.query_experiment_set_inducers(SD2Constants.SD2_EXPERIMENT_COLLECTION)
+    # Retrieves the result of query_single_experiment_inducers for each of the specified experiments,
+    # by experiment URI, with a few queries over chunks of the experiments, see fan_in_experiments.
+    def query_multi_experiment_inducers(self, experiments, chunk_size=None):
+        return self.fan_in_experiments('query_experiment_inducers', experiments, chunk_size)
 
     # Retrieves the URIs for all inducers in the specified sample and their associated levels.
     def query_sample_inducers(self, sample):
-        inducer_query = """
-        PREFIX sbol: <http://sbols.org/v2#>
-        PREFIX om: <http://www.ontology-of-units-of-measure.org/resource/om-2#>
-        SELECT ?inducer ?level WHERE {{
-            <{samp}> sbol:built ?condition .
-            ?condition sbol:functionalComponent ?fc .
-            ?fc sbol:definition ?inducer .
-            ?inducer sbol:type <{ty}> ;
-                sbol:role <{ro}> .
-            OPTIONAL {{
-                ?fc om:measure ?concentration .
-                ?concentration om:hasNumericalValue ?level
-            }}
-        }}
-        GROUP BY ?inducer
-        """.format(samp=sample, ty=BIOPAX_SMALL_MOLECULE, ro=SBOLConstants.EFFECTOR)
+        inducer_query = serialize(Select(['inducer', 'level'], Group(
+            Triple(IRI(sample), 'sbol:built', Var('condition')),
+            self.__inducer_pattern(Var('condition'))), group_by=['inducer']))
 
         return self.fetch_SPARQL(self._server, inducer_query)
 
     # Retrieves the URIs for all inducers in the specified sample condition and their associated levels.
     def query_condition_inducers(self, condition):
-        inducer_query = """
-        PREFIX sbol: <http://sbols.org/v2#>
-        PREFIX om: <http://www.ontology-of-units-of-measure.org/resource/om-2#>
-        SELECT ?inducer ?level WHERE {{
-            <{cond}> sbol:functionalComponent ?fc .
-            ?fc sbol:definition ?inducer .
-            ?inducer sbol:type <{ty}> ;
-                sbol:role <{ro}> .
-            OPTIONAL {{
-                ?fc om:measure ?concentration .
-                ?concentration om:hasNumericalValue ?level
-            }}
-        }}
-        GROUP BY ?inducer
-        """.format(cond=condition, ty=BIOPAX_SMALL_MOLECULE, ro=SBOLConstants.EFFECTOR)
+        inducer_query = serialize(Select(['inducer', 'level'], self.__inducer_pattern(IRI(condition)),
+                                         group_by=['inducer']))
 
         return self.fetch_SPARQL(self._server, inducer_query)
 
+    # Returns the pattern matching the inducers of a sample condition and their optional concentrations.
+    def __inducer_pattern(self, condition):
+        return Group(Triple(condition, 'sbol:functionalComponent', Var('fc')),
+                     Triple(Var('fc'), 'sbol:definition', Var('inducer')),
+                     Triple(Var('inducer'), 'sbol:type', IRI(BIOPAX_SMALL_MOLECULE)),
+                     Triple(Var('inducer'), 'sbol:role', IRI(SBOLConstants.EFFECTOR)),
+                     Optional(Triple(Var('fc'), 'om:measure', Var('concentration')),
+                              Triple(Var('concentration'), 'om:hasNumericalValue', Var('level'))))
+
     # Media query methods \\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\
 
     # Retrieves the URIs for all media from the collection of every SD2 design element.
@@ -493,6 +484,13 @@ class SynBioHubQuery(SBOLQuery):
     def query_single_experiment_media(self, experiment, verbose=False, trace_derivation=True, by_sample=True, pretty=True):
         return self.query_experiment_media(verbose, trace_derivation, by_sample, pretty, experiments=[experiment])
 
+    # Retrieves the result of query_single_experiment_media for each of the specified experiments,
+    # by experiment URI, with a few queries over chunks of the experiments, see fan_in_experiments.
+    def query_multi_experiment_media(self, experiments, verbose=False, trace_derivation=True, by_sample=True,
+                                     pretty=True, chunk_size=None):
+        return self.fan_in_experiments('query_experiment_media', experiments, chunk_size, verbose=verbose,
+                                       trace_derivation=trace_derivation, by_sample=by_sample, pretty=pretty)
+
     # Plasmid query methods \\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\
 
     # Retrieves URIs and optional properties for all plasmids (or a specified
@@ -558,35 +556,35 @@ class SynBioHubQuery(SBOLQuery):
     def query_single_experiment_plasmids(self, experiment, verbose=False, with_sequence=False, trace_derivation=True, by_sample=True, pretty=True):
         return self.query_experiment_plasmids(verbose, with_sequence, trace_derivation, by_sample, pretty, experiments=[experiment])
 
+    # Retrieves the result of query_single_experiment_plasmids for each of the specified experiments,
+    # by experiment URI, with a few queries over chunks of the experiments, see fan_in_experiments.
+    def query_multi_experiment_plasmids(self, experiments, verbose=False, with_sequence=False, trace_derivation=True,
+                                        by_sample=True, pretty=True, chunk_size=None):
+        return self.fan_in_experiments('query_experiment_plasmids', experiments, chunk_size, verbose=verbose,
+                                       with_sequence=with_sequence, trace_derivation=trace_derivation,
+                                       by_sample=by_sample, pretty=pretty)
+
     # Retrieves the URIs for all plasmids in the specified sample.
     def query_sample_plasmids(self, sample):
-        plasmid_query = """
-        PREFIX sbol: <http://sbols.org/v2#>
-        SELECT DISTINCT ?plasmid WHERE {{
-            <{samp}> sbol:built ?condition .
-            ?condition sbol:functionalComponent ?fc .
-            ?fc sbol:definition ?plasmid .
-            ?plasmid sbol:type <{ty1}> ;
-                sbol:type <{ty2}>
-        }}
-        """.format(samp=sample, ty1=BIOPAX_DNA, ty2=SO_CIRCULAR)
+        plasmid_query = serialize(Select(['plasmid'], Group(
+            Triple(IRI(sample), 'sbol:built', Var('condition')),
+            self.__plasmid_pattern(Var('condition'))), distinct=True))
 
         return self.fetch_SPARQL(self._server, plasmid_query)
 
     # Retrieves the URIs for all plasmids in the specified sample condition.
     def query_condition_plasmids(self, condition):
-        plasmid_query = """
-        PREFIX sbol: <http://sbols.org/v2#>
-        SELECT DISTINCT ?plasmid WHERE {{
-            <{cond}> sbol:functionalComponent ?fc .
-            ?fc sbol:definition ?plasmid .
-            ?plasmid sbol:type <{ty1}> ;
-                sbol:type <{ty2}>
-        }}
-        """.format(cond=condition, ty1=BIOPAX_DNA, ty2=SO_CIRCULAR)
+        plasmid_query = serialize(Select(['plasmid'], self.__plasmid_pattern(IRI(condition)), distinct=True))
 
         return self.fetch_SPARQL(self._server, plasmid_query)
 
+    # Returns the pattern matching the plasmids of a sample condition.
+    def __plasmid_pattern(self, condition):
+        return Group(Triple(condition, 'sbol:functionalComponent', Var('fc')),
+                     Triple(Var('fc'), 'sbol:definition', Var('plasmid')),
+                     Triple(Var('plasmid'), 'sbol:type', IRI(BIOPAX_DNA)),
+                     Triple(Var('plasmid'), 'sbol:type', IRI(SO_CIRCULAR)))
+
     # Primer query methods \\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\
 
     # Retrieves the URIs for all plasmids from the collection of every SD2 design element.
@@ -653,6 +651,14 @@ class SynBioHubQuery(SBOLQuery):
     def query_single_experiment_primers(self, experiment, verbose=False, with_sequence=False, trace_derivation=True, by_sample=True, pretty=True, downstream_gene=None):
         return self.query_experiment_plasmids(verbose, with_sequence, trace_derivation, by_sample, pretty, experiments=[experiment], downstream_gene=downstream_gene)
 
+    # Retrieves the result of query_single_experiment_primers for each of the specified experiments,
+    # by experiment URI, with a few queries over chunks of the experiments, see fan_in_experiments.
+    def query_multi_experiment_primers(self, experiments, verbose=False, with_sequence=False, trace_derivation=True,
+                                       by_sample=True, pretty=True, downstream_gene=None, chunk_size=None):
+        return self.fan_in_experiments('query_experiment_primers', experiments, chunk_size, verbose=verbose,
+                                       with_sequence=with_sequence, trace_derivation=trace_derivation,
+                                       by_sample=by_sample, pretty=pretty, downstream_gene=downstream_gene)
+
     # DNA query methods \\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\
 
     # Retrieves the URIs for all protein components from the collection of every SD2 design element.
@@ -709,6 +715,14 @@ class SynBioHubQuery(SBOLQuery):
     def query_single_experiment_proteins(self, experiment, verbose=False, with_sequence=False, trace_derivation=True, by_sample=True, pretty=True):
         return self.query_experiment_proteins(verbose, with_sequence, trace_derivation, by_sample, pretty, experiments=[experiment])
 
+    # Retrieves the result of query_single_experiment_proteins for each of the specified experiments,
+    # by experiment URI, with a few queries over chunks of the experiments, see fan_in_experiments.
+    def query_multi_experiment_proteins(self, experiments, verbose=False, with_sequence=False, trace_derivation=True,
+                                        by_sample=True, pretty=True, chunk_size=None):
+        return self.fan_in_experiments('query_experiment_proteins', experiments, chunk_size, verbose=verbose,
+                                       with_sequence=with_sequence, trace_derivation=trace_derivation,
+                                       by_sample=by_sample, pretty=pretty)
+
     # Riboswitch query methods \\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\
 
     # Retrieves the URIs for all riboswitches from the collection of every SD2 design element.
@@ -765,6 +779,14 @@ class SynBioHubQuery(SBOLQuery):
     def query_single_experiment_riboswitches(self, experiment, verbose=False, with_sequence=False, trace_derivation=True, by_sample=True, pretty=True):
         return self.query_experiment_riboswitches(verbose, with_sequence, trace_derivation, by_sample, pretty, experiments=[experiment])
 
+    # Retrieves the result of query_single_experiment_riboswitches for each of the specified experiments,
+    # by experiment URI, with a few queries over chunks of the experiments, see fan_in_experiments.
+    def query_multi_experiment_riboswitches(self, experiments, verbose=False, with_sequence=False,
+                                            trace_derivation=True, by_sample=True, pretty=True, chunk_size=None):
+        return self.fan_in_experiments('query_experiment_riboswitches', experiments, chunk_size, verbose=verbose,
+                                       with_sequence=with_sequence, trace_derivation=trace_derivation,
+                                       by_sample=by_sample, pretty=pretty)
+
     # Strain query methods \\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\
     # def query_and_compare_strains(self, strains):
     #   strain_query = """
@@ -864,30 +886,29 @@ class SynBioHubQuery(SBOLQuery):
     def query_single_experiment_strains(self, experiment, verbose=False, trace_derivation=True, by_sample=True, pretty=True):
         return self.query_experiment_strains(verbose, trace_derivation, by_sample, pretty, experiments=[experiment])
 
+    # Retrieves the result of query_single_experiment_strains for each of the specified experiments,
+    # by experiment URI, with a few queries over chunks of the experiments, see fan_in_experiments.
+    def query_multi_experiment_strains(self, experiments, verbose=False, trace_derivation=True, by_sample=True,
+                                       pretty=True, chunk_size=None):
+        return self.fan_in_experiments('query_experiment_strains', experiments, chunk_size, verbose=verbose,
+                                       trace_derivation=trace_derivation, by_sample=by_sample, pretty=pretty)
+
     # Sample query methods \\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\
 
     def query_single_experiment_samples_by_probability(self, experiment, threshold):
-        sample_query = """
-        PREFIX sd2: <http://sd2e.org#>
-        PREFIX prov: <http://www.w3.org/ns/prov#>
-        SELECT ?sample ?prob WHERE {{
-            <{exp}> sd2:experimentalData ?data;
-                sd2:matches_sample ?intent_sample .
-            ?data prov:wasDerivedFrom+ ?sample .
-            ?intent_sample sd2:has_sample ?sample .
-            ?intent_sample sd2:has_probability ?prob
-            FILTER (?prob <= {thr})
-        }}
-        """.format(exp=experiment, thr=threshold)
+        sample_query = serialize(Select(['sample', 'prob'], Group(
+            Triple(IRI(experiment), 'sd2:experimentalData', Var('data')),
+            Triple(IRI(experiment), 'sd2:matches_sample', Var('intent_sample')),
+            Triple(Var('data'), Repeat('prov:wasDerivedFrom', '+'), Var('sample')),
+            Triple(Var('intent_sample'), 'sd2:has_sample', Var('sample')),
+            Triple(Var('intent_sample'), 'sd2:has_probability', Var('prob')),
+            Filter(Expr('?prob <= {}', Literal(float(threshold)))))))
 
         return self.fetch_SPARQL(self._server, sample_query)
 
     def query_intent_downselect_samples(self, plan_uri):
-        sample_query = """
-        SELECT ?sample WHERE {{
-            <{}> <http://sd2e.org#intent_downselect_sample> ?sample .
-        }}
-        """.format(plan_uri)
+        sample_query = serialize(Select(['sample'], Triple(IRI(plan_uri), 'sd2:intent_downselect_sample',
+                                                           Var('sample'))))
 
         return self.fetch_SPARQL(self._server, sample_query)
 
@@ -895,16 +916,11 @@ class SynBioHubQuery(SBOLQuery):
 
     # Retrieves the source URLs for all experimental data files generated by the specified experiment and their associated samples.
     def query_single_experiment_data(self, experiment, pretty=True):
-        exp_data_query = """
-        PREFIX sd2: <http://sd2e.org#>
-        PREFIX prov: <http://www.w3.org/ns/prov#>
-        SELECT DISTINCT ?sample ?source WHERE {{
-            <{exp}> sd2:experimentalData ?data .
-            ?data prov:wasDerivedFrom ?sample;
-                sd2:attachment ?attach .
-            ?attach sd2:source ?source
-        }}
-        """.format(exp=experiment)
+        exp_data_query = serialize(Select(['sample', 'source'], Group(
+            Triple(IRI(experiment), 'sd2:experimentalData', Var('data')),
+            Triple(Var('data'), 'prov:wasDerivedFrom', Var('sample')),
+            Triple(Var('data'), 'sd2:attachment', Var('attach')),
+            Triple(Var('attach'), 'sd2:source', Var('source'))), distinct=True))
 
         exp_data_query_result = self.fetch_SPARQL(self._server, exp_data_query)
 
@@ -917,27 +933,16 @@ class SynBioHubQuery(SBOLQuery):
 
     # Retrieves the experimental intent JSON for the specified experiment.
     def query_single_experiment_intent(self, experiment):
-        intent_query = """
-        PREFIX sd2: <http://sd2e.org#>
-        PREFIX dcterms: <http://purl.org/dc/terms/>
-        SELECT ?dname ?ename ?oname ?ddef ?edef ?odef
-        WHERE {{ {{
-            <{exp}> sd2:experimentalDesign ?design .
-            ?design sd2:diagnosticVariable ?dvar .
-            ?dvar dcterms:title ?dname .
-            OPTIONAL {{?dvar sd2:definition ?ddef}}
-        }} UNION {{
-            <{exp}> sd2:experimentalDesign ?design .
-            ?design sd2:experimentalVariable ?evar .
-            ?evar dcterms:title ?ename .
-            OPTIONAL {{?evar sd2:definition ?edef}}
-        }} UNION {{
-            <{exp}> sd2:experimentalDesign ?design .
-            ?design sd2:outcomeVariable ?ovar .
-            ?ovar dcterms:title ?oname .
-            OPTIONAL {{?ovar sd2:definition ?odef}}
-        }} }}
-        """.format(exp=experiment)
+        variable_patterns = []
+        for predicate, var, name, definition in [('sd2:diagnosticVariable', 'dvar', 'dname', 'ddef'),
+                                                 ('sd2:experimentalVariable', 'evar', 'ename', 'edef'),
+                                                 ('sd2:outcomeVariable', 'ovar', 'oname', 'odef')]:
+            variable_patterns.append(Group(Triple(IRI(experiment), 'sd2:experimentalDesign', Var('design')),
+                                           Triple(Var('design'), predicate, Var(var)),
+                                           Triple(Var(var), 'dcterms:title', Var(name)),
+                                           Optional(Triple(Var(var), 'sd2:definition', Var(definition)))))
+        intent_query = serialize(Select(['dname', 'ename', 'oname', 'ddef', 'edef', 'odef'],
+                                        Group(Union(*variable_patterns))))
 
         intent_data = self.fetch_SPARQL(self._server, intent_query)
 
@@ -945,7 +950,7 @@ class SynBioHubQuery(SBOLQuery):
 
         level_switcher = {}
 
-        for binding in intent_data['results']['bindings']:
+        for binding in iter_bindings(intent_data):
             try:
                 try:
                     intent['diagnostic-variables'].append({'name': binding['dname']['value'], 'uri': binding['ddef']['value']})
@@ -968,34 +973,24 @@ class SynBioHubQuery(SBOLQuery):
                         except:
                             exp_intent['experimental-variables'].append({'name': ename})
 
-        truth_table_query = """
-        PREFIX sd2: <http://sd2e.org#>
-        PREFIX dcterms: <http://purl.org/dc/terms/>
-        SELECT ?defin ?emag ?ename ?omag ?oname
-        WHERE {{ {{
-            <{exp}> sd2:experimentalDesign ?design .
-            ?design sd2:experimentalCondition ?cond .
-            ?cond sd2:definition ?defin ;
-                sd2:experimentalLevel ?elevel .
-            ?elevel sd2:level ?emag ;
-                sd2:experimentalVariable ?evar .
-            ?evar dcterms:title ?ename
-        }} UNION {{
-            <{exp}> sd2:experimentalDesign ?design .
-            ?design sd2:experimentalCondition ?cond .
-            ?cond sd2:definition ?defin ;
-                sd2:outcomeLevel ?olevel .
-            ?olevel sd2:level ?omag ;
-                sd2:experimentalVariable ?ovar .
-            ?ovar dcterms:title ?oname
-        }} }}
-        """.format(exp=experiment)
-
-        truth_table_data = self.fetch_SPARQL(self._server, truth_table_query)
+        level_patterns = []
+        for predicate, level, magnitude, var, name in [('sd2:experimentalLevel', 'elevel', 'emag', 'evar', 'ename'),
+                                                       ('sd2:outcomeLevel', 'olevel', 'omag', 'ovar', 'oname')]:
+            level_patterns.append(Group(Triple(IRI(experiment), 'sd2:experimentalDesign', Var('design')),
+                                        Triple(Var('design'), 'sd2:experimentalCondition', Var('cond')),
+                                        Triple(Var('cond'), 'sd2:definition', Var('defin')),
+                                        Triple(Var('cond'), predicate, Var(level)),
+                                        Triple(Var(level), 'sd2:level', Var(magnitude)),
+                                        Triple(Var(level), 'sd2:experimentalVariable', Var(var)),
+                                        Triple(Var(var), 'dcterms:title', Var(name))))
+        truth_table_query = serialize(Select(['defin', 'emag', 'ename', 'omag', 'oname'],
+                                             Group(Union(*level_patterns))))
+
+        truth_table_bindings = list(iter_bindings(self.fetch_SPARQL(self._server, truth_table_query)))
 
         input_switcher = {}
 
-        for binding in truth_table_data['results']['bindings']:
+        for binding in truth_table_bindings:
             defin = binding['defin']['value']
             try:
                 assert defin in input_switcher
@@ -1008,7 +1003,7 @@ class SynBioHubQuery(SBOLQuery):
             for evar in exp_intent['experimental-variables']:
                 tt_input['experimental-variables'].append('-')
 
-        for binding in truth_table_data['results']['bindings']:
+        for binding in truth_table_bindings:
             i = input_switcher[binding['defin']['value']]
             tt_input = exp_intent['truth-table']['input'][i]
             try:
@@ -1024,14 +1019,10 @@ class SynBioHubQuery(SBOLQuery):
     # Retrieves the URIs for all sub-collections of design elements from the collection of every SD2 design element.
     # These sub-collections are typically associated with challenge problems.
     def query_design_sets(self, pretty=True):
-        design_set_query = """
-        PREFIX sbol: <http://sbols.org/v2#>
-        SELECT DISTINCT ?collection WHERE {{
-            <{col}> sbol:member ?design ;
-                sbol:member ?collection .
-            ?collection sbol:member ?design
-        }}
-        """.format(col=SD2Constants.SD2_DESIGN_COLLECTION)
+        design_set_query = serialize(Select(['collection'], Group(
+            Triple(IRI(SD2Constants.SD2_DESIGN_COLLECTION), 'sbol:member', Var('design')),
+            Triple(IRI(SD2Constants.SD2_DESIGN_COLLECTION), 'sbol:member', Var('collection')),
+            Triple(Var('collection'), 'sbol:member', Var('design'))), distinct=True))
 
         query_result = self.fetch_SPARQL(self._server, design_set_query)
 
@@ -1043,16 +1034,10 @@ class SynBioHubQuery(SBOLQuery):
     # Retrieves the URIs for all sub-collections of experiments from the collection of every SD2 experiemnt.
     # These sub-collections are typically associated with challenge problems.
     def query_experiment_sets(self, pretty=True):
-        exp_set_query = """
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        PREFIX sbol: <http://sbols.org/v2#>
-        PREFIX sd2: <http://sd2e.org#>
-        SELECT DISTINCT ?collection WHERE {{
-            <{col}> sbol:member ?collection .
-            ?collection sbol:member ?exp .
-            ?exp rdf:type <http://sd2e.org#Experiment>
-        }}
-        """.format(col=SD2Constants.SD2_EXPERIMENT_COLLECTION)
+        exp_set_query = serialize(Select(['collection'], Group(
+            Triple(IRI(SD2Constants.SD2_EXPERIMENT_COLLECTION), 'sbol:member', Var('collection')),
+            Triple(Var('collection'), 'sbol:member', Var('exp')),
+            Triple(Var('exp'), 'rdf:type', 'sd2:Experiment')), distinct=True))
 
         query_result = self.fetch_SPARQL(self._server, exp_set_query)
 
@@ -1064,66 +1049,48 @@ class SynBioHubQuery(SBOLQuery):
     # Retrieves the size of the specified collection of experiments.
     # This collection is typically associated with a challenge problem.
     def query_experiment_set_size(self, collection):
-        exp_set_size_query = """
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        PREFIX sbol: <http://sbols.org/v2#>
-        PREFIX sd2: <http://sd2e.org#>
-        SELECT (count(distinct ?exp) as ?size) WHERE {{
-            <{col}> sbol:member ?exp .
-            ?exp rdf:type <http://sd2e.org#Experiment>
-        }}
-        """.format(col=collection)
+        exp_set_size_query = serialize(Select([As(Expr('count(distinct ?exp)'), Var('size'))], Group(
+            Triple(IRI(collection), 'sbol:member', Var('exp')),
+            Triple(Var('exp'), 'rdf:type', 'sd2:Experiment'))))
 
         query_result = self.fetch_SPARQL(self._server, exp_set_size_query)
 
-        return int(query_result['results']['bindings'][0]['size']['value'])
+        # A count has a single row, which an endpoint counting no experiment may leave out or leave unbound
+        row = next(iter_bindings(query_result), None)
+        if row is None or 'size' not in row:
+            return 0
+
+        return int(row['size']['value'])
 
     # Retrieves the attachments for a given plan URI
     def query_single_experiment_attachments(self, plan_uri):
-        attachment_query = """
-        SELECT ?attachment_id WHERE
-        {{
-        <{}> <http://sbols.org/v2#attachment> ?attachment_id .
-        }}
-        """.format(plan_uri)
+        attachment_query = serialize(Select(['attachment_id'], Triple(IRI(plan_uri), 'sbol:attachment',
+                                                                      Var('attachment_id'))))
 
         return self.fetch_SPARQL(self._server, attachment_query)
 
     # Retrieves the named attachment for a given plan URI
     def query_single_experiment_attachment(self, plan_uri, attachment_name):
-        attachment_name_query = """
-        SELECT ?attachment_id WHERE
-        {{
-        <{}> <http://sbols.org/v2#attachment> ?attachment_id .
-        ?attachment_id <http://purl.org/dc/terms/title> "{}" .
-        }}
-        """.format(plan_uri, attachment_name)
+        attachment_name_query = serialize(Select(['attachment_id'], Group(
+            Triple(IRI(plan_uri), 'sbol:attachment', Var('attachment_id')),
+            Triple(Var('attachment_id'), 'dcterms:title', Literal(attachment_name)))))
 
         return self.fetch_SPARQL(self._server, attachment_name_query)
 
     def query_designs_by_lab_ids(self, lab, lab_ids, verbose=False, pretty=True, print_query=False):
+        if isinstance(lab_ids, (bytes, str)):
+            lab_ids = [lab_ids]
+
+        design_pattern = Group(Triple(IRI(SD2Constants.SD2_DESIGN_COLLECTION), 'sbol:member', Var('identity')))
         if verbose:
-            design_query = """
-            PREFIX sbol: <http://sbols.org/v2#>
-            PREFIX dcterms: <http://purl.org/dc/terms/>
-            PREFIX sd2: <http://sd2e.org#>
-            SELECT ?identity ?name ?id WHERE {{
-                <{col}> sbol:member ?identity .
-                ?identity dcterms:title ?name .
-                VALUES (?id) {{ {id} }}
-                ?identity sd2:{lab} ?id
-            }}
-            """.format(col=SD2Constants.SD2_DESIGN_COLLECTION, lab=lab + '_UID', id=self.serialize_literal_options(lab_ids))
+            design_pattern.add(Triple(Var('identity'), 'dcterms:title', Var('name')))
+        design_pattern.add(Values(Var('id'), [Literal(lab_id) for lab_id in lab_ids]))
+        design_pattern.add(Triple(Var('identity'), 'sd2:' + lab + '_UID', Var('id')))
+
+        if verbose:
+            design_query = serialize(Select(['identity', 'name', 'id'], design_pattern))
         else:
-            design_query = """
-            PREFIX sbol: <http://sbols.org/v2#>
-            PREFIX sd2: <http://sd2e.org#>
-            SELECT ?identity ?id WHERE {{
-                <{col}> sbol:member ?identity .
-                VALUES (?id) {{ {id} }}
-                ?identity sd2:{lab} ?id
-            }}
-            """.format(col=SD2Constants.SD2_DESIGN_COLLECTION, lab=lab + '_UID', id=self.serialize_literal_options(lab_ids))
+            design_query = serialize(Select(['identity', 'id'], design_pattern))
 
         if print_query:
             print(design_query)
@@ -1148,19 +1115,11 @@ class SynBioHubQuery(SBOLQuery):
         # Accept a string or list for designs
         if isinstance(designs, (bytes, str)):
             designs = [designs]
-        lab_id_query = """
-            PREFIX sbol: <http://sbols.org/v2#>
-            PREFIX dcterms: <http://purl.org/dc/terms/>
-            PREFIX sd2: <http://sd2e.org#>
-            SELECT ?design ?name ?id WHERE {{
-                VALUES (?design) {{ {designs} }}
-                <{col}> sbol:member ?design .
-                ?design dcterms:title ?name .
-                ?design sd2:{lab} ?id
-            }}
-            """.format(col=SD2Constants.SD2_DESIGN_COLLECTION,
-                       lab=lab + '_UID',
-                       designs=self.serialize_options(designs))
+        lab_id_query = serialize(Select(['design', 'name', 'id'], Group(
+            Values(Var('design'), iris(designs)),
+            Triple(IRI(SD2Constants.SD2_DESIGN_COLLECTION), 'sbol:member', Var('design')),
+            Triple(Var('design'), 'dcterms:title', Var('name')),
+            Triple(Var('design'), 'sd2:' + lab + '_UID', Var('id')))))
 
         if print_query:
             print(lab_id_query)
@@ -1176,47 +1135,34 @@ class SynBioHubQuery(SBOLQuery):
             return lab_id_result
 
     def query_synbiohub_statistics(self):
-        design_riboswitches = repr(len(self.query_design_riboswitches(pretty=True)))
-        exp_riboswitches = repr(len(self.query_experiment_riboswitches(by_sample=False)))
-
-        print(exp_riboswitches + ' out of ' + design_riboswitches + ' riboswitches')
-
-        design_plasmids = repr(len(self.query_design_plasmids(pretty=True)))
-        exp_plasmids = repr(len(self.query_experiment_plasmids(by_sample=False)))
-
-        print(exp_plasmids + ' out of ' + design_plasmids + ' plasmids')
-
-        design_gates = repr(len(self.query_design_gates(pretty=True)))
-        exp_gates = repr(len(self.query_experiment_gates(by_sample=False)))
+        calls = []
 
-        print(exp_gates + ' out of ' + design_gates + ' gates')
+        for entity_type in ['riboswitches', 'plasmids', 'gates', 'media', 'controls']:
+            calls.append(('query_design_' + entity_type, {'pretty': True}))
+            calls.append(('query_experiment_' + entity_type, {'by_sample': False}))
 
-        design_media = repr(len(self.query_design_media(pretty=True)))
-        exp_media = repr(len(self.query_experiment_media(by_sample=False)))
+        calls.append(('query_collection_members', {'collections': [SD2Constants.SD2_EXPERIMENT_COLLECTION],
+                                                   'rdf_type': 'http://sd2e.org#Experiment'}))
 
-        print(exp_media + ' out of ' + design_media + ' media')
+        results = self.run_many(calls)
 
-        design_controls = repr(len(self.query_design_controls(pretty=True)))
-        exp_controls = repr(len(self.query_experiment_controls(by_sample=False)))
+        for result in results:
+            if not result.ok:
+                raise result.error
 
-        print(exp_controls + ' out of ' + design_controls + ' controls')
+        for i, entity_type in enumerate(['riboswitches', 'plasmids', 'gates', 'media', 'controls']):
+            design_count = repr(len(results[2 * i].value))
+            exp_count = repr(len(results[2 * i + 1].value))
 
-        exp_query_result = self.query_collection_members(collections=[SD2Constants.SD2_EXPERIMENT_COLLECTION], rdf_type='http://sd2e.org#Experiment')
+            print(exp_count + ' out of ' + design_count + ' ' + entity_type)
 
-        print(repr(len(self.format_query_result(exp_query_result, ['entity']))) + ' experiment plans')
+        print(repr(len(self.format_query_result(results[-1].value, ['entity']))) + ' experiment plans')
 
     # Filters members of the collection that contain the substring in their URI
     def filter(self, collection, search_token):
-        sparql_filter = """
-        PREFIX sbol: <http://sbols.org/v2#>
-        PREFIX sd2: <http://sd2e.org#>
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        SELECT DISTINCT ?member
-        WHERE {{
-            <{col}> sbol:member ?member .
-            FILTER (contains(str(?member), "{tok}"))
-        }}
-        """.format(col=collection, tok=search_token)
+        sparql_filter = serialize(Select(['member'], Group(
+            Triple(IRI(collection), 'sbol:member', Var('member')),
+            Filter(Expr('contains(str(?member), {})', Literal(search_token)))), distinct=True))
         result = self.fetch_SPARQL(self._server, sparql_filter)
         return self.format_query_result(result, ['member'])
 
@@ -0,0 +1,321 @@
+import asyncio
+import collections
+import random
+import threading
+import time
+
+import requests
+from SPARQLWrapper.SPARQLExceptions import EndPointInternalError
+
+from .cancellation import current_context, QueryTimeoutError, QueryCancelledError
+
+'''
+    This module decides when failed requests to SynBioHub are retried.
+
+    A RetryPolicy retries only errors that signal a transient problem with the hub (server errors, dropped
+    connections and timeouts), waiting an exponentially growing, randomly jittered delay between attempts so that
+    many workers do not retry in lockstep. Query method calls that exceed their own timeout or are cancelled
+    (see cancellation.py) are not retried. Retries are drawn from a RetryBudget shared by every policy in the
+    process, which caps retries at a fraction of recent calls. An optional CircuitBreaker stops sending requests
+    altogether once too many recent calls have failed or timed out, and lets a single probe through after
+    a cool-down.
+'''
+
+# Errors that signal a transient problem with SynBioHub rather than a problem with the request
+RETRYABLE_ERRORS = (EndPointInternalError, requests.ConnectionError, requests.Timeout, asyncio.TimeoutError)
+
+# HTTP status codes of responses that are worth retrying
+RETRYABLE_STATUS_CODES = (429, 502, 503, 504)
+
+
+# Returns whether an error signals a transient problem with SynBioHub that is worth retrying.
+def is_retryable(error, retryable_errors=RETRYABLE_ERRORS, retryable_status_codes=RETRYABLE_STATUS_CODES):
+    if isinstance(error, retryable_errors):
+        return True
+
+    # requests raises HTTPError with a response and aiohttp raises ClientResponseError with a status
+    response = getattr(error, 'response', None)
+    status_code = getattr(response, 'status_code', getattr(error, 'status', None))
+
+    return status_code in retryable_status_codes
+
+
+class RetryBudget():
+    ''' Limits the number of retries to a fraction of the calls made within a sliding time window,
+        so that retries cannot multiply the load on a hub that is already struggling.
+    '''
+
+    # ratio: The number of retries allowed per call made within the window.
+    # min_retries: The number of retries allowed within the window regardless of the number of calls.
+    # window: The length in seconds of the sliding window.
+    def __init__(self, ratio=0.2, min_retries=10, window=10.0, clock=time.monotonic):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._clock = clock
+        self._calls = collections.deque()
+        self._retries = collections.deque()
+        self._lock = threading.Lock()
+
+    def __prune(self, now):
+        for times in (self._calls, self._retries):
+            while len(times) > 0 and times[0] <= now - self.window:
+                times.popleft()
+
+    def record_call(self):
+        with self._lock:
+            now = self._clock()
+            self.__prune(now)
+            self._calls.append(now)
+
+    # Withdraws one retry from the budget. Returns False if the budget is exhausted.
+    def try_retry(self):
+        with self._lock:
+            now = self._clock()
+            self.__prune(now)
+
+            if len(self._retries) >= self.min_retries + self.ratio * len(self._calls):
+                return False
+
+            self._retries.append(now)
+            return True
+
+
+# Shared by every RetryPolicy that is not given its own budget
+DEFAULT_RETRY_BUDGET = RetryBudget()
+
+
+class CircuitBreaker():
+    ''' Fails calls fast once the rate of failed calls within a sliding time window crosses a threshold.
+
+        The breaker is closed while calls are allowed. Once at least minimum_calls calls were made within the window
+        and the fraction of them that failed reaches failure_rate, the breaker opens and every call raises
+        CircuitOpenError. After reset_timeout seconds, the breaker is half-open and lets a single probe call through:
+        the breaker closes if the probe succeeds and opens again if it fails. A probe that is cancelled says nothing
+        about the hub, so it is released for the next call to probe again.
+    '''
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_rate=0.5, minimum_calls=10, window=30.0, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.minimum_calls = minimum_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._outcomes = collections.deque()
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    # Raises CircuitOpenError if the call must not be made. Returns whether the call is the probe of a half-open
+    # breaker, which must be released with release_probe if it ends without an outcome.
+    def before_call(self):
+        with self._lock:
+            if self._state == self.OPEN:
+                retry_after = self._opened_at + self.reset_timeout - self._clock()
+                if retry_after > 0:
+                    raise CircuitOpenError(retry_after)
+                self._state = self.HALF_OPEN
+                self._probing = False
+
+            if self._state == self.HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpenError(0)
+                self._probing = True
+                return True
+
+        return False
+
+    # Lets another call probe a half-open breaker, once the probe was cancelled.
+    def release_probe(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._probing = False
+                self._outcomes.clear()
+            else:
+                self.__record(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self.__open()
+                return
+
+            self.__record(False)
+
+            failures = sum(1 for at, ok in self._outcomes if not ok)
+            if len(self._outcomes) >= self.minimum_calls and failures >= self.failure_rate * len(self._outcomes):
+                self.__open()
+
+    def __record(self, ok):
+        now = self._clock()
+        while len(self._outcomes) > 0 and self._outcomes[0][0] <= now - self.window:
+            self._outcomes.popleft()
+        self._outcomes.append((now, ok))
+
+    def __open(self):
+        self._state = self.OPEN
+        self._opened_at = self._clock()
+        self._probing = False
+        self._outcomes.clear()
+
+
+class RetryPolicy():
+    ''' Retries calls that fail with a retryable error, with exponential backoff and full jitter.
+
+        Before retry n (counting from 1), the policy sleeps for a random delay between 0 and
+        min(max_delay, base_delay * multiplier ** (n - 1)) seconds.
+        Errors that are not retryable, such as malformed queries or failed authentication, are raised at once.
+    '''
+
+    # max_attempts: The maximum number of attempts per call, including the first one.
+    # retryable_errors: The exception types that are retried.
+    # retryable_status_codes: The HTTP status codes of error responses that are retried.
+    # budget: The RetryBudget retries are drawn from, or None for no budget. Defaults to a budget shared process-wide.
+    # circuit_breaker: The CircuitBreaker consulted before each attempt, or None.
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=30.0, multiplier=2.0,
+                 retryable_errors=RETRYABLE_ERRORS, retryable_status_codes=RETRYABLE_STATUS_CODES,
+                 budget=DEFAULT_RETRY_BUDGET, circuit_breaker=None, sleep=time.sleep):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.retryable_errors = retryable_errors
+        self.retryable_status_codes = retryable_status_codes
+        self.budget = budget
+        self.circuit_breaker = circuit_breaker
+        self.sleep = sleep
+
+    # Returns the delay in seconds to wait before the given retry.
+    def backoff(self, retry):
+        return random.uniform(0, min(self.max_delay, self.base_delay * self.multiplier ** (retry - 1)))
+
+    def is_retryable(self, error):
+        return is_retryable(error, self.retryable_errors, self.retryable_status_codes)
+
+    # Calls fn with the given arguments, retrying it according to this policy.
+    def call(self, fn, *args, **kwargs):
+        attempt = 0
+
+        while True:
+            attempt += 1
+            probe = self.__before_attempt(attempt)
+
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self.__after_failure(e, attempt, probe)
+                if delay is None:
+                    raise
+                current_context().sleep(delay, self.sleep)
+            except BaseException:
+                self.__after_cancel(probe)
+                raise
+            else:
+                self.__after_success()
+                return result
+
+    # Awaits the coroutine function fn with the given arguments, retrying it according to this policy.
+    # Delays between attempts are awaited with asyncio.sleep rather than passed to sleep.
+    async def call_async(self, fn, *args, **kwargs):
+        attempt = 0
+
+        while True:
+            attempt += 1
+            probe = self.__before_attempt(attempt)
+
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self.__after_failure(e, attempt, probe)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+            except BaseException:
+                self.__after_cancel(probe)
+                raise
+            else:
+                self.__after_success()
+                return result
+
+    # Calls fn once, without retrying it, but failing fast while the circuit breaker is open.
+    # Used for requests that are not safe to repeat, such as submissions.
+    def guard(self, fn, *args, **kwargs):
+        return RetryPolicy(max_attempts=1, retryable_errors=self.retryable_errors,
+                           retryable_status_codes=self.retryable_status_codes, budget=None,
+                           circuit_breaker=self.circuit_breaker).call(fn, *args, **kwargs)
+
+    # Returns whether the attempt is the probe of a half-open circuit breaker.
+    def __before_attempt(self, attempt):
+        probe = False
+        if self.circuit_breaker is not None:
+            probe = self.circuit_breaker.before_call()
+
+        if attempt == 1 and self.budget is not None:
+            self.budget.record_call()
+
+        return probe
+
+    def __after_success(self):
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_success()
+
+    # Releases the probe of the circuit breaker after an attempt cancelled or interrupted without an outcome,
+    # such as by QueryCancelledError, asyncio.CancelledError or KeyboardInterrupt.
+    def __after_cancel(self, probe):
+        if probe:
+            self.circuit_breaker.release_probe()
+
+    # Records a failed attempt and returns the delay before the next one, or None if the error must be raised.
+    def __after_failure(self, error, attempt, probe=False):
+        retryable = self.is_retryable(error)
+
+        # Only transient errors and timeouts say something about the health of the hub
+        if self.circuit_breaker is not None:
+            if retryable or isinstance(error, QueryTimeoutError):
+                self.circuit_breaker.record_failure()
+            elif isinstance(error, QueryCancelledError):
+                self.__after_cancel(probe)
+            else:
+                self.circuit_breaker.record_success()
+
+        if not retryable or attempt >= self.max_attempts:
+            return None
+
+        # Do not retry if the call would time out before the next attempt
+        delay = self.backoff(attempt)
+        remaining = current_context().remaining()
+        if remaining is not None and delay >= remaining:
+            return None
+
+        if self.budget is not None and not self.budget.try_retry():
+            return None
+
+        return delay
+
+
+class CircuitOpenError(Exception):
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+
+    def __str__(self):
+        return "SynBioHub requests are failing fast after repeated errors. Retry in {:.1f} seconds.".format(
+            max(self.retry_after, 0))
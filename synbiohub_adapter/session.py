@@ -0,0 +1,153 @@
+import getpass
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import appdirs
+
+from .resilience import RetryPolicy
+from .transport import PooledTransport
+
+'''
+    This module shares one SynBioHub login between every client that talks to the same instance as the same user.
+
+    A SynBioHubSession logs in when a token is first needed and keeps the X-authorization token it receives for
+    token_lifetime seconds. The token is also written to a file readable only by the current user, so that later
+    processes, such as short-lived jobs, reuse it instead of logging in again. The password is never written.
+
+    When SynBioHub rejects a token, clients call refresh with the rejected token. Only the first of several
+    concurrent callers logs in again; the others receive the token it obtained.
+'''
+
+SESSION_DIR = os.path.join(appdirs.user_cache_dir(appname='synbiohub_adapter'), 'sessions')
+
+
+class SynBioHubSession():
+    ''' The authentication token of one user on one SynBioHub instance, shared by the query and upload clients.
+    '''
+
+    # url: The URL of the SynBioHub instance. A trailing /sparql is ignored.
+    # email: The email or user name to log in with.
+    # password: The password to log in with. If None, it is prompted for on the first login.
+    # token_lifetime: The number of seconds a token is reused before logging in again.
+    # cache_dir: The directory in which tokens are kept between processes, or None to keep them in memory only.
+    # transport: The transport of the login requests. By default, a PooledTransport owned by this instance.
+    # retry_policy: The RetryPolicy applied to logins. By default, up to 3 attempts with exponential backoff.
+    def __init__(self, url, email, password=None, token_lifetime=12 * 3600, cache_dir=SESSION_DIR, transport=None,
+                 retry_policy=None, clock=time.time):
+        url = url.rstrip('/')
+        if url.endswith('/sparql'):
+            url = url[:-len('/sparql')]
+
+        self.url = url
+        self.email = email
+        self._password = password
+        self.token_lifetime = token_lifetime
+        self.cache_dir = cache_dir
+        self.logins = 0
+
+        if transport is None:
+            transport = PooledTransport()
+        self.transport = transport
+
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+        self.retry_policy = retry_policy
+
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._token = None
+        self._issued = 0
+
+    # The path of the file holding the token of this session, or None if tokens are not kept on disk.
+    @property
+    def path(self):
+        if self.cache_dir is None:
+            return None
+
+        key = hashlib.sha256('{}\n{}'.format(self.url, self.email).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key + '.json')
+
+    @property
+    def token(self):
+        return self.get_token()
+
+    # Returns a valid token, reading it from disk or logging in if the token in memory has expired.
+    def get_token(self):
+        with self._lock:
+            if not self.__valid():
+                self.__load()
+                if not self.__valid():
+                    self.__login()
+
+            return self._token
+
+    # Returns a token other than stale_token, the token that SynBioHub rejected, logging in again unless another
+    # thread or process already did.
+    def refresh(self, stale_token=None):
+        with self._lock:
+            if not self.__valid() or self._token == stale_token:
+                self.__load()
+                if not self.__valid() or self._token == stale_token:
+                    self.__login()
+
+            return self._token
+
+    # Forgets the token of this session, in memory and on disk.
+    def invalidate(self):
+        with self._lock:
+            self._token = None
+            self._issued = 0
+
+            if self.path is not None:
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
+
+    def __valid(self):
+        return self._token is not None and self._clock() < self._issued + self.token_lifetime
+
+    def __login(self):
+        if self._password is None:
+            self._password = getpass.getpass('SynBioHub password for {}: '.format(self.email))
+
+        response = self.retry_policy.call(self.transport.request, 'POST', self.url + '/login',
+                                          data={'email': self.email, 'password': self._password},
+                                          headers={'Accept': 'text/plain'})
+
+        self.logins += 1
+        self._token = response.content.decode('utf-8')
+        self._issued = self._clock()
+        self.__save()
+
+    # Reads the token saved by this or another process, ignoring a missing or unreadable file. The lifetime of a
+    # saved token is that of this session, counted from the time the token was issued.
+    def __load(self):
+        if self.path is None:
+            return
+
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+            self._token, self._issued = saved['token'], float(saved['issued'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+
+    # Writes the token to a file only the current user can read, replacing the previous file atomically.
+    def __save(self):
+        if self.path is None:
+            return
+
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'url': self.url, 'email': self.email, 'token': self._token, 'issued': self._issued}, f)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
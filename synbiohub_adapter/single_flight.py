@@ -0,0 +1,147 @@
+import asyncio
+import threading
+
+from .cancellation import current_context, QueryTimeoutError, QueryCancelledError
+
+'''
+    This module coalesces identical requests made at the same time, so that only one of them is sent.
+
+    The first caller of a key runs the request. Callers of the same key arriving before it completes wait for it
+    and receive its result, or the exception it raised. A caller waiting for another still honours the timeout and
+    cancellation token of its own query method call. Should the running call time out or be cancelled, the callers
+    waiting for it do not share its fate: one of them sends the request again.
+
+    SingleFlight serves threads and AsyncSingleFlight coroutines of one event loop. Both count the calls that
+    received the result of another call, which are the requests saved.
+'''
+
+# The errors that belong to one caller and are not passed on to the callers sharing its request
+_CALLER_ERRORS = (QueryTimeoutError, QueryCancelledError, asyncio.CancelledError)
+
+
+class SingleFlight():
+    ''' Shares the result of a call with the threads making a call with the same key while it runs.
+    '''
+
+    # The number of seconds between checks of the deadline and cancellation token of a waiting caller
+    POLL_INTERVAL = 0.05
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counts = {'calls': 0, 'saved': 0}
+
+    # Returns the result of fn, or of the call with the same key already running.
+    def call(self, key, fn, *args, **kwargs):
+        with self._lock:
+            self._counts['calls'] += 1
+
+        while True:
+            with self._lock:
+                flight = self._calls.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._calls[key] = _Flight()
+
+            if leader:
+                return self.__lead(key, flight, fn, args, kwargs)
+
+            self.__wait(flight)
+            if not flight.aborted:
+                with self._lock:
+                    self._counts['saved'] += 1
+                return flight.outcome()
+
+            # The call shared was aborted by its own caller, so this caller sends the request itself
+
+    def __lead(self, key, flight, fn, args, kwargs):
+        try:
+            flight.result = fn(*args, **kwargs)
+            return flight.result
+        except _CALLER_ERRORS:
+            flight.aborted = True
+            raise
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            flight.done.set()
+
+    def __wait(self, flight):
+        context = current_context()
+        if not context.active:
+            flight.done.wait()
+            return
+
+        while not flight.done.wait(self.POLL_INTERVAL):
+            context.check()
+
+    # Returns the number of calls made and of calls that shared the request of another call.
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+class AsyncSingleFlight():
+    ''' Shares the result of a coroutine with the coroutines making a call with the same key while it runs.
+
+        An AsyncSingleFlight must only be used from one event loop.
+    '''
+
+    def __init__(self):
+        self._calls = {}
+        self._counts = {'calls': 0, 'saved': 0}
+
+    # Returns the result of awaiting fn(*args, **kwargs), or of the call with the same key already running.
+    async def call(self, key, fn, *args, **kwargs):
+        self._counts['calls'] += 1
+
+        while True:
+            if key not in self._calls:
+                return await self.__lead(key, fn, args, kwargs)
+
+            # A caller cancelled while waiting must not cancel the call it shares
+            future, flight = self._calls[key]
+            await asyncio.shield(future)
+            if not flight.aborted:
+                self._counts['saved'] += 1
+                return flight.outcome()
+
+    async def __lead(self, key, fn, args, kwargs):
+        future = asyncio.get_event_loop().create_future()
+        flight = _Flight()
+        self._calls[key] = (future, flight)
+        try:
+            flight.result = await fn(*args, **kwargs)
+            return flight.result
+        except _CALLER_ERRORS:
+            flight.aborted = True
+            raise
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            del self._calls[key]
+            future.set_result(None)
+
+    # Returns the number of calls made and of calls that shared the request of another call.
+    def stats(self):
+        return dict(self._counts)
+
+
+class _Flight():
+    ''' The outcome of a call shared by several callers.
+    '''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.aborted = False
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
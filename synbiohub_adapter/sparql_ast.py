@@ -0,0 +1,413 @@
+import math
+import re
+
+'''
+    This module represents SPARQL SELECT queries as trees of nodes, and serializes them to compact query text.
+
+    Terms are Var, IRI and Literal instances, or strings holding a prefixed name such as 'sbol:member', or 'a'.
+    Patterns are Triple, Values, Optional, Union, Filter and Group instances, a Group splicing the patterns of the
+    groups it contains. Property paths are built with Seq, Alt, Repeat and Inverse, and expressions with Expr, whose
+    template is formatted with the serialization of its terms:
+
+        Select([Var('entity')], Group(
+            Values(Var('collection'), [IRI(collection)]),
+            Triple(Var('collection'), 'sbol:member', Var('entity')),
+            Filter(Expr('strstarts(str(?entity), {})', Literal(namespace)))), distinct=True)
+
+    The IRIs and literals given are checked or escaped as they are serialized, so that values cannot change the
+    structure of a query. The query text declares only the prefixes it uses, from PREFIXES or those given to the
+    Select, and lists one pattern per line, consecutive triples sharing their subject being joined with ';' and ','.
+'''
+
+PREFIXES = {
+    'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'rdfs': 'http://www.w3.org/2000/01/rdf-schema#',
+    'sbol': 'http://sbols.org/v2#',
+    'sd2': 'http://sd2e.org#',
+    'prov': 'http://www.w3.org/ns/prov#',
+    'dcterms': 'http://purl.org/dc/terms/',
+    'om': 'http://www.ontology-of-units-of-measure.org/resource/om-2#'
+}
+
+INDENT = '  '
+
+_VARIABLE = re.compile(r'^\w+$')
+_PREFIXED_NAME = re.compile(r'^([A-Za-z][\w-]*)?:([\w-]+(?:[\w.-]*[\w-])?)?$')
+# Prefixed names in an expression template, which may also hold variables, function calls and operators
+_TEMPLATE_PREFIX = re.compile(r'(?<![\w?$:/#-])([A-Za-z][\w-]*)?:(?=[\w-])')
+_IRI_EXCLUDED = re.compile(r'[\x00-\x20<>"{}|^`\\]')
+_XSD_DOUBLE = 'http://www.w3.org/2001/XMLSchema#double'
+_LITERAL_ESCAPES = {'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r', '\t': '\\t'}
+
+
+# Returns the text of a query or pattern. The text of a Select declares the prefixes it uses.
+def serialize(node):
+    writer = _Writer(getattr(node, 'prefixes', None))
+    node._write(writer, 0)
+
+    return writer.text()
+
+
+# Returns the IRI terms of a URI or list of URIs.
+def iris(uris):
+    if isinstance(uris, str):
+        uris = [uris]
+    return [IRI(uri) for uri in uris]
+
+
+class Node():
+    ''' The base of the nodes of a query, compared by type and attributes.
+    '''
+
+    def __eq__(self, other):
+        return type(self) is type(other) and vars(self) == vars(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        attributes = ['{}={!r}'.format(name, value) for name, value in sorted(vars(self).items())]
+
+        return '{}({})'.format(type(self).__name__, ', '.join(attributes))
+
+    def __str__(self):
+        return serialize(self)
+
+
+class Term(Node):
+    ''' A term whose attributes are not changed once built, so that it can be hashed.
+    '''
+
+    def __hash__(self):
+        return hash((type(self), tuple(sorted(vars(self).items()))))
+
+
+class Var(Term):
+
+    def __init__(self, name):
+        if not _VARIABLE.match(name):
+            raise ValueError('Invalid variable name: {!r}'.format(name))
+        self.name = name
+
+    def _text(self, writer):
+        return '?' + self.name
+
+
+class IRI(Term):
+
+    def __init__(self, value):
+        if _IRI_EXCLUDED.search(value):
+            raise ValueError('Invalid IRI: {!r}'.format(value))
+        self.value = value
+
+    def _text(self, writer):
+        return '<' + self.value + '>'
+
+
+class Literal(Term):
+    ''' A string, numeric or boolean literal. A string may have a language tag or a datatype. Infinite and NaN
+        floats, which have no numeric syntax in SPARQL, are written as xsd:double literals.
+    '''
+
+    def __init__(self, value, datatype=None, language=None):
+        if language is not None and not re.match(r'^[A-Za-z]+(-[A-Za-z0-9]+)*$', language):
+            raise ValueError('Invalid language tag: {!r}'.format(language))
+        self.value = value
+        self.datatype = datatype
+        self.language = language
+
+    def _text(self, writer):
+        if isinstance(self.value, bool):
+            return 'true' if self.value else 'false'
+        elif isinstance(self.value, float) and not math.isfinite(self.value):
+            text = 'NaN' if math.isnan(self.value) else 'INF' if self.value > 0 else '-INF'
+            return '"{}"^^<{}>'.format(text, _XSD_DOUBLE)
+        elif isinstance(self.value, (int, float)):
+            return repr(self.value)
+
+        text = '"' + ''.join(_LITERAL_ESCAPES.get(c, c) for c in self.value) + '"'
+        if self.language is not None:
+            text += '@' + self.language
+        elif self.datatype is not None:
+            text += '^^' + writer.term(self.datatype)
+
+        return text
+
+
+class Expr(Term):
+    ''' An expression, whose template is formatted with the serialization of args: Expr('?level <= {}', Literal(3)).
+    '''
+
+    def __init__(self, template, *args):
+        self.template = template
+        self.args = args
+
+    def _text(self, writer):
+        for match in _TEMPLATE_PREFIX.finditer(self.template):
+            writer.use_prefix(match.group(1) or '')
+
+        return self.template.format(*[writer.term(arg) for arg in self.args])
+
+
+class As(Node):
+    ''' A projected expression: (expression AS ?variable).
+    '''
+
+    def __init__(self, expression, variable):
+        self.expression = expression
+        self.variable = variable
+
+    def _text(self, writer):
+        return '({} AS {})'.format(writer.term(self.expression), writer.term(self.variable))
+
+
+class Seq(Term):
+
+    def __init__(self, *paths):
+        self.paths = paths
+
+    def _text(self, writer):
+        return '/'.join(writer.path(path, (Seq, Alt)) for path in self.paths)
+
+
+class Alt(Term):
+
+    def __init__(self, *paths):
+        self.paths = paths
+
+    def _text(self, writer):
+        return '|'.join(writer.path(path, (Seq, Alt)) for path in self.paths)
+
+
+class Repeat(Term):
+    ''' A path repeated zero or more ('*'), one or more ('+') or zero or one ('?') times.
+    '''
+
+    def __init__(self, path, modifier):
+        if modifier not in ('*', '+', '?'):
+            raise ValueError('Invalid path modifier: {!r}'.format(modifier))
+        self.path = path
+        self.modifier = modifier
+
+    def _text(self, writer):
+        return writer.path(self.path, (Seq, Alt, Repeat, Inverse)) + self.modifier
+
+
+class Inverse(Term):
+
+    def __init__(self, path):
+        self.path = path
+
+    def _text(self, writer):
+        return '^' + writer.path(self.path, (Seq, Alt, Inverse))
+
+
+class Triple(Node):
+    ''' A triple pattern, whose predicate may be a property path.
+    '''
+
+    def __init__(self, subject, predicate, object):
+        self.subject = subject
+        self.predicate = predicate
+        self.object = object
+
+    def _write(self, writer, depth):
+        writer.triples([self], depth)
+
+
+class Values(Node):
+    ''' Inline data binding variables to each of rows, a row holding a term or None, for UNDEF, per variable.
+        A single variable may be given instead of a list, along with the list of its terms.
+    '''
+
+    def __init__(self, variables, rows):
+        if isinstance(variables, Var):
+            variables = [variables]
+            rows = [[term] for term in rows]
+        self.variables = list(variables)
+        self.rows = [list(row) for row in rows]
+
+    def _write(self, writer, depth):
+        rows = ['(' + ' '.join('UNDEF' if term is None else writer.term(term) for term in row) + ')'
+                for row in self.rows]
+        writer.line(depth, 'VALUES ({}) {{ {} }}'.format(' '.join(writer.term(var) for var in self.variables),
+                                                         ' '.join(rows)))
+
+
+class Filter(Node):
+
+    def __init__(self, expression):
+        self.expression = expression
+
+    def _write(self, writer, depth):
+        writer.line(depth, 'FILTER ({})'.format(writer.term(self.expression)))
+
+
+class Group(Node):
+    ''' A group graph pattern. The patterns of the groups it is given are spliced into it, and empty ones ignored.
+    '''
+
+    def __init__(self, *patterns):
+        self.patterns = []
+        self.extend(patterns)
+
+    def add(self, pattern):
+        if isinstance(pattern, Group):
+            self.patterns.extend(pattern.patterns)
+        elif pattern is None or isinstance(pattern, str) and len(pattern) == 0:
+            pass
+        elif isinstance(pattern, (Triple, Values, Optional, Union, Filter)):
+            self.patterns.append(pattern)
+        else:
+            raise TypeError('Not a graph pattern: {!r}'.format(pattern))
+
+    def extend(self, patterns):
+        for pattern in patterns:
+            self.add(pattern)
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __iter__(self):
+        return iter(self.patterns)
+
+    def _write(self, writer, depth):
+        i = 0
+        while i < len(self.patterns):
+            pattern = self.patterns[i]
+            if isinstance(pattern, Triple):
+                j = i + 1
+                while j < len(self.patterns) and isinstance(self.patterns[j], Triple):
+                    j += 1
+                writer.triples(self.patterns[i:j], depth)
+                i = j
+            else:
+                pattern._write(writer, depth)
+                i += 1
+
+
+class Optional(Node):
+
+    def __init__(self, *patterns):
+        self.group = Group(*patterns)
+
+    def _write(self, writer, depth):
+        writer.block(depth, 'OPTIONAL {', self.group, '}')
+
+
+class Union(Node):
+    ''' The union of groups, each given as a Group or a pattern.
+    '''
+
+    def __init__(self, *groups):
+        self.groups = [Group(group) for group in groups]
+
+    def _write(self, writer, depth):
+        for i, group in enumerate(self.groups):
+            writer.block(depth, '{' if i == 0 else '} UNION {', group, '}' if i == len(self.groups) - 1 else None)
+
+
+class Select(Node):
+    ''' A SELECT query of variables, which are Var or As instances or variable names, matching the Group where.
+    '''
+
+    def __init__(self, variables, where, distinct=False, group_by=[], order_by=[], limit=None, offset=None,
+                 prefixes=None):
+        self.variables = [Var(var) if isinstance(var, str) else var for var in variables]
+        self.where = where if isinstance(where, Group) else Group(where)
+        self.distinct = distinct
+        self.group_by = [Var(var) if isinstance(var, str) else var for var in group_by]
+        self.order_by = [Var(var) if isinstance(var, str) else var for var in order_by]
+        self.limit = limit
+        self.offset = offset
+        self.prefixes = prefixes
+
+    def _write(self, writer, depth):
+        projection = ' '.join(writer.term(var) for var in self.variables)
+        writer.block(depth, 'SELECT {}{} WHERE {{'.format('DISTINCT ' if self.distinct else '', projection),
+                     self.where, '}')
+        if len(self.group_by) > 0:
+            writer.line(depth, 'GROUP BY ' + ' '.join(writer.term(var) for var in self.group_by))
+        if len(self.order_by) > 0:
+            writer.line(depth, 'ORDER BY ' + ' '.join(writer.term(var) for var in self.order_by))
+        if self.limit is not None:
+            writer.line(depth, 'LIMIT {:d}'.format(self.limit))
+        if self.offset is not None:
+            writer.line(depth, 'OFFSET {:d}'.format(self.offset))
+
+
+class _Writer():
+    ''' Collects the lines of a query and the prefixes they use.
+    '''
+
+    def __init__(self, prefixes=None):
+        self.prefixes = dict(PREFIXES)
+        if prefixes is not None:
+            self.prefixes.update(prefixes)
+        self.used = []
+        self.lines = []
+
+    def text(self):
+        declarations = ['PREFIX {}: <{}>'.format(prefix, self.prefixes[prefix]) for prefix in sorted(self.used)]
+
+        return '\n'.join(declarations + self.lines)
+
+    def line(self, depth, text):
+        self.lines.append(INDENT * depth + text)
+
+    def block(self, depth, opening, group, closing):
+        self.line(depth, opening)
+        group._write(self, depth + 1)
+        if closing is not None:
+            self.line(depth, closing)
+
+    def use_prefix(self, prefix):
+        if prefix not in self.prefixes:
+            raise ValueError('Unknown prefix: {!r}'.format(prefix))
+        if prefix not in self.used:
+            self.used.append(prefix)
+
+    def term(self, term):
+        if isinstance(term, str):
+            if term == 'a':
+                return term
+
+            match = _PREFIXED_NAME.match(term)
+            if match is None:
+                raise ValueError('Invalid prefixed name: {!r}'.format(term))
+            self.use_prefix(match.group(1) or '')
+
+            return term
+
+        return term._text(self)
+
+    # Returns the text of a path within another, in parentheses if it is one of the path types grouped.
+    def path(self, path, grouped):
+        text = self.term(path)
+
+        return '(' + text + ')' if isinstance(path, grouped) else text
+
+    # Writes consecutive triples, joining those sharing their subject with ';' and their predicate too with ','.
+    def triples(self, triples, depth):
+        i = 0
+        while i < len(triples):
+            subject = triples[i].subject
+            j = i
+            predicates = []
+            while j < len(triples) and triples[j].subject == subject:
+                if len(predicates) > 0 and predicates[-1][0] == triples[j].predicate:
+                    predicates[-1][1].append(triples[j].object)
+                else:
+                    predicates.append((triples[j].predicate, [triples[j].object]))
+                j += 1
+
+            for k, (predicate, objects) in enumerate(predicates):
+                text = '{} {}{}'.format(self.term(predicate), ', '.join(self.term(obj) for obj in objects),
+                                        ' ;' if k < len(predicates) - 1 else ' .')
+                if k == 0:
+                    self.line(depth, self.term(subject) + ' ' + text)
+                else:
+                    self.line(depth + 1, text)
+            i = j
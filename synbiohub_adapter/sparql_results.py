@@ -0,0 +1,370 @@
+import codecs
+import csv
+import io
+import json
+import re
+
+'''
+    This module decodes SPARQL query results returned by SynBioHub.
+
+    iter_json_bindings parses the bindings of a SPARQL JSON result incrementally from a stream of byte chunks,
+    so that a result never needs to be held in memory as a whole.
+
+    decode_tsv and decode_csv decode the more compact SPARQL TSV and CSV result formats into the same binding
+    structure as a SPARQL JSON result. TSV keeps the type of every RDF term, while CSV only keeps values.
+'''
+
+# Accepted media types for each result format
+RESULT_FORMATS = {
+    'json': 'application/sparql-results+json',
+    'tsv': 'text/tab-separated-values',
+    'csv': 'text/csv'
+}
+
+XSD_NS = 'http://www.w3.org/2001/XMLSchema#'
+
+_decoder = json.JSONDecoder()
+
+_WHITESPACE = ' \t\n\r'
+
+
+class StreamingResult():
+    ''' A SPARQL JSON result whose bindings are parsed one at a time as they are read from the response.
+
+        Iterating over the result (or over result['results']['bindings']) yields each binding once.
+        The result can only be iterated over once. The response is closed once iteration finishes or
+        close is called. The head of the result is read along with the bindings, so its vars are only known
+        once the bindings have been iterated over.
+    '''
+
+    def __init__(self, chunks, close=None):
+        self._chunks = chunks
+        self._close = close
+        self._iterated = False
+        self._head = {'vars': []}
+
+    def __iter__(self):
+        if self._iterated:
+            raise RuntimeError('The bindings of a StreamingResult can only be iterated over once.')
+        self._iterated = True
+
+        try:
+            for binding in iter_json_bindings(self._chunks, self._head):
+                yield binding
+        finally:
+            self.close()
+
+    # The head of the result, as read from the response so far.
+    @property
+    def head(self):
+        return self._head
+
+    def __getitem__(self, key):
+        if key == 'head':
+            return self.head
+        elif key == 'results':
+            return {'bindings': iter(self)}
+        raise KeyError(key)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+    # Reads the remaining bindings into a SPARQL JSON result dictionary, with the head read from the response.
+    def to_dict(self):
+        bindings = list(self)
+
+        return {'head': dict(self.head), 'results': {'bindings': bindings}}
+
+
+# Returns an iterator over the bindings of a query result, whether it is a SPARQL JSON result dictionary,
+# a StreamingResult or any other iterable of bindings.
+def iter_bindings(query_result):
+    if isinstance(query_result, dict):
+        return iter(query_result['results']['bindings'])
+    else:
+        return iter(query_result)
+
+
+# Yields each binding of a SPARQL JSON result read from an iterable of byte chunks. The head of the result is read
+# into head, if given, once it is reached.
+def iter_json_bindings(chunks, head=None):
+    reader = _ChunkReader(chunks)
+
+    reader.expect('{')
+
+    while not reader.consume('}'):
+        key = reader.read_value()
+        reader.expect(':')
+
+        if key == 'results':
+            reader.expect('{')
+
+            while not reader.consume('}'):
+                results_key = reader.read_value()
+                reader.expect(':')
+
+                if results_key == 'bindings':
+                    reader.expect('[')
+
+                    while not reader.consume(']'):
+                        yield reader.read_value()
+                        reader.consume(',')
+                else:
+                    reader.read_value()
+
+                reader.consume(',')
+        elif key == 'head' and head is not None:
+            head.update(reader.read_value())
+        else:
+            reader.read_value()
+
+        reader.consume(',')
+
+
+class _ChunkReader():
+    ''' Decodes JSON values one at a time from an iterable of UTF-8 encoded byte chunks,
+        reading only as many chunks as are needed for the next value.
+    '''
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._text = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        if self._eof:
+            return False
+
+        chunk = next(self._chunks, None)
+
+        if chunk is None:
+            self._eof = True
+            text = self._utf8.decode(b'', final=True)
+        else:
+            text = self._utf8.decode(chunk)
+
+        # Drop the text that has already been decoded
+        self._text = self._text[self._pos:] + text
+        self._pos = 0
+
+        return True
+
+    def _skip_whitespace(self):
+        while True:
+            while self._pos < len(self._text) and self._text[self._pos] in _WHITESPACE:
+                self._pos += 1
+
+            if self._pos < len(self._text) or not self._fill():
+                return
+
+    def consume(self, char):
+        self._skip_whitespace()
+
+        if self._text.startswith(char, self._pos):
+            self._pos += 1
+            return True
+        else:
+            return False
+
+    def expect(self, char):
+        if not self.consume(char):
+            raise ValueError('Malformed SPARQL JSON result: expected {!r} at {!r}'.format(
+                char, self._text[self._pos:self._pos + 20]))
+
+    def read_value(self):
+        self._skip_whitespace()
+
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._text, self._pos)
+
+                # A value ending at the end of the buffer (such as a number) may continue in the next chunk.
+                if end < len(self._text) or self._eof:
+                    self._pos = end
+                    return value
+            except ValueError:
+                if self._eof:
+                    raise
+
+            self._fill()
+
+
+# Decodes a SPARQL result in the given format ('json', 'tsv' or 'csv') into a SPARQL JSON result dictionary.
+def decode_result(content, result_format='json'):
+    if result_format == 'json':
+        return json.loads(content.decode('utf-8'))
+    elif result_format == 'tsv':
+        return decode_tsv(content)
+    elif result_format == 'csv':
+        return decode_csv(content)
+    else:
+        raise ValueError('Unsupported SPARQL result format: {}'.format(result_format))
+
+
+# Decodes a SPARQL TSV result into a SPARQL JSON result dictionary.
+# Repeated RDF terms share a single binding dictionary, which must therefore not be modified.
+def decode_tsv(content):
+    variables, rows = decode_tsv_rows(content, _parse_tsv_term)
+
+    return _to_json_result(variables, rows)
+
+
+# Decodes a SPARQL TSV result into a list of variable names and a list of row tuples.
+# By default, each cell holds the value of its RDF term, or None if the variable is unbound.
+def decode_tsv_rows(content, parse_term=None):
+    if parse_term is None:
+        parse_term = _parse_tsv_value
+
+    lines = content.decode('utf-8').split('\n')
+
+    if len(lines[0].strip()) == 0:
+        return [], []
+
+    variables = [var[1:] if var.startswith('?') or var.startswith('$') else var
+                 for var in lines[0].rstrip('\r').split('\t')]
+
+    # The same IRIs recur in many rows, so each distinct cell is only parsed once
+    terms = {'': None}
+
+    rows = []
+
+    for line in lines[1:]:
+        if len(line) == 0 or line == '\r':
+            continue
+
+        row = []
+        for cell in line.rstrip('\r').split('\t'):
+            try:
+                row.append(terms[cell])
+            except KeyError:
+                term = terms[cell] = parse_term(cell)
+                row.append(term)
+
+        rows.append(tuple(row))
+
+    return variables, rows
+
+
+# Decodes a SPARQL CSV result into a SPARQL JSON result dictionary.
+# CSV results do not record term types, so values that look like absolute IRIs are typed as URIs
+# and every other value as a literal. Empty values are treated as unbound.
+def decode_csv(content):
+    variables, rows = decode_csv_rows(content)
+
+    terms = {None: None}
+    for row in rows:
+        for value in row:
+            if value not in terms:
+                terms[value] = _csv_term(value)
+
+    return _to_json_result(variables, [tuple(terms[value] for value in row) for row in rows])
+
+
+# Decodes a SPARQL CSV result into a list of variable names and a list of row tuples of values.
+def decode_csv_rows(content):
+    # Quoted values may contain line breaks, so the text is not split into lines before parsing
+    reader = csv.reader(io.StringIO(content.decode('utf-8'), newline=''))
+
+    variables = next(reader, [])
+    rows = [tuple(value or None for value in row) for row in reader if len(row) > 0]
+
+    return variables, rows
+
+
+def _to_json_result(variables, rows):
+    bindings = []
+
+    for row in rows:
+        bindings.append({var: term for var, term in zip(variables, row) if term is not None})
+
+    return {'head': {'vars': variables}, 'results': {'bindings': bindings}}
+
+
+_IRI_PATTERN = re.compile(r'^[A-Za-z][A-Za-z0-9+.-]*:[^\s]*$')
+
+_ESCAPE_PATTERN = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)')
+
+_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', 'b': '\b', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+
+def _csv_term(value):
+    if value is None:
+        return None
+    elif _IRI_PATTERN.match(value):
+        return {'type': 'uri', 'value': value}
+    else:
+        return {'type': 'literal', 'value': value}
+
+
+def _unescape(match):
+    escape = match.group(1)
+
+    if len(escape) > 1:
+        return chr(int(escape[1:], 16))
+    else:
+        return _ESCAPES.get(escape, escape)
+
+
+def _parse_tsv_value(cell):
+    if cell.startswith('<'):
+        return cell[1:-1]
+
+    term = _parse_tsv_term(cell)
+
+    if term is None:
+        return None
+    else:
+        return term['value']
+
+
+# Parses one cell of a SPARQL TSV result, which holds an RDF term in Turtle syntax.
+def _parse_tsv_term(cell):
+    if len(cell) == 0:
+        return None
+
+    first = cell[0]
+
+    if first == '<':
+        return {'type': 'uri', 'value': cell[1:-1]}
+    elif first == '"' or first == "'":
+        if cell.startswith(first * 3):
+            quote = first * 3
+        else:
+            quote = first
+        end = cell.rfind(quote)
+
+        value = cell[len(quote):end]
+        if '\\' in value:
+            value = _ESCAPE_PATTERN.sub(_unescape, value)
+
+        term = {'type': 'literal', 'value': value}
+
+        suffix = cell[end + len(quote):]
+        if suffix.startswith('@'):
+            term['xml:lang'] = suffix[1:]
+        elif suffix.startswith('^^<'):
+            term['datatype'] = suffix[3:-1]
+        elif suffix.startswith('^^'):
+            term['datatype'] = suffix[2:]
+
+        return term
+    elif cell.startswith('_:'):
+        return {'type': 'bnode', 'value': cell[2:]}
+    elif cell == 'true' or cell == 'false':
+        return {'type': 'literal', 'value': cell, 'datatype': XSD_NS + 'boolean'}
+    elif 'e' in cell or 'E' in cell:
+        return {'type': 'literal', 'value': cell, 'datatype': XSD_NS + 'double'}
+    elif '.' in cell:
+        return {'type': 'literal', 'value': cell, 'datatype': XSD_NS + 'decimal'}
+    else:
+        return {'type': 'literal', 'value': cell, 'datatype': XSD_NS + 'integer'}
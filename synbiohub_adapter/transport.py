@@ -0,0 +1,112 @@
+import requests
+from requests.adapters import HTTPAdapter
+from SPARQLWrapper.SPARQLExceptions import QueryBadFormed, EndPointNotFound, EndPointInternalError, Unauthorized
+
+'''
+    This module contains the HTTP transport layer used by SBOLQuery to send requests to SynBioHub.
+
+    A transport is owned by a query client and reused for every request that client makes, so that
+    TCP and TLS connections to the SynBioHub instance are kept alive and shared between queries.
+'''
+
+
+class Transport():
+    ''' Base class for pluggable transports.
+
+        Subclasses must implement request, which sends an HTTP request and returns a response object
+        exposing status_code, headers and content (as returned by the requests library). When stream is True,
+        the body must instead be read through iter_content and the response closed with close.
+        timeout is the number of seconds to wait for the server to accept the connection and for each read.
+    '''
+
+    def request(self, method, url, params=None, data=None, headers=None, stream=False, timeout=None):
+        raise NotImplementedError()
+
+    # Calls fn with the given arguments on behalf of this transport, for requests to url that are sent by other
+    # means (such as the PartShop of pySBOL), so that transports limiting requests can account for them.
+    def call(self, url, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    # Returns a dictionary mapping each host to its connection reuse statistics.
+    def connection_stats(self):
+        return {}
+
+    # Returns a dictionary mapping each governed endpoint to its wait time statistics.
+    def governor_stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class PooledTransport(Transport):
+    ''' A transport backed by a requests Session with a persistent pool of keep-alive connections per host.
+    '''
+
+    # pool_size: The maximum number of connections kept open to each host.
+    # max_hosts: The maximum number of hosts for which a connection pool is kept.
+    # pool_block: Whether to wait for a free connection rather than opening a throwaway one when the pool is full.
+    # keep_alive: Whether to ask the server to keep connections open between requests.
+    def __init__(self, pool_size=10, max_hosts=10, pool_block=False, keep_alive=True):
+        self.pool_size = pool_size
+        self._session = requests.Session()
+
+        adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=pool_size, pool_block=pool_block)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+        if keep_alive:
+            self._session.headers['Connection'] = 'keep-alive'
+        else:
+            self._session.headers['Connection'] = 'close'
+
+    def request(self, method, url, params=None, data=None, headers=None, stream=False, timeout=None):
+        response = self._session.request(method, url, params=params, data=data, headers=headers, stream=stream,
+                                         timeout=timeout)
+
+        try:
+            check_response(response)
+        except Exception:
+            response.close()
+            raise
+
+        return response
+
+    def connection_stats(self):
+        stats = {}
+
+        for adapter in set(self._session.adapters.values()):
+            pools = adapter.poolmanager.pools
+
+            for pool_key in pools.keys():
+                pool = pools[pool_key]
+
+                host = '{sc}://{ho}:{po}'.format(sc=pool_key.key_scheme, ho=pool_key.key_host, po=pool_key.key_port)
+
+                stats[host] = {
+                    'requests': pool.num_requests,
+                    'connections': pool.num_connections,
+                    'reused': max(pool.num_requests - pool.num_connections, 0)
+                }
+
+        return stats
+
+    def close(self):
+        self._session.close()
+
+
+# Raises the SPARQLWrapper exception matching the HTTP status code of a failed response.
+def check_response(response):
+    check_status(response.status_code, response.content)
+    response.raise_for_status()
+
+
+def check_status(status_code, content=None):
+    if status_code == 400:
+        raise QueryBadFormed(content)
+    elif status_code == 401 or status_code == 403:
+        raise Unauthorized(content)
+    elif status_code == 404:
+        raise EndPointNotFound(content)
+    elif status_code == 500:
+        raise EndPointInternalError(content)
@@ -1,13 +1,18 @@
 import argparse
+import builtins
 import sys
 import os
 import json
 import requests
 import re
 from urllib3.exceptions import HTTPError
+from SPARQLWrapper.SPARQLExceptions import Unauthorized
 from sbol2 import *
 from synbiohub_adapter import SynBioHubQuery
 from synbiohub_adapter import SD2Constants
+from synbiohub_adapter.transport import PooledTransport
+from synbiohub_adapter.resilience import RetryPolicy, CircuitBreaker
+from synbiohub_adapter.session import SynBioHubSession
 
 
 def main(args=None):
@@ -63,19 +68,129 @@ def main(args=None):
         raise EmptySubmissionError()
 
 
+# Returns whether an error raised or a response returned by a request shows that SynBioHub rejected its token.
+# part_shop reports rejected submissions with an HTTPError and rejected pulls with an SBOLError.
+def is_unauthorized(outcome):
+    if isinstance(outcome, Unauthorized):
+        return True
+    elif isinstance(outcome, HTTPError):
+        return 'valid credentials' in str(outcome)
+    elif isinstance(outcome, SBOLError):
+        return outcome.error_code() == SBOLErrorCode.SBOL_ERROR_HTTP_UNAUTHORIZED
+
+    return getattr(outcome, 'status_code', None) in (401, 403)
+
+
 class SynBioHub():
-    def __init__(self, url, email, password, sparql, spoofed_url=None):
+    # retry_policy: The RetryPolicy shared by the queries and uploads of this instance. Logins, queries, pulls and
+    #   downloads are retried. Submissions, attachments and removals are not repeated, but fail fast while the
+    #   circuit breaker of the policy is open.
+    # endpoints: An EndpointSet of SPARQL endpoints to route queries to, instead of sparql.
+    #   Submissions through part_shop always go to url.
+    # transport: The transport of every request made by this instance. Requests sent through part_shop are
+    #   accounted for by its call method, so that a GovernedTransport also limits uploads.
+    # session: The SynBioHubSession whose token authenticates the queries and uploads of this instance.
+    #   By default, a session logging in to url as email, which reuses a token saved by an earlier process.
+    # cache: A QueryCache answering the queries of this instance. The cached results depending on the collections
+    #   and objects written by this instance are invalidated after each successful submission.
+    # existence_cache: An ExistenceCache answering the existence checks of query_collection_members and of the
+    #   push methods. Like the query cache, it is invalidated after each successful submission.
+    def __init__(self, url, email, password, sparql, spoofed_url=None, retry_policy=None, endpoints=None,
+                 transport=None, session=None, cache=None, existence_cache=None):
         url = url.rstrip('/')
         self.url = url
         self.email = email
+        if retry_policy is None:
+            retry_policy = RetryPolicy(circuit_breaker=CircuitBreaker())
+        self.retry_policy = retry_policy
+        # Shared by every query made through this instance so that connections are kept alive between queries.
+        if transport is None:
+            transport = PooledTransport()
+        self.transport = transport
+        if session is None:
+            session = SynBioHubSession(url, email, password, transport=transport, retry_policy=retry_policy)
+        self.session = session
+        # part_shop uses the token of the session rather than logging in on its own
         self.part_shop = PartShop(url)
-        self.part_shop.login(email, password)
-        response = requests.post(url + '/login',
-                                 headers={'Accept': 'text/plain'},
-                                 data={'email': email, 'password': password})
-        self.token = response.content.decode('UTF-8')
+        self.part_shop.user = email
+        self.part_shop.key = self.session.token
         self.sparql = sparql
         self.spoofed_url = spoofed_url
+        self.endpoints = endpoints
+        self.cache = cache
+        self.existence_cache = existence_cache
+
+        # Queries on the graph of the logged in user, and on public data such as attachments
+        self.__user_query = SynBioHubQuery(sparql, spoofed_url=spoofed_url, transport=transport,
+                                           retry_policy=retry_policy, endpoints=endpoints, session=session,
+                                           cache=cache, existence_cache=existence_cache)
+        self.__public_query = SynBioHubQuery(sparql, transport=transport, retry_policy=retry_policy,
+                                             endpoints=endpoints, cache=cache)
+
+    # The token of the session, which authenticates the requests of this instance.
+    # The property builtin is shadowed by the property module of sbol2.
+    @builtins.property
+    def token(self):
+        return self.session.token
+
+    # Returns send(token) for the token of the session. If SynBioHub rejects the token, for instance because it
+    # expired or SynBioHub restarted, logs in again and returns send(token) once more with the new token.
+    # A rejected request wrote nothing, so sending it again is safe even for submissions.
+    def __authorized(self, send):
+        token = self.session.token
+        try:
+            response = send(token)
+        except Exception as e:
+            if not is_unauthorized(e):
+                raise
+        else:
+            if not is_unauthorized(response):
+                return response
+
+        return send(self.session.refresh(token))
+
+    # Calls a method of part_shop with the token of the session, see __authorized.
+    def __part_shop_call(self, call, fn, *args):
+        def send(token):
+            self.part_shop.key = token
+            return call(self.transport.call, self.url, fn, *args)
+
+        return self.__authorized(send)
+
+    # Submits doc through part_shop once, failing fast while the circuit breaker is open, to the collection with
+    # the URI given as first argument or else to a new collection. Then invalidates the cached results depending on
+    # that collection or on the objects of doc, and the existence checks of those objects or in that collection.
+    def __submit(self, doc, *args):
+        response = self.__part_shop_call(self.retry_policy.guard, self.part_shop.submit, doc, *args)
+
+        if self.cache is not None or self.existence_cache is not None:
+            collection_uri = args[0] if len(args) > 0 else self.__collection_uri(doc.displayId)
+            written_uris = self.__written_uris(doc, collection_uri)
+            for cache in [self.cache, self.existence_cache]:
+                if cache is not None:
+                    cache.invalidate(written_uris)
+
+        return response
+
+    # Returns the URI of the collection created by submitting a document with the given id.
+    def __collection_uri(self, collection_id):
+        if self.spoofed_url:
+            return '/'.join([self.spoofed_url, 'user', self.email, collection_id, collection_id + '_collection', '1'])
+        else:
+            return '/'.join([self.url, 'user', self.email, collection_id, collection_id + '_collection', '1'])
+
+    # Returns the URIs written by submitting doc to a collection: the collection, and the objects of doc under
+    # their own URIs and under those SynBioHub gives them in the namespace of the collection.
+    def __written_uris(self, doc, collection_uri):
+        collection_namespace = self.__get_top_level_namespace(collection_uri)
+        uris = [collection_uri]
+
+        for obj in doc:
+            uris.append(obj.identity)
+            if obj.displayId and obj.version:
+                uris.append('/'.join([collection_namespace, obj.displayId, obj.version]))
+
+        return uris
 
     def submit_collection(self, doc, collection_id, collection_version, collection_name, collection_description,
                           max_upload=0, sub_collection_id=None, sub_collection_version=None,
@@ -93,7 +208,7 @@ class SynBioHub():
         doc.version = collection_version
 
         try:
-            response = self.part_shop.submit(doc)
+            response = self.__submit(doc)
 
         # If Collection already exists on SynBioHub, then DuplicateCollectionError should be raised unless overwriting.
         # Since exception raised by PartShop in this case is generic, currently check its message.
@@ -101,14 +216,7 @@ class SynBioHub():
             if (str(e).endswith('Submission id and version already in use') or str(e).endswith("b'Submission id and \
 version already in use'")):
                 if overwrite:
-                    if self.spoofed_url:
-                        collection_uri = '/'.join([self.spoofed_url, 'user', self.email, collection_id,
-                                                   collection_id + '_collection', '1'])
-                    else:
-                        collection_uri = '/'.join([self.url, 'user', self.email, collection_id,
-                                                   collection_id + '_collection', '1'])
-
-                    response = self.part_shop.submit(doc, collection_uri, 1)
+                    response = self.__submit(doc, self.__collection_uri(collection_id), 1)
                 else:
                     raise DuplicateCollectionError(doc.displayId, doc.version)
             else:
@@ -147,9 +255,9 @@ version already in use'")):
 
             try:
                 if overwrite:
-                    response = self.part_shop.submit(submission_doc, collection_uri, 3)
+                    response = self.__submit(submission_doc, collection_uri, 3)
                 else:
-                    response = self.part_shop.submit(submission_doc, collection_uri, 2)
+                    response = self.__submit(submission_doc, collection_uri, 2)
 
                 # print(response)
                 # print(repr(i) + ' of ' + repr(len(submission_docs)))
@@ -392,7 +500,7 @@ includes an object: (.+) that is already in this repository and has different co
                     pull_uri = remote_uri
 
                 try:
-                    self.part_shop.pull(pull_uri, remote_doc, False)
+                    self.__part_shop_call(self.retry_policy.call, self.part_shop.pull, pull_uri, remote_doc, False)
 
                     try:
                         remote_sub_collection = remote_doc.collections.get(remote_uri)
@@ -455,23 +563,34 @@ includes an object: (.+) that is already in this repository and has different co
         return sub_collection
 
     def remove_all_identified(self, uris):
-        header = {'Accept': 'text/plain', 'X-authorization': self.token}
         for uri in uris:
-            requests.get(uri + '/remove', headers=header)
+            self.__authorized(lambda token: self.retry_policy.guard(self.transport.call, uri, requests.get,
+                                                                    uri + '/remove',
+                                                                    headers={'Accept': 'text/plain',
+                                                                             'X-authorization': token}))
 
     def attach_file(self, file, uri):
-        response = requests.post(uri + '/attach',
-                                 headers={'Accept': 'text/plain',
-                                          'X-authorization': self.token},
-                                 files={'file': open(file, 'rb')})
+        def send(token):
+            with open(file, 'rb') as f:
+                return self.retry_policy.guard(self.transport.call, uri, requests.post, uri + '/attach',
+                                               headers={'Accept': 'text/plain', 'X-authorization': token},
+                                               files={'file': f})
+
+        response = self.__authorized(send)
+
+    # Downloads an attachment with the token of the session, see __authorized.
+    def __download(self, attachment_id):
+        return self.__authorized(lambda token: self.retry_policy.call(self.transport.request, 'GET',
+                                                                      attachment_id + '/download',
+                                                                      headers={'Accept': 'text/plain',
+                                                                               'X-authorization': token}))
 
     def query_collection_members(self, member_uris=[], collection_uris=[], rdf_type=None):
         responses = []
 
         cut_len = 50
 
-        sbh_query = SynBioHubQuery(self.sparql, user=self.email, authentication_key=self.token,
-                                   spoofed_url=self.spoofed_url)
+        sbh_query = self.__user_query
 
         if len(member_uris) <= cut_len:
             responses.append(sbh_query.query_collection_members(collection_uris, member_uris, rdf_type))
@@ -504,25 +623,21 @@ includes an object: (.+) that is already in this repository and has different co
 
     # for a given plan URI, retrieve the named attachment
     def get_single_experiment_attachment(self, plan_uri, attachment_name):
-        sbh_query = SynBioHubQuery(self.sparql)
+        sbh_query = self.__public_query
         attachments = sbh_query.query_single_experiment_attachment(plan_uri, attachment_name)
         if len(attachments['results']['bindings']) > 0:
             attachment_id = attachments['results']['bindings'][0]['attachment_id']['value']
-            response = requests.get(attachment_id + '/download',
-                                    headers={'Accept': 'text/plain',
-                                             'X-authorization': self.token})
+            response = self.__download(attachment_id)
             return response.json()
         print("No attachment found {}".format(attachment_name))
 
     # for a given plan URI, retrieve its intent JSON
     def get_single_experiment_intent_attachment(self, plan_uri):
-        sbh_query = SynBioHubQuery(self.sparql)
+        sbh_query = self.__public_query
         attachments = sbh_query.query_single_experiment_attachments(plan_uri)
         for binding in attachments['results']['bindings']:
             attachment_id = binding['attachment_id']['value']
-            response = requests.get(attachment_id + '/download',
-                                    headers={'Accept': 'text/plain',
-                                             'X-authorization': self.token})
+            response = self.__download(attachment_id)
             try:
                 attachment_json = response.json()
                 # TODO find a better way to identify intent attachments
@@ -565,7 +680,7 @@ includes an object: (.+) that is already in this repository and has different co
             plan.this, parameter_uri, '0', '*'))
         plan.addPropertyValue(parameter_uri, parameter_value)
 
-        response = self.part_shop.submit(doc, SD2Constants.SD2_EXPERIMENT_COLLECTION, 2)
+        response = self.__submit(doc, SD2Constants.SD2_EXPERIMENT_COLLECTION, 2)
 
     def push_lab_sample_parameter(self, sample_uri, parameter_uri, parameter_value):
         """Pushes a lab parameter for a sample to SynBioHub.
@@ -602,7 +717,7 @@ includes an object: (.+) that is already in this repository and has different co
             sample.this, parameter_uri, '0', '*'))
         sample.addPropertyValue(parameter_uri, parameter_value)
 
-        response = self.part_shop.submit(doc, list(collection_to_member.keys())[0], 2)
+        response = self.__submit(doc, list(collection_to_member.keys())[0], 2)
 
 
 class CollectionArgumentError(Exception):
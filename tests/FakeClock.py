@@ -0,0 +1,15 @@
+'''
+    This module provides a clock for the tests of components that take a clock function, whose time only passes
+    when a test moves it.
+'''
+
+
+class FakeClock():
+    ''' A clock function returning now, which tests set or advance.
+    '''
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
@@ -0,0 +1,150 @@
+import csv
+import io
+import json
+import re
+import threading
+import rdflib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+'''
+    This module runs a stand-in SynBioHub SPARQL endpoint on localhost so that query clients can be tested
+    without network access to a real SynBioHub instance.
+'''
+
+
+def bindings_result(variables, rows):
+    bindings = []
+
+    for row in rows:
+        bindings.append({var: {'type': 'uri', 'value': value} for var, value in zip(variables, row)
+                         if value is not None})
+
+    return {'head': {'vars': list(variables)}, 'results': {'bindings': bindings}}
+
+
+def tsv_term(term):
+    if term is None:
+        return ''
+    elif isinstance(term, rdflib.URIRef):
+        return '<{}>'.format(term)
+    elif isinstance(term, rdflib.BNode):
+        return '_:{}'.format(term)
+
+    value = str(term)
+    for char, escape in [('\\', '\\\\'), ('"', '\\"'), ('\n', '\\n'), ('\r', '\\r'), ('\t', '\\t')]:
+        value = value.replace(char, escape)
+
+    if term.language is not None:
+        return '"{}"@{}'.format(value, term.language)
+    elif term.datatype is not None:
+        return '"{}"^^<{}>'.format(value, term.datatype)
+    else:
+        return '"{}"'.format(value)
+
+
+# Serializes an rdflib SELECT result in the SPARQL 'json', 'tsv' or 'csv' result format.
+def serialize_result(result, result_format='json'):
+    if result_format == 'tsv':
+        lines = ['\t'.join('?' + str(var) for var in result.vars)]
+        for row in result:
+            lines.append('\t'.join(tsv_term(term) for term in row))
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+    elif result_format == 'csv':
+        text = io.StringIO()
+        writer = csv.writer(text)
+        writer.writerow([str(var) for var in result.vars])
+        for row in result:
+            writer.writerow(['' if term is None else str(term) for term in row])
+        return text.getvalue().encode('utf-8')
+    else:
+        return result.serialize(format='json')
+
+
+# Returns a responder that answers queries from an rdflib Graph, in the result format asked for by the client.
+def graph_responder(graph):
+    content_types = {'text/tab-separated-values': 'tsv', 'text/csv': 'csv'}
+    lock = threading.Lock()
+
+    def responder(query, headers):
+        accept = headers.get('Accept', '')
+        result_format = content_types.get(accept, 'json')
+
+        # The graph holds every user's data, so drop the FROM clause restricting a query to one user
+        query = re.sub(r'FROM <[^>]*>', '', query)
+
+        with lock:
+            body = serialize_result(graph.query(query), result_format)
+
+        return (200, accept if result_format != 'json' else 'application/sparql-results+json', body)
+
+    return responder
+
+
+class LocalSPARQLServer():
+    ''' A threaded HTTP server answering GET /sparql and POST /login requests.
+
+        responder is called with the query text and the request headers and returns either a SPARQL JSON
+        result dictionary or a tuple of (status code, content type, body bytes).
+    '''
+
+    def __init__(self, responder=None, token='local-token'):
+        if responder is None:
+            responder = (lambda query, headers: bindings_result([], []))
+        self.responder = responder
+        self.token = token
+        self.queries = []
+        self.logins = 0
+
+        local_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = parse_qs(parsed.query).get('query', [''])[0]
+                local_server.queries.append(query)
+
+                response = local_server.responder(query, self.headers)
+                if isinstance(response, dict):
+                    response = (200, 'application/sparql-results+json', json.dumps(response).encode('utf-8'))
+
+                self.send(*response)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                self.rfile.read(length)
+                local_server.logins += 1
+
+                self.send(200, 'text/plain', local_server.token.encode('utf-8'))
+
+            def send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self._httpd.server_address[1])
+
+    @property
+    def sparql_url(self):
+        return self.url + '/sparql'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+
+import synbiohub_adapter as sbha
+
+from tests.LocalSPARQLServer import LocalSPARQLServer, bindings_result
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+STRAIN = 'https://hub.sd2e.org/user/sd2e/design/UWBF_6390/1'
+
+
+@unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+class TestAsyncSynBioHubQuery(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        lock = threading.Lock()
+        self.counts = {'in_flight': 0, 'max_in_flight': 0}
+
+        def responder(query, headers):
+            with lock:
+                self.counts['in_flight'] += 1
+                self.counts['max_in_flight'] = max(self.counts['max_in_flight'], self.counts['in_flight'])
+
+            time.sleep(0.05)
+
+            with lock:
+                self.counts['in_flight'] -= 1
+
+            if '?dname' in query:
+                return bindings_result(['ename', 'edef'], [['IPTG', 'https://hub.sd2e.org/user/sd2e/design/IPTG/1']])
+            elif '?defin' in query:
+                return {'head': {'vars': ['defin', 'emag', 'ename']},
+                        'results': {'bindings': [{'defin': {'type': 'uri', 'value': STRAIN},
+                                                  'emag': {'type': 'literal', 'value': '1'},
+                                                  'ename': {'type': 'literal', 'value': 'IPTG'}}]}}
+            else:
+                return bindings_result(['strain', 'sample'], [[STRAIN, 'sample_1'], [STRAIN, 'sample_2']])
+
+        self.server = LocalSPARQLServer(responder).start()
+
+    @classmethod
+    def tearDownClass(self):
+        self.server.stop()
+
+    def test_concurrent_queries_bounded(self):
+        async def run():
+            async with sbha.AsyncSynBioHubQuery(self.server.url, max_in_flight=3) as sbh_query:
+                await sbh_query.login('sd2e', 'password')
+                experiments = ['https://hub.sd2e.org/user/sd2e/experiment/exp_{}/1'.format(i) for i in range(12)]
+                return await asyncio.gather(*[sbh_query.query_single_experiment_strains(exp)
+                                              for exp in experiments])
+
+        self.counts['max_in_flight'] = 0
+        results = asyncio.run(run())
+
+        self.assertEqual(len(results), 12)
+        for result in results:
+            self.assertEqual(result, {'sample_1': STRAIN, 'sample_2': STRAIN})
+        self.assertLessEqual(self.counts['max_in_flight'], 3)
+        self.assertGreater(self.counts['max_in_flight'], 1)
+
+    def test_multiple_query_method(self):
+        async def run():
+            async with sbha.AsyncSynBioHubQuery(self.server.sparql_url) as sbh_query:
+                return await sbh_query.query_single_experiment_intent('https://hub.sd2e.org/user/sd2e/experiment/e/1')
+
+        sync_query = sbha.SynBioHubQuery(self.server.sparql_url)
+        self.assertEqual(asyncio.run(run()),
+                         sync_query.query_single_experiment_intent('https://hub.sd2e.org/user/sd2e/experiment/e/1'))
+
+        intent = json.loads(asyncio.run(run()))
+        self.assertEqual(intent['truth-table']['input'][0]['experimental-variables'], [1])
+
+    def test_collection_members(self):
+        collections = ['https://hub.sd2e.org/user/sd2e/design/design_collection/1']
+
+        async def run():
+            async with sbha.AsyncSynBioHubQuery(self.server.sparql_url) as sbh_query:
+                return await asyncio.gather(sbh_query.query_collection_members(collections, [STRAIN]),
+                                            sbh_query.query_collection_members(collections))
+
+        sync_query = sbha.SynBioHubQuery(self.server.sparql_url)
+        self.assertEqual(asyncio.run(run()), [sync_query.query_collection_members(collections, [STRAIN]),
+                                              sync_query.query_collection_members(collections)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import threading
+import time
+import unittest
+from concurrent.futures import CancelledError
+
+import SPARQLWrapper
+import synbiohub_adapter as sbha
+from synbiohub_adapter.batch import run_many
+
+from tests.LocalSPARQLServer import LocalSPARQLServer, bindings_result
+
+
+class TestRunMany(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        def responder(query, headers):
+            time.sleep(0.2)
+            return bindings_result(['collection'], [[query.split('<')[-1].split('>')[0]]])
+
+        self.server = LocalSPARQLServer(responder).start()
+
+    @classmethod
+    def tearDownClass(self):
+        self.server.stop()
+
+    def test_results_in_input_order(self):
+        sbh_query = sbha.SynBioHubQuery(self.server.sparql_url)
+        collections = ['https://hub.sd2e.org/user/sd2e/design/col_{}/1'.format(i) for i in range(8)]
+        calls = [('query_collections', {'collections': [col]}) for col in collections]
+        calls.insert(3, ('query_not_a_method', {}))
+
+        start = time.time()
+        results = sbh_query.run_many(calls, max_workers=9)
+        elapsed = time.time() - start
+
+        self.assertLess(elapsed, 8 * 0.2)
+        self.assertEqual(len(results), 9)
+        self.assertIsInstance(results[3].error, AttributeError)
+        values = [result.value['results']['bindings'][0]['collection']['value'] for result in results if result.ok]
+        self.assertEqual(values, collections)
+
+    def test_fatal_error_cancels_pending_calls(self):
+        started = []
+        lock = threading.Lock()
+
+        class Client():
+            def query_fail(self):
+                raise SPARQLWrapper.SPARQLExceptions.Unauthorized()
+
+            def query_slow(self):
+                with lock:
+                    started.append(1)
+                time.sleep(0.1)
+                return 'slow'
+
+        calls = [('query_fail', None)] + [('query_slow', None)] * 10
+        results = run_many(Client(), calls, max_workers=2)
+
+        self.assertIsInstance(results[0].error, SPARQLWrapper.SPARQLExceptions.Unauthorized)
+        cancelled = [result for result in results if isinstance(result.error, CancelledError)]
+        self.assertGreater(len(cancelled), 0)
+        self.assertEqual(len(started) + len(cancelled), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
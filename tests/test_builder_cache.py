@@ -0,0 +1,128 @@
+import unittest
+
+from synbiohub_adapter.SynBioHubUtil import SD2Constants, SBOLQuery
+from synbiohub_adapter.builder_cache import BuilderCache, freeze, memoize_builder
+
+EXPERIMENTS = ['https://hub.sd2e.org/user/sd2e/experiment/experiment_{}/1'.format(i) for i in range(3)]
+
+
+class Builder():
+
+    def __init__(self):
+        self.builds = 0
+
+    @memoize_builder(maxsize=2)
+    def build(self, labels, properties={}):
+        self.builds += 1
+        return ' '.join(labels) + str(sorted(properties.items()))
+
+
+class RenamingBuilder(Builder):
+    pass
+
+
+class TestBuilderCache(unittest.TestCase):
+
+    def setUp(self):
+        Builder.build.cache.clear()
+        self.stats = Builder.build.cache.stats()
+
+    def counted(self, name):
+        return Builder.build.cache.stats()[name] - self.stats[name]
+
+    def test_freeze(self):
+        self.assertEqual(freeze([['a', 'b'], {'y': [1], 'x': 2}]), (('a', 'b'), (dict, (('x', 2), ('y', (1,))))))
+        self.assertEqual(freeze({'a'}), frozenset(['a']))
+        with self.assertRaises(TypeError):
+            freeze([bytearray()])
+
+    def test_memoized(self):
+        builder = Builder()
+
+        query = builder.build(['a', 'b'], {'sbol:role': '<r>'})
+        self.assertEqual(builder.build(['a', 'b'], {'sbol:role': '<r>'}), query)
+        self.assertEqual(builder.builds, 1)
+
+        # Instances of a subclass, which may override the builders called, do not share the queries built
+        RenamingBuilder().build(['a', 'b'], {'sbol:role': '<r>'})
+        self.assertEqual([self.counted('hits'), self.counted('misses')], [1, 2])
+        self.assertEqual(Builder.build.cache.stats()['entries'], 2)
+
+    def test_least_recently_used_evicted(self):
+        builder = Builder()
+        builder.build(['a'])
+        builder.build(['b'])
+        builder.build(['a'])
+        builder.build(['c'])
+
+        builder.build(['a'])
+        self.assertEqual(builder.builds, 3)
+        builder.build(['b'])
+        self.assertEqual(builder.builds, 4)
+        self.assertEqual(self.counted('evictions'), 2)
+
+    def test_unhashable_arguments_built(self):
+        builder = Builder()
+        builder.build(['a'], {'k': bytearray()})
+        builder.build(['a'], {'k': bytearray()})
+
+        self.assertEqual(builder.builds, 2)
+
+    def test_cache_size(self):
+        cache = BuilderCache(maxsize=1)
+        cache.put('a', 'query a')
+        cache.put('b', 'query b')
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 'query b')
+
+
+class TestMemoizedQueries(unittest.TestCase):
+
+    def setUp(self):
+        self.sbol_query = SBOLQuery('http://localhost/sparql')
+
+    def tearDown(self):
+        self.sbol_query.close()
+
+    def test_same_query_built(self):
+        construct = SBOLQuery.construct_collection_entity_query
+        kwargs = {'members': EXPERIMENTS, 'member_cardinality': '*', 'entity_depth': 2,
+                  'rdf_type': 'http://sbols.org/v2#ModuleDefinition', 'custom_properties': {'sbol:role': '<r>'}}
+
+        query = self.sbol_query.construct_collection_entity_query([SD2Constants.SD2_EXPERIMENT_COLLECTION], 'exp',
+                                                                  **kwargs)
+        hits = self.sbol_query.builder_cache_stats()['construct_collection_entity_query']['hits']
+
+        self.assertEqual(construct.__wrapped__(self.sbol_query, [SD2Constants.SD2_EXPERIMENT_COLLECTION], 'exp',
+                                               **kwargs), query)
+        self.assertIs(self.sbol_query.construct_collection_entity_query([SD2Constants.SD2_EXPERIMENT_COLLECTION],
+                                                                        'exp', **kwargs), query)
+        self.assertEqual(self.sbol_query.builder_cache_stats()['construct_collection_entity_query']['hits'],
+                         hits + 1)
+
+        # Changing an argument builds another query
+        kwargs['members'] = EXPERIMENTS[:2]
+        self.assertNotIn(EXPERIMENTS[2], self.sbol_query.construct_collection_entity_query(
+            [SD2Constants.SD2_EXPERIMENT_COLLECTION], 'exp', **kwargs))
+
+    def test_settings_in_key(self):
+        query = self.sbol_query.construct_collection_entity_query([SD2Constants.SD2_EXPERIMENT_COLLECTION], 'exp',
+                                                                  members=EXPERIMENTS[:1])
+
+        # Settings changing the query built are part of the key, even when set on an instance
+        for name, value in [('OPTIMIZE_QUERIES', True), ('project_experiments', True)]:
+            other_query = SBOLQuery('http://localhost/sparql')
+            try:
+                setattr(other_query, name, value)
+                built = other_query.construct_collection_entity_query([SD2Constants.SD2_EXPERIMENT_COLLECTION],
+                                                                      'exp', members=EXPERIMENTS[:1])
+                self.assertNotEqual(built, query)
+                self.assertEqual(built, SBOLQuery.construct_collection_entity_query.__wrapped__(
+                    other_query, [SD2Constants.SD2_EXPERIMENT_COLLECTION], 'exp', members=EXPERIMENTS[:1]))
+            finally:
+                other_query.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
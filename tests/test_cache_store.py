@@ -0,0 +1,301 @@
+import multiprocessing
+import os
+import pickle
+import shelve
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+import zlib
+
+from SPARQLWrapper.SPARQLExceptions import QueryBadFormed
+from synbiohub_adapter.cache_query import wrap_query_fn
+from synbiohub_adapter.cache_store import SQLiteStore, migrate_shelve
+
+BINDING = {'s': {'type': 'uri', 'value': 'https://hub.sd2e.org/user/sd2e/design/x/1'}}
+RESULT = {'head': {'vars': ['s']}, 'results': {'bindings': [BINDING] * 100}}
+
+
+def invalidate_tags(path, tags):
+    store = SQLiteStore.open(path)
+    store.invalidate(tags)
+    store.close()
+
+
+def write_entries(path, writer, count):
+    store = SQLiteStore.open(path, batch_size=16)
+    for i in range(count):
+        store.put('{}:{}'.format(writer, i), (None, {'writer': writer, 'i': i}))
+    store.close()
+
+
+class TestSQLiteStore(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.cache_dir, 'queries.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def committed(self, key):
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute('SELECT COUNT(*) FROM entries WHERE key = ?', (key,)).fetchone()[0] == 1
+        finally:
+            conn.close()
+
+    def test_get_put_delete(self):
+        store = SQLiteStore(self.path)
+
+        self.assertIsNone(store.get('q'))
+        store.put('q', (None, RESULT))
+        self.assertEqual(store.get('q'), (None, RESULT))
+        store.put('e', (1234.5, 'expiring'))
+        store.put('s', (1234.5, 'stale', 1000.0))
+        store.flush()
+        self.assertEqual(store.get('e'), (1234.5, 'expiring'))
+        self.assertEqual(store.get('s'), (1234.5, 'stale', 1000.0))
+
+        store.delete('q')
+        self.assertIsNone(store.get('q'))
+        store.flush()
+        self.assertIsNone(store.get('q'))
+        self.assertEqual(len(store), 2)
+
+        self.assertEqual(store.purge_expired(now=2000), 2)
+        self.assertEqual(len(store), 0)
+        store.close()
+
+    def test_wal_and_compression(self):
+        store = SQLiteStore(self.path)
+        store.put('q', (None, RESULT))
+        store.flush()
+
+        conn = sqlite3.connect(self.path)
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        blob = conn.execute('SELECT value FROM bodies').fetchone()[0]
+        conn.close()
+        self.assertLess(len(blob), len(repr(RESULT)) / 10)
+        store.close()
+
+    def test_identical_values_stored_once(self):
+        store = SQLiteStore(self.path)
+        store.put('a', (None, RESULT))
+        store.put('b', (100.0, dict(RESULT)))
+        store.put('c', (None, 'other'))
+        store.flush()
+        store.put('d', (None, RESULT))
+
+        stats = store.stats()
+        self.assertEqual((stats['entries'], stats['bodies']), (4, 2))
+        self.assertLess(stats['stored_size'], stats['size'])
+        self.assertEqual(store.get('d'), (None, RESULT))
+        self.assertEqual(store.get('b'), (100.0, RESULT))
+
+        # A body is removed with the last entry referring to it
+        store.delete('c')
+        store.purge_expired(now=1000)
+        self.assertEqual(store.stats()['bodies'], 1)
+        store.clear()
+        self.assertEqual(store.stats()['bodies'], 0)
+        store.close()
+
+    def test_codecs(self):
+        sizes = {}
+        for codec in [None, 'zlib', 'lzma']:
+            store = SQLiteStore(self.path, codec=codec, compress_level=9)
+            store.clear()
+            store.put(str(codec), (None, RESULT))
+            sizes[codec] = store.stats()['stored_size']
+            store.close()
+
+        self.assertLess(sizes['zlib'], sizes[None])
+        self.assertLess(sizes['lzma'], sizes[None])
+
+        # Bodies written with any codec can be read
+        store = SQLiteStore(self.path, codec='lzma')
+        store.put('zlib', (None, RESULT))
+        store.put('None', (None, 'other'))
+        store.flush()
+        self.assertEqual(store.get('zlib'), (None, RESULT))
+        store.close()
+
+        with self.assertRaises(ValueError):
+            SQLiteStore(self.path, codec='gzip')
+
+    def test_upgrade_from_value_column(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute('CREATE TABLE entries (key TEXT PRIMARY KEY, expires REAL, value BLOB NOT NULL)')
+        for key in ['a', 'b']:
+            conn.execute('INSERT INTO entries VALUES (?, ?, ?)', (key, None, zlib.compress(pickle.dumps(RESULT))))
+        conn.commit()
+        conn.close()
+
+        store = SQLiteStore(self.path)
+        self.assertEqual(store.get('a'), (None, RESULT))
+        self.assertEqual(store.stats()['bodies'], 1)
+        store.close()
+
+    def test_invalidate(self):
+        store = SQLiteStore(self.path)
+        store.put('a', (None, RESULT), ['collection', 'entity'])
+        store.put('b', (None, RESULT), ['collection'])
+        store.put('c', (None, 'other'), ['other'])
+        store.flush()
+        store.put('d', (None, 'pending'), ['entity'])
+        self.assertEqual(store.tags('a'), {'collection', 'entity'})
+
+        last = store.last_invalidation()
+        self.assertEqual(store.invalidate(['entity'], now=100.0), (1, last + 1))
+        self.assertIsNone(store.get('a'))
+        self.assertIsNone(store.get('d'))
+        self.assertEqual(store.get('b'), (None, RESULT))
+        self.assertEqual(store.tags('b'), {'collection'})
+
+        # Entries are invalidated by other processes
+        process = multiprocessing.get_context('spawn').Process(target=invalidate_tags,
+                                                               args=(self.path, ['collection', 'unknown']))
+        process.start()
+        process.join()
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.invalidations_since(last),
+                         [(last + 1, {'entity'}), (last + 2, {'collection', 'unknown'})])
+
+        # Invalidations are kept in the log for a while
+        store.purge_expired(now=100.0 + SQLiteStore.log_retention - 1)
+        self.assertEqual(len(store.invalidations_since(last)), 2)
+        store.purge_expired(now=100.0 + SQLiteStore.log_retention + 1)
+        self.assertEqual(len(store.invalidations_since(last)), 1)
+        self.assertEqual(store.stats()['entries'], 1)
+        store.close()
+
+    def test_upgrade_adds_stale_column(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute('CREATE TABLE entries (key TEXT PRIMARY KEY, expires REAL, body TEXT NOT NULL)')
+        conn.commit()
+        conn.close()
+
+        store = SQLiteStore(self.path)
+        store.put('s', (1234.5, 'stale', 1000.0))
+        store.flush()
+        self.assertEqual(store.get('s'), (1234.5, 'stale', 1000.0))
+        store.close()
+
+    def test_snapshot(self):
+        store = SQLiteStore(self.path)
+        store.put('a', (None, RESULT), ['collection'])
+        store.put('b', (5000.0, RESULT, 3000.0))
+        store.put('expired', (500.0, 'expired'))
+        store.invalidate(['other'])
+
+        snapshot = os.path.join(self.cache_dir, 'queries.snapshot')
+        self.assertEqual(store.export_snapshot(snapshot, now=1000.0), 2)
+        self.assertEqual(os.listdir(self.cache_dir).count('queries.snapshot-wal'), 0)
+        store.close()
+
+        other = SQLiteStore(os.path.join(self.cache_dir, 'other.sqlite'))
+        other.put('a', (None, 'replaced'))
+        other.put('c', (None, 'kept'))
+        self.assertEqual(other.import_snapshot(snapshot), 2)
+        self.assertEqual(other.get('a'), (None, RESULT))
+        self.assertEqual(other.get('b'), (5000.0, RESULT, 3000.0))
+        self.assertEqual(other.get('c'), (None, 'kept'))
+        self.assertEqual(other.tags('a'), {'collection'})
+        self.assertEqual(other.stats()['bodies'], 2)
+        self.assertEqual(other.invalidations_since(0), [])
+
+        # Imported entries can be given a new lifetime
+        self.assertEqual(other.import_snapshot(snapshot, ttl=60, now=1000.0), 2)
+        self.assertEqual(other.get('a'), (1060.0, RESULT))
+        with self.assertRaises(FileNotFoundError):
+            other.import_snapshot(os.path.join(self.cache_dir, 'missing.snapshot'))
+        other.close()
+
+    def test_batched_writes(self):
+        store = SQLiteStore(self.path, batch_size=3, flush_interval=60)
+
+        store.put('a', (None, 1))
+        store.put('b', (None, 2))
+        self.assertFalse(self.committed('a'))
+        self.assertEqual(store.get('a'), (None, 1))
+
+        store.put('c', (None, 3))
+        self.assertTrue(self.committed('a'))
+        self.assertTrue(self.committed('c'))
+
+        # Writes left in the queue are committed on close
+        store.put('d', (None, 4))
+        store.close()
+        self.assertTrue(self.committed('d'))
+
+    def test_flush_interval(self):
+        store = SQLiteStore(self.path, flush_interval=0.05)
+        store.put('a', (None, 1))
+
+        for i in range(100):
+            if self.committed('a'):
+                break
+            time.sleep(0.01)
+        self.assertTrue(self.committed('a'))
+        store.close()
+
+    def test_one_connection_per_process(self):
+        store = SQLiteStore.open(self.path)
+        self.assertIs(SQLiteStore.open(os.path.join(self.cache_dir, '.', 'queries.sqlite')), store)
+
+        store.close()
+        self.assertIsNot(SQLiteStore.open(self.path), store)
+        SQLiteStore.open(self.path).close()
+
+    def test_concurrent_processes(self):
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=write_entries, args=(self.path, writer, 200)) for writer in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+        store = SQLiteStore(self.path)
+        self.assertEqual(len(store), 800)
+        self.assertEqual(store.get('3:199'), (None, {'writer': 3, 'i': 199}))
+        store.close()
+
+    def test_migrate_shelve(self):
+        shelve_path = os.path.join(self.cache_dir, 'queries.db')
+        with shelve.open(shelve_path) as db:
+            db['https://hub.sd2e.org/sparql, SELECT'] = RESULT
+            db['skipped'] = 'skipped'
+
+        store = SQLiteStore(self.path)
+        key_fn = (lambda key: None if key == 'skipped' else key)
+        self.assertEqual(migrate_shelve(shelve_path, store, key_fn), 1)
+        self.assertEqual(store.get('https://hub.sd2e.org/sparql, SELECT'), (None, RESULT))
+
+        # Entries are only copied once, and a missing shelve database is ignored
+        self.assertEqual(migrate_shelve(shelve_path, store, key_fn), 0)
+        self.assertEqual(migrate_shelve(os.path.join(self.cache_dir, 'missing.db'), store), 0)
+        store.close()
+
+    def test_fallback_cache(self):
+        calls = []
+
+        def query(server, query):
+            calls.append(query)
+            if len(calls) > 1:
+                raise QueryBadFormed()
+            return RESULT
+
+        cached_query = wrap_query_fn(query, db_file_path=self.path)
+
+        self.assertEqual(cached_query('https://hub.sd2e.org/sparql', 'SELECT'), RESULT)
+        self.assertEqual(cached_query('https://hub.sd2e.org/sparql', 'SELECT'), RESULT)
+        with self.assertRaises(QueryBadFormed):
+            cached_query('https://hub.sd2e.org/sparql', 'SELECT other')
+        SQLiteStore.open(self.path).close()
+
+
+if __name__ == '__main__':
+    unittest.main()
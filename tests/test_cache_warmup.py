@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import synbiohub_adapter as sbha
+from synbiohub_adapter.cache_warmup import main, warm, query_methods, result_values, ManifestError
+from synbiohub_adapter.query_cache import QueryCache
+
+from tests.LocalSPARQLServer import LocalSPARQLServer, bindings_result
+
+DESIGN_SETS = ['https://hub.sd2e.org/user/sd2e/design/rule_30/1',
+               'https://hub.sd2e.org/user/sd2e/design/yeast_gates/1']
+
+MANIFEST = {
+    'calls': [
+        {'method': 'query_design_strains'},
+        {'method': 'query_design_set_*controls', 'kwargs': {'verbose': True},
+         'for_each': {'collection': 'query_design_sets'}}
+    ]
+}
+
+
+def responder(query, headers):
+    if 'SELECT DISTINCT ?collection' in query:
+        return bindings_result(['collection'], [[uri] for uri in DESIGN_SETS])
+
+    return bindings_result(['entity'], [['https://hub.sd2e.org/user/sd2e/design/entity/1']])
+
+
+class TestCacheWarmup(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalSPARQLServer(responder).start()
+        self.cache_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.cache_dir, 'queries.sqlite')
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.cache_dir)
+
+    def test_manifest_expanded(self):
+        cache = QueryCache(path=self.path)
+        sbh_query = sbha.SynBioHubQuery(self.server.sparql_url, cache=cache)
+
+        results = warm(sbh_query, MANIFEST, workers=4)
+
+        controls = query_methods('query_design_set_*controls')
+        self.assertEqual(len(controls), 5)
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual(len(results), 2 + len(controls) * len(DESIGN_SETS))
+        self.assertIn(('query_design_set_ludox_controls', {'verbose': True, 'collection': DESIGN_SETS[1]}),
+                      [(result.method_name, result.kwargs) for result in results])
+
+        # A second warm-up is answered by the cache
+        sent = len(self.server.queries)
+        warm(sbh_query, MANIFEST)
+        self.assertEqual(len(self.server.queries), sent)
+        cache.close()
+
+    def test_snapshot_used_without_network(self):
+        manifest_path = os.path.join(self.cache_dir, 'manifest.json')
+        with open(manifest_path, 'w') as manifest_file:
+            json.dump(MANIFEST, manifest_file)
+        snapshot = os.path.join(self.cache_dir, 'design.snapshot')
+
+        self.assertEqual(main(['-c', self.path, 'warm', '-s', self.server.sparql_url, '-m', manifest_path,
+                               '-o', snapshot]), 0)
+        self.server.stop()
+
+        # The snapshot is imported into the cache of a host that cannot reach SynBioHub
+        node_path = os.path.join(self.cache_dir, 'node', 'queries.sqlite')
+        self.assertEqual(main(['-c', node_path, 'import', snapshot, '--ttl', '3600']), 0)
+
+        cache = QueryCache(path=node_path)
+        sbh_query = sbha.SynBioHubQuery(self.server.sparql_url, cache=cache)
+        self.assertEqual(sbh_query.query_design_set_water_controls(DESIGN_SETS[0], verbose=True),
+                         responder('', {}))
+        cache.close()
+
+    def test_failed_calls_reported(self):
+        manifest_path = os.path.join(self.cache_dir, 'manifest.json')
+        with open(manifest_path, 'w') as manifest_file:
+            json.dump({'calls': [{'method': 'query_design_set_dna', 'kwargs': {'unknown': 1}}]}, manifest_file)
+
+        self.assertEqual(main(['-c', self.path, 'warm', '-s', self.server.sparql_url, '-m', manifest_path]), 1)
+
+    def test_manifest_errors(self):
+        with self.assertRaises(ManifestError):
+            query_methods('query_unknown_*')
+        with self.assertRaises(ManifestError):
+            result_values('not a list')
+
+        self.assertEqual(result_values({'a': 1, 'b': 2}), ['a', 'b'])
+        self.assertEqual(result_values(bindings_result(['collection'], [[uri] for uri in DESIGN_SETS])),
+                         DESIGN_SETS)
+
+
+if __name__ == '__main__':
+    unittest.main()
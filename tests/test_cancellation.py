@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+import unittest
+
+import SPARQLWrapper
+import synbiohub_adapter as sbha
+from synbiohub_adapter.cancellation import CancellationToken, QueryTimeoutError, QueryCancelledError
+from synbiohub_adapter.resilience import RetryPolicy
+
+from tests.LocalSPARQLServer import LocalSPARQLServer, bindings_result
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+RESULT = bindings_result(['collection'], [['https://hub.sd2e.org/user/sd2e/experiment/rule_30/1']])
+
+
+class TestTimeoutsAndCancellation(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        def responder(query, headers):
+            if 'slow' in query:
+                time.sleep(1.5)
+            elif 'bad' in query:
+                return (400, 'text/plain', b'bad query')
+            return RESULT
+
+        self.server = LocalSPARQLServer(responder).start()
+
+    @classmethod
+    def tearDownClass(self):
+        self.server.stop()
+
+    def new_query(self, **kwargs):
+        return sbha.SynBioHubQuery(self.server.sparql_url, retry_policy=RetryPolicy(budget=None), **kwargs)
+
+    def assertFast(self, start):
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_call_timeout(self):
+        sbh_query = self.new_query()
+        queries = len(self.server.queries)
+
+        start = time.monotonic()
+        with self.assertRaises(QueryTimeoutError):
+            sbh_query.query_collections(collections=['slow'], timeout=0.2)
+        self.assertFast(start)
+
+        # Timeouts are not retried, and the client can still be used
+        self.assertEqual(len(self.server.queries), queries + 1)
+        self.assertEqual(len(sbh_query.query_collections(timeout=5)['results']['bindings']), 1)
+
+    def test_client_timeout(self):
+        sbh_query = self.new_query(timeout=0.2)
+
+        self.assertEqual(len(sbh_query.query_experiment_sets()), 1)
+
+        start = time.monotonic()
+        with self.assertRaises(QueryTimeoutError):
+            sbh_query.query_collections(collections=['slow'])
+        self.assertFast(start)
+
+    def test_cancel_from_another_thread(self):
+        sbh_query = self.new_query()
+        token = CancellationToken()
+        threading.Timer(0.2, token.cancel).start()
+
+        start = time.monotonic()
+        with self.assertRaises(QueryCancelledError):
+            sbh_query.query_collections(collections=['slow'], cancel_token=token)
+        self.assertFast(start)
+
+    def test_cancelled_before_call(self):
+        sbh_query = self.new_query()
+        token = CancellationToken()
+        token.cancel()
+        queries = len(self.server.queries)
+
+        with self.assertRaises(QueryCancelledError):
+            sbh_query.query_collections(cancel_token=token)
+        self.assertEqual(len(self.server.queries), queries)
+
+    def test_token_without_cancel(self):
+        sbh_query = self.new_query()
+
+        result = sbh_query.query_collections(cancel_token=CancellationToken(), timeout=5)
+        self.assertEqual(len(result['results']['bindings']), 1)
+
+    def test_errors_reported_distinctly(self):
+        sbh_query = self.new_query(timeout=5)
+
+        with self.assertRaises(SPARQLWrapper.SPARQLExceptions.QueryBadFormed):
+            sbh_query.query_collections(collections=['bad'], cancel_token=CancellationToken())
+
+    def test_nested_calls_share_deadline(self):
+        sbh_query = self.new_query()
+
+        # query_design_set_dna calls query_design_dna, which must not restart the timeout
+        start = time.monotonic()
+        with self.assertRaises(QueryTimeoutError):
+            sbh_query.query_design_set_dna('slow', timeout=0.2)
+        self.assertFast(start)
+
+    @unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+    def test_async_timeout_and_cancel(self):
+        async def run():
+            async with sbha.AsyncSynBioHubQuery(self.server.sparql_url) as sbh_query:
+                with self.assertRaises(QueryTimeoutError):
+                    await sbh_query.query_collections(collections=['slow'], timeout=0.2)
+
+                token = CancellationToken()
+                asyncio.get_event_loop().call_later(0.2, token.cancel)
+                with self.assertRaises(QueryCancelledError):
+                    await sbh_query.query_collections(collections=['slow'], cancel_token=token)
+
+                result = await sbh_query.query_collections(timeout=5)
+                self.assertEqual(len(result['results']['bindings']), 1)
+
+        start = time.monotonic()
+        asyncio.run(run())
+        self.assertLess(time.monotonic() - start, 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import time
+import unittest
+
+import SPARQLWrapper
+import synbiohub_adapter as sbha
+from synbiohub_adapter.endpoints import EndpointSet
+from synbiohub_adapter.resilience import RetryPolicy
+
+from tests.LocalSPARQLServer import LocalSPARQLServer, bindings_result
+
+
+class Replica():
+    ''' A local endpoint answering with its own name after an adjustable delay, or with an error status.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.delay = 0
+        self.status = None
+        self.server = LocalSPARQLServer(self.respond).start()
+
+    def respond(self, query, headers):
+        time.sleep(self.delay)
+        if self.status is not None:
+            return (self.status, 'text/plain', b'error')
+        return bindings_result(['collection'], [['https://hub.sd2e.org/user/sd2e/' + self.name + '/1']])
+
+
+def answered_by(result):
+    return result[0].split('/')[-2]
+
+
+class TestEndpointSet(unittest.TestCase):
+
+    def setUp(self):
+        self.primary = Replica('primary')
+        self.replica = Replica('replica')
+
+    def tearDown(self):
+        self.primary.server.stop()
+        self.replica.server.stop()
+
+    def new_query(self, **kwargs):
+        self.endpoints = EndpointSet([self.primary.server.sparql_url, self.replica.server.sparql_url], **kwargs)
+        return sbha.SynBioHubQuery(self.primary.server.sparql_url, endpoints=self.endpoints,
+                                   retry_policy=RetryPolicy(max_attempts=1))
+
+    def test_routes_to_fastest(self):
+        sbh_query = self.new_query()
+        self.primary.delay = 0.05
+
+        answers = [answered_by(sbh_query.query_experiment_sets()) for i in range(10)]
+
+        # Both endpoints are tried once, then the faster replica is preferred
+        self.assertEqual(answers[:2], ['primary', 'replica'])
+        self.assertEqual(set(answers[2:]), {'replica'})
+        stats = self.endpoints.stats()
+        self.assertGreater(stats[self.primary.server.sparql_url]['latency'],
+                           stats[self.replica.server.sparql_url]['latency'])
+
+    def test_failover(self):
+        sbh_query = self.new_query()
+        self.primary.status = 503
+
+        self.assertEqual(answered_by(sbh_query.query_experiment_sets()), 'replica')
+        self.assertEqual(answered_by(sbh_query.query_experiment_sets()), 'replica')
+
+        stats = self.endpoints.stats()
+        self.assertFalse(stats[self.primary.server.sparql_url]['healthy'])
+        self.assertEqual(stats[self.primary.server.sparql_url]['failures'], 1)
+
+    def test_all_endpoints_failing(self):
+        sbh_query = self.new_query()
+        self.primary.status = 503
+        self.replica.status = 500
+
+        with self.assertRaises(SPARQLWrapper.SPARQLExceptions.EndPointInternalError):
+            sbh_query.query_experiment_sets()
+
+    def test_no_failover_on_bad_query(self):
+        sbh_query = self.new_query()
+        self.primary.status = 400
+
+        with self.assertRaises(SPARQLWrapper.SPARQLExceptions.QueryBadFormed):
+            sbh_query.query_experiment_sets()
+        self.assertEqual(len(self.replica.server.queries), 0)
+
+    def test_hedged_request(self):
+        sbh_query = self.new_query(hedge_delay=0.05)
+        self.primary.delay = 1.0
+
+        start = time.monotonic()
+        self.assertEqual(answered_by(sbh_query.query_experiment_sets()), 'replica')
+        self.assertLess(time.monotonic() - start, 0.9)
+
+        self.assertEqual(self.endpoints.stats()[self.replica.server.sparql_url]['hedged_wins'], 1)
+        self.endpoints.close()
+
+    def test_hedge_not_sent_to_fast_endpoint(self):
+        sbh_query = self.new_query(hedge_delay=0.5)
+
+        self.assertEqual(answered_by(sbh_query.query_experiment_sets()), 'primary')
+        self.assertEqual(len(self.replica.server.queries), 0)
+        self.endpoints.close()
+
+    def test_login_pinned_to_primary(self):
+        sbh_query = self.new_query()
+        sbh_query.login('sd2e', 'password')
+
+        self.assertEqual(self.primary.server.logins, 1)
+        self.assertEqual(self.replica.server.logins, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import re
+import unittest
+
+import synbiohub_adapter as sbha
+from synbiohub_adapter.existence_cache import ExistenceCache
+
+from tests.FakeClock import FakeClock
+from tests.LocalSPARQLServer import LocalSPARQLServer, bindings_result
+
+COLLECTION = 'https://hub.sd2e.org/user/sd2e/design/collection/1'
+OTHER_COLLECTION = 'https://hub.sd2e.org/user/sd2e/design/other_collection/1'
+IMPLEMENTATION = 'http://sbols.org/v2#Implementation'
+SAMPLES = ['https://hub.sd2e.org/user/sd2e/sample/sample_{}/1'.format(i) for i in range(4)]
+
+
+class TestExistenceCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock(1000.0)
+        self.cache = ExistenceCache(hit_ttl=100, miss_ttl=10, max_entries=3, clock=self.clock)
+
+    def test_hit_and_miss_ttls(self):
+        self.assertIsNone(self.cache.get(SAMPLES[0], IMPLEMENTATION, [COLLECTION]))
+
+        self.cache.put(SAMPLES[0], IMPLEMENTATION, [COLLECTION], [COLLECTION])
+        self.cache.put(SAMPLES[1], IMPLEMENTATION, [COLLECTION], [])
+        self.assertEqual(self.cache.get(SAMPLES[0], IMPLEMENTATION, [COLLECTION]), [COLLECTION])
+        self.assertEqual(self.cache.get(SAMPLES[1], IMPLEMENTATION, [COLLECTION]), [])
+
+        # Checks of another type or in other collections are not answered
+        self.assertIsNone(self.cache.get(SAMPLES[0], None, [COLLECTION]))
+        self.assertIsNone(self.cache.get(SAMPLES[0], IMPLEMENTATION, []))
+
+        self.clock.now += 10
+        self.assertEqual(self.cache.get(SAMPLES[0], IMPLEMENTATION, [COLLECTION]), [COLLECTION])
+        self.assertIsNone(self.cache.get(SAMPLES[1], IMPLEMENTATION, [COLLECTION]))
+        self.clock.now += 90
+        self.assertIsNone(self.cache.get(SAMPLES[0], IMPLEMENTATION, [COLLECTION]))
+
+        self.assertEqual(self.cache.stats(), {'hits': 2, 'negative_hits': 1, 'misses': 5, 'evictions': 0,
+                                              'entries': 0})
+
+    def test_least_recently_used_evicted(self):
+        for sample in SAMPLES[:3]:
+            self.cache.put(sample, None, [], [COLLECTION])
+        self.cache.get(SAMPLES[0])
+        self.cache.put(SAMPLES[3], None, [], [COLLECTION])
+
+        self.assertIsNone(self.cache.get(SAMPLES[1]))
+        self.assertEqual(self.cache.get(SAMPLES[0]), [COLLECTION])
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_invalidate(self):
+        self.cache.put(SAMPLES[0], None, [COLLECTION], [])
+        self.cache.put(SAMPLES[1], None, [OTHER_COLLECTION], [])
+        self.cache.put(SAMPLES[2], None, [], [OTHER_COLLECTION])
+
+        # An entity is forgotten when written, or when a collection it was searched for in is written
+        self.assertEqual(self.cache.invalidate([SAMPLES[2].replace('https', 'http'), COLLECTION]), 2)
+        self.assertIsNone(self.cache.get(SAMPLES[0], None, [COLLECTION]))
+        self.assertEqual(self.cache.get(SAMPLES[1], None, [OTHER_COLLECTION]), [])
+        self.assertIsNone(self.cache.get(SAMPLES[2]))
+
+
+class TestCachedMembership(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.existing = set(SAMPLES[:2])
+
+        def responder(query, headers):
+            members = [uri for uri in re.findall('<([^>]+)>', query) if uri in SAMPLES]
+            return bindings_result(['entity'], [[member] for member in members if member in self.existing])
+
+        self.server = LocalSPARQLServer(responder).start()
+
+    @classmethod
+    def tearDownClass(self):
+        self.server.stop()
+
+    def setUp(self):
+        self.cache = ExistenceCache()
+        self.sbh_query = sbha.SynBioHubQuery(self.server.sparql_url, existence_cache=self.cache)
+        self.sent = len(self.server.queries)
+
+    def members(self, result):
+        return sorted(binding['entity']['value'] for binding in result['results']['bindings'])
+
+    def test_repeated_checks_answered_locally(self):
+        result = self.sbh_query.query_collection_members([COLLECTION], SAMPLES[:3], IMPLEMENTATION)
+        self.assertEqual(self.members(result), SAMPLES[:2])
+        self.assertEqual(len(self.server.queries) - self.sent, 1)
+
+        # Only the member not checked yet is queried, and the missing member is answered by a negative entry
+        result = self.sbh_query.query_collection_members([COLLECTION], SAMPLES, IMPLEMENTATION)
+        self.assertEqual(result['head']['vars'], ['entity'])
+        self.assertEqual(self.members(result), SAMPLES[:2])
+        self.assertEqual(len(self.server.queries) - self.sent, 2)
+        self.assertIn(SAMPLES[3], self.server.queries[-1])
+        self.assertNotIn(SAMPLES[0], self.server.queries[-1])
+
+        result = self.sbh_query.query_collection_members([COLLECTION], SAMPLES, IMPLEMENTATION)
+        self.assertEqual(self.members(result), SAMPLES[:2])
+        self.assertEqual(len(self.server.queries) - self.sent, 2)
+        self.assertEqual(self.cache.stats()['negative_hits'], 3)
+
+    def test_collections_of_cached_members_listed(self):
+        self.cache.put(SAMPLES[0], None, [COLLECTION, OTHER_COLLECTION], [OTHER_COLLECTION])
+
+        result = self.sbh_query.query_collection_members([COLLECTION, OTHER_COLLECTION], [SAMPLES[0]])
+        self.assertEqual(result['head']['vars'], ['collection', 'entity'])
+        self.assertEqual(result['results']['bindings'],
+                         [{'collection': {'type': 'uri', 'value': OTHER_COLLECTION},
+                           'entity': {'type': 'uri', 'value': SAMPLES[0]}}])
+        self.assertEqual(len(self.server.queries), self.sent)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import unittest
+
+import rdflib
+
+from synbiohub_adapter.SynBioHubUtil import SBOLConstants, SD2Constants
+from synbiohub_adapter.query_synbiohub import SynBioHubQuery
+from synbiohub_adapter.fan_in import iter_chunks, fan_in
+
+from tests.LocalSPARQLServer import LocalSPARQLServer, graph_responder
+
+EXPERIMENT = 'https://hub.sd2e.org/user/sd2e/experiment/'
+DESIGN = 'https://hub.sd2e.org/user/sd2e/design/'
+BIOPAX_SMALL_MOLECULE = 'http://www.biopax.org/release/biopax-level3.owl#SmallMolecule'
+OM = 'http://www.ontology-of-units-of-measure.org/resource/om-2#'
+
+
+def experiment_graph(size):
+    graph = rdflib.Graph()
+    sbol = rdflib.Namespace(SBOLConstants.SBOL_NS)
+    sd2 = rdflib.Namespace('http://sd2e.org#')
+    prov = rdflib.Namespace('http://www.w3.org/ns/prov#')
+    om = rdflib.Namespace(OM)
+    collection = rdflib.URIRef(SD2Constants.SD2_EXPERIMENT_COLLECTION)
+
+    strains = [rdflib.URIRef(DESIGN + 'strain_{}/1'.format(i)) for i in range(3)]
+    for strain in strains:
+        graph.add((strain, rdflib.RDF.type, sbol.ModuleDefinition))
+        graph.add((strain, sbol.role, rdflib.URIRef(SBOLConstants.NCIT_STRAIN)))
+
+    inducers = [rdflib.URIRef(DESIGN + 'inducer_{}/1'.format(i)) for i in range(2)]
+    for inducer in inducers:
+        graph.add((inducer, sbol.type, rdflib.URIRef(BIOPAX_SMALL_MOLECULE)))
+        graph.add((inducer, sbol.role, rdflib.URIRef(SBOLConstants.EFFECTOR)))
+
+    for i in range(size):
+        experiment = rdflib.URIRef(EXPERIMENT + 'experiment_{}/1'.format(i))
+        graph.add((collection, sbol.member, experiment))
+
+        # Experiments have from none to two samples, each built from a strain and a condition with an inducer
+        for j in range(i % 3):
+            data = rdflib.URIRef(EXPERIMENT + 'data_{}_{}/1'.format(i, j))
+            sample = rdflib.URIRef(EXPERIMENT + 'sample_{}_{}/1'.format(i, j))
+            condition = rdflib.URIRef(EXPERIMENT + 'condition_{}_{}/1'.format(i, j))
+            functional_component = rdflib.URIRef(condition + '/inducer')
+            measure = rdflib.URIRef(condition + '/inducer/measure')
+            graph.add((experiment, sd2.experimentalData, data))
+            graph.add((data, prov.wasDerivedFrom, sample))
+            graph.add((sample, sbol.built, strains[(i + j) % len(strains)]))
+            graph.add((sample, sbol.built, condition))
+            graph.add((condition, sbol.functionalComponent, functional_component))
+            graph.add((functional_component, sbol.definition, inducers[j % len(inducers)]))
+            graph.add((functional_component, om.measure, measure))
+            graph.add((measure, om.hasNumericalValue, rdflib.Literal(float(i + j))))
+
+    return graph
+
+
+class TestFanIn(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.server = LocalSPARQLServer(graph_responder(experiment_graph(7))).start()
+        self.experiments = [EXPERIMENT + 'experiment_{}/1'.format(i) for i in range(7)]
+
+    @classmethod
+    def tearDownClass(self):
+        self.server.stop()
+
+    def setUp(self):
+        self.server.queries.clear()
+        self.sbh_query = SynBioHubQuery(self.server.sparql_url)
+
+    def tearDown(self):
+        self.sbh_query.close()
+
+    # rdflib answers a grouped query matching nothing with an empty row, which other endpoints do not
+    def rows(self, query_result):
+        return sorted(sorted((name, term['value']) for name, term in binding.items())
+                      for binding in query_result['results']['bindings'] if len(binding) > 0)
+
+    def test_same_results(self):
+        results = self.sbh_query.query_multi_experiment_strains(self.experiments, chunk_size=3)
+        self.assertEqual(len(self.server.queries), 3)
+        self.assertEqual(list(results), self.experiments)
+
+        for experiment in self.experiments:
+            expected = self.sbh_query.query_single_experiment_strains(experiment)
+            self.assertEqual(results[experiment], expected)
+        self.assertGreater(sum(len(result) for result in results.values()), 0)
+
+        results = self.sbh_query.query_multi_experiment_strains(self.experiments, by_sample=False, pretty=False)
+        for experiment in self.experiments:
+            expected = self.sbh_query.query_single_experiment_strains(experiment, by_sample=False, pretty=False)
+            self.assertEqual(results[experiment]['head']['vars'], expected['head']['vars'])
+            self.assertEqual(self.rows(results[experiment]), self.rows(expected))
+
+    def test_streamed_results(self):
+        streaming_query = SynBioHubQuery(self.server.sparql_url, stream_results=True)
+        try:
+            results = streaming_query.query_multi_experiment_strains(self.experiments, by_sample=False, pretty=False)
+        finally:
+            streaming_query.close()
+
+        for experiment in self.experiments:
+            expected = self.sbh_query.query_single_experiment_strains(experiment, by_sample=False, pretty=False)
+            self.assertEqual(results[experiment]['head']['vars'], expected['head']['vars'])
+            self.assertEqual(self.rows(results[experiment]), self.rows(expected))
+        self.assertEqual(results[self.experiments[0]]['head']['vars'], ['strain'])
+
+    def test_inducers(self):
+        self.server.queries.clear()
+        results = self.sbh_query.query_multi_experiment_inducers(self.experiments)
+        self.assertEqual(len(self.server.queries), 1)
+        self.assertIn('GROUP BY ?exp ?inducer', self.server.queries[0])
+
+        for experiment in self.experiments:
+            expected = self.sbh_query.query_single_experiment_inducers(experiment)
+            self.assertEqual(results[experiment]['head']['vars'], expected['head']['vars'])
+            self.assertEqual(self.rows(results[experiment]), self.rows(expected))
+        self.assertEqual(len(results[self.experiments[0]]['results']['bindings']), 0)
+        self.assertEqual(len(results[self.experiments[2]]['results']['bindings']), 2)
+
+    def test_iter_chunks(self):
+        experiments = ['e{}'.format(i) for i in range(50)]
+
+        def build(chunk):
+            return ' '.join(chunk)
+
+        url = 'http://localhost/sparql'
+        chunks = list(iter_chunks(experiments, build, url, max_url_length=100))
+        self.assertEqual(sum(chunks, []), experiments)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(url) + len('?query=') + len(build(chunk).replace(' ', '+')) <= 100
+                            for chunk in chunks))
+
+        # A chunk of longer URIs than the first two is split in two
+        experiments = ['e0', 'e1'] + ['experiment_{}'.format(i) for i in range(8)]
+        chunks = list(iter_chunks(experiments, build, url, max_url_length=100))
+        self.assertEqual(sum(chunks, []), experiments)
+        self.assertTrue(all(len(url) + len('?query=') + len(build(chunk).replace(' ', '+')) <= 100
+                            for chunk in chunks))
+
+        self.assertEqual(list(iter_chunks(experiments, build, url, chunk_size=4)),
+                         [experiments[:4], experiments[4:8], experiments[8:]])
+        self.assertEqual(list(iter_chunks(experiments, build, url, max_chunk_size=3))[0], experiments[:3])
+
+    def test_fan_in(self):
+        def fetch(chunk):
+            return {'head': {'vars': ['exp', 'x']},
+                    'results': {'bindings': [{'exp': {'type': 'uri', 'value': experiment},
+                                              'x': {'type': 'literal', 'value': experiment.upper()}}
+                                             for experiment in chunk if experiment != 'b']}}
+
+        results = fan_in([['a', 'b'], ['c']], fetch)
+        self.assertEqual(list(results), ['a', 'b', 'c'])
+        self.assertEqual(results['a'], {'head': {'vars': ['x']},
+                                        'results': {'bindings': [{'x': {'type': 'literal', 'value': 'A'}}]}})
+        self.assertEqual(results['b']['results']['bindings'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
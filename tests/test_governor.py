@@ -0,0 +1,218 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import synbiohub_adapter as sbha
+from synbiohub_adapter.cancellation import CancellationToken, QueryTimeoutError, QueryCancelledError
+from synbiohub_adapter.governor import Governor, GovernedTransport, endpoint_key
+from synbiohub_adapter.transport import PooledTransport
+
+from tests.LocalSPARQLServer import LocalSPARQLServer, bindings_result
+
+
+class ConcurrencyTracker():
+    ''' Records the maximum number of concurrent calls of hold.
+    '''
+
+    def __init__(self, duration):
+        self.duration = duration
+        self.current = 0
+        self.max = 0
+        self._lock = threading.Lock()
+
+    def hold(self, *args):
+        with self._lock:
+            self.current += 1
+            self.max = max(self.max, self.current)
+
+        time.sleep(self.duration)
+
+        with self._lock:
+            self.current -= 1
+
+        return bindings_result(['collection'], [['https://hub.sd2e.org/user/sd2e/experiment/rule_30/1']])
+
+
+# Returns calls of distinct queries for run_many, so that they are not coalesced into one request.
+def distinct_queries(count):
+    return [('query_collection_members', {'collections': ['https://hub.sd2e.org/user/sd2e/c{}/1'.format(i)]})
+            for i in range(count)]
+
+
+def run_threads(target, count):
+    threads = [threading.Thread(target=target) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class TestGovernor(unittest.TestCase):
+
+    def setUp(self):
+        self.lock_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.lock_dir)
+
+    def test_rate_limit(self):
+        governor = Governor(rate=20, burst=2)
+
+        start = time.monotonic()
+        for i in range(6):
+            governor.acquire().release()
+
+        # Two requests start at once, the other four are spaced by 1/20 s
+        self.assertGreater(time.monotonic() - start, 0.18)
+        stats = governor.stats()
+        self.assertEqual(stats['requests'], 6)
+        self.assertEqual(stats['waited'], 4)
+        self.assertGreater(stats['max_wait'], 0.03)
+        self.assertEqual(stats['rate_wait']['waited'], 4)
+        self.assertEqual(stats['slot_wait']['waited'], 0)
+
+    def test_max_in_flight(self):
+        governor = Governor(max_in_flight=2)
+        tracker = ConcurrencyTracker(0.05)
+
+        run_threads(lambda: governor.call(tracker.hold), 6)
+
+        self.assertEqual(tracker.max, 2)
+        self.assertEqual(governor.stats()['in_flight'], 0)
+        self.assertGreater(governor.stats()['p95_wait'], 0.04)
+        self.assertGreater(governor.stats()['slot_wait']['p95_wait'], 0.04)
+        self.assertEqual(governor.stats()['rate_wait']['waited'], 0)
+
+    def test_shared_between_processes(self):
+        # Each Governor opens its own lock files, as another process would
+        lock_path = os.path.join(self.lock_dir, 'hub')
+        governors = [Governor(max_in_flight=2, lock_path=lock_path) for i in range(3)]
+        tracker = ConcurrencyTracker(0.05)
+
+        run_threads(lambda: [governor.call(tracker.hold) for governor in governors], 3)
+
+        self.assertEqual(tracker.max, 2)
+
+    def test_rate_shared_between_processes(self):
+        lock_path = os.path.join(self.lock_dir, 'hub')
+        governors = [Governor(rate=20, burst=1, lock_path=lock_path) for i in range(2)]
+
+        start = time.monotonic()
+        for i in range(3):
+            for governor in governors:
+                governor.acquire().release()
+
+        self.assertGreater(time.monotonic() - start, 0.22)
+
+    def test_bounded_waits(self):
+        lock_path = os.path.join(self.lock_dir, 'hub')
+        for governor in [Governor(max_in_flight=1), Governor(max_in_flight=1, lock_path=lock_path)]:
+            permit = governor.acquire()
+
+            start = time.monotonic()
+            with self.assertRaises(QueryTimeoutError):
+                governor.acquire(timeout=0.1)
+            self.assertLess(time.monotonic() - start, 0.5)
+
+            cancel_token = CancellationToken()
+            threading.Timer(0.1, cancel_token.cancel).start()
+            with self.assertRaises(QueryCancelledError):
+                governor.acquire(cancel_token=cancel_token)
+
+            permit.release()
+            governor.acquire(timeout=0.1).release()
+            self.assertEqual(governor.stats()['in_flight'], 0)
+
+        # A request that cannot get a token in time takes none, and a request cancelled while waiting gives it back
+        for governor in [Governor(rate=5, burst=1), Governor(rate=5, burst=1, lock_path=lock_path)]:
+            governor.acquire().release()
+            with self.assertRaises(QueryTimeoutError):
+                governor.acquire(timeout=0.05)
+
+            cancel_token = CancellationToken()
+            threading.Timer(0.05, cancel_token.cancel).start()
+            with self.assertRaises(QueryCancelledError):
+                governor.acquire(cancel_token=cancel_token)
+
+            start = time.monotonic()
+            governor.acquire().release()
+            self.assertLess(time.monotonic() - start, 0.25)
+
+
+class TestGovernedTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = ConcurrencyTracker(0.05)
+        self.server = LocalSPARQLServer(self.tracker.hold).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_queries_governed_per_endpoint(self):
+        governor = Governor(max_in_flight=2)
+        transport = GovernedTransport(PooledTransport(), {self.server.url: governor})
+        sbh_query = sbha.SynBioHubQuery(self.server.sparql_url, transport=transport)
+
+        results = sbh_query.run_many(distinct_queries(6))
+
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual(self.tracker.max, 2)
+        self.assertEqual(sbh_query.governor_stats()[endpoint_key(self.server.url)]['requests'], 6)
+
+    def test_ungoverned_endpoint(self):
+        transport = GovernedTransport(PooledTransport(), {'https://hub.sd2e.org': Governor(max_in_flight=1)})
+        sbh_query = sbha.SynBioHubQuery(self.server.sparql_url, transport=transport)
+
+        sbh_query.run_many(distinct_queries(4))
+
+        self.assertEqual(self.tracker.max, 4)
+
+    def test_streamed_response_holds_permit(self):
+        governor = Governor(max_in_flight=1)
+        transport = GovernedTransport(PooledTransport(), default=governor)
+        sbh_query = sbha.SynBioHubQuery(self.server.sparql_url, transport=transport, stream_results=True)
+
+        result = sbh_query.query_experiment_sets(pretty=False)
+        self.assertEqual(governor.stats()['in_flight'], 1)
+
+        self.assertEqual(len(list(result)), 1)
+        self.assertEqual(governor.stats()['in_flight'], 0)
+
+    def test_query_timeout_covers_wait(self):
+        governor = Governor(max_in_flight=1)
+        transport = GovernedTransport(PooledTransport(), default=governor)
+        permit = governor.acquire()
+        try:
+            sbh_query = sbha.SynBioHubQuery(self.server.sparql_url, transport=transport, timeout=0.3)
+            start = time.monotonic()
+            with self.assertRaises(QueryTimeoutError):
+                sbh_query.query_collections()
+            self.assertLess(time.monotonic() - start, 1)
+
+            # A cancelled query sends no request once the permit is released
+            cancel_token = CancellationToken()
+            threading.Timer(0.2, cancel_token.cancel).start()
+            with self.assertRaises(QueryCancelledError):
+                sbh_query.query_collections(timeout=None, cancel_token=cancel_token)
+        finally:
+            permit.release()
+
+        time.sleep(0.1)
+        self.assertEqual(len(self.server.queries), 0)
+        self.assertEqual(governor.stats()['in_flight'], 0)
+
+    def test_call_governed(self):
+        governor = Governor(max_in_flight=1)
+        transport = GovernedTransport(PooledTransport(), {self.server.url: governor})
+
+        run_threads(lambda: transport.call(self.server.url + '/submit', self.tracker.hold), 3)
+
+        self.assertEqual(self.tracker.max, 1)
+        self.assertEqual(governor.stats()['requests'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+import unittest
+
+import rdflib
+
+from synbiohub_adapter.SynBioHubUtil import SBOLConstants, SD2Constants, SBOLQuery
+from synbiohub_adapter.query_synbiohub import SynBioHubQuery
+from synbiohub_adapter.pagination import projected_variables, page_query, keyset_page_query, ScanCursor, PagedResult
+
+from tests.LocalSPARQLServer import LocalSPARQLServer, graph_responder
+
+COMPONENT_DEFINITION = SBOLConstants.SBOL_NS + 'ComponentDefinition'
+DESIGN = 'https://hub.sd2e.org/user/sd2e/design/'
+
+# Every title of a member twice, as the branches of the union match the same rows
+TITLES_QUERY = '''PREFIX sbol: <http://sbols.org/v2#>
+PREFIX dcterms: <http://purl.org/dc/terms/>
+SELECT ?entity ?title WHERE {{
+  <{}> sbol:member ?entity .
+  {{ ?entity dcterms:title ?title }} UNION {{ ?entity dcterms:title ?title }}
+}}'''.format(SD2Constants.SD2_DESIGN_COLLECTION)
+
+
+def collection_graph(size):
+    graph = rdflib.Graph()
+    collection = rdflib.URIRef(SD2Constants.SD2_DESIGN_COLLECTION)
+
+    for i in range(size):
+        member = rdflib.URIRef(DESIGN + 'component_{}/1'.format(i))
+        graph.add((collection, rdflib.URIRef(SBOLConstants.SBOL_NS + 'member'), member))
+        graph.add((member, rdflib.RDF.type, rdflib.URIRef(COMPONENT_DEFINITION)))
+
+    return graph
+
+
+class TestPagination(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.server = LocalSPARQLServer(graph_responder(collection_graph(25))).start()
+
+    @classmethod
+    def tearDownClass(self):
+        self.server.stop()
+
+    def setUp(self):
+        self.server.queries.clear()
+
+    def members(self, bindings):
+        return sorted(binding['entity']['value'] for binding in bindings)
+
+    def test_projected_variables(self):
+        self.assertEqual(projected_variables('PREFIX a: <http://a.org/>\nSELECT DISTINCT ?x ?y WHERE { ?x a:p ?y }'),
+                         ['x', 'y'])
+        self.assertEqual(projected_variables("SELECT ?g (concat('[', group_concat(?l), ']') AS ?levels) WHERE "
+                                             "{ ?g ?p ?l } GROUP BY ?g"), ['g', 'levels'])
+        self.assertIsNone(projected_variables('SELECT * WHERE { ?s ?p ?o }'))
+        self.assertIsNone(projected_variables('SELECT ?s WHERE { ?s ?p ?o }\nLIMIT 10'))
+        self.assertIsNone(projected_variables('ASK { ?s ?p ?o }'))
+
+        query = page_query('PREFIX a: <http://a.org/>\nSELECT ?x WHERE { ?x a:p ?y }', ['x'], 11, 20)
+        self.assertTrue(query.startswith('PREFIX a: <http://a.org/>\nSELECT * WHERE {'))
+        self.assertTrue(query.endswith('ORDER BY ?x\nLIMIT 11\nOFFSET 20'))
+
+    def test_iter_pages(self):
+        sbol_query = SBOLQuery(self.server.sparql_url)
+        try:
+            expected = self.members(sbol_query.query_collection_members(
+                [SD2Constants.SD2_DESIGN_COLLECTION], rdf_type=COMPONENT_DEFINITION)['results']['bindings'])
+            self.assertEqual(len(expected), 25)
+
+            for prefetch in [True, False]:
+                self.server.queries.clear()
+                bindings = sbol_query.iter_collection_members([SD2Constants.SD2_DESIGN_COLLECTION],
+                                                              rdf_type=COMPONENT_DEFINITION, page_size=5,
+                                                              prefetch=prefetch)
+                self.assertEqual(len(self.server.queries), 0)
+
+                # 25 rows make 5 full pages, the last of which shows that there is no next page
+                self.assertEqual(self.members(bindings), expected)
+                self.assertEqual(len(self.server.queries), 5)
+                self.assertTrue(all('LIMIT 6' in query for query in self.server.queries))
+        finally:
+            sbol_query.close()
+
+    def test_page_size(self):
+        sbol_query = SBOLQuery(self.server.sparql_url, page_size=10)
+        try:
+            query_result = sbol_query.query_collection_members([SD2Constants.SD2_DESIGN_COLLECTION],
+                                                               rdf_type=COMPONENT_DEFINITION)
+
+            self.assertEqual(query_result['head']['vars'], ['entity'])
+            self.assertEqual(len(query_result['results']['bindings']), 25)
+            self.assertEqual(len(set(self.members(query_result['results']['bindings']))), 25)
+            self.assertEqual(len(self.server.queries), 3)
+        finally:
+            sbol_query.close()
+
+    def test_iter_stops_early(self):
+        sbh_query = SynBioHubQuery(self.server.sparql_url, prefetch_pages=False)
+        try:
+            bindings = sbh_query.iter_collection_members([SD2Constants.SD2_DESIGN_COLLECTION],
+                                                         rdf_type=COMPONENT_DEFINITION, page_size=4)
+            first = [next(bindings) for i in range(6)]
+            bindings.close()
+
+            self.assertEqual(len(set(self.members(first))), 6)
+            self.assertEqual(len(self.server.queries), 2)
+        finally:
+            sbh_query.close()
+
+    def test_keyset_resume(self):
+        sbol_query = SBOLQuery(self.server.sparql_url)
+        try:
+            cursor = ScanCursor(key='entity')
+            bindings = sbol_query.iter_collection_members([SD2Constants.SD2_DESIGN_COLLECTION],
+                                                          rdf_type=COMPONENT_DEFINITION, page_size=4, prefetch=False,
+                                                          cursor=cursor)
+            first = [next(bindings) for i in range(10)]
+            bindings.close()
+
+            # The scan resumes after the last row read, from a cursor saved as JSON
+            saved = cursor.to_json()
+            self.server.queries.clear()
+            cursor = ScanCursor.from_json(saved)
+            rest = list(sbol_query.iter_collection_members([SD2Constants.SD2_DESIGN_COLLECTION],
+                                                           rdf_type=COMPONENT_DEFINITION, page_size=4, cursor=cursor))
+
+            self.assertEqual(self.members(first + rest), sorted(set(self.members(first + rest))))
+            self.assertEqual(len(first + rest), 25)
+            self.assertEqual(self.members(first), self.members(first + rest)[:10])
+            self.assertTrue(cursor.done)
+            self.assertEqual(len(self.server.queries), 4)
+            self.assertTrue(all('str(?entity) >= ' in query and query.endswith('LIMIT 5\nOFFSET 1')
+                                for query in self.server.queries))
+
+            # A finished scan yields nothing more, and a cursor cannot follow the result of another query
+            self.assertEqual(list(sbol_query.iter_collection_members([SD2Constants.SD2_DESIGN_COLLECTION],
+                                                                     rdf_type=COMPONENT_DEFINITION, cursor=cursor)),
+                             [])
+            with self.assertRaises(ValueError):
+                list(sbol_query.iter_collections([SD2Constants.SD2_DESIGN_COLLECTION], cursor=cursor))
+        finally:
+            sbol_query.close()
+
+    def test_keyset_ties(self):
+        graph = collection_graph(5)
+        for i in range(5):
+            for j in range(i % 3 + 1):
+                graph.add((rdflib.URIRef(DESIGN + 'component_{}/1'.format(i)),
+                           rdflib.URIRef('http://purl.org/dc/terms/title'), rdflib.Literal('title {}'.format(j))))
+        server = LocalSPARQLServer(graph_responder(graph)).start()
+
+        sbol_query = SBOLQuery(server.sparql_url)
+        try:
+            expected = sorted(sorted((name, term['value']) for name, term in binding.items())
+                              for binding in sbol_query.fetch_SPARQL(server.sparql_url, TITLES_QUERY)['results']
+                              ['bindings'])
+            self.assertEqual(len(expected), 18)
+
+            # Rows sharing a title, and duplicate rows, span pages
+            for key in ['entity', 'title']:
+                for prefetch in [True, False]:
+                    cursor = ScanCursor(key=key)
+                    bindings = PagedResult(sbol_query.fetch_SPARQL, server.sparql_url, TITLES_QUERY, 'json',
+                                           ['entity', 'title'], page_size=3, prefetch=prefetch, cursor=cursor)
+                    self.assertEqual(sorted(sorted((name, term['value']) for name, term in binding.items())
+                                            for binding in bindings), expected)
+                    self.assertTrue(cursor.done)
+        finally:
+            sbol_query.close()
+            server.stop()
+
+        with self.assertRaises(ValueError):
+            keyset_page_query(TITLES_QUERY + '\nORDER BY ?title', ['entity', 'title'], 3)
+
+    def test_offset_resume(self):
+        sbol_query = SBOLQuery(self.server.sparql_url)
+        try:
+            cursor = ScanCursor(keyset=False)
+            bindings = sbol_query.iter_collection_members([SD2Constants.SD2_DESIGN_COLLECTION],
+                                                          rdf_type=COMPONENT_DEFINITION, page_size=10, cursor=cursor)
+            first = [next(bindings) for i in range(12)]
+            bindings.close()
+
+            cursor = ScanCursor.from_json(cursor.to_json())
+            self.assertEqual(cursor.offset, 12)
+            rest = list(sbol_query.iter_collection_members([SD2Constants.SD2_DESIGN_COLLECTION],
+                                                           rdf_type=COMPONENT_DEFINITION, page_size=10, cursor=cursor))
+
+            self.assertEqual(len(set(self.members(first + rest))), 25)
+        finally:
+            sbol_query.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
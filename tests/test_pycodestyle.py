@@ -6,7 +6,7 @@ import pycodestyle
 
 # Please do not increase this number. Style warnings should DECREASE,
 # not increase.
-ALLOWED_ERRORS = 187
+ALLOWED_ERRORS = 184
 
 # Allow longer lines. The default is 79, which allows the 80th
 # character to be a line continuation symbol. Here, we increase the
@@ -49,18 +49,63 @@ class TestStyle(unittest.TestCase):
         # List all clean directories and files
         # Keep these sorted
         dirs_and_files = [
+            'benchmarks/__init__.py',
+            'benchmarks/bench_cache_storage.py',
+            'benchmarks/bench_query_builders.py',
+            'benchmarks/bench_query_optimizer.py',
+            'benchmarks/bench_result_formats.py',
             'setup.py',
             'synbiohub_adapter/__init__.py',
+            'synbiohub_adapter/async_query.py',
+            'synbiohub_adapter/batch.py',
+            'synbiohub_adapter/builder_cache.py',
             'synbiohub_adapter/cache_query.py',
+            'synbiohub_adapter/cache_store.py',
+            'synbiohub_adapter/cache_warmup.py',
+            'synbiohub_adapter/cancellation.py',
+            'synbiohub_adapter/endpoints.py',
+            'synbiohub_adapter/existence_cache.py',
+            'synbiohub_adapter/fan_in.py',
+            'synbiohub_adapter/governor.py',
+            'synbiohub_adapter/pagination.py',
+            'synbiohub_adapter/query_cache.py',
+            'synbiohub_adapter/query_optimizer.py',
+            'synbiohub_adapter/resilience.py',
+            'synbiohub_adapter/session.py',
+            'synbiohub_adapter/single_flight.py',
+            'synbiohub_adapter/sparql_ast.py',
+            'synbiohub_adapter/sparql_results.py',
+            'synbiohub_adapter/transport.py',
             'synbiohub_adapter/upload_sbol/__init__.py',
             'tests/DataGenerator.py',
+            'tests/FakeClock.py',
+            'tests/LocalSPARQLServer.py',
             'tests/SBHRun_Environment.py',
             'tests/__init__.py',
+            'tests/test_async_query.py',
             'tests/test_authentication.py',
+            'tests/test_batch.py',
+            'tests/test_builder_cache.py',
+            'tests/test_cache_store.py',
+            'tests/test_cache_warmup.py',
+            'tests/test_cancellation.py',
+            'tests/test_endpoints.py',
+            'tests/test_existence_cache.py',
             'tests/test_fallback_cache.py',
+            'tests/test_fan_in.py',
+            'tests/test_governor.py',
+            'tests/test_pagination.py',
             'tests/test_pycodestyle.py',
+            'tests/test_query_cache.py',
+            'tests/test_query_optimizer.py',
+            'tests/test_resilience.py',
             'tests/test_sbh_submissions.py',
-            'tests/test_sbolquery.py'
+            'tests/test_sbolquery.py',
+            'tests/test_session.py',
+            'tests/test_single_flight.py',
+            'tests/test_sparql_ast.py',
+            'tests/test_sparql_results.py',
+            'tests/test_transport.py'
         ]
         sg = pycodestyle.StyleGuide(quiet=QUIET,
                                     max_line_length=MAX_LINE_LENGTH,
@@ -81,7 +126,7 @@ class TestStyle(unittest.TestCase):
         self.assertEqual(report.total_errors, count, msg=message)
 
     def test_allowed_errors(self):
-        self.assert_warning_count('E501', 174, "line too long")
+        self.assert_warning_count('E501', 171, "line too long")
         self.assert_warning_count('E722', 13, "do not use bare 'except'")
 
     def test_disallowed_errors(self):
@@ -0,0 +1,450 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import synbiohub_adapter as sbha
+from synbiohub_adapter.query_cache import QueryCache, cache_key, canonical_query, query_tags, result_tags
+
+from tests.FakeClock import FakeClock
+from tests.LocalSPARQLServer import LocalSPARQLServer, bindings_result
+
+RESULT = bindings_result(['collection'], [['https://hub.sd2e.org/user/sd2e/experiment/rule_30/1']])
+
+RULE_30 = 'https://hub.sd2e.org/user/sd2e/experiment/rule_30/1'
+COLLECTION = 'https://hub.sd2e.org/user/sd2e/design/collection/1'
+EXPERIMENT = 'https://hub.sd2e.org/user/sd2e/experiment/experiment_collection/1'
+
+
+class TestQueryCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.server = LocalSPARQLServer(lambda query, headers: RESULT).start()
+
+    @classmethod
+    def tearDownClass(self):
+        self.server.stop()
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.clock = FakeClock(1000.0)
+        self.sent = len(self.server.queries)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def new_cache(self, **kwargs):
+        return QueryCache(clock=self.clock, **kwargs)
+
+    def new_query(self, cache, **kwargs):
+        return sbha.SynBioHubQuery(self.server.sparql_url, cache=cache, **kwargs)
+
+    def assertSent(self, count):
+        self.assertEqual(len(self.server.queries) - self.sent, count)
+
+    def test_repeated_query_served_from_memory(self):
+        cache = self.new_cache()
+        sbh_query = self.new_query(cache)
+
+        first = sbh_query.query_design_strains()
+        self.assertEqual(sbh_query.query_design_strains(), first)
+
+        self.assertSent(1)
+        stats = sbh_query.cache_stats()
+        self.assertEqual((stats['misses'], stats['memory_hits'], stats['stores']), (1, 1, 1))
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+    def test_cache_shared_between_clients(self):
+        cache = self.new_cache()
+
+        self.new_query(cache).query_collections()
+        self.new_query(cache).query_collections()
+
+        self.assertSent(1)
+
+    def test_keyed_by_user_and_format(self):
+        cache = self.new_cache()
+
+        self.new_query(cache).query_collections()
+        self.new_query(cache, user='sd2e', authentication_key='token').query_collections()
+        self.new_query(cache, user='other', authentication_key='token').query_collections()
+        self.new_query(cache, result_format='tsv').query_collections()
+        self.new_query(cache, user='sd2e', authentication_key='token').query_collections()
+
+        self.assertSent(4)
+
+    def test_whitespace_normalized(self):
+        cache = self.new_cache()
+        sbh_query = self.new_query(cache)
+
+        sbh_query.fetch_SPARQL(self.server.sparql_url, 'SELECT ?s WHERE {\n    ?s ?p ?o .\n}')
+        sbh_query.fetch_SPARQL(self.server.sparql_url, 'SELECT ?s WHERE { ?s ?p ?o . }')
+
+        self.assertSent(1)
+
+    def test_family_ttls(self):
+        cache = self.new_cache()
+        sbh_query = self.new_query(cache)
+
+        sbh_query.query_design_strains()
+        sbh_query.query_experiment_sets()
+
+        # Experiment results expire after 5 minutes, design results after a day
+        self.clock.now += 301
+        sbh_query.query_design_strains()
+        sbh_query.query_experiment_sets()
+        self.assertSent(3)
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+        self.clock.now += 24 * 3600
+        sbh_query.query_design_strains()
+        self.assertSent(4)
+
+    def test_family_of_outermost_method(self):
+        # query_design_set_dna sends its query through query_design_dna, whose results are not cached
+        cache = self.new_cache(ttls={'query_design_set_*': 60, '*': 0})
+        sbh_query = self.new_query(cache)
+
+        sbh_query.query_design_set_dna('https://hub.sd2e.org/user/sd2e/design/rule_30/1')
+        sbh_query.query_design_set_dna('https://hub.sd2e.org/user/sd2e/design/rule_30/1')
+        sbh_query.query_design_dna()
+        sbh_query.query_design_dna()
+
+        self.assertSent(3)
+        self.assertEqual(cache.ttl('query_design_dna'), 0)
+        self.assertEqual(cache.ttl(None), 0)
+
+    def test_lru_eviction(self):
+        cache = self.new_cache(max_entries=2)
+        sbh_query = self.new_query(cache)
+
+        sbh_query.query_collections()
+        sbh_query.query_experiment_sets()
+        sbh_query.query_collections()
+        sbh_query.query_design_sets()
+
+        # query_experiment_sets was the least recently used
+        sbh_query.query_collections()
+        self.assertSent(3)
+        sbh_query.query_experiment_sets()
+        self.assertSent(4)
+
+        stats = cache.stats()
+        self.assertEqual(stats['evictions'], 2)
+        self.assertEqual(stats['entries'], 2)
+
+    def test_disk_tier(self):
+        path = os.path.join(self.cache_dir, 'queries')
+        cache = self.new_cache(path=path)
+        self.new_query(cache).query_design_strains()
+        cache.close()
+
+        # A new cache on the same file stands for a later process
+        cache = self.new_cache(path=path)
+        sbh_query = self.new_query(cache)
+        sbh_query.query_design_strains()
+        sbh_query.query_design_strains()
+        self.assertSent(1)
+
+        stats = cache.stats()
+        self.assertEqual((stats['disk_hits'], stats['memory_hits'], stats['misses']), (1, 1, 0))
+
+        cache.clear()
+        sbh_query.query_design_strains()
+        self.assertSent(2)
+        cache.close()
+
+    def test_disk_read_outside_lock(self):
+        path = os.path.join(self.cache_dir, 'queries')
+        cache = self.new_cache(path=path)
+        cache.put('on-disk', RESULT, 300)
+        cache.close()
+
+        cache = self.new_cache(path=path)
+        cache.put('in-memory', RESULT, 300)
+        disk = cache._disk
+        reading = threading.Event()
+        release = threading.Event()
+
+        def blocking_get(key):
+            reading.set()
+            release.wait(10)
+            return type(disk).get(disk, key)
+
+        disk.get = blocking_get
+        try:
+            reader = threading.Thread(target=cache.get, args=('on-disk',))
+            reader.start()
+            self.assertTrue(reading.wait(10))
+
+            # A memory hit does not wait for the disk read of another thread
+            hits = []
+            hitter = threading.Thread(target=lambda: hits.append(cache.get('in-memory')))
+            hitter.start()
+            hitter.join(5)
+            self.assertEqual(hits, [(True, RESULT)])
+        finally:
+            release.set()
+            reader.join()
+            hitter.join()
+            del disk.get
+
+        self.assertEqual(cache.get('on-disk'), (True, RESULT))
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+        cache.close()
+
+    def test_streaming_not_cached(self):
+        with self.assertRaises(ValueError):
+            self.new_query(self.new_cache(), stream_results=True)
+
+
+class TestStaleWhileRevalidate(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.server = LocalSPARQLServer(lambda query, headers: RESULT).start()
+
+    @classmethod
+    def tearDownClass(self):
+        self.server.stop()
+
+    def setUp(self):
+        self.clock = FakeClock(1000.0)
+        self.sent = len(self.server.queries)
+
+    def new_cache(self, **kwargs):
+        return QueryCache(ttls={'*': (60, 3600)}, clock=self.clock, **kwargs)
+
+    def assertSent(self, count):
+        self.assertEqual(len(self.server.queries) - self.sent, count)
+
+    def test_stale_result_refreshed_in_background(self):
+        cache = self.new_cache()
+        sbh_query = sbha.SynBioHubQuery(self.server.sparql_url, cache=cache)
+        self.assertEqual((cache.ttl('query_experiment_sets'), cache.max_age('query_experiment_sets')), (60, 3600))
+
+        first = sbh_query.query_experiment_sets()
+        self.clock.now += 61
+        self.assertEqual(sbh_query.query_experiment_sets(), first)
+        self.assertTrue(cache.wait_refreshes(timeout=10))
+        self.assertSent(2)
+
+        # The refreshed result is fresh again
+        sbh_query.query_experiment_sets()
+        self.assertSent(2)
+        stats = cache.stats()
+        self.assertEqual((stats['stale_hits'], stats['refreshes'], stats['stores']), (1, 1, 2))
+
+        # Past the hard TTL, callers wait for the query
+        self.clock.now += 3601
+        sbh_query.query_experiment_sets()
+        self.assertSent(3)
+        self.assertEqual(cache.stats()['misses'], 2)
+        cache.close()
+
+    def test_refreshes_deduplicated_and_bounded(self):
+        cache = self.new_cache(max_refreshes=1)
+        release = threading.Event()
+        calls = []
+
+        def slow_fetch():
+            calls.append(1)
+            release.wait(10)
+            return 'new'
+
+        cache.put('a', 'old', 60, max_age=3600)
+        cache.put('b', 'old', 60, max_age=3600)
+        self.clock.now += 61
+
+        for i in range(5):
+            self.assertEqual(cache.fetch('a', None, slow_fetch), 'old')
+        self.assertEqual(cache.fetch('b', None, slow_fetch), 'old')
+        release.set()
+        self.assertTrue(cache.wait_refreshes(timeout=10))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.get('a'), (True, 'new'))
+        self.assertEqual(cache.get('b'), (True, 'old'))
+        self.assertEqual(cache.stats()['refreshes_skipped'], 5)
+        cache.close()
+
+    def test_failed_refresh_keeps_stale_result(self):
+        cache = self.new_cache()
+
+        def failing_fetch():
+            raise RuntimeError('SynBioHub is down')
+
+        cache.put('a', 'old', 60, max_age=3600)
+        self.clock.now += 61
+        self.assertEqual(cache.fetch('a', None, failing_fetch), 'old')
+        self.assertTrue(cache.wait_refreshes(timeout=10))
+
+        self.assertEqual(cache.get('a'), (True, 'old'))
+        self.assertEqual(cache.stats()['refresh_errors'], 1)
+        cache.close()
+
+    def test_stale_time_kept_on_disk(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(cache_dir, 'queries')
+            cache = self.new_cache(path=path)
+            cache.put('a', 'old', 60, max_age=3600)
+            cache.close()
+
+            cache = self.new_cache(path=path)
+            self.clock.now += 61
+            self.assertEqual(cache.fetch('a', None, lambda: 'new'), 'old')
+            self.assertTrue(cache.wait_refreshes(timeout=10))
+            self.assertEqual(cache.get('a'), (True, 'new'))
+            cache.close()
+        finally:
+            shutil.rmtree(cache_dir)
+
+
+class TestInvalidation(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.server = LocalSPARQLServer(lambda query, headers: RESULT).start()
+
+    @classmethod
+    def tearDownClass(self):
+        self.server.stop()
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.cache_dir, 'queries')
+        self.sent = len(self.server.queries)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def new_query(self, cache):
+        return sbha.SynBioHubQuery(self.server.sparql_url, cache=cache)
+
+    def assertSent(self, count):
+        self.assertEqual(len(self.server.queries) - self.sent, count)
+
+    def test_tags(self):
+        sbh_query = sbha.SynBioHubQuery(self.server.sparql_url)
+        query = sbh_query.construct_collection_entity_query([COLLECTION], members=[RULE_30])
+
+        self.assertEqual(query_tags(query), {COLLECTION, RULE_30})
+        self.assertEqual(query_tags('SELECT * WHERE { ?s ?p ?o FILTER (?o <= 3) }'), set())
+        self.assertEqual(result_tags(RESULT), {RULE_30})
+        self.assertEqual(result_tags('collection\n<{}>\n'.format(RULE_30)), set())
+
+    def test_only_affected_entries_invalidated(self):
+        cache = QueryCache()
+        sbh_query = self.new_query(cache)
+
+        sbh_query.query_collection_members([COLLECTION])
+        sbh_query.query_collection_members([EXPERIMENT])
+        sbh_query.query_design_strains()
+        self.assertSent(3)
+
+        # The scheme of a URI does not matter
+        self.assertEqual(cache.invalidate([COLLECTION.replace('https', 'http')]), 1)
+        sbh_query.query_collection_members([COLLECTION])
+        sbh_query.query_collection_members([EXPERIMENT])
+        sbh_query.query_design_strains()
+        self.assertSent(4)
+
+        # Every result binding rule_30 depends on it
+        self.assertEqual(cache.invalidate([RULE_30]), 3)
+        self.assertEqual(cache.stats()['invalidations'], 4)
+        self.assertEqual(cache.invalidate([]), 0)
+
+    def test_result_fetched_during_invalidation_not_stored(self):
+        cache = QueryCache()
+
+        def fetch():
+            cache.invalidate([COLLECTION])
+            return RESULT
+
+        self.assertEqual(cache.fetch('key', None, fetch), RESULT)
+        self.assertEqual(cache.get('key'), (False, None))
+        cache.fetch('key', None, lambda: RESULT)
+        self.assertEqual(cache.get('key'), (True, RESULT))
+
+    def test_invalidation_shared_through_disk(self):
+        # A second cache on the same database stands for another process, with its own memory tier
+        cache = QueryCache(path=self.path, poll_interval=0)
+        other = QueryCache(path=self.path, poll_interval=0)
+
+        self.new_query(cache).query_collection_members([COLLECTION])
+        self.new_query(other).query_collection_members([COLLECTION])
+        self.new_query(other).query_collection_members([EXPERIMENT])
+        self.assertEqual(other.stats()['disk_hits'], 1)
+
+        cache.invalidate([COLLECTION])
+        self.new_query(other).query_collection_members([COLLECTION])
+        self.new_query(other).query_collection_members([EXPERIMENT])
+        self.assertSent(3)
+        self.assertEqual(other.stats()['invalidations'], 1)
+
+        # A cache ignores its own invalidations when it polls
+        cache.put('key', RESULT, 60, [COLLECTION])
+        self.assertEqual(cache.get('key'), (True, RESULT))
+        cache.close()
+        other.close()
+
+
+class TestCacheKeys(unittest.TestCase):
+
+    QUERY = """
+        PREFIX sbol: <http://sbols.org/v2#>
+        PREFIX dcterms: <http://purl.org/dc/terms/>
+        SELECT ?entity ?name WHERE {
+            ?entity sbol:role <http://identifiers.org/so/SO:0000112> ;
+                dcterms:title ?name .
+            FILTER ( ?name != "two  spaces" )
+        }
+        """
+
+    def key(self, query, server='https://hub.sd2e.org/sparql', user=None, result_format='json'):
+        return cache_key(server, user, result_format, query)
+
+    def test_fixed_size_digest(self):
+        key = self.key(self.QUERY * 100)
+
+        self.assertEqual(len(key), 64)
+        int(key, 16)
+
+    def test_insignificant_differences(self):
+        query = ('prefix dcterms: <http://purl.org/dc/terms/> PREFIX sbol: <http://sbols.org/v2#> '
+                 'PREFIX sbol: <http://sbols.org/v2#> SELECT ?entity ?name WHERE{# comment\n'
+                 '?entity sbol:role <http://identifiers.org/so/SO:0000112>;dcterms:title ?name.'
+                 'FILTER(?name != "two  spaces")}')
+
+        self.assertEqual(canonical_query(query), canonical_query(self.QUERY))
+        self.assertEqual(self.key(query, server='HTTPS://hub.sd2e.org/sparql/'), self.key(self.QUERY))
+        self.assertEqual(self.key(query, result_format=None), self.key(self.QUERY))
+
+    def test_significant_differences(self):
+        key = self.key(self.QUERY)
+
+        self.assertNotEqual(self.key(self.QUERY.replace('two  spaces', 'two spaces')), key)
+        self.assertNotEqual(self.key(self.QUERY.replace('?name .', '?title .')), key)
+        self.assertNotEqual(self.key(self.QUERY, server='https://hub-staging.sd2e.org/sparql'), key)
+        self.assertNotEqual(self.key(self.QUERY, user='sd2e'), key)
+        self.assertNotEqual(self.key(self.QUERY, result_format='tsv'), key)
+
+    def test_literals_kept(self):
+        query = 'SELECT * WHERE { ?s ?p """a # b\n  c""" . ?s ?q \'it\\\'s  <x>\' }'
+
+        self.assertEqual(canonical_query(query), query)
+
+    def test_fallback_cache_keyed_by_user(self):
+        anonymous = sbha.SynBioHubQuery('https://hub.sd2e.org/sparql')
+        user = sbha.SynBioHubQuery('https://hub.sd2e.org/sparql', user='sd2e', authentication_key='token')
+        not_logged_in = sbha.SynBioHubQuery('https://hub.sd2e.org/sparql', user='sd2e')
+
+        self.assertNotEqual(user.cache_key(None, self.QUERY), anonymous.cache_key(None, self.QUERY))
+        self.assertEqual(not_logged_in.cache_key(None, self.QUERY), anonymous.cache_key(None, self.QUERY))
+
+
+if __name__ == '__main__':
+    unittest.main()
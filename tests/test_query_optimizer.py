@@ -0,0 +1,168 @@
+import unittest
+
+import rdflib
+
+from synbiohub_adapter.SynBioHubUtil import SBOLConstants, SD2Constants, SBOLQuery
+from synbiohub_adapter.query_optimizer import optimize, rewrite_group, factor_union, triple_cost, variables
+from synbiohub_adapter.sparql_ast import (serialize, Select, Group, Triple, Values, Optional, Union, Filter, Expr, Var,
+                                          IRI, Seq, Repeat)
+
+CDS = 'http://identifiers.org/so/SO:0000316'
+DESIGN = 'https://hub.sd2e.org/user/sd2e/design/'
+EXPERIMENT = 'https://hub.sd2e.org/user/sd2e/experiment/'
+
+
+# Returns the triples of group following a property path whose ends are not bound by the other patterns of their
+# group, as the branches of a union are evaluated on their own.
+def unbound_paths(group):
+    paths = []
+
+    for pattern in group:
+        if isinstance(pattern, Triple) and isinstance(pattern.predicate, (Seq, Repeat)):
+            others = variables(Group(*[other for other in group if other is not pattern]))
+            if not variables(pattern.subject) | variables(pattern.object) <= others:
+                paths.append(pattern)
+        elif isinstance(pattern, Union):
+            for branch in pattern.groups:
+                paths.extend(unbound_paths(branch))
+
+    return paths
+
+
+class QueryBuilder(SBOLQuery):
+    ''' A client whose queries return the SPARQL text they would send.
+    '''
+
+    def fetch_SPARQL(self, server, query, result_format=None):
+        return query
+
+
+class OptimizedQueryBuilder(QueryBuilder):
+
+    OPTIMIZE_QUERIES = True
+
+
+class TestQueryOptimizer(unittest.TestCase):
+
+    def test_triple_cost(self):
+        self.assertLess(triple_cost(Triple(Var('s'), 'sbol:role', IRI(CDS)), set()),
+                        triple_cost(Triple(Var('s'), 'sbol:type', Var('t')), set()))
+        self.assertLess(triple_cost(Triple(Var('s'), 'dcterms:title', Var('name')), {'s'}),
+                        triple_cost(Triple(Var('t'), 'dcterms:title', Var('name')), {'s'}))
+
+        # The object of rdf:type is a class, which too many subjects share to count as bound
+        self.assertEqual(triple_cost(Triple(Var('s'), 'rdf:type', IRI(CDS)), set()),
+                         triple_cost(Triple(Var('s'), 'rdf:type', Var('t')), set()))
+
+    def test_selective_first(self):
+        member = Triple(Var('collection'), 'sbol:member', Var('entity'))
+        title = Triple(Var('entity'), 'dcterms:title', Var('name'))
+        role = Triple(Var('entity'), 'sbol:role', Var('role'))
+        collections = Values(Var('collection'), [IRI(SD2Constants.SD2_DESIGN_COLLECTION)])
+        roles = Values(Var('role'), [IRI(CDS)])
+        has_name = Filter(Expr('bound(?name)'))
+
+        group = rewrite_group(Group(has_name, title, member, collections, role, roles))
+        self.assertEqual(list(group), [roles, role, collections, member, title, has_name])
+
+    def test_optional_boundary(self):
+        title = Triple(Var('entity'), 'dcterms:title', Var('name'))
+        role = Triple(Var('entity'), 'sbol:role', IRI(CDS))
+        status = Optional(Triple(Var('entity'), 'sd2:status', Var('status')))
+        label = Triple(Var('entity'), 'rdfs:label', Var('status'))
+
+        group = rewrite_group(Group(title, role, status, label))
+        self.assertEqual(list(group), [role, title, status, label])
+
+    def test_factor_union(self):
+        collections = Values(Var('collection'), [IRI(SD2Constants.SD2_DESIGN_COLLECTION)])
+        member = Triple(Var('collection'), 'sbol:member', Var('entity'))
+        first = Triple(Var('entity'), 'sbol:role', IRI(CDS))
+        second = Triple(Var('entity'), 'sbol:type', Var('type'))
+
+        common, union = factor_union(Union(Group(collections, member, first), Group(collections, member, second)))
+        self.assertEqual(common, [collections, member])
+        self.assertEqual(union, Union(Group(first), Group(second)))
+
+        # An OPTIONAL of a branch is only joined to the patterns before it, so ?entity must stay bound there
+        status = Optional(Triple(Var('entity'), 'sd2:status', Var('status')))
+        union = Union(Group(member, status), Group(member, second))
+        self.assertEqual(factor_union(union), ([], union))
+
+        # As is a branch whose FILTER uses ?collection, which the rest of the branch does not bind
+        in_design = Filter(Expr('?collection = {}', IRI(SD2Constants.SD2_DESIGN_COLLECTION)))
+        union = Union(Group(member, first, in_design), Group(member, second))
+        self.assertEqual(factor_union(union), ([], union))
+
+        # And a branch starting from ?sample along a repeated path, which would be followed from every node
+        data = Triple(Var('data'), 'prov:wasDerivedFrom', Var('sample'))
+        built = Triple(Var('sample'), Seq(Repeat('prov:wasDerivedFrom', '*'), 'sbol:built'), Var('entity'))
+        union = Union(Group(data, built, first), Group(data, second))
+        self.assertEqual(factor_union(union), ([], union))
+
+    def test_repeated_path_last(self):
+        data = Triple(IRI(EXPERIMENT + 'experiment/1'), 'sd2:experimentalData', Var('data'))
+        sample = Triple(Var('data'), 'prov:wasDerivedFrom', Var('sample'))
+        built = Triple(Var('sample'), Seq(Repeat('prov:wasDerivedFrom', '*'), 'sbol:built'), Var('entity'))
+        role = Triple(Var('entity'), 'sbol:role', Var('role'))
+
+        group = rewrite_group(Group(built, role, sample, data))
+        self.assertEqual(unbound_paths(group), [])
+        self.assertEqual(list(group)[:3], [data, sample, built])
+
+    def test_experiment_paths_bound(self):
+        media = [SBOLConstants.OBI_MEDIA, SBOLConstants.NCIT_MEDIA]
+        collections = [SD2Constants.SD2_EXPERIMENT_COLLECTION]
+        experiments = [EXPERIMENT + 'experiment_{}/1'.format(i) for i in range(2)]
+
+        builder = OptimizedQueryBuilder('http://localhost/sparql')
+        try:
+            for members in [experiments[:1], experiments]:
+                select = builder.construct_collection_entity_select(
+                    collections, 'exp', roles=media, entity_label='media', members=members, member_cardinality='*',
+                    rdf_type=SBOLConstants.SBOL_NS + 'ModuleDefinition', entity_depth=2)
+                self.assertEqual(unbound_paths(select.where), [])
+                self.assertEqual(unbound_paths(optimize(select).where), [])
+        finally:
+            builder.close()
+
+    def test_same_results(self):
+        graph = rdflib.Graph()
+        sbol = rdflib.Namespace(SBOLConstants.SBOL_NS)
+        collection = rdflib.URIRef(SD2Constants.SD2_DESIGN_COLLECTION)
+        for i in range(6):
+            component = rdflib.URIRef(DESIGN + 'component_{}/1'.format(i))
+            sub_component = rdflib.URIRef(DESIGN + 'component_{}/1/sub/1'.format(i))
+            graph.add((collection, sbol.member, component))
+            graph.add((component, rdflib.RDF.type, sbol.ComponentDefinition))
+            graph.add((component, sbol.role, rdflib.URIRef(CDS if i % 2 == 0 else CDS + '0')))
+            graph.add((component, sbol.component, sub_component))
+            graph.add((sub_component, sbol.definition, rdflib.URIRef(DESIGN + 'component_{}/1'.format(i // 2))))
+            if i % 3 > 0:
+                graph.add((component, rdflib.URIRef('http://purl.org/dc/terms/title'), rdflib.Literal(str(i))))
+
+        collections = [SD2Constants.SD2_DESIGN_COLLECTION]
+        calls = [('query_design_components', {'roles': [CDS], 'collections': collections,
+                                              'other_comp_labels': ['name']}),
+                 ('query_design_components', {'sub_roles': [CDS], 'collections': collections})]
+        builders = [QueryBuilder('http://localhost/sparql'), OptimizedQueryBuilder('http://localhost/sparql')]
+        try:
+            for method, kwargs in calls:
+                before, after = [getattr(builder, method)(**kwargs) for builder in builders]
+                self.assertEqual(set(graph.query(after)), set(graph.query(before)))
+                self.assertGreater(len(graph.query(after)), 0)
+        finally:
+            for builder in builders:
+                builder.close()
+
+    def test_optimize_select(self):
+        select = Select(['entity'], Group(Triple(Var('entity'), 'dcterms:title', Var('name')),
+                                          Triple(Var('entity'), 'sbol:role', IRI(CDS))), distinct=True, limit=5)
+
+        optimized = optimize(select)
+        self.assertEqual(serialize(optimized).split('\n')[-1], 'LIMIT 5')
+        self.assertEqual(list(optimized.where)[0], Triple(Var('entity'), 'sbol:role', IRI(CDS)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+import asyncio
+import unittest
+
+import SPARQLWrapper
+import synbiohub_adapter as sbha
+from synbiohub_adapter.resilience import RetryPolicy, RetryBudget, CircuitBreaker, CircuitOpenError
+from synbiohub_adapter.cancellation import QueryCancelledError
+
+from tests.FakeClock import FakeClock
+from tests.LocalSPARQLServer import LocalSPARQLServer, bindings_result
+
+RESULT = bindings_result(['collection'], [['https://hub.sd2e.org/user/sd2e/experiment/rule_30/1']])
+
+
+class FlakyResponder():
+    ''' Answers with the given error status for the first failures queries, then with RESULT.
+    '''
+
+    def __init__(self, failures, status=503):
+        self.failures = failures
+        self.status = status
+        self.calls = 0
+
+    def __call__(self, query, headers):
+        self.calls += 1
+        if self.calls <= self.failures:
+            return (self.status, 'text/plain', b'unavailable')
+        return RESULT
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.delays = []
+        self.responder = FlakyResponder(0)
+        self.server = LocalSPARQLServer(self.responder).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def new_query(self, **kwargs):
+        kwargs.setdefault('budget', RetryBudget())
+        policy = RetryPolicy(sleep=self.delays.append, **kwargs)
+        return sbha.SynBioHubQuery(self.server.sparql_url, retry_policy=policy)
+
+    def test_retries_transient_errors(self):
+        for status in [500, 502, 503, 504]:
+            self.responder.failures = self.responder.calls + 2
+            self.responder.status = status
+
+            self.assertEqual(len(self.new_query().query_experiment_sets()), 1)
+
+        self.assertEqual(self.responder.calls, 12)
+        self.assertEqual(len(self.delays), 8)
+
+    def test_gives_up_after_max_attempts(self):
+        self.responder.failures = 10
+        self.responder.status = 500
+
+        with self.assertRaises(SPARQLWrapper.SPARQLExceptions.EndPointInternalError):
+            self.new_query(max_attempts=4).query_experiment_sets()
+
+        self.assertEqual(self.responder.calls, 4)
+
+    def test_does_not_retry_bad_query(self):
+        self.responder.failures = 10
+        self.responder.status = 400
+
+        with self.assertRaises(SPARQLWrapper.SPARQLExceptions.QueryBadFormed):
+            self.new_query().query_experiment_sets()
+
+        self.assertEqual(self.responder.calls, 1)
+        self.assertEqual(self.delays, [])
+
+    def test_exponential_backoff_with_jitter(self):
+        policy = RetryPolicy(base_delay=1.0, multiplier=2.0, max_delay=5.0)
+
+        for retry, cap in [(1, 1.0), (2, 2.0), (3, 4.0), (4, 5.0), (10, 5.0)]:
+            delays = [policy.backoff(retry) for i in range(50)]
+            self.assertTrue(all(0 <= delay <= cap for delay in delays))
+            self.assertGreater(len(set(delays)), 1)
+
+    def test_retry_budget(self):
+        budget = RetryBudget(ratio=0.0, min_retries=1)
+        self.responder.failures = 10
+        self.responder.status = 500
+
+        with self.assertRaises(SPARQLWrapper.SPARQLExceptions.EndPointInternalError):
+            self.new_query(budget=budget, max_attempts=5).query_experiment_sets()
+
+        # One retry was allowed by the budget, after which the error was raised
+        self.assertEqual(self.responder.calls, 2)
+        self.assertFalse(budget.try_retry())
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_rate=0.5, minimum_calls=4, window=10.0, reset_timeout=5.0,
+                                      clock=self.clock)
+
+    def test_opens_and_recovers(self):
+        responder = FlakyResponder(4)
+        server = LocalSPARQLServer(responder).start()
+
+        try:
+            policy = RetryPolicy(max_attempts=1, circuit_breaker=self.breaker, budget=None)
+            sbh_query = sbha.SynBioHubQuery(server.sparql_url, retry_policy=policy)
+
+            for i in range(4):
+                with self.assertRaises(Exception):
+                    sbh_query.query_experiment_sets()
+            self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+            # While open, calls fail fast without reaching the server
+            with self.assertRaises(CircuitOpenError):
+                sbh_query.query_experiment_sets()
+            self.assertEqual(responder.calls, 4)
+
+            self.clock.now += 5.0
+            self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+            self.assertEqual(len(sbh_query.query_experiment_sets()), 1)
+            self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        finally:
+            server.stop()
+
+    def test_failed_probe_reopens(self):
+        for i in range(4):
+            self.breaker.record_failure()
+
+        self.clock.now += 5.0
+        self.breaker.before_call()
+
+        # Only one probe is let through while half-open
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_cancelled_probe_is_released(self):
+        policy = RetryPolicy(max_attempts=1, circuit_breaker=self.breaker, budget=None)
+
+        def cancelled():
+            raise QueryCancelledError()
+
+        async def cancelled_async():
+            raise asyncio.CancelledError()
+
+        async def succeeded_async():
+            return 1
+
+        for i in range(4):
+            self.breaker.record_failure()
+        self.clock.now += 5.0
+
+        # A cancelled probe lets the next call probe the hub again, in both the sync and async paths
+        with self.assertRaises(QueryCancelledError):
+            policy.call(cancelled)
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(policy.call_async(cancelled_async))
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+
+        self.assertEqual(asyncio.run(policy.call_async(succeeded_async)), 1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_below_failure_rate(self):
+        for i in range(10):
+            self.breaker.record_success()
+            if i % 3 == 0:
+                self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_falls_back_to_cache(self):
+        responder = FlakyResponder(0)
+        server = LocalSPARQLServer(responder).start()
+
+        try:
+            policy = RetryPolicy(max_attempts=1, circuit_breaker=self.breaker, budget=None)
+            sbh_query = sbha.SynBioHubQuery(server.sparql_url, use_fallback_cache=True, retry_policy=policy)
+            expected = sbh_query.query_experiment_sets()
+
+            for i in range(4):
+                self.breaker.record_failure()
+
+            self.assertEqual(sbh_query.query_experiment_sets(), expected)
+            self.assertEqual(responder.calls, 1)
+        finally:
+            server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import SPARQLWrapper
+import synbiohub_adapter as sbha
+from synbiohub_adapter.session import SynBioHubSession
+from synbiohub_adapter.upload_sbol.upload_sbol import SynBioHub
+
+from tests.FakeClock import FakeClock
+from tests.LocalSPARQLServer import LocalSPARQLServer, bindings_result
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+RESULT = bindings_result(['collection'], [['https://hub.sd2e.org/user/sd2e/experiment/rule_30/1']])
+
+
+class TestSynBioHubSession(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.clock = FakeClock(1000.0)
+        self.authorized = []
+        self.reject_all = False
+
+        # Like SynBioHub, answer with the HTML home page when the token is missing or was not issued by the server
+        def responder(query, headers):
+            token = headers.get('X-authorization')
+            self.authorized.append(token)
+            if self.reject_all or token != self.server.token:
+                return (200, 'text/html', b'<!DOCTYPE html><html></html>')
+            return RESULT
+
+        self.server = LocalSPARQLServer(responder).start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.cache_dir)
+
+    def new_session(self, **kwargs):
+        return SynBioHubSession(self.server.sparql_url, 'sd2e', 'password', cache_dir=self.cache_dir,
+                                clock=self.clock, **kwargs)
+
+    def test_login_once_for_many_clients(self):
+        session = self.new_session()
+        queries = [sbha.SynBioHubQuery(self.server.sparql_url, session=session) for i in range(3)]
+
+        for sbh_query in queries:
+            self.assertEqual(len(sbh_query.query_experiment_sets()), 1)
+
+        self.assertEqual(self.server.logins, 1)
+        self.assertEqual(self.authorized, ['local-token'] * 3)
+        self.assertIn('FROM <{}/user/sd2e>'.format(self.server.url), self.server.queries[0])
+
+    def test_token_reused_by_later_process(self):
+        self.assertEqual(self.new_session().token, 'local-token')
+
+        # A new session with the same cache directory stands for a later process
+        session = self.new_session()
+        self.assertEqual(sbha.SynBioHubQuery(self.server.sparql_url, session=session).query_experiment_sets(),
+                         ['https://hub.sd2e.org/user/sd2e/experiment/rule_30/1'])
+        self.assertEqual(self.server.logins, 1)
+        self.assertEqual(session.logins, 0)
+
+    def test_token_lifetime(self):
+        session = self.new_session(token_lifetime=60)
+        session.token
+
+        self.clock.now += 59
+        session.token
+        self.assertEqual(self.server.logins, 1)
+
+        self.clock.now += 2
+        session.token
+        self.assertEqual(self.server.logins, 2)
+
+        # A saved token is reused for the lifetime of the session reading it, counted from its login
+        self.clock.now += 5
+        self.new_session(token_lifetime=10).token
+        self.assertEqual(self.server.logins, 2)
+        self.clock.now += 6
+        self.new_session(token_lifetime=10).token
+        self.assertEqual(self.server.logins, 3)
+
+    def test_refresh_on_unauthorized(self):
+        session = self.new_session()
+        sbh_query = sbha.SynBioHubQuery(self.server.sparql_url, session=session)
+        sbh_query.query_experiment_sets()
+
+        # The server forgets its tokens, as it does when it restarts
+        self.server.token = 'new-token'
+        self.assertEqual(len(sbh_query.query_experiment_sets()), 1)
+
+        self.assertEqual(self.server.logins, 2)
+        self.assertEqual(self.authorized, ['local-token', 'local-token', 'new-token'])
+        self.assertEqual(self.new_session().token, 'new-token')
+
+    def test_refresh_once(self):
+        session = self.new_session()
+        self.assertEqual(session.refresh('local-token'), 'local-token')
+        self.assertEqual(session.refresh(None), 'local-token')
+        self.assertEqual(self.server.logins, 1)
+
+        # A token refreshed by another client is returned without logging in again
+        self.server.token = 'new-token'
+        self.assertEqual(session.refresh('local-token'), 'new-token')
+        self.assertEqual(session.refresh('local-token'), 'new-token')
+        self.assertEqual(self.server.logins, 2)
+
+    def test_rejected_after_refresh(self):
+        sbh_query = sbha.SynBioHubQuery(self.server.sparql_url, session=self.new_session())
+        self.reject_all = True
+
+        with self.assertRaises(SPARQLWrapper.SPARQLExceptions.Unauthorized):
+            sbh_query.query_experiment_sets()
+        self.assertEqual(len(self.authorized), 2)
+
+    def test_saved_privately(self):
+        session = self.new_session()
+        session.token
+
+        self.assertEqual(os.listdir(self.cache_dir), [os.path.basename(session.path)])
+        self.assertEqual(stat.S_IMODE(os.stat(session.path).st_mode), 0o600)
+        with open(session.path) as f:
+            saved = json.load(f)
+        self.assertEqual(saved['token'], 'local-token')
+        self.assertNotIn('password', json.dumps(saved))
+
+        session.invalidate()
+        self.assertFalse(os.path.exists(session.path))
+        session.token
+        self.assertEqual(self.server.logins, 2)
+
+    def test_unreadable_file_ignored(self):
+        session = self.new_session()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(session.path, 'w') as f:
+            f.write('{')
+
+        self.assertEqual(session.token, 'local-token')
+        self.assertEqual(self.server.logins, 1)
+
+    def test_memory_only(self):
+        session = SynBioHubSession(self.server.url, 'sd2e', 'password', cache_dir=None)
+        session.token
+        session.token
+
+        self.assertIsNone(session.path)
+        self.assertEqual(self.server.logins, 1)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_upload_client_shares_session(self):
+        session = self.new_session()
+        sbh_query = sbha.SynBioHubQuery(self.server.sparql_url, session=session)
+        sbh_query.query_experiment_sets()
+
+        sbh = SynBioHub(self.server.url, 'sd2e', 'password', self.server.sparql_url, session=session)
+        self.assertEqual(sbh.part_shop.key, 'local-token')
+        self.assertEqual(sbh.part_shop.user, 'sd2e')
+        sbh.query_collection_members(collection_uris=['https://hub.sd2e.org/user/sd2e/experiment/rule_30/1'])
+
+        self.assertEqual(self.server.logins, 1)
+        self.assertEqual(self.authorized[-1], 'local-token')
+
+    def test_upload_client_logs_in_once(self):
+        session = SynBioHubSession(self.server.url, 'sd2e', 'password', cache_dir=None)
+        sbh = SynBioHub(self.server.url, 'sd2e', 'password', self.server.sparql_url, session=session)
+
+        self.assertEqual(self.server.logins, 1)
+        self.assertEqual(sbh.session.token, 'local-token')
+
+    def test_upload_client_refreshes_token(self):
+        session = self.new_session()
+        sbh = SynBioHub(self.server.url, 'sd2e', 'password', self.server.sparql_url, session=session)
+        self.assertEqual(sbh.token, 'local-token')
+
+        # Like SynBioHub, reject removals whose token was not issued by the server
+        def responder(query, headers):
+            self.authorized.append(headers.get('X-authorization'))
+            if headers.get('X-authorization') != self.server.token:
+                return (401, 'text/plain', b'Unauthorized')
+            return (200, 'text/plain', b'')
+
+        self.server.responder = responder
+        self.server.token = 'new-token'
+        sbh.remove_all_identified([self.server.url + '/user/sd2e/design/component/1'])
+
+        self.assertEqual(self.authorized, ['local-token', 'new-token'])
+        self.assertEqual(self.server.logins, 2)
+        self.assertEqual(sbh.token, 'new-token')
+
+    @unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+    def test_async_refresh(self):
+        session = self.new_session()
+
+        async def run():
+            async with sbha.AsyncSynBioHubQuery(self.server.sparql_url, session=session) as sbh_query:
+                await sbh_query.query_experiment_sets()
+                self.server.token = 'new-token'
+                return await sbh_query.query_experiment_sets()
+
+        self.assertEqual(len(asyncio.run(run())), 1)
+        self.assertEqual(self.server.logins, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
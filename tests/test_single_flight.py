@@ -0,0 +1,200 @@
+import asyncio
+import threading
+import time
+import unittest
+
+import synbiohub_adapter as sbha
+from synbiohub_adapter.cancellation import call_context, QueryTimeoutError
+from synbiohub_adapter.single_flight import SingleFlight, AsyncSingleFlight
+
+from tests.LocalSPARQLServer import LocalSPARQLServer, bindings_result
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+CONTROL = 'https://hub.sd2e.org/user/sd2e/design/control/1'
+
+
+# Runs target in count threads started at the same time, and returns their results or errors in order.
+def run_threads(count, target):
+    outcomes = [None] * count
+
+    def run(i):
+        try:
+            outcomes[i] = target()
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+
+    return threads, outcomes
+
+
+# Waits until condition holds, for at most 10 seconds.
+def wait_until(condition):
+    for i in range(1000):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError('Timed out')
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.release = threading.Event()
+        self.calls = []
+
+    def slow(self, outcome):
+        self.calls.append(1)
+        self.release.wait(10)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def test_result_shared(self):
+        threads, outcomes = run_threads(5, lambda: self.flight.call('q', self.slow, 'result'))
+        wait_until(lambda: self.flight.stats()['calls'] == 5)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes, ['result'] * 5)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.flight.stats(), {'calls': 5, 'saved': 4})
+
+        # Calls made after the shared call completed send their own request
+        self.flight.call('q', self.slow, 'result')
+        self.assertEqual(len(self.calls), 2)
+
+    def test_error_shared(self):
+        error = ValueError('bad query')
+        threads, outcomes = run_threads(3, lambda: self.flight.call('q', self.slow, error))
+        wait_until(lambda: self.flight.stats()['calls'] == 3)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes, [error] * 3)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_waiting_caller_times_out(self):
+        threads, outcomes = run_threads(1, lambda: self.flight.call('q', self.slow, 'result'))
+        wait_until(lambda: len(self.calls) == 1)
+
+        with call_context(timeout=0.1):
+            with self.assertRaises(QueryTimeoutError):
+                self.flight.call('q', self.slow, 'other')
+
+        self.release.set()
+        threads[0].join()
+        self.assertEqual(outcomes, ['result'])
+
+    def test_aborted_call_not_shared(self):
+        def timing_out():
+            self.calls.append(1)
+            time.sleep(0.2)
+            raise QueryTimeoutError()
+
+        threads, outcomes = run_threads(1, lambda: self.flight.call('q', timing_out))
+        wait_until(lambda: len(self.calls) == 1)
+
+        # The waiting caller sends the request again once the first caller timed out
+        self.assertEqual(self.flight.call('q', lambda: 'result'), 'result')
+        threads[0].join()
+        self.assertIsInstance(outcomes[0], QueryTimeoutError)
+        self.assertEqual(self.flight.stats()['saved'], 0)
+
+
+class TestCoalescedQueries(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.release = threading.Event()
+
+        def responder(query, headers):
+            self.release.wait(10)
+            return bindings_result(['control'], [[CONTROL]])
+
+        self.server = LocalSPARQLServer(responder).start()
+
+    @classmethod
+    def tearDownClass(self):
+        self.server.stop()
+
+    def setUp(self):
+        self.release.clear()
+        self.sent = len(self.server.queries)
+
+    def test_threads_share_request(self):
+        sbh_query = sbha.SynBioHubQuery(self.server.sparql_url)
+
+        threads, outcomes = run_threads(8, sbh_query.query_design_controls)
+        wait_until(lambda: sbh_query.single_flight_stats()['calls'] == 8)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.server.queries) - self.sent, 1)
+        for outcome in outcomes:
+            self.assertEqual(outcome, outcomes[0])
+        self.assertEqual(sbh_query.single_flight_stats(), {'calls': 8, 'saved': 7})
+
+    def test_shared_between_clients_of_same_user(self):
+        flight = SingleFlight()
+        clients = [sbha.SynBioHubQuery(self.server.sparql_url, single_flight=flight),
+                   sbha.SynBioHubQuery(self.server.sparql_url, single_flight=flight),
+                   sbha.SynBioHubQuery(self.server.sparql_url, user='sd2e', authentication_key='token',
+                                       single_flight=flight)]
+
+        threads = [threading.Thread(target=client.query_design_controls) for client in clients]
+        for thread in threads:
+            thread.start()
+        wait_until(lambda: flight.stats()['calls'] == 3)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.server.queries) - self.sent, 2)
+        self.assertEqual(flight.stats()['saved'], 1)
+
+    @unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+    def test_coroutines_share_request(self):
+        async def run():
+            async with sbha.AsyncSynBioHubQuery(self.server.sparql_url) as sbh_query:
+                tasks = [asyncio.ensure_future(sbh_query.query_design_controls()) for i in range(5)]
+                while sbh_query.single_flight_stats()['calls'] < 5:
+                    await asyncio.sleep(0.01)
+                self.release.set()
+                return await asyncio.gather(*tasks), sbh_query.single_flight_stats()
+
+        results, stats = asyncio.run(run())
+
+        self.assertEqual(len(self.server.queries) - self.sent, 1)
+        self.assertEqual(results, [results[0]] * 5)
+        self.assertEqual(stats, {'calls': 5, 'saved': 4})
+
+    def test_cancelled_coroutine_does_not_cancel_shared_request(self):
+        flight = AsyncSingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.1)
+            return 'result'
+
+        async def run():
+            first = asyncio.ensure_future(flight.call('q', fetch))
+            second = asyncio.ensure_future(flight.call('q', fetch))
+            await asyncio.sleep(0.01)
+            second.cancel()
+            return await first
+
+        self.assertEqual(asyncio.run(run()), 'result')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import unittest
+
+import rdflib
+from rdflib.plugins.sparql import prepareQuery
+
+from synbiohub_adapter.SynBioHubUtil import SD2Constants, SBOLQuery
+from synbiohub_adapter.query_synbiohub import SynBioHubQuery
+from synbiohub_adapter.sparql_ast import (serialize, Select, Group, Triple, Values, Optional, Union, Filter, Expr,
+                                          As, Var, IRI, Literal, Seq, Alt, Repeat, Inverse, iris)
+
+PLAN = 'https://hub.sd2e.org/user/sd2e/experiment/plan_1/1'
+SAMPLE = 'https://hub.sd2e.org/user/sd2e/experiment/sample_1/1'
+
+
+class QueryRecorder(SynBioHubQuery):
+    ''' A client recording the SPARQL text of its queries, whose results are empty.
+    '''
+
+    def __init__(self, server):
+        super().__init__(server)
+        self.queries = []
+
+    def fetch_SPARQL(self, server, query, result_format=None):
+        self.queries.append(query)
+        return {'head': {'vars': []}, 'results': {'bindings': []}}
+
+
+class UnoptimizedQuery(SBOLQuery):
+
+    OPTIMIZE_QUERIES = False
+
+
+class TestSparqlAst(unittest.TestCase):
+
+    def test_serialize(self):
+        query = Select(['entity'], Group(
+            Values(Var('collection'), iris([SD2Constants.SD2_DESIGN_COLLECTION])),
+            Triple(Var('collection'), 'sbol:member', Var('entity')),
+            Triple(Var('entity'), 'sbol:role', IRI('http://identifiers.org/so/SO:0000141')),
+            Triple(Var('entity'), 'sbol:role', IRI('http://identifiers.org/so/SO:0000167')),
+            Triple(Var('entity'), 'dcterms:title', Var('name')),
+            Optional(Triple(Var('entity'), 'sd2:status', Var('status')))), distinct=True, limit=10)
+
+        self.assertEqual(serialize(query), '\n'.join([
+            'PREFIX dcterms: <http://purl.org/dc/terms/>',
+            'PREFIX sbol: <http://sbols.org/v2#>',
+            'PREFIX sd2: <http://sd2e.org#>',
+            'SELECT DISTINCT ?entity WHERE {',
+            '  VALUES (?collection) { (<' + SD2Constants.SD2_DESIGN_COLLECTION + '>) }',
+            '  ?collection sbol:member ?entity .',
+            '  ?entity sbol:role <http://identifiers.org/so/SO:0000141>, <http://identifiers.org/so/SO:0000167> ;',
+            '    dcterms:title ?name .',
+            '  OPTIONAL {',
+            '    ?entity sd2:status ?status .',
+            '  }',
+            '}',
+            'LIMIT 10']))
+
+    def test_group_splices(self):
+        triple = Triple(Var('s'), 'a', 'sbol:Collection')
+        group = Group(Group(triple, None), '', Group())
+        group.add(Filter(Expr('bound(?s)')))
+
+        self.assertEqual(len(group), 2)
+        self.assertEqual(list(group)[0], triple)
+        with self.assertRaises(TypeError):
+            Group('?s ?p ?o')
+
+    def test_literals(self):
+        self.assertEqual(serialize(Filter(Expr('?n = {}', Literal('a "b"\\\n')))), 'FILTER (?n = "a \\"b\\"\\\\\\n")')
+        self.assertEqual(serialize(Filter(Expr('?n = {}', Literal('mM', language='en')))), 'FILTER (?n = "mM"@en)')
+        self.assertEqual(serialize(Filter(Expr('?n <= {}', Literal(0.5)))), 'FILTER (?n <= 0.5)')
+        self.assertEqual(serialize(Filter(Expr('?n = {}', Literal(True)))), 'FILTER (?n = true)')
+
+        # Infinite and NaN floats have no numeric syntax
+        xsd_double = '^^<http://www.w3.org/2001/XMLSchema#double>'
+        self.assertEqual(serialize(Filter(Expr('?n <= {}', Literal(float('inf'))))),
+                         'FILTER (?n <= "INF"{})'.format(xsd_double))
+        self.assertEqual(serialize(Filter(Expr('?n >= {}', Literal(float('-inf'))))),
+                         'FILTER (?n >= "-INF"{})'.format(xsd_double))
+        self.assertEqual(serialize(Filter(Expr('?n = {}', Literal(float('nan'))))),
+                         'FILTER (?n = "NaN"{})'.format(xsd_double))
+        graph = rdflib.Graph()
+        graph.add((rdflib.URIRef('http://a.org/x'), rdflib.URIRef('http://a.org/n'), rdflib.Literal(1.5)))
+        query = Select([Var('s')], Group(Triple(Var('s'), IRI('http://a.org/n'), Var('n')),
+                                         Filter(Expr('?n <= {}', Literal(float('inf'))))))
+        self.assertEqual(len(graph.query(serialize(query))), 1)
+        with self.assertRaises(ValueError):
+            Literal('mM', language='e n')
+
+    def test_invalid_terms(self):
+        for value in ['http://a.org/x> . ?s ?p ?o . <http://a.org/y', 'http://a.org/x y', 'http://a.org/"x"']:
+            with self.assertRaises(ValueError):
+                IRI(value)
+        with self.assertRaises(ValueError):
+            Var('x y')
+        with self.assertRaises(ValueError):
+            serialize(Triple(Var('s'), 'foo:bar', Var('o')))
+        with self.assertRaises(ValueError):
+            serialize(Triple(Var('s'), '<http://sbols.org/v2#member>', Var('o')))
+
+    def test_prefixes(self):
+        query = Select([As(Expr('count(?s)'), Var('n'))], Triple(Var('s'), 'ex:member', Var('o')),
+                       prefixes={'ex': 'http://example.org/'})
+        self.assertEqual(serialize(query).split('\n')[:2], ['PREFIX ex: <http://example.org/>',
+                                                            'SELECT (count(?s) AS ?n) WHERE {'])
+
+        # Prefixed names are found in expressions, but not in IRIs or literals
+        text = serialize(Filter(Expr('strstarts(str(?t), "http://a.org") && ?t != sd2:Experiment')))
+        self.assertEqual(text, 'PREFIX sd2: <http://sd2e.org#>\nFILTER (strstarts(str(?t), "http://a.org") && '
+                               '?t != sd2:Experiment)')
+
+    def test_paths(self):
+        path = Seq(Repeat(Alt('prov:wasDerivedFrom', Inverse('sbol:built')), '+'), 'sbol:member')
+        self.assertEqual(serialize(Triple(Var('s'), path, Var('o'))).split('\n')[-1],
+                         '?s (prov:wasDerivedFrom|^sbol:built)+/sbol:member ?o .')
+
+    def test_rdflib_parses(self):
+        query = Select(['dname', 'ename'], Group(Union(
+            Group(Triple(IRI(PLAN), 'sd2:diagnosticVariable', Var('dvar')),
+                  Triple(Var('dvar'), 'dcterms:title', Var('dname'))),
+            Triple(IRI(PLAN), 'sd2:experimentalVariable', Var('ename')))), order_by=['dname'], offset=5)
+
+        prepareQuery(serialize(query))
+
+    def test_builders(self):
+        sbh_query = QueryRecorder('http://localhost/sparql')
+        try:
+            sbh_query.query_design_gates()
+            sbh_query.query_experiment_components(collections=[SD2Constants.SD2_EXPERIMENT_COLLECTION],
+                                                  experiments=[PLAN], types=['http://a.org/type'])
+            sbh_query.query_sample_inducers(SAMPLE)
+            sbh_query.query_single_experiment_samples_by_probability(PLAN, 0.5)
+            sbh_query.query_single_experiment_intent(PLAN)
+            sbh_query.query_designs_by_lab_ids('BioFAB', ['a "1"', '2'], verbose=True)
+            sbh_query.query_single_experiment_attachment(PLAN, 'a "name"')
+        finally:
+            sbh_query.close()
+
+        queries = sbh_query.queries + [sbh_query.construct_unit_query(name='millimolar')]
+        for query in queries:
+            prepareQuery(query)
+
+        self.assertTrue(any('VALUES (?id) { ("a \\"1\\"") ("2") }' in query for query in queries))
+        self.assertNotIn('PREFIX prov:', queries[0])
+
+    def test_collection_entity_select(self):
+        sbol_query = UnoptimizedQuery('http://localhost/sparql')
+        try:
+            select = sbol_query.construct_collection_entity_select([SD2Constants.SD2_DESIGN_COLLECTION],
+                                                                   other_entity_labels=['name'])
+            self.assertIsInstance(select, Select)
+            self.assertEqual(serialize(select), sbol_query.construct_collection_entity_query(
+                [SD2Constants.SD2_DESIGN_COLLECTION], other_entity_labels=['name']))
+            self.assertIsNone(sbol_query.construct_collection_entity_select([], entity_depth=0))
+        finally:
+            sbol_query.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+import json
+import os
+import unittest
+
+import rdflib
+
+import synbiohub_adapter as sbha
+from synbiohub_adapter.sparql_results import iter_json_bindings, StreamingResult, decode_result, decode_tsv, \
+    decode_tsv_rows, decode_csv, XSD_NS
+
+from tests.LocalSPARQLServer import LocalSPARQLServer, graph_responder, serialize_result
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'examples', 'workingFiles')
+
+RESULT = {
+    'head': {'vars': ['dna', 'sequence', 'sample'], 'link': []},
+    'results': {
+        'distinct': False,
+        'ordered': True,
+        'bindings': [
+            {'dna': {'type': 'uri', 'value': 'https://hub.sd2e.org/user/sd2e/design/pAN{}/1'.format(i)},
+             'sequence': {'type': 'literal', 'value': 'atgc' * (i + 1) + 'é中'},
+             'sample': {'type': 'uri', 'value': 'https://hub.sd2e.org/user/sd2e/experiment/sample_{}/1'.format(i % 3)},
+             'count': {'type': 'typed-literal', 'value': 12345 + i}}
+            for i in range(50)
+        ]
+    }
+}
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestStreamingResults(unittest.TestCase):
+
+    def test_iter_json_bindings(self):
+        data = json.dumps(RESULT, ensure_ascii=False, indent=2).encode('utf-8')
+
+        for size in [1, 2, 7, 64, len(data)]:
+            self.assertEqual(list(iter_json_bindings(chunked(data, size))), RESULT['results']['bindings'])
+
+    def test_results_before_head(self):
+        data = json.dumps({'results': RESULT['results'], 'head': RESULT['head']}).encode('utf-8')
+        self.assertEqual(list(iter_json_bindings(chunked(data, 5))), RESULT['results']['bindings'])
+
+    def test_to_dict(self):
+        data = json.dumps(RESULT).encode('utf-8')
+        streamed = StreamingResult(chunked(data, 64))
+        self.assertEqual(streamed['head'], {'vars': []})
+        self.assertEqual(len(list(streamed)), len(RESULT['results']['bindings']))
+        self.assertEqual(streamed.head, RESULT['head'])
+
+        self.assertEqual(StreamingResult(chunked(data, 64)).to_dict(),
+                         {'head': RESULT['head'], 'results': {'bindings': RESULT['results']['bindings']}})
+
+        data = json.dumps({'results': RESULT['results'], 'head': RESULT['head']}).encode('utf-8')
+        self.assertEqual(StreamingResult(chunked(data, 64)).to_dict()['head'], RESULT['head'])
+
+    def test_malformed(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_bindings([b'{"results": {"bindings": [{"a": ']))
+
+    def test_format_streaming_result(self):
+        sbh_query = sbha.SBOLQuery('http://localhost')
+        data = json.dumps(RESULT).encode('utf-8')
+
+        expected = sbh_query.format_query_result(RESULT, ['dna', 'sequence'], 'sample')
+        streamed = sbh_query.format_query_result(StreamingResult(chunked(data, 100)), ['dna', 'sequence'], 'sample')
+
+        self.assertEqual(streamed, expected)
+
+    def test_fetch_streaming_result(self):
+        server = LocalSPARQLServer(lambda query, headers: RESULT).start()
+
+        try:
+            sbh_query = sbha.SynBioHubQuery(server.sparql_url, stream_results=True)
+            sbh_query.STREAM_CHUNK_SIZE = 128
+
+            result = sbh_query.query_experiment_dna(with_sequence=True, by_sample=True, pretty=False)
+            self.assertIsInstance(result, StreamingResult)
+            self.assertEqual(list(result['results']['bindings']), RESULT['results']['bindings'])
+
+            pretty = sbh_query.query_experiment_dna(with_sequence=True, by_sample=True)
+            self.assertEqual(len(pretty), 3)
+        finally:
+            server.stop()
+
+    def test_experiment_set_size(self):
+        results = [{'size': {'type': 'literal', 'value': '3'}}]
+
+        def respond(query, headers):
+            return {'head': {'vars': ['size']}, 'results': {'bindings': results}}
+
+        server = LocalSPARQLServer(respond).start()
+
+        try:
+            for stream_results in [False, True]:
+                sbh_query = sbha.SynBioHubQuery(server.sparql_url, stream_results=stream_results)
+                results[:] = [{'size': {'type': 'literal', 'value': '3'}}]
+                self.assertEqual(sbh_query.query_experiment_set_size('https://hub.sd2e.org/collection/1'), 3)
+
+                # Counting no experiment, an endpoint may answer with no row or a row without the count
+                for rows in [[], [{}]]:
+                    results[:] = rows
+                    self.assertEqual(sbh_query.query_experiment_set_size('https://hub.sd2e.org/collection/1'), 0)
+        finally:
+            server.stop()
+
+
+def example_graph():
+    graph = rdflib.Graph()
+    graph.parse(os.path.join(EXAMPLES_DIR, 'r30_86.xml'), format='xml')
+
+    member = rdflib.URIRef(sbha.SBOLConstants.SBOL_NS + 'member')
+    for collection in set(graph.subjects(member, None)):
+        graph.add((rdflib.URIRef(sbha.SD2Constants.SD2_EXPERIMENT_COLLECTION), member, collection))
+
+    subject = rdflib.URIRef('https://hub.sd2e.org/user/sd2e/design/escapes/1')
+    for value in [rdflib.Literal('tab\there "quoted"\nnew line \\ é中'),
+                  rdflib.Literal('LB broth', lang='en'),
+                  rdflib.Literal(42),
+                  rdflib.Literal(0.5),
+                  rdflib.Literal(True),
+                  rdflib.BNode('b0')]:
+        graph.add((subject, rdflib.URIRef('http://purl.org/dc/terms/description'), value))
+
+    return graph
+
+
+QUERY = '''SELECT ?s ?p ?o ?title WHERE {
+    ?s ?p ?o .
+    OPTIONAL { ?s <http://purl.org/dc/terms/title> ?title }
+}'''
+
+
+class TestResultFormats(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.graph = example_graph()
+        self.server = LocalSPARQLServer(graph_responder(self.graph)).start()
+
+    @classmethod
+    def tearDownClass(self):
+        self.server.stop()
+
+    def get_bindings(self, result_format):
+        content = serialize_result(self.graph.query(QUERY), result_format)
+        bindings = decode_result(content, result_format)['results']['bindings']
+        return sorted(bindings, key=lambda binding: json.dumps(binding, sort_keys=True))
+
+    def test_decode_tsv(self):
+        self.assertEqual(self.get_bindings('tsv'), self.get_bindings('json'))
+
+    def test_decode_csv(self):
+        values = [{var: term['value'] for var, term in binding.items()} for binding in self.get_bindings('json')]
+        csv_values = [{var: term['value'] for var, term in binding.items()} for binding in self.get_bindings('csv')]
+
+        self.assertEqual(sorted(csv_values, key=str), sorted(values, key=str))
+
+    def test_decode_tsv_rows(self):
+        variables, rows = decode_tsv_rows(b'?a\t?b\n<http://a>\t"x\\ty"@en\n\t12\n')
+
+        self.assertEqual(variables, ['a', 'b'])
+        self.assertEqual(rows, [('http://a', 'x\ty'), (None, '12')])
+
+    def test_parse_tsv_terms(self):
+        result = decode_tsv(b'?v\n"""a "b" c"""\n"1"^^xsd:integer\n1.5e3\n-2.5\n7\ntrue\n_:b1\n')
+        terms = [binding['v'] for binding in result['results']['bindings']]
+
+        self.assertEqual(terms[0], {'type': 'literal', 'value': 'a "b" c'})
+        self.assertEqual(terms[1]['datatype'], 'xsd:integer')
+        self.assertEqual([term['datatype'][len(XSD_NS):] for term in terms[2:6]],
+                         ['double', 'decimal', 'integer', 'boolean'])
+        self.assertEqual(terms[6], {'type': 'bnode', 'value': 'b1'})
+
+    def test_empty_result(self):
+        self.assertEqual(decode_tsv_rows(b''), ([], []))
+        self.assertEqual(decode_tsv(b'?a\n')['results']['bindings'], [])
+        self.assertEqual(decode_csv(b'a\r\n')['results']['bindings'], [])
+
+    def test_client_result_format(self):
+        expected = sbha.SynBioHubQuery(self.server.sparql_url).query_experiment_sets()
+
+        for result_format in ['tsv', 'csv']:
+            sbh_query = sbha.SynBioHubQuery(self.server.sparql_url, result_format=result_format)
+            self.assertEqual(sbh_query.query_experiment_sets(), expected)
+        self.assertEqual(len(expected), 1)
+
+    def test_per_query_result_format(self):
+        sbh_query = sbha.SBOLQuery(self.server.sparql_url)
+        json_result = sbh_query.fetch_SPARQL(self.server.sparql_url, QUERY)
+        tsv_result = sbh_query.fetch_SPARQL(self.server.sparql_url, QUERY, result_format='tsv')
+
+        self.assertEqual(len(tsv_result['results']['bindings']), len(json_result['results']['bindings']))
+        self.assertEqual(self.server.queries[-1], QUERY)
+
+    def test_unsupported_result_format(self):
+        with self.assertRaises(ValueError):
+            sbha.SBOLQuery(self.server.sparql_url, result_format='xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+import SPARQLWrapper
+import synbiohub_adapter as sbha
+from synbiohub_adapter.transport import PooledTransport
+
+from tests.LocalSPARQLServer import LocalSPARQLServer, bindings_result
+
+
+class TestPooledTransport(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        def responder(query, headers):
+            if 'bad' in query:
+                return (400, 'text/plain', b'bad query')
+            return bindings_result(['entity'], [['https://hub.sd2e.org/user/sd2e/design/foo/1']])
+
+        self.server = LocalSPARQLServer(responder).start()
+
+    @classmethod
+    def tearDownClass(self):
+        self.server.stop()
+
+    def test_connections_reused_across_queries(self):
+        sbh_query = sbha.SynBioHubQuery(self.server.url)
+        sbh_query.login('sd2e', 'password')
+
+        for i in range(5):
+            result = sbh_query.query_collection_members(collections=[sbha.SD2Constants.SD2_DESIGN_COLLECTION])
+            self.assertEqual(len(result['results']['bindings']), 1)
+
+        stats = sbh_query.connection_stats()
+        self.assertEqual(len(stats), 1)
+        host_stats = list(stats.values())[0]
+        self.assertEqual(host_stats['requests'], 6)
+        self.assertEqual(host_stats['connections'], 1)
+        self.assertEqual(host_stats['reused'], 5)
+        self.assertEqual(sbh_query.authentication_key, 'local-token')
+
+        sbh_query.close()
+
+    def test_shared_transport(self):
+        transport = PooledTransport(pool_size=2)
+        query_1 = sbha.SynBioHubQuery(self.server.sparql_url, transport=transport)
+        query_2 = sbha.SynBioHubQuery(self.server.sparql_url, transport=transport)
+
+        query_1.query_collections()
+        query_2.query_collections()
+
+        self.assertIs(query_1.transport, query_2.transport)
+        self.assertEqual(list(transport.connection_stats().values())[0]['reused'], 1)
+
+        transport.close()
+
+    def test_bad_query(self):
+        sbh_query = sbha.SBOLQuery(self.server.sparql_url)
+        with self.assertRaises(SPARQLWrapper.SPARQLExceptions.QueryBadFormed):
+            sbh_query.fetch_SPARQL(self.server.sparql_url, 'SELECT ?bad WHERE { ?bad ?p ?o }')
+
+
+if __name__ == '__main__':
+    unittest.main()